@@ -5,15 +5,20 @@ from flask_mail import Mail
 from flask_moment import Moment
 from flask_whooshee import Whooshee
 from flask_resize import Resize
-from flask_sqlalchemy import SQLAlchemy
 from flask_uploads import UploadSet, configure_uploads, IMAGES
 
 from config import config
+from .cache import response_cache
+from .database import Database
+from .lattice import lattice_cache
+from .price_store import price_store
+from .pubsub import broker
+from .quote_cache import quote_cache
 
 bootstrap = Bootstrap()
 mail = Mail()
 moment = Moment()
-db = SQLAlchemy()
+db = Database()
 photos = UploadSet('photos', IMAGES)
 resize = Resize()
 whooshee = Whooshee()
@@ -41,6 +46,17 @@ def create_app(config_name):
     resize.init_app(app)
     # whooshee = Whooshee(app)
     whooshee.init_app(app)
+    response_cache.init_app(app)
+    broker.init_app(app)
+    price_store.init_app(app)
+    quote_cache.init_app(app)
+    lattice_cache.init_app(app)
+    from .correlation import correlation_store
+    from .portfolio_greeks import greek_book
+    from .vol_surface import vol_surfaces
+    correlation_store.init_app(app)
+    greek_book.init_app(app)
+    vol_surfaces.init_app(app)
     # whooshee.reindex()
 
     # attach routes & error handlers to application here
@@ -62,4 +78,7 @@ def create_app(config_name):
     from .users import users as users_blueprint
     app.register_blueprint(users_blueprint, url_prefix='/users')
 
+    from .stream import stream as stream_blueprint
+    app.register_blueprint(stream_blueprint, url_prefix='/stream')
+
     return app
@@ -0,0 +1,206 @@
+"""
+Price alerts. Every active rule is reduced to price levels: 'above' fires once the price reaches its threshold,
+'below' once it falls to it, and 'percent' is an above and a below level around the price it was set at, whichever
+is reached first. The levels of each stock sit in two sorted arrays, so a batch of prices finds the rules it
+crossed with two binary searches per stock and never looks at the others. Fired rules are dropped by moving the
+array's live bound instead of rewriting it.
+"""
+import time
+from datetime import datetime
+from itertools import groupby
+
+import numpy as np
+from flask import current_app
+
+from . import db
+from .email import send_emails
+from .models import Alert, AlertKind, BrokerMessage, User
+
+
+def levels(kinds, thresholds, references):
+    """(above, below) level arrays of rules, NaN where a rule has no level on that side"""
+    kinds = np.asarray(kinds)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    references = np.asarray([np.nan if reference is None else reference for reference in references],
+                            dtype=np.float64)
+    percent = kinds == AlertKind.PERCENT
+    above = np.where(kinds == AlertKind.ABOVE, thresholds, np.where(percent, references * (1 + thresholds), np.nan))
+    below = np.where(kinds == AlertKind.BELOW, thresholds, np.where(percent, references * (1 - thresholds), np.nan))
+    return above, below
+
+
+class LevelBook:
+    """
+    Levels of one stock, both arrays ascending. Above levels fire from the low end and below levels from the high
+    end, so the rules still waiting are above_levels[above_start:] and below_levels[:below_end].
+    """
+    __slots__ = ('above_levels', 'above_ids', 'above_start', 'below_levels', 'below_ids', 'below_end')
+
+    def __init__(self):
+        self.above_levels = self.below_levels = np.zeros(0)
+        self.above_ids = self.below_ids = np.zeros(0, dtype=np.int64)
+        self.above_start = self.below_end = 0
+
+    def __len__(self):
+        return len(self.above_levels) - self.above_start + self.below_end
+
+    def rebuild(self, ids, above, below, keep=None):
+        """Merge new levels into the waiting ones, keep is a mask indexed by alert id of the rules still live"""
+        above_levels = np.concatenate((self.above_levels[self.above_start:], above))
+        above_ids = np.concatenate((self.above_ids[self.above_start:], ids))
+        below_levels = np.concatenate((self.below_levels[:self.below_end], below))
+        below_ids = np.concatenate((self.below_ids[:self.below_end], ids))
+        if keep is not None:
+            above_live, below_live = keep[above_ids], keep[below_ids]
+            above_levels, above_ids = above_levels[above_live], above_ids[above_live]
+            below_levels, below_ids = below_levels[below_live], below_ids[below_live]
+        has_above, has_below = ~np.isnan(above_levels), ~np.isnan(below_levels)
+        above_levels, above_ids = above_levels[has_above], above_ids[has_above]
+        below_levels, below_ids = below_levels[has_below], below_ids[has_below]
+        order = np.argsort(above_levels, kind='stable')
+        self.above_levels, self.above_ids, self.above_start = above_levels[order], above_ids[order], 0
+        order = np.argsort(below_levels, kind='stable')
+        self.below_levels, self.below_ids = below_levels[order], below_ids[order]
+        self.below_end = len(self.below_levels)
+
+    def cross(self, high, low):
+        """Take the rules crossed by a price range, (above ids, below ids)"""
+        stop = max(int(np.searchsorted(self.above_levels, high, side='right')), self.above_start)
+        above = self.above_ids[self.above_start:stop]
+        self.above_start = stop
+        begin = min(int(np.searchsorted(self.below_levels, low, side='left')), self.below_end)
+        below = self.below_ids[begin:self.below_end]
+        self.below_end = begin
+        return above, below
+
+
+class AlertIndex:
+    """Every stock's LevelBook plus a mask of the alert ids still live, which retires both levels of a percent rule"""
+
+    def __init__(self):
+        self.books = {}
+        self.live = np.zeros(1024, dtype=bool)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.live))
+
+    def add(self, alert_ids, stock_ids, kinds, thresholds, references):
+        alert_ids = np.asarray(alert_ids, dtype=np.int64)
+        if not len(alert_ids):
+            return
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        if alert_ids.max() >= len(self.live):
+            self.live = np.concatenate((self.live, np.zeros(max(int(alert_ids.max()) + 1, 2 * len(self.live)) -
+                                                            len(self.live), dtype=bool)))
+        self.live[alert_ids] = True
+        above, below = levels(kinds, thresholds, references)
+        order = np.argsort(stock_ids, kind='stable')
+        stocks, starts = np.unique(stock_ids[order], return_index=True)
+        for stock, selected in zip(stocks.tolist(), np.split(order, starts[1:])):
+            self.books.setdefault(stock, LevelBook()).rebuild(alert_ids[selected], above[selected],
+                                                              below[selected])
+
+    def remove(self, alert_ids):
+        alert_ids = np.asarray(alert_ids, dtype=np.int64)
+        self.live[alert_ids[alert_ids < len(self.live)]] = False
+
+    def compact(self):
+        """Drop the levels of removed and fired rules from books where they are at least half of what is left"""
+        for stock, book in list(self.books.items()):
+            waiting = np.concatenate((book.above_ids[book.above_start:], book.below_ids[:book.below_end]))
+            if not len(waiting):
+                del self.books[stock]
+            elif 2 * np.count_nonzero(self.live[waiting]) <= len(waiting):
+                book.rebuild(np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0), keep=self.live)
+
+    def evaluate(self, stock_ids, highs, lows):
+        """
+        Fire the rules crossed by each stock's price range
+        :return: (alert ids, the high or low that crossed each), every alert at most once
+        """
+        fired, prices = [], []
+        for stock, high, low in zip(np.asarray(stock_ids).tolist(), np.asarray(highs).tolist(),
+                                    np.asarray(lows).tolist()):
+            book = self.books.get(stock)
+            if book is None:
+                continue
+            above, below = book.cross(high, low)
+            if len(above):
+                fired.append(above)
+                prices.append(np.full(len(above), high))
+            if len(below):
+                fired.append(below)
+                prices.append(np.full(len(below), low))
+        if not fired:
+            return np.zeros(0, dtype=np.int64), np.zeros(0)
+        fired, prices = np.concatenate(fired), np.concatenate(prices)
+        alive = self.live[fired]
+        # A percent rule whose range crossed both levels in one batch fires once
+        fired, first = np.unique(fired[alive], return_index=True)
+        prices = prices[alive][first]
+        self.live[fired] = False
+        return fired, prices
+
+    def evaluate_ticks(self, stock_ids, prices):
+        """evaluate() a batch of ticks, each stock's range being the high and low of its ticks"""
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        prices = np.asarray(prices, dtype=np.float64)
+        if not len(stock_ids):
+            return self.evaluate([], [], [])
+        order = np.argsort(stock_ids, kind='stable')
+        stocks, starts = np.unique(stock_ids[order], return_index=True)
+        return self.evaluate(stocks, np.maximum.reduceat(prices[order], starts),
+                             np.minimum.reduceat(prices[order], starts))
+
+
+class AlertEngine:
+    """Keeps an AlertIndex in step with the alerts table, fires what prices cross and delivers it; needs an app context"""
+
+    def __init__(self, refresh_interval=None):
+        self.index = AlertIndex()
+        self.last_id = 0
+        self.last_refresh = None
+        self.next_refresh = 0.0
+        self.refresh_interval = refresh_interval
+
+    def refresh(self):
+        """Load the rules created and drop the ones cancelled since the last refresh"""
+        now = datetime.utcnow()
+        added, cancelled = Alert.changes(self.last_id, self.last_refresh)
+        if added:
+            columns = list(zip(*added))
+            self.index.add(*columns)
+            self.last_id = max(columns[0])
+        self.index.remove(cancelled)
+        self.index.compact()
+        self.last_refresh = now
+        interval = self.refresh_interval or current_app.config['ALERTS_REFRESH_INTERVAL']
+        self.next_refresh = time.monotonic() + interval
+        db.session.commit()
+
+    def observe(self, stock_ids, highs, lows):
+        """
+        Check a batch of per-stock price ranges
+        :return: number of alerts triggered
+        """
+        if time.monotonic() >= self.next_refresh:
+            self.refresh()
+        fired, prices = self.index.evaluate(stock_ids, highs, lows)
+        if not len(fired):
+            return 0
+        triggered = Alert.trigger(fired.tolist(), prices.tolist())
+        deliver(triggered)
+        return len(triggered)
+
+
+def deliver(alerts):
+    """One in-app message per alert and one email per user for a batch of triggered alerts"""
+    if not alerts:
+        return
+    BrokerMessage.publish('alerts', [alert.payload() for alert in alerts])
+    if current_app.config['ALERTS_EMAIL']:
+        by_user = groupby(sorted(alerts, key=lambda alert: alert.user_id), key=lambda alert: alert.user_id)
+        users = {user.id: user for user in User.query.filter(User.id.in_({alert.user_id for alert in alerts}))}
+        send_emails([(users[user_id].email, 'Price alerts', 'mail/price_alerts',
+                      {'user': users[user_id], 'alerts': list(user_alerts)}) for user_id, user_alerts in by_user])
+    Alert.mark_delivered([alert.id for alert in alerts])
@@ -2,4 +2,4 @@ from flask import Blueprint
 
 api = Blueprint('api', __name__)
 
-from . import auth, stocks, trades, users
+from . import auth, greeks, options, risk, stocks, trades, users
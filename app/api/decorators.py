@@ -1,6 +1,10 @@
+import hashlib
+from datetime import timedelta, timezone
 from functools import wraps
-from flask import g
+from flask import current_app, g, make_response, request
 from .errors import forbidden
+from ..cache import response_cache
+from ..models import TableVersion
 
 
 def permission_required(permission):
@@ -14,3 +18,54 @@ def permission_required(permission):
         return decorated_function
 
     return decorator
+
+
+def conditional(*tables, scoped=False, state=None):
+    """
+    Validate and cache a read endpoint against the versions of the tables it reads from.
+    A matching If-None-Match or If-Modified-Since gets a 304 without running the view, otherwise the body comes
+    from the response cache and the view only runs on a miss.
+    :param tables: version keys the response depends on, table names or '<table>.<column>'
+    :param scoped: True when the body depends on the authenticated user, keys the cache per user
+    :param state: called with the view's arguments for a hashable version of data that lives outside the database,
+                  such a response has an ETag but no Last-Modified
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            versions, last_modified = TableVersion.lookup(tables)
+            scope = g.current_user.id if scoped else 'public'
+            key = (request.full_path, scope, versions)
+            if state is not None:
+                key += (state(*args, **kwargs),)
+                last_modified = None
+            etag = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+            if last_modified is not None:
+                # HTTP dates are whole seconds, round up so a client's copy never looks older than the change it holds
+                rounded = last_modified.replace(microsecond=0, tzinfo=timezone.utc)
+                last_modified = rounded + timedelta(seconds=1) if last_modified.microsecond else rounded
+            if request.if_none_match:
+                not_modified = request.if_none_match.contains(etag)
+            else:
+                since = request.if_modified_since
+                not_modified = since is not None and last_modified is not None and last_modified <= since
+            if not_modified:
+                response = current_app.response_class(status=304)
+            else:
+                body = response_cache.get(key)
+                if body is None:
+                    response = make_response(f(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.set(key, response.get_data(), tables)
+                else:
+                    response = current_app.response_class(body, mimetype='application/json')
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            return response
+
+        return decorated_function
+
+    return decorator
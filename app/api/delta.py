@@ -0,0 +1,54 @@
+import time
+
+from flask import current_app, jsonify, request
+
+from .errors import bad_request
+from .. import db
+from ..models import Trade, TradeChange
+
+
+def wants_delta():
+    return 'since' in request.args
+
+
+def poll_changes(cursor, user_filter):
+    """
+    Changes after cursor, holding the request for up to ?wait=<seconds> (capped by DELTA_SYNC_MAX_WAIT) while
+    there are none
+    """
+    config = current_app.config
+    wait = max(0.0, min(request.args.get('wait', 0, type=float), config['DELTA_SYNC_MAX_WAIT']))
+    deadline = time.monotonic() + wait
+    changes = TradeChange.since(cursor, config['DELTA_SYNC_LIMIT'], user_filter)
+    while not changes:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        # End the read transaction so the next poll sees commits made by other workers
+        db.session.rollback()
+        time.sleep(min(config['DELTA_SYNC_POLL_INTERVAL'], remaining))
+        changes = TradeChange.since(cursor, config['DELTA_SYNC_LIMIT'], user_filter)
+    return changes
+
+
+def delta_response(user_filter=None):
+    """
+    Answer ?since=<cursor> with the current state of every trade changed after the cursor and the ids of deleted
+    trades. The returned cursor goes into the next request, 'more' means the batch hit DELTA_SYNC_LIMIT.
+    """
+    cursor = request.args.get('since', type=int)
+    if cursor is None or cursor < 0:
+        return bad_request('since must be a change cursor returned by an earlier request.')
+    changes = poll_changes(cursor, user_filter)
+    last_operation = {}
+    for change in changes:
+        last_operation[change.trade_id] = change.operation
+    live_ids = [trade_id for trade_id, operation in last_operation.items() if operation != TradeChange.DELETE]
+    trades = Trade.query.filter(Trade.id.in_(live_ids)).order_by(Trade.id).all() if live_ids else []
+    return jsonify({
+        'trades': [trade.to_json() for trade in trades],
+        'deleted': [trade_id for trade_id, operation in last_operation.items()
+                    if operation == TradeChange.DELETE],
+        'cursor': changes[-1].seq if changes else cursor,
+        'more': len(changes) == current_app.config['DELTA_SYNC_LIMIT']
+    })
@@ -0,0 +1,128 @@
+import numpy as np
+from flask import current_app, jsonify, request
+
+from . import api
+from .decorators import permission_required
+from .. import db
+from ..decorators import read_only
+from ..exceptions import ValidationError
+from ..greeks import Greeks, black_scholes, years_to_expiry
+from ..lattice import american_price
+from ..models import OptionContract, OptionKind, Permission, Stock, User
+from ..portfolio_greeks import greek_book, with_tickers
+
+
+def number_array(body, name, default=None, minimum=None):
+    value = body.get(name, default)
+    if value is None:
+        raise ValidationError(name + ' is required')
+    try:
+        values = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise ValidationError(name + ' must be a number or a list of numbers')
+    if values.ndim > 1 or not np.all(np.isfinite(values)):
+        raise ValidationError(name + ' must be a number or a list of numbers')
+    if minimum is not None and np.any(values < minimum):
+        raise ValidationError('{} cannot be below {}'.format(name, minimum))
+    return values
+
+
+def call_flags(kinds):
+    kinds = np.asarray(kinds)
+    if kinds.ndim > 1 or not np.all(np.isin(kinds, OptionKind.ALL)):
+        raise ValidationError('kind must be one of ' + ', '.join(OptionKind.ALL))
+    return kinds == OptionKind.CALL
+
+
+def contract_inputs(contract_ids):
+    """Strikes, expiries, kinds and underlying marks of listed contracts, in the order of contract_ids"""
+    table = OptionContract.__table__
+    found = {}
+    for offset in range(0, len(contract_ids), 500):
+        found.update((row.id, row) for row in db.session.execute(
+            table.select().where(table.c.id.in_(contract_ids[offset:offset + 500]))))
+    missing = [contract_id for contract_id in contract_ids if contract_id not in found]
+    if missing:
+        raise ValidationError('option contracts do not exist: ' + ', '.join(str(i) for i in missing[:10]))
+    rows = [found[contract_id] for contract_id in contract_ids]
+    underlyings, positions = np.unique([row.underlying_id for row in rows], return_inverse=True)
+    return (Stock.marks(underlyings)[positions], np.array([row.strike for row in rows]),
+            years_to_expiry([row.expiry for row in rows]), call_flags([row.kind for row in rows]))
+
+
+@api.route('/greeks', methods=['POST'])
+@read_only
+def get_greeks():
+    """
+    Batch Black-Scholes Greeks. Either 'contracts', a list of option contract ids priced off their underlying's
+    last quote, or arrays of 'spot', 'strike' and 'years' or 'expiry' dates with an optional 'kind'.
+    'vol' is required, 'rate' and 'dividend' are optional. Scalars broadcast against the lists.
+    With 'style' 'american' the price comes from the binomial lattice and 'early_exercise' gives its premium over
+    the European price, the Greeks stay Black-Scholes. Such requests are capped at LATTICE_MAX_BATCH options instead
+    of GREEKS_MAX_BATCH.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        raise ValidationError('expected a JSON object')
+    style = body.get('style', 'european')
+    if style not in ('european', 'american'):
+        raise ValidationError('style must be european or american')
+    # Lattice prices cost far more memory and time per option than the closed form
+    limit = current_app.config['LATTICE_MAX_BATCH' if style == 'american' else 'GREEKS_MAX_BATCH']
+    contract_ids = body.get('contracts')
+    if contract_ids is not None:
+        if not isinstance(contract_ids, list) or not all(isinstance(i, int) and not isinstance(i, bool)
+                                                         for i in contract_ids):
+            raise ValidationError('contracts must be a list of option contract ids')
+        if len(contract_ids) > limit:
+            raise ValidationError('at most {} {} contracts per request'.format(limit, style))
+        spot, strike, years, call = contract_inputs(contract_ids)
+        if 'spot' in body:
+            spot = number_array(body, 'spot', minimum=0)
+        if np.any(np.isnan(spot)):
+            raise ValidationError('an underlying has no price, give a spot')
+    else:
+        spot = number_array(body, 'spot', minimum=0)
+        strike = number_array(body, 'strike')
+        if np.any(strike <= 0):
+            raise ValidationError('strike must be positive')
+        if 'expiry' in body:
+            try:
+                years = years_to_expiry(body['expiry'])
+            except (TypeError, ValueError):
+                raise ValidationError('expiry must be an ISO date or a list of them')
+        else:
+            years = number_array(body, 'years', minimum=0)
+        call = call_flags(body.get('kind', OptionKind.CALL))
+    vol = number_array(body, 'vol', minimum=0)
+    rate = number_array(body, 'rate', current_app.config['RISK_FREE_RATE'])
+    dividend = number_array(body, 'dividend', 0.0)
+    try:
+        shape = np.broadcast_shapes(*(np.shape(values) for values in (spot, strike, years, call, vol, rate,
+                                                                      dividend)))
+    except ValueError:
+        raise ValidationError('lists must all have the same length')
+    if np.prod(shape, dtype=np.int64) > limit:
+        raise ValidationError('at most {} {} options per request'.format(limit, style))
+    greeks = black_scholes(spot, strike, years, rate, dividend, vol, call)
+    result = {name: np.broadcast_to(values, shape).tolist() for name, values in zip(Greeks._fields, greeks)}
+    if style == 'american':
+        american = american_price(spot, strike, years, rate, dividend, vol, call, current_app.config['LATTICE_STEPS'])
+        result['price'] = np.broadcast_to(american.price, shape).tolist()
+        result['early_exercise'] = np.broadcast_to(american.premium, shape).tolist()
+    result['count'] = int(np.prod(shape, dtype=np.int64))
+    return jsonify(result)
+
+
+@api.route('/users/<username>/greeks')
+@read_only
+def get_user_greeks(username):
+    user = User.find_by_username_or_404(username=username)
+    return jsonify(with_tickers(greek_book.user_greeks(user.id)))
+
+
+@api.route('/greeks/firm')
+@permission_required(Permission.ADMIN)
+@read_only
+def get_firm_greeks():
+    return jsonify(with_tickers(greek_book.firm_greeks()))
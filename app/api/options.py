@@ -0,0 +1,75 @@
+from datetime import date
+
+from flask import abort, g, jsonify, request, url_for
+
+from . import api
+from .decorators import conditional, permission_required
+from .errors import bad_request
+from .. import db
+from ..database import write_with_retry
+from ..decorators import read_only
+from ..models import OptionContract, OptionKind, OptionTrade, Permission, Stock
+from ..vol_surface import vol_surfaces
+
+
+@api.route('/stocks/<ticker>/options')
+@read_only
+@conditional('option_contracts', 'stocks')
+def get_option_chain(ticker):
+    stock = Stock.query.filter_by(ticker=ticker).first()
+    if stock is None:
+        abort(404)
+    expiry = request.args.get('expiry')
+    if expiry is not None:
+        try:
+            expiry = date.fromisoformat(expiry)
+        except ValueError:
+            return bad_request('expiry must be an ISO date.')
+    kind = request.args.get('kind')
+    if kind is not None and kind not in OptionKind.ALL:
+        return bad_request('kind must be one of ' + ', '.join(OptionKind.ALL) + '.')
+    contracts = OptionContract.chain(stock.id, expiry, kind).all()
+    return jsonify({
+        'underlying': stock.ticker,
+        'expiries': [day.isoformat() for day in OptionContract.expiries(stock.id)],
+        'contracts': [contract.to_json() for contract in contracts],
+        'count': len(contracts)
+    })
+
+
+@api.route('/stocks/<ticker>/volsurface')
+@read_only
+def get_vol_surface(ticker):
+    """Fitted SVI slice per expiry and the surface's vol grid, rows by years and columns by log-moneyness"""
+    stock = Stock.query.filter_by(ticker=ticker).first()
+    if stock is None:
+        abort(404)
+    surface = vol_surfaces.surface(stock.id)
+    if surface is None:
+        abort(404)
+    return jsonify(dict(surface.to_json(), underlying=stock.ticker))
+
+
+@api.route('/options/<int:contract_id>')
+@read_only
+@conditional('option_contracts', 'stocks')
+def get_option_contract(contract_id):
+    contract = OptionContract.query.get_or_404(contract_id)
+    return jsonify(contract.to_json())
+
+
+@api.route('/option-trades/<int:trade_id>')
+@read_only
+@conditional('option_trades', 'option_contracts', 'stocks', 'users')
+def get_option_trade(trade_id):
+    trade = OptionTrade.query.get_or_404(trade_id)
+    return jsonify(trade.to_json())
+
+
+@api.route('/option-trades/', methods=['POST'])
+@permission_required(Permission.WRITE)
+def new_option_trade():
+    trade = OptionTrade.from_json(request.json, g.current_user)
+    write_with_retry(lambda: db.session.add(trade))
+    return jsonify(trade.to_json()), 201, \
+        {'Location': url_for('api.get_option_trade', trade_id=trade.id)}
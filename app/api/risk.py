@@ -0,0 +1,54 @@
+import math
+
+from flask import current_app, jsonify, request
+
+from . import api
+from .decorators import permission_required
+from .. import db
+from ..decorators import read_only
+from ..exceptions import ValidationError
+from ..models import Permission, Stock, User
+from ..scenarios import GROUPS, run
+
+
+def shock_list(name, above=None):
+    """Sorted distinct shocks of a query argument, None when it is absent; above is an exclusive lower bound"""
+    value = request.args.get(name)
+    if value is None:
+        return None
+    try:
+        shocks = sorted({float(shock) for shock in value.split(',')})
+    except ValueError:
+        raise ValidationError(name + ' must be a comma separated list of numbers')
+    if not all(math.isfinite(shock) for shock in shocks):
+        raise ValidationError(name + ' must be finite')
+    if above is not None and shocks[0] <= above:
+        raise ValidationError('{} must be above {}'.format(name, above))
+    if len(shocks) > current_app.config['SCENARIO_MAX_POINTS']:
+        raise ValidationError('at most {} {}'.format(current_app.config['SCENARIO_MAX_POINTS'], name))
+    return shocks
+
+
+@api.route('/risk/scenarios')
+@permission_required(Permission.ADMIN)
+@read_only
+def get_scenarios():
+    """
+    Firm-wide scenario P&L by 'user' or 'underlying'. 'spot_shocks' (relative moves) and 'vol_shocks' (absolute vol
+    moves) override the configured grid. Each matrix has a row per spot shock and a column per vol shock.
+    """
+    by = request.args.get('by', 'user')
+    if by not in GROUPS:
+        raise ValidationError('by must be one of ' + ', '.join(GROUPS))
+    # A spot shock of -1 or below takes the underlying to zero or a negative price
+    grid = run(by, shock_list('spot_shocks', above=-1), shock_list('vol_shocks'))
+    keys = grid.keys.tolist()
+    if by == 'user':
+        names = dict(db.session.query(User.id, User.username).filter(User.id.in_(keys))) if keys else {}
+    else:
+        names = dict(db.session.query(Stock.id, Stock.ticker).filter(Stock.id.in_(keys))) if keys else {}
+    label = 'username' if by == 'user' else 'stock'
+    entries = sorted(({label: names.get(key), 'pnl': pnl} for key, pnl in zip(keys, grid.pnl.tolist())),
+                     key=lambda entry: entry[label] or '')
+    return jsonify({'by': by, 'spot_shocks': grid.spot_shocks.tolist(), 'vol_shocks': grid.vol_shocks.tolist(),
+                    'total': grid.total.tolist(), 'unpriced': grid.unpriced, by + 's': entries})
@@ -1,13 +1,19 @@
+import numpy as np
 from flask import abort, jsonify, request, url_for, current_app
 
 from . import api
-from .decorators import permission_required
+from .decorators import conditional, permission_required
+from .errors import bad_request
 from .. import db
+from ..decorators import read_only
 from ..exceptions import ValidationError
-from ..models import Stock, Permission
+from ..models import Stock, StockStatistic, Permission
+from ..price_store import price_store, to_epoch_seconds
 
 
 @api.route('/stocks/')
+@read_only
+@conditional('stocks')
 def get_stocks():
     page = request.args.get('page', 1, type=int)
     pagination = Stock.query.paginate(page, per_page=current_app.config['STOCKS_PER_PAGE'], error_out=False)
@@ -27,6 +33,8 @@ def get_stocks():
 
 
 @api.route('/stocks/<ticker>')
+@read_only
+@conditional('stocks')
 def get_stock(ticker):
     stock = Stock.query.filter_by(ticker=ticker).first()
     if stock is None:
@@ -34,6 +42,82 @@ def get_stock(ticker):
     return jsonify(stock.to_json())
 
 
+@api.route('/stocks/<ticker>/prices')
+@read_only
+def get_stock_prices(ticker):
+    stock = Stock.query.filter_by(ticker=ticker).first()
+    if stock is None:
+        abort(404)
+    bounds = []
+    for name in ('from', 'to'):
+        value = request.args.get(name)
+        try:
+            bounds.append(None if value is None else to_epoch_seconds([value]).astype('datetime64[s]')[0])
+        except ValueError:
+            return bad_request('{} must be an ISO date or date-time.'.format(name))
+    try:
+        prices = price_store.read(stock.ticker, *bounds)
+    except ValueError:
+        return bad_request('{!r} is not a ticker prices can be stored under.'.format(stock.ticker))
+    limit = current_app.config['PRICES_PER_REQUEST']
+    # Newest rows win when the range holds more than one response's worth, 'more' tells the client to narrow it
+    rows = slice(max(len(prices) - limit, 0), None)
+    return jsonify({
+        'ticker': stock.ticker,
+        'timestamp': np.datetime_as_string(prices['timestamp'][rows], unit='s').tolist(),
+        'open': prices['open'][rows].tolist(),
+        'high': prices['high'][rows].tolist(),
+        'low': prices['low'][rows].tolist(),
+        'close': prices['close'][rows].tolist(),
+        'volume': prices['volume'][rows].tolist(),
+        'more': len(prices) > limit
+    })
+
+
+@api.route('/stocks/<ticker>/statistics')
+@read_only
+@conditional('stock_statistics')
+def get_stock_statistics(ticker):
+    stock = Stock.query.filter_by(ticker=ticker).first()
+    if stock is None:
+        abort(404)
+    return jsonify({
+        'ticker': stock.ticker,
+        'statistics': [statistic.to_json() for statistic in StockStatistic.for_stock(stock.id)]
+    })
+
+
+@api.route('/stocks/screen')
+@read_only
+@conditional('stock_statistics')
+def screen_stocks():
+    """Stocks whose statistics over one window fall within min_<field> and max_<field> bounds"""
+    window = request.args.get('window', current_app.config['STATISTICS_WINDOWS'][0], type=int)
+    sort = request.args.get('sort', 'realized_vol')
+    if sort not in StockStatistic.FIELDS:
+        return bad_request('sort must be one of {}.'.format(', '.join(StockStatistic.FIELDS)))
+    query = StockStatistic.query.filter_by(window=window).join(StockStatistic.stock)
+    for field in StockStatistic.FIELDS:
+        for bound, compare in (('min_', '__ge__'), ('max_', '__le__')):
+            value = request.args.get(bound + field)
+            if value is None:
+                continue
+            try:
+                query = query.filter(getattr(getattr(StockStatistic, field), compare)(float(value)))
+            except ValueError:
+                return bad_request('{} must be a number.'.format(bound + field))
+    column = getattr(StockStatistic, sort)
+    query = query.order_by(column.asc() if request.args.get('order') == 'asc' else column.desc(), Stock.ticker)
+    limit = max(min(request.args.get('limit', int(current_app.config['STOCKS_PER_PAGE']), type=int),
+                    current_app.config['PRICES_PER_REQUEST']), 1)
+    return jsonify({
+        'window': window,
+        'stocks': [dict(statistic.to_json(), ticker=statistic.stock.ticker,
+                        url=url_for('api.get_stock', ticker=statistic.stock.ticker))
+                   for statistic in query.limit(limit)]
+    })
+
+
 @api.route('/stocks/', methods=['POST'])
 @permission_required(Permission.ADMIN)
 def new_stock():
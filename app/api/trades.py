@@ -1,14 +1,22 @@
 from flask import jsonify, request, g, url_for, current_app
 
 from . import api
-from .decorators import permission_required
+from .decorators import conditional, permission_required
+from .delta import delta_response, wants_delta
 from .errors import forbidden
 from .. import db
-from ..models import Stock, Trade, Permission
+from ..database import write_with_retry
+from ..decorators import read_only
+from ..models import Stock, Trade, TradeChange, Permission
 
 
 @api.route('/trades/')
+@read_only
 def get_trades():
+    if wants_delta():
+        return delta_response()
+    # Read the cursor before the page so a trade committed in between is replayed rather than skipped
+    cursor = TradeChange.current_cursor()
     page = request.args.get('page', 1, type=int)
     pagination = Trade.query.paginate(
         page, per_page=current_app.config['TRADES_PER_PAGE'],
@@ -24,11 +32,14 @@ def get_trades():
         'trades': [trade.to_json() for trade in trades],
         'prev': prev,
         'next': next_page,
-        'count': pagination.total
+        'count': pagination.total,
+        'cursor': cursor
     })
 
 
 @api.route('/trades/<int:trade_id>')
+@read_only
+@conditional('trades', 'stocks', 'users')
 def get_trade(trade_id):
     trade = Trade.query.get_or_404(trade_id)
     return jsonify(trade.to_json())
@@ -39,8 +50,7 @@ def get_trade(trade_id):
 def new_trade():
     trade = Trade.from_json(request.json)
     trade.author = g.current_user
-    db.session.add(trade)
-    db.session.commit()
+    write_with_retry(lambda: db.session.add(trade))
     return jsonify(trade.to_json()), 201, \
         {'Location': url_for('api.get_trade', trade_id=trade.id)}
 
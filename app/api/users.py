@@ -1,17 +1,33 @@
+from datetime import datetime
+
+import numpy as np
 from flask import abort, g, jsonify, request, current_app, url_for
 
 from . import api
+from .decorators import conditional
+from .delta import delta_response, wants_delta
+from .errors import bad_request
+from .. import db
+from ..correlation import correlation_store
+from ..decorators import read_only
 from ..exceptions import ValidationError
-from ..models import User, Stock, Trade, Watch
+from ..performance import downsample
+from ..price_store import price_store
+from ..quote_cache import quote_cache
+from ..models import Alert, EquityCurve, Follow, PortfolioValuation, Position, RealizedPnl, User, Stock, Trade, \
+    TradeChange, ValueAtRisk, Watch
 
 
 @api.route('/users/<username>')
+@read_only
+@conditional('users', 'users.last_seen', 'trades')
 def get_user(username):
     user = User.find_by_username_or_404(username=username)
     return jsonify(user.to_json())
 
 
 @api.route('/users/<username>/trades/')
+@read_only
 def get_user_trades(username):
     user = User.find_by_username_or_404(username=username)
     page = request.args.get('page', 1, type=int)
@@ -34,10 +50,16 @@ def get_user_trades(username):
 
 
 @api.route('/users/<username>/timeline/')
+@read_only
 def get_user_followed_trades(username):
     user = User.find_by_username_or_404(username=username)
     if g.current_user is not user:
         abort(403)
+    if wants_delta():
+        followed_ids = db.session.query(Follow.followed_id).filter(Follow.follower_id == user.id)
+        return delta_response(user_filter=TradeChange.user_id.in_(followed_ids))
+    # Read the cursor before the page so a trade committed in between is replayed rather than skipped
+    cursor = TradeChange.current_cursor()
     page = request.args.get('page', 1, type=int)
     pagination = user.followed_trades.order_by(Trade.timestamp.desc()).paginate(
         page, per_page=current_app.config['TRADES_PER_PAGE'],
@@ -53,6 +75,138 @@ def get_user_followed_trades(username):
         'trades': [trade.to_json() for trade in trades],
         'prev': prev,
         'next': next_page,
+        'count': pagination.total,
+        'cursor': cursor
+    })
+
+
+@api.route('/users/<username>/positions/')
+@read_only
+@conditional('trades', 'stocks')
+def get_user_positions(username):
+    user = User.find_by_username_or_404(username=username)
+    positions = Position.load_costs(user.positions.order_by(Position.stock_id).all())
+    return jsonify({
+        'positions': [position.to_json() for position in positions],
+        'count': len(positions)
+    })
+
+
+@api.route('/users/<username>/pnl/')
+@read_only
+@conditional('trades', 'stocks')
+def get_user_pnl(username):
+    user = User.find_by_username_or_404(username=username)
+    stocks = [dict(entry, stock=entry['stock'].ticker) for entry in RealizedPnl.summary(user)]
+    return jsonify({
+        'stocks': stocks,
+        'realized': sum(entry['realized'] for entry in stocks),
+        'unrealized': sum(entry['unrealized'] or 0.0 for entry in stocks),
+        'realized_url': url_for('api.get_user_realized_pnl', username=username)
+    })
+
+
+@api.route('/users/<username>/valuation/')
+@read_only
+@conditional('portfolio_valuations')
+def get_user_valuation(username):
+    user = User.find_by_username_or_404(username=username)
+    valuation = PortfolioValuation.latest(user)
+    if valuation is None:
+        abort(404)
+    return jsonify(valuation.to_json())
+
+
+@api.route('/users/<username>/var/')
+@read_only
+@conditional('value_at_risk')
+def get_user_value_at_risk(username):
+    user = User.find_by_username_or_404(username=username)
+    result = ValueAtRisk.query.get(user.id)
+    if result is None:
+        abort(404)
+    return jsonify(result.to_json())
+
+
+def finite_or_none(values):
+    """Nested lists of values with NaN as None, JSON has no NaN"""
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+@api.route('/users/<username>/correlation/')
+@read_only
+def get_user_correlation(username):
+    """Correlations and covariances of the stocks of a user's positions, or of their watchlist with of=watchlist"""
+    user = User.find_by_username_or_404(username=username)
+    of = request.args.get('of', 'positions')
+    if of == 'watchlist':
+        if g.current_user is not user:
+            abort(403)
+        stock_ids = sorted(Watch.stock_ids(user))
+    elif of == 'positions':
+        stock_ids = [row[0] for row in db.session.query(Position.stock_id).filter(
+            Position.user_id == user.id, Position.quantity != 0).order_by(Position.stock_id)]
+    else:
+        return bad_request('of must be positions or watchlist.')
+    matrix = correlation_store.submatrix(stock_ids)
+    if matrix is None:
+        abort(404)
+    tickers = dict(db.session.query(Stock.id, Stock.ticker).filter(Stock.id.in_(stock_ids))) if stock_ids else {}
+    off_diagonal = matrix.correlation[~np.eye(len(stock_ids), dtype=bool)]
+    off_diagonal = off_diagonal[~np.isnan(off_diagonal)]
+    return jsonify({
+        'as_of': matrix.as_of.isoformat(),
+        'of': of,
+        'stocks': [tickers[stock_id] for stock_id in stock_ids],
+        'vol': finite_or_none(matrix.vol),
+        'correlation': finite_or_none(matrix.correlation),
+        'covariance': finite_or_none(matrix.covariance),
+        'average_correlation': float(off_diagonal.mean()) if len(off_diagonal) else None
+    })
+
+
+@api.route('/users/<username>/performance/')
+@read_only
+@conditional('equity_curve')
+def get_user_performance(username):
+    user = User.find_by_username_or_404(username=username)
+    try:
+        start, end = (datetime.strptime(request.args[name], '%Y-%m-%d').date() if request.args.get(name) else None
+                      for name in ('from', 'to'))
+    except ValueError:
+        return bad_request('from and to must be dates formatted as YYYY-MM-DD.')
+    points = request.args.get('points', current_app.config['PERFORMANCE_MAX_POINTS'], type=int)
+    points = max(1, min(points, current_app.config['PERFORMANCE_MAX_POINTS']))
+    days, equity, cash_flow, returns = EquityCurve.series(user, start, end)
+    ends, equity, cash_flow, returns = downsample(np.array(equity), np.array(cash_flow), np.array(returns), points)
+    return jsonify({
+        'series': [{'day': days[last].isoformat(), 'equity': value, 'cash_flow': flow, 'return': change}
+                   for last, value, flow, change in zip(ends.tolist(), equity.tolist(), cash_flow.tolist(),
+                                                       returns.tolist())],
+        'total_return': float(np.prod(1.0 + returns) - 1.0),
+        'count': len(days)
+    })
+
+
+@api.route('/users/<username>/pnl/realized/')
+@read_only
+def get_user_realized_pnl(username):
+    user = User.find_by_username_or_404(username=username)
+    page = request.args.get('page', 1, type=int)
+    pagination = RealizedPnl.query.filter_by(user_id=user.id) \
+        .order_by(RealizedPnl.timestamp.desc(), RealizedPnl.id.desc()).paginate(
+            page, per_page=current_app.config['TRADES_PER_PAGE'],
+            error_out=False)
+    prev = None
+    if pagination.has_prev:
+        prev = url_for('api.get_user_realized_pnl', username=username, page=page - 1)
+    next_page = None
+    if pagination.has_next:
+        next_page = url_for('api.get_user_realized_pnl', username=username, page=page + 1)
+    return jsonify({
+        'realized': [record.to_json() for record in pagination.items],
+        'prev': prev,
+        'next': next_page,
         'count': pagination.total
     })
 
@@ -89,6 +243,7 @@ def user_unwatch_stock(username, ticker):
 
 
 @api.route('/users/<username>/watchlist/')
+@read_only
 def get_user_watched_stocks(username):
     user = User.find_by_username_or_404(username=username)
     if g.current_user is not user:
@@ -110,3 +265,80 @@ def get_user_watched_stocks(username):
         'next': next_page,
         'count': pagination.total
     }), 200
+
+
+def watchlist_quote_state(username):
+    """
+    The day, the quote cache versions and the price store versions of the watched stocks, what a quote board
+    changes with between commits
+    """
+    user = User.find_by_username_or_404(username=username)
+    stocks = db.session.query(Stock.id, Stock.ticker).join(Watch, Watch.stock_id == Stock.id) \
+        .filter(Watch.user_id == user.id).order_by(Stock.id).all()
+    return datetime.utcnow().date().isoformat(), \
+        quote_cache.versions([stock_id for stock_id, _ in stocks]).tobytes(), \
+        tuple(price_store.version(ticker) for _, ticker in stocks)
+
+
+@api.route('/users/<username>/watchlist/quotes')
+@read_only
+@conditional('watches', 'stocks', scoped=True, state=watchlist_quote_state)
+def get_user_watchlist_quotes(username):
+    user = User.find_by_username_or_404(username=username)
+    if g.current_user is not user:
+        abort(403)
+    board = Watch.board(user)
+    for entry in board:
+        del entry['photo_filename']
+        entry['url'] = url_for('api.get_stock', ticker=entry['ticker'])
+    return jsonify({
+        'stocks': board,
+        'count': len(board)
+    })
+
+
+@api.route('/users/<username>/alerts/')
+@read_only
+def get_user_alerts(username):
+    user = User.find_by_username_or_404(username=username)
+    if g.current_user is not user:
+        abort(403)
+    page = request.args.get('page', 1, type=int)
+    pagination = user.alerts.order_by(Alert.created_at.desc(), Alert.id.desc()).paginate(
+        page, per_page=current_app.config['ALERTS_PER_PAGE'],
+        error_out=False)
+    prev = None
+    if pagination.has_prev:
+        prev = url_for('api.get_user_alerts', username=username, page=page - 1)
+    next_page = None
+    if pagination.has_next:
+        next_page = url_for('api.get_user_alerts', username=username, page=page + 1)
+    return jsonify({
+        'alerts': [alert.to_json() for alert in pagination.items],
+        'prev': prev,
+        'next': next_page,
+        'count': pagination.total
+    })
+
+
+@api.route('/users/<username>/alerts/', methods=['POST'])
+def new_user_alert(username):
+    user = User.find_by_username_or_404(username=username)
+    if g.current_user is not user:
+        abort(403)
+    alert = Alert.from_json(request.json or {}, user)
+    db.session.add(alert)
+    db.session.commit()
+    return jsonify(alert.to_json()), 201, {'Location': url_for('api.cancel_alert', alert_id=alert.id)}
+
+
+@api.route('/alerts/<int:alert_id>', methods=['DELETE'])
+def cancel_alert(alert_id):
+    alert = Alert.query.get_or_404(alert_id)
+    if g.current_user != alert.user:
+        abort(403)
+    if not alert.active:
+        raise ValidationError('alert is no longer active')
+    alert.cancelled_at = datetime.utcnow()
+    db.session.commit()
+    return {}, 204
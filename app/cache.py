@@ -0,0 +1,51 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+class ResponseCache:
+    """
+    Per-process LRU of serialized response bodies.
+    Keys carry the data versions the body was built from, so an entry can never be served after a commit in any
+    worker bumped one of its tables. Local commits also evict their entries right away to free the memory.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.max_entries = app.config['RESPONSE_CACHE_SIZE']
+        self.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, body, tables):
+        with self._lock:
+            self._entries[key] = (body, frozenset(tables))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, tables):
+        tables = set(tables)
+        with self._lock:
+            stale = [key for key, (body, depends_on) in self._entries.items() if depends_on & tables]
+            for key in stale:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+response_cache = ResponseCache()
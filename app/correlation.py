@@ -0,0 +1,181 @@
+"""
+Correlation matrix of the daily returns of every stock, for portfolio risk and diversification views.
+Returns come from the daily closes of the price store over a lookback window. Each stock's returns are standardized
+with its own mean and vol, a pair's correlation is the mean product of the standardized returns over the days both
+have, and the off-diagonal is shrunk towards zero, which is shrinking the covariance towards its diagonal. The
+matrix is filled in square blocks of stocks, so memory holds the returns and one block at a time whatever the size
+of the universe. It is saved as a float32 .npy file indexed by stock id on both axes, next to the annualized vols,
+and read back as a memory map: any watchlist or portfolio's sub-matrix is a gather of its rows, the covariance the
+correlation scaled by the vols. Every run writes a new generation directory and then swaps the manifest that names
+it, so readers never see a half-written matrix; the generation it replaced is kept until the next run for readers
+that read the old manifest.
+"""
+import json
+import os
+import re
+import shutil
+import tempfile
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from threading import Lock
+
+import numpy as np
+from flask import current_app
+
+from . import db
+from .models import Stock
+from .value_at_risk import daily_closes
+
+TRADING_DAYS = 252
+MANIFEST = 'manifest.json'
+# Generation directory names, '<as_of>-<UTC write time to the microsecond>'
+GENERATION = re.compile(r'\d{4}-\d{2}-\d{2}-\d{20}$')
+
+CorrelationMatrix = namedtuple('CorrelationMatrix', ['stock_ids', 'vol', 'correlation', 'covariance', 'as_of'])
+Generation = namedtuple('Generation', ['name', 'as_of', 'correlation', 'vol'])
+
+
+def standardized_returns(closes, min_days):
+    """
+    Daily log returns scaled to zero mean and unit variance per column, missing returns as zeros
+    :param closes: (days, stocks) closes, NaN before a stock's first price
+    :return: (standardized, observed mask as float64, annualized vol with NaN for stocks without min_days returns)
+    """
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = np.diff(np.log(closes), axis=0)
+    observed = ~np.isnan(returns)
+    count = observed.sum(axis=0)
+    mean = np.where(count > 0, np.nansum(returns, axis=0) / np.maximum(count, 1), 0.0)
+    centred = np.where(observed, returns - mean, 0.0)
+    std = np.sqrt((centred * centred).sum(axis=0) / np.maximum(count - 1, 1))
+    valid = (count >= max(min_days, 2)) & (std > 0)
+    standardized = np.where(valid, centred / np.where(valid, std, 1.0), 0.0)
+    vol = np.where(valid, std * np.sqrt(TRADING_DAYS), np.nan)
+    return standardized, observed.astype(np.float64), vol
+
+
+def correlation_block(standardized, observed, rows, columns, shrinkage):
+    """Shrunk correlations between the stocks at positions rows and those at columns"""
+    pairs = observed[:, rows].T @ observed[:, columns]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        block = standardized[:, rows].T @ standardized[:, columns] / (pairs - 1.0)
+    block = np.where(pairs > 1, np.clip(block, -1.0, 1.0) * (1.0 - shrinkage), np.nan)
+    block[rows[:, None] == columns[None, :]] = 1.0
+    return block
+
+
+class CorrelationStore:
+    def __init__(self, root=None):
+        self.root = root
+        self._current = None
+        self._lock = Lock()
+
+    def init_app(self, app):
+        self.root = app.config['CORRELATION_DIR']
+        with self._lock:
+            self._current = None
+
+    def write(self, stock_ids, closes, as_of, shrinkage=0.1, min_days=60, block_stocks=1024):
+        """
+        Compute and publish the matrix of one universe
+        :param stock_ids: id of each column of closes
+        :param closes: (days, stocks) daily closes, NaN before a stock's first price
+        :return: number of stocks with a vol
+        """
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        size = int(stock_ids.max()) + 1 if len(stock_ids) else 0
+        standardized, observed, vol = standardized_returns(np.asarray(closes, dtype=np.float64), min_days)
+        valid = np.flatnonzero(~np.isnan(vol))
+        os.makedirs(self.root, exist_ok=True)
+        name = '{}-{}'.format(as_of.isoformat(), datetime.utcnow().strftime('%Y%m%d%H%M%S%f'))
+        directory = os.path.join(self.root, name)
+        os.makedirs(directory)
+        vols = np.full(size, np.nan, dtype=np.float32)
+        vols[stock_ids] = vol
+        np.save(os.path.join(directory, 'vol.npy'), vols)
+        matrix = np.lib.format.open_memmap(os.path.join(directory, 'correlation.npy'), mode='w+',
+                                           dtype=np.float32, shape=(size, size))
+        for start in range(0, size, block_stocks):
+            matrix[start:start + block_stocks] = np.nan
+        # Upper triangle blocks, each also written transposed below the diagonal
+        for first in range(0, len(valid), block_stocks):
+            rows = valid[first:first + block_stocks]
+            for second in range(first, len(valid), block_stocks):
+                columns = valid[second:second + block_stocks]
+                block = correlation_block(standardized, observed, rows, columns, shrinkage).astype(np.float32)
+                matrix[np.ix_(stock_ids[rows], stock_ids[columns])] = block
+                matrix[np.ix_(stock_ids[columns], stock_ids[rows])] = block.T
+        matrix.flush()
+        del matrix
+        self._publish(name, as_of)
+        return len(valid)
+
+    def published(self):
+        """The manifest, {'generation': name, 'as_of': ISO day}, None before the first run"""
+        try:
+            with open(os.path.join(self.root, MANIFEST)) as manifest:
+                return json.load(manifest)
+        except FileNotFoundError:
+            return None
+
+    def _publish(self, name, as_of):
+        previous = self.published()
+        handle, path = tempfile.mkstemp(dir=self.root, suffix='.json')
+        with os.fdopen(handle, 'w') as manifest:
+            json.dump({'generation': name, 'as_of': as_of.isoformat()}, manifest)
+        os.replace(path, os.path.join(self.root, MANIFEST))
+        # A reader may have read the previous manifest and not opened its files yet, so that generation stays until
+        # the next run; readers still mapping an older one keep their open files
+        keep = {name, previous['generation'] if previous else None}
+        for entry in os.listdir(self.root):
+            if GENERATION.match(entry) and entry not in keep and os.path.isdir(os.path.join(self.root, entry)):
+                shutil.rmtree(os.path.join(self.root, entry), ignore_errors=True)
+
+    def current(self):
+        """The published Generation, mapped once per generation; None before the first run"""
+        published = self.published()
+        if published is None:
+            return None
+        with self._lock:
+            if self._current is None or self._current.name != published['generation']:
+                directory = os.path.join(self.root, published['generation'])
+                self._current = Generation(published['generation'], date.fromisoformat(published['as_of']),
+                                           np.load(os.path.join(directory, 'correlation.npy'), mmap_mode='r'),
+                                           np.load(os.path.join(directory, 'vol.npy')))
+            return self._current
+
+    def submatrix(self, stock_ids):
+        """
+        Correlations, covariances and vols of some stocks, NaN for stocks without enough history
+        :return: CorrelationMatrix of float64 arrays in the order of stock_ids, None before the first run
+        """
+        generation = self.current()
+        if generation is None:
+            return None
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        known = np.flatnonzero(stock_ids < len(generation.vol))
+        vol = np.full(len(stock_ids), np.nan)
+        vol[known] = generation.vol[stock_ids[known]]
+        correlation = np.full((len(stock_ids), len(stock_ids)), np.nan)
+        correlation[np.ix_(known, known)] = generation.correlation[np.ix_(stock_ids[known], stock_ids[known])]
+        return CorrelationMatrix(stock_ids, vol, correlation, correlation * np.outer(vol, vol), generation.as_of)
+
+
+correlation_store = CorrelationStore()
+
+
+def run(as_of=None, lookback=None):
+    """
+    Recompute the matrix of every stock
+    :param as_of: day of the last close included, defaults to yesterday (UTC)
+    :param lookback: days of returns, defaults to CORRELATION_LOOKBACK_DAYS
+    :return: number of stocks with enough history
+    """
+    config = current_app.config
+    as_of = as_of or datetime.utcnow().date() - timedelta(days=1)
+    stocks = db.session.query(Stock.id, Stock.ticker).order_by(Stock.id).all()
+    _, closes = daily_closes([ticker for _, ticker in stocks], as_of + timedelta(days=1),
+                             lookback or config['CORRELATION_LOOKBACK_DAYS'])
+    return correlation_store.write([stock_id for stock_id, _ in stocks], closes, as_of,
+                                   shrinkage=config['CORRELATION_SHRINKAGE'], min_days=config['CORRELATION_MIN_DAYS'],
+                                   block_stocks=config['CORRELATION_BLOCK_STOCKS'])
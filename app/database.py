@@ -0,0 +1,168 @@
+import random
+import time
+from contextlib import contextmanager
+from functools import partial
+
+from flask import current_app, g, has_request_context, session as cookie_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession
+from sqlalchemy import event, orm
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import Select
+
+LOCK_ERRORS = ('database is locked', 'database table is locked', 'database is busy')
+REPLICA_BIND_PREFIX = 'replica'
+PRIMARY_UNTIL = '_primary_until'
+REPLICA = '_replica'
+
+
+def set_sqlite_pragmas(dbapi_connection, connection_record, pragmas):
+    """Connect event handler, SQLite pragmas are per connection so every pooled connection needs them"""
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute('PRAGMA {}={}'.format(name, value))
+    cursor.close()
+
+
+def primary_window_open():
+    """True while the current client is inside the read-your-writes window that follows one of its commits"""
+    if not has_request_context():
+        return False
+    until = g.get(PRIMARY_UNTIL) or cookie_session.get(PRIMARY_UNTIL)
+    return until is not None and until > time.time()
+
+
+def open_primary_window(app):
+    if not has_request_context():
+        return
+    until = time.time() + app.config['READ_YOUR_WRITES_SECONDS']
+    setattr(g, PRIMARY_UNTIL, until)
+    cookie_session[PRIMARY_UNTIL] = until
+
+
+class RoutingSession(SignallingSession):
+    """
+    Session that sends SELECTs issued while marked read-only to a replica bind, picked at random once per request
+    (or per session outside requests) so every read of a request sees the same replica lag.
+    Flushes, non-SELECT statements, anything after a write in the current transaction and anything inside the
+    client's read-your-writes window go to the primary.
+    """
+
+    def __init__(self, db, **options):
+        super(RoutingSession, self).__init__(db, **options)
+        self.db = db
+        event.listen(self, 'after_flush', self._record_write)
+        event.listen(self, 'after_commit', self._end_transaction)
+        event.listen(self, 'after_rollback', self._forget_write)
+
+    def get_bind(self, mapper=None, clause=None):
+        if self.routes_to_replica(clause):
+            replicas = self.db.get_replica_binds(self.app)
+            if replicas:
+                return self.db.get_engine(self.app, bind=self.pick_replica(replicas))
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+    def pick_replica(self, replicas):
+        in_request = has_request_context()
+        replica = g.get(REPLICA) if in_request else self.info.get(REPLICA)
+        if replica not in replicas:
+            replica = random.choice(replicas)
+            if in_request:
+                setattr(g, REPLICA, replica)
+            else:
+                self.info[REPLICA] = replica
+        return replica
+
+    def routes_to_replica(self, clause):
+        if not self.info.get('read_only') or self._flushing or self.info.get('wrote'):
+            return False
+        if clause is not None and not isinstance(clause, Select):
+            return False
+        return not primary_window_open()
+
+    @staticmethod
+    def _record_write(session, flush_context):
+        session.info['wrote'] = True
+
+    @staticmethod
+    def _end_transaction(session):
+        wrote = session.info.pop('wrote', False)
+        sticky = session.info.pop('sticky', True)
+        if wrote and sticky:
+            open_primary_window(session.app)
+
+    @staticmethod
+    def _forget_write(session):
+        session.info.pop('wrote', None)
+        session.info.pop('sticky', None)
+
+
+class Database(SQLAlchemy):
+    """
+    Flask-SQLAlchemy extension that applies the SQLITE_PRAGMAS profile from the app config to every connection
+    opened by a SQLite engine and routes read-only queries to the replica binds
+    """
+
+    def create_engine(self, sa_url, engine_opts):
+        engine = super(Database, self).create_engine(sa_url, engine_opts)
+        pragmas = self.get_app().config.get('SQLITE_PRAGMAS')
+        if pragmas and engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', partial(set_sqlite_pragmas, pragmas=pragmas))
+        return engine
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_replica_binds(self, app=None):
+        """Replicas are the SQLALCHEMY_BINDS entries whose key starts with 'replica', they hold no tables of their own"""
+        binds = self.get_app(app).config.get('SQLALCHEMY_BINDS') or {}
+        return [bind for bind in binds if bind.startswith(REPLICA_BIND_PREFIX)]
+
+    def mark_read_only(self):
+        """Route the reads of the rest of this session to the replicas"""
+        self.session.info['read_only'] = True
+
+    @contextmanager
+    def read_only(self):
+        info = self.session.info
+        previous = info.get('read_only', False)
+        info['read_only'] = True
+        try:
+            yield
+        finally:
+            info['read_only'] = previous
+
+
+def is_lock_error(error):
+    message = str(error.orig if getattr(error, 'orig', None) is not None else error).lower()
+    return any(lock_error in message for lock_error in LOCK_ERRORS)
+
+
+def write_with_retry(work, session=None, attempts=None, base_delay=None, sticky=True):
+    """
+    Stage changes with work() and commit them, retrying the whole unit while SQLite reports lock contention.
+    A rolled back session forgets pending objects, so work must re-add everything it wants committed.
+    Backoff is exponential with full jitter so competing workers spread out instead of retrying in lockstep.
+    :param work: callable that stages the changes on the session, its return value is passed through
+    :param session: session to commit, defaults to db.session
+    :param attempts: number of tries before the lock error is raised, defaults to WRITE_RETRY_ATTEMPTS
+    :param base_delay: backoff ceiling in seconds for the first retry, defaults to WRITE_RETRY_BASE_DELAY
+    :param sticky: False for bookkeeping writes the client never reads back, they skip the read-your-writes window
+    :return: result of work()
+    """
+    if session is None:
+        from . import db
+        session = db.session
+    config = current_app.config
+    attempts = attempts or config['WRITE_RETRY_ATTEMPTS']
+    base_delay = base_delay or config['WRITE_RETRY_BASE_DELAY']
+    for attempt in range(attempts):
+        try:
+            result = work()
+            session.info['sticky'] = sticky
+            session.commit()
+            return result
+        except OperationalError as e:
+            session.rollback()
+            if not is_lock_error(e) or attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0, base_delay * 2 ** attempt))
@@ -1,6 +1,7 @@
 from functools import wraps
 from flask import abort
 from flask_login import current_user
+from . import db
 from .models import Permission
 
 
@@ -17,3 +18,12 @@ def permission_required(permission):
 
 def admin_required(f):
     return permission_required(Permission.ADMIN)(f)
+
+
+def read_only(function):
+    """Serve the view's queries from the read replicas unless the user is in a read-your-writes window"""
+    @wraps(function)
+    def decorated_function(*args, **kwargs):
+        with db.read_only():
+            return function(*args, **kwargs)
+    return decorated_function
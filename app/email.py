@@ -9,13 +9,38 @@ def send_async_email(app, msg):
         mail.send(msg)
 
 
+def send_async_emails(app, msgs):
+    with app.app_context():
+        with mail.connect() as connection:
+            for msg in msgs:
+                connection.send(msg)
+
+
+def make_message(app, to, subject, template, **kwargs):
+    msg = Message(app.config['GREEK_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
+                  sender=app.config['GREEK_MAIL_SENDER'], recipients=[to])
+    msg.body = render_template(template + '.txt', **kwargs)
+    msg.html = render_template(template + '.html', **kwargs)
+    return msg
+
+
 def send_email(to, subject, template, **kwargs):
     # noinspection PyProtectedMember
     app = current_app._get_current_object()
-    msg = Message(app.config['GREEK_TERMINAL_MAIL_SUBJECT_PREFIX'] + ' ' + subject,
-                  sender=app.config['GREEK_TERMINAL_MAIL_SENDER'], recipients=[to])
-    msg.body = render_template(template + '.txt', **kwargs)
-    msg.html = render_template(template + '.html', **kwargs)
+    msg = make_message(app, to, subject, template, **kwargs)
     thr = Thread(target=send_async_email, args=[app, msg])
     thr.start()
     return thr
+
+
+def send_emails(batch):
+    """
+    Send many emails from one thread over one SMTP connection
+    :param batch: list of (to, subject, template, template kwargs)
+    """
+    # noinspection PyProtectedMember
+    app = current_app._get_current_object()
+    msgs = [make_message(app, to, subject, template, **kwargs) for to, subject, template, kwargs in batch]
+    thr = Thread(target=send_async_emails, args=[app, msgs])
+    thr.start()
+    return thr
@@ -0,0 +1,120 @@
+"""
+Implied volatility for whole arrays of option prices. Every element runs its own safeguarded Newton iteration
+inside a shrinking bracket, and the loop only keeps working on the elements that have not converged yet.
+Prices are solved on the out-of-the-money side through put-call parity, where the whole price is time value and
+keeps its precision.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+from .greeks import norm_cdf, norm_pdf
+
+ImpliedVol = namedtuple('ImpliedVol', ['vol', 'status', 'iterations'])
+
+EPSILON = np.finfo(np.float64).eps
+
+
+class IVStatus:
+    """Per-element outcome of implied_vol, every status but CONVERGED comes with a NaN vol"""
+    CONVERGED = 0
+    NOT_CONVERGED = 1
+    BELOW_INTRINSIC = 2
+    ABOVE_UPPER_BOUND = 3
+    EXPIRED = 4
+    NAMES = {CONVERGED: 'converged', NOT_CONVERGED: 'not converged', BELOW_INTRINSIC: 'below intrinsic value',
+             ABOVE_UPPER_BOUND: 'above upper bound', EXPIRED: 'expired'}
+
+
+def black(forward, strike, spread, sign):
+    """
+    Undiscounted Black price and its derivative in spread
+    :param spread: total standard deviation, vol * sqrt(years), positive
+    :param sign: 1 for calls and -1 for puts
+    """
+    d1 = np.log(forward / strike) / spread + 0.5 * spread
+    d2 = d1 - spread
+    price = sign * (forward * norm_cdf(sign * d1) - strike * norm_cdf(sign * d2))
+    return price, forward * norm_pdf(d1)
+
+
+def initial_spread(forward, strike, call_value):
+    """Corrado-Miller closed form estimate of vol * sqrt(years) from an undiscounted call value"""
+    half = call_value - 0.5 * (forward - strike)
+    root = np.sqrt(np.maximum(np.square(half) - np.square(forward - strike) / np.pi, 0.0))
+    return np.sqrt(2 * np.pi) / (forward + strike) * (half + root)
+
+
+def implied_vol(price, spot, strike, years, rate=0.0, dividend=0.0, call=True, max_vol=10.0, max_iterations=100,
+                tolerance=1e-12):
+    """
+    Black-Scholes-Merton implied volatilities of European option prices
+    :param price: option prices per share
+    :param call: True for calls and False for puts, scalar or boolean array
+    :param max_vol: upper end of the search bracket, prices implying more are NOT_CONVERGED
+    :param tolerance: relative slack of the no-arbitrage bounds, a price within it of intrinsic value has zero vol
+    :return: ImpliedVol of arrays in the broadcast shape of the inputs, vol is NaN wherever status is not CONVERGED
+    """
+    price, spot, strike, years, rate, dividend, call = np.broadcast_arrays(
+        *(np.asarray(value, dtype=np.float64) for value in (price, spot, strike, years, rate, dividend)),
+        np.asarray(call, dtype=bool))
+    shape = price.shape
+    price, spot, strike, years, rate, dividend, call = (value.ravel() for value in (price, spot, strike, years, rate,
+                                                                                   dividend, call))
+    vol = np.full(price.size, np.nan)
+    status = np.full(price.size, IVStatus.NOT_CONVERGED, dtype=np.int8)
+    iterations = np.zeros(price.size, dtype=np.int32)
+
+    forward = spot * np.exp((rate - dividend) * years)
+    value = price * np.exp(rate * years)
+    intrinsic = np.maximum(np.where(call, forward - strike, strike - forward), 0.0)
+    scale = tolerance * np.maximum(forward, strike)
+    # Only in-the-money prices carry the rounding error of forward - strike, any positive out-of-the-money price
+    # has a vol however small it is
+    slack = np.where(intrinsic > 0, scale, 0.0)
+    expired = years <= 0
+    below = ~expired & (value < intrinsic - slack)
+    above = ~expired & ~below & (value >= np.where(call, forward, strike) - scale)
+    flat = ~expired & ~below & ~above & (value <= intrinsic + slack)
+    status[expired] = IVStatus.EXPIRED
+    status[below] = IVStatus.BELOW_INTRINSIC
+    status[above] = IVStatus.ABOVE_UPPER_BOUND
+    status[flat] = IVStatus.CONVERGED
+    vol[flat] = 0.0
+
+    index = np.flatnonzero(~(expired | below | above | flat))
+    forward, strike, sqrt_years = forward[index], strike[index], np.sqrt(years[index])
+    # The out-of-the-money option's price is the time value of either side
+    target = value[index] - intrinsic[index]
+    side = np.where(forward > strike, -1.0, 1.0)
+    low = np.zeros(len(index))
+    high = max_vol * sqrt_years
+    reachable = black(forward, strike, high, side)[0] >= target
+    index, forward, strike, sqrt_years, target, side, low, high = (
+        values[reachable] for values in (index, forward, strike, sqrt_years, target, side, low, high))
+    iterations[index] = max_iterations
+    spread = initial_spread(forward, strike, target + np.maximum(forward - strike, 0.0))
+    spread = np.where((spread > low) & (spread < high), spread, 0.5 * (low + high))
+
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        for iteration in range(1, max_iterations + 1):
+            if not len(index):
+                break
+            model, vega = black(forward, strike, spread, side)
+            # Newton on log prices, out-of-the-money prices are exponentially small in spread and log is near linear
+            error = np.log(model / target)
+            low = np.where(error < 0, spread, low)
+            high = np.where(error > 0, spread, high)
+            newton = spread - error * model / vega
+            # Newton steps that leave the bracket, including those of a vanishing vega, fall back to bisection
+            step = np.where((newton > low) & (newton < high), newton, 0.5 * (low + high))
+            done = (error == 0) | (np.abs(step - spread) <= 4 * EPSILON * step) | (high - low <= 4 * EPSILON * high)
+            spread = step
+            finished = index[done]
+            vol[finished] = spread[done] / sqrt_years[done]
+            status[finished] = IVStatus.CONVERGED
+            iterations[finished] = iteration
+            keep = ~done
+            index, forward, strike, sqrt_years, target, side, low, high, spread = (
+                values[keep] for values in (index, forward, strike, sqrt_years, target, side, low, high, spread))
+    return ImpliedVol(vol.reshape(shape), status.reshape(shape), iterations.reshape(shape))
@@ -0,0 +1,151 @@
+"""
+Tax-lot matching. A trade against the direction of the open lots closes them, FIFO or LIFO, and whatever is left
+of it opens a new lot, so positions can flip between long and short. Quantities are signed like Trade.quantity.
+
+Trades are referred to by their index in the replayed history. The sequential LotBook handles one trade at a time
+for the incremental path, match() replays a whole history and uses the vectorized FIFO matcher when it can.
+"""
+from collections import deque, namedtuple
+
+import numpy as np
+
+FIFO = 'fifo'
+LIFO = 'lifo'
+METHODS = (FIFO, LIFO)
+
+Matches = namedtuple('Matches', ['open_index', 'close_index', 'quantity', 'open_price', 'close_price', 'pnl'])
+OpenLots = namedtuple('OpenLots', ['index', 'quantity', 'price'])
+
+
+class LotBook:
+    """
+    Open lots of one (user, stock) as a deque of [ref, signed quantity, price], oldest first.
+    All open lots share the sign of the position.
+    """
+    __slots__ = ('method', 'lots')
+
+    def __init__(self, method=FIFO, lots=()):
+        if method not in METHODS:
+            raise ValueError('unknown lot matching method {!r}'.format(method))
+        self.method = method
+        self.lots = deque([ref, quantity, price] for ref, quantity, price in lots)
+
+    @property
+    def quantity(self):
+        return sum(lot[1] for lot in self.lots)
+
+    def apply(self, ref, quantity, price):
+        """
+        Book one trade
+        :return: list of (open_ref, close_ref, signed matched quantity, open price, close price, pnl)
+        """
+        realized = []
+        lots = self.lots
+        while quantity and lots and (lots[0][1] > 0) != (quantity > 0):
+            lot = lots[0] if self.method == FIFO else lots[-1]
+            matched = min(abs(quantity), abs(lot[1])) * (1 if lot[1] > 0 else -1)
+            realized.append((lot[0], ref, matched, lot[2], price, matched * (price - lot[2])))
+            lot[1] -= matched
+            quantity += matched
+            if not lot[1]:
+                if self.method == FIFO:
+                    lots.popleft()
+                else:
+                    lots.pop()
+        if quantity:
+            lots.append([ref, quantity, price])
+        return realized
+
+
+def match_sequential(quantities, prices, method=FIFO):
+    """Replay a history one trade at a time, works for every method"""
+    book = LotBook(method)
+    realized = []
+    for index, (quantity, price) in enumerate(zip(np.asarray(quantities).tolist(), np.asarray(prices).tolist())):
+        realized.extend(book.apply(index, quantity, price))
+    if realized:
+        columns = list(zip(*realized))
+    else:
+        columns = [()] * len(Matches._fields)
+    matches = Matches(*(np.asarray(column, dtype=dtype) for column, dtype in
+                        zip(columns, (np.int64, np.int64, np.int64, np.float64, np.float64, np.float64))))
+    open_lots = OpenLots(np.array([lot[0] for lot in book.lots], dtype=np.int64),
+                         np.array([lot[1] for lot in book.lots], dtype=np.int64),
+                         np.array([lot[2] for lot in book.lots], dtype=np.float64))
+    return matches, open_lots
+
+
+def _overlaps(opened, closed):
+    """
+    FIFO pairing of one side of the book. opened[i] and closed[j] are the unsigned quantities trade i opens and
+    trade j closes, each trade takes the next interval of the cumulative sum, and a close matches the opens whose
+    intervals it overlaps.
+    :return: (open index, close index, quantity) of every pairing, and (open index, remaining) of the open lots
+    """
+    open_index = np.flatnonzero(opened)
+    close_index = np.flatnonzero(closed)
+    open_ends = np.cumsum(opened[open_index])
+    close_ends = np.cumsum(closed[close_index])
+    total_closed = close_ends[-1] if len(close_ends) else 0
+    if not total_closed:
+        empty = np.zeros(0, dtype=np.int64)
+        return (empty, empty, empty), (open_index, opened[open_index])
+    # Every boundary splits the closed range into pieces that belong to exactly one (open, close) pair
+    ends = np.union1d(open_ends[open_ends < total_closed], close_ends)
+    starts = np.concatenate(([0], ends[:-1]))
+    pairs = (open_index[np.searchsorted(open_ends, starts, side='right')],
+             close_index[np.searchsorted(close_ends, starts, side='right')],
+             ends - starts)
+    still_open = open_ends > total_closed
+    remaining = open_ends[still_open] - np.maximum(open_ends[still_open] - opened[open_index[still_open]],
+                                                   total_closed)
+    return pairs, (open_index[still_open], remaining)
+
+
+def match_fifo(quantities, prices):
+    """
+    Vectorized FIFO replay. Each trade is split into the part that closes the position it finds and the part that
+    opens a new one; long and short lots then pair up independently through cumulative sums.
+    """
+    quantities = np.asarray(quantities, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    before = np.cumsum(quantities) - quantities
+    closing = np.where(np.sign(quantities) * np.sign(before) < 0,
+                       np.minimum(np.abs(quantities), np.abs(before)), 0)
+    opening = np.abs(quantities) - closing
+    buys = quantities > 0
+    long_pairs, long_open = _overlaps(np.where(buys, opening, 0), np.where(buys, 0, closing))
+    short_pairs, short_open = _overlaps(np.where(buys, 0, opening), np.where(buys, closing, 0))
+
+    open_index = np.concatenate((long_pairs[0], short_pairs[0]))
+    close_index = np.concatenate((long_pairs[1], short_pairs[1]))
+    quantity = np.concatenate((long_pairs[2], -short_pairs[2]))
+    order = np.lexsort((open_index, close_index))
+    open_index, close_index, quantity = open_index[order], close_index[order], quantity[order]
+    open_price, close_price = prices[open_index], prices[close_index]
+    matches = Matches(open_index, close_index, quantity, open_price, close_price,
+                      quantity * (close_price - open_price))
+
+    # At most one side has open lots once the history is replayed
+    index = np.concatenate((long_open[0], short_open[0]))
+    remaining = np.concatenate((long_open[1], -short_open[1]))
+    return matches, OpenLots(index, remaining, prices[index])
+
+
+def match(quantities, prices, method=FIFO):
+    """
+    Replay a whole history in trade order
+    :return: (Matches, OpenLots), indexes refer to positions in the input arrays
+    """
+    quantities = np.asarray(quantities, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if method == FIFO:
+        return match_fifo(quantities, prices)
+    return match_sequential(quantities, prices, method)
+
+
+def unrealized_pnl(open_quantities, open_prices, mark):
+    """Mark-to-market P&L of open lots at price mark"""
+    if mark is None:
+        return None
+    return float(np.dot(np.asarray(open_quantities, dtype=np.float64), mark - np.asarray(open_prices)))
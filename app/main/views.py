@@ -4,11 +4,13 @@ from flask import abort, current_app, make_response, render_template, redirect,
 from flask_login import current_user, login_required
 
 from . import main
+from ..decorators import read_only
 from .forms import SearchForm
 from ..models import User, Stock, Trade
 
 
 @main.route('/', methods=['GET', 'POST'])
+@read_only
 def index():
     form = SearchForm()
     if form.validate_on_submit():
@@ -0,0 +1,372 @@
+"""
+Market data ingest service behind 'flask market-feed'.
+A source coroutine reads raw ticks into a bounded queue, the coalescer drops malformed, duplicate and late ticks
+and folds the rest into one OHLCV bar per ticker per interval, and a single writer appends closed bars to the price
+store and publishes the last trade of every ticker to the quote cache and the broker. Every stage waits on a bounded
+queue, so a slow writer ends up throttling the source instead of growing memory.
+
+Sources are picked by URL scheme:
+    csv:///path/ticks.csv?speed=10  replay a CSV at 10x its recorded pace, speed=0 replays as fast as possible
+    tail:///path/ticks.csv          follow a file that another process appends lines to
+    tcp://host:port                 read newline-delimited lines from a socket
+Lines are 'ticker,timestamp,price[,size]' with an ISO (UTC unless it has an offset) or epoch-seconds timestamp.
+"""
+import asyncio
+import math
+import time
+from collections import OrderedDict, namedtuple
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+Tick = namedtuple('Tick', ['ticker', 'timestamp', 'price', 'size'])
+
+SOURCES = {}
+
+
+def register_source(scheme):
+    """Decorator that makes an async line iterator factory(url, speed=None) available under a URL scheme"""
+    def decorator(factory):
+        SOURCES[scheme] = factory
+        return factory
+    return decorator
+
+
+def parse_timestamp(value):
+    """Epoch seconds of an epoch-seconds or ISO 8601 value"""
+    try:
+        return float(value)
+    except ValueError:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if parsed.tzinfo is None:
+            parsed = parsed.replace(tzinfo=timezone.utc)
+        return parsed.timestamp()
+
+
+def parse_tick(line):
+    """Normalize one 'ticker,timestamp,price[,size]' line, None when it is not a usable tick"""
+    fields = [field.strip() for field in line.split(',')]
+    if len(fields) < 3:
+        return None
+    try:
+        ticker = fields[0].upper()
+        timestamp = parse_timestamp(fields[1])
+        price = float(fields[2])
+        size = float(fields[3]) if len(fields) > 3 and fields[3] else 0.0
+    except ValueError:
+        return None
+    if not ticker or not math.isfinite(price) or price <= 0 or not math.isfinite(timestamp) or size < 0:
+        return None
+    return Tick(ticker, timestamp, price, size)
+
+
+@register_source('csv')
+async def replay_csv(url, speed=None):
+    """Replay a recorded tick file, sleeping so that ticks arrive speed times faster than they were recorded"""
+    if speed is None:
+        speed = float(parse_qs(url.query).get('speed', ['1'])[0])
+    started = first = None
+    with open(url.path) as tick_file:
+        for line in tick_file:
+            tick = parse_tick(line)
+            if tick is not None and speed > 0:
+                if first is None:
+                    started, first = time.monotonic(), tick.timestamp
+                delay = (tick.timestamp - first) / speed - (time.monotonic() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield line
+
+
+@register_source('tail')
+async def tail_file(url, speed=None, poll_interval=0.1):
+    """Follow a growing file from its current end, live sources ignore speed"""
+    with open(url.path) as tick_file:
+        tick_file.seek(0, 2)
+        partial = ''
+        while True:
+            chunk = tick_file.readline()
+            if not chunk:
+                await asyncio.sleep(poll_interval)
+                continue
+            partial += chunk
+            if partial.endswith('\n'):
+                yield partial
+                partial = ''
+
+
+@register_source('tcp')
+async def read_socket(url, speed=None):
+    reader, writer = await asyncio.open_connection(url.hostname, url.port)
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            yield line.decode('utf-8', 'replace')
+    finally:
+        writer.close()
+
+
+def open_source(source, speed=None):
+    url = urlparse(source)
+    if url.scheme not in SOURCES:
+        raise ValueError('unknown market feed source {!r}, expected one of {}'.format(
+            source, ', '.join(sorted(SOURCES))))
+    return SOURCES[url.scheme](url, speed=speed)
+
+
+class FeedMetrics:
+    """Counters and lag of a running feed"""
+
+    def __init__(self):
+        self.received = self.accepted = self.malformed = self.unknown = 0
+        self.duplicates = self.late = self.bars = self.batches = 0
+        self.event_lag = 0.0
+        self.max_write_latency = 0.0
+        self.started = time.monotonic()
+
+    def snapshot(self, queue_depth=0):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        return {
+            'received': self.received,
+            'accepted': self.accepted,
+            'malformed': self.malformed,
+            'unknown': self.unknown,
+            'duplicates': self.duplicates,
+            'late': self.late,
+            'bars': self.bars,
+            'batches': self.batches,
+            'ticks_per_second': self.received / elapsed,
+            'queue_depth': queue_depth,
+            'event_lag': self.event_lag,
+            'max_write_latency': self.max_write_latency
+        }
+
+
+class Bar:
+    __slots__ = ('start', 'open', 'high', 'low', 'close', 'volume', 'received')
+
+    def __init__(self, start, tick, received):
+        self.start = start
+        self.open = self.high = self.low = self.close = tick.price
+        self.volume = tick.size
+        self.received = received
+
+    def add(self, tick):
+        self.high = max(self.high, tick.price)
+        self.low = min(self.low, tick.price)
+        self.close = tick.price
+        self.volume += tick.size
+
+
+class Coalescer:
+    """
+    Folds ticks into per-ticker bars of interval seconds. Bars close once the event-time watermark, the newest
+    tick timestamp minus lateness, passes their end; ticks for bars already closed are dropped as late.
+    """
+
+    def __init__(self, interval, lateness, known_tickers=None, metrics=None, dedupe_window=4096):
+        self.interval = interval
+        self.lateness = lateness
+        self.known_tickers = known_tickers
+        self.metrics = metrics or FeedMetrics()
+        self.bars = {}
+        self.closed_until = {}
+        self.watermark = -math.inf
+        self.last = {}
+        self.recent = OrderedDict()
+        self.dedupe_window = dedupe_window
+
+    def add(self, tick):
+        metrics = self.metrics
+        if self.known_tickers is not None and tick.ticker not in self.known_tickers:
+            metrics.unknown += 1
+            return False
+        if tick in self.recent:
+            metrics.duplicates += 1
+            return False
+        self.recent[tick] = None
+        if len(self.recent) > self.dedupe_window:
+            self.recent.popitem(last=False)
+        start = math.floor(tick.timestamp / self.interval) * self.interval
+        if start < self.closed_until.get(tick.ticker, -math.inf):
+            metrics.late += 1
+            return False
+        bar = self.bars.get((tick.ticker, start))
+        if bar is None:
+            self.bars[(tick.ticker, start)] = Bar(start, tick, time.monotonic())
+        else:
+            bar.add(tick)
+        if tick.timestamp >= self.last.get(tick.ticker, (-math.inf,))[0]:
+            self.last[tick.ticker] = (tick.timestamp, tick.price, tick.size)
+        self.watermark = max(self.watermark, tick.timestamp - self.lateness)
+        metrics.accepted += 1
+        metrics.event_lag = max(time.time() - tick.timestamp, 0.0)
+        return True
+
+    def close(self, everything=False):
+        """
+        Remove the bars that can no longer change
+        :return: ({ticker: [Bar, ...] in time order}, {ticker: (timestamp, price, size)} of their last trades)
+        """
+        closed = {}
+        for key in sorted(key for key in self.bars if everything or key[1] + self.interval <= self.watermark):
+            ticker, start = key
+            closed.setdefault(ticker, []).append(self.bars.pop(key))
+            self.closed_until[ticker] = start + self.interval
+        last_trades = {ticker: self.last.pop(ticker) for ticker in closed if ticker in self.last}
+        return closed, last_trades
+
+
+class MarketFeed:
+    """
+    The ingest service. store and publish are called from a worker thread with one batch at a time:
+    store(ticker, columns) takes price store columns and publish(payloads) the last-trade messages, the optional
+    observe(ranges) gets {ticker: (high, low)} of the batch's bars.
+    Closed bars are looked for every flush_interval seconds, or sooner after batch_size accepted ticks.
+    """
+
+    def __init__(self, source, store, publish, interval=1.0, lateness=2.0, queue_size=10000, batch_size=1000,
+                 flush_interval=0.5, known_tickers=None, logger=None, metrics_interval=10.0, observe=None):
+        self.source = source
+        self.store = store
+        self.publish = publish
+        self.observe = observe
+        self.metrics = FeedMetrics()
+        self.coalescer = Coalescer(interval, lateness, known_tickers, self.metrics)
+        self.ticks = asyncio.Queue(maxsize=queue_size)
+        self.batches = asyncio.Queue(maxsize=4)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.logger = logger
+        self.metrics_interval = metrics_interval
+
+    async def read(self):
+        async for line in self.source:
+            self.metrics.received += 1
+            tick = parse_tick(line)
+            if tick is None:
+                self.metrics.malformed += 1
+                continue
+            await self.ticks.put(tick)
+        await self.ticks.put(None)
+
+    async def coalesce(self):
+        loop = asyncio.get_running_loop()
+        next_flush = loop.time() + self.flush_interval
+        pending = 0
+        while True:
+            if not self.ticks.empty():
+                tick = self.ticks.get_nowait()
+            else:
+                # Wake up for the flush even when the source goes quiet, so idle tickers still get their bars written
+                try:
+                    tick = await asyncio.wait_for(self.ticks.get(), max(next_flush - loop.time(), 0.001))
+                except asyncio.TimeoutError:
+                    tick = False
+            if tick is None:
+                await self.batches.put(self.coalescer.close(everything=True))
+                await self.batches.put(None)
+                return
+            if tick:
+                pending += self.coalescer.add(tick)
+            if loop.time() >= next_flush or pending >= self.batch_size:
+                closed, last_trades = self.coalescer.close()
+                if closed:
+                    await self.batches.put((closed, last_trades))
+                pending = 0
+                next_flush = loop.time() + self.flush_interval
+
+    async def write(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self.batches.get()
+            if batch is None:
+                return
+            await loop.run_in_executor(None, self.write_batch, *batch)
+
+    def write_batch(self, closed, last_trades):
+        for ticker, bars in closed.items():
+            self.store(ticker, {
+                'timestamp': np.array([bar.start for bar in bars], dtype=np.int64).astype('datetime64[s]'),
+                'open': [bar.open for bar in bars],
+                'high': [bar.high for bar in bars],
+                'low': [bar.low for bar in bars],
+                'close': [bar.close for bar in bars],
+                'volume': [bar.volume for bar in bars]
+            })
+            self.metrics.bars += len(bars)
+            oldest = min(bar.received for bar in bars)
+            self.metrics.max_write_latency = max(self.metrics.max_write_latency, time.monotonic() - oldest)
+        if last_trades:
+            self.publish([{'ticker': ticker, 'price': price, 'size': size,
+                           'timestamp': datetime.utcfromtimestamp(timestamp).isoformat() + 'Z'}
+                          for ticker, (timestamp, price, size) in sorted(last_trades.items())])
+        if self.observe is not None and closed:
+            self.observe({ticker: (max(bar.high for bar in bars), min(bar.low for bar in bars))
+                          for ticker, bars in closed.items()})
+        self.metrics.batches += 1
+
+    async def report(self):
+        while True:
+            await asyncio.sleep(self.metrics_interval)
+            if self.logger is not None:
+                self.logger.info('market feed %s', self.metrics.snapshot(self.ticks.qsize()))
+
+    async def run(self):
+        """Run until the source is exhausted, then flush every open bar"""
+        reporter = asyncio.ensure_future(self.report())
+        try:
+            await asyncio.gather(self.read(), self.coalesce(), self.write())
+        finally:
+            reporter.cancel()
+        return self.metrics.snapshot()
+
+
+def run_feed(app, source, speed=None):
+    """Run a MarketFeed into the app's price store, quote cache, broker and price alerts until the source ends"""
+    from . import db
+    from .alerts import AlertEngine
+    from .models import BrokerMessage, Stock
+    from .price_store import price_store
+    from .quote_cache import quote_cache
+
+    def publish(payloads):
+        quote_cache.write([stock_ids[payload['ticker']] for payload in payloads],
+                          [payload['price'] for payload in payloads],
+                          [payload['size'] for payload in payloads],
+                          [parse_timestamp(payload['timestamp']) for payload in payloads])
+        with app.app_context():
+            try:
+                BrokerMessage.publish('quotes', payloads)
+            finally:
+                db.session.remove()
+
+    def observe(ranges):
+        with app.app_context():
+            try:
+                alerts.observe([stock_ids[ticker] for ticker in ranges], *zip(*ranges.values()))
+            except Exception:
+                # A failed alert check must not stop prices from being stored
+                app.logger.exception('Price alert check failed')
+            finally:
+                db.session.remove()
+
+    config = app.config
+    with app.app_context():
+        stock_ids = {stock.ticker.upper(): stock.id for stock in Stock.query.all()}
+        db.session.remove()
+    alerts = AlertEngine()
+    feed = MarketFeed(open_source(source, speed), price_store.append, publish,
+                      interval=config['MARKET_FEED_INTERVAL'],
+                      lateness=config['MARKET_FEED_LATENESS'],
+                      queue_size=config['MARKET_FEED_QUEUE_SIZE'],
+                      batch_size=config['MARKET_FEED_BATCH_SIZE'],
+                      flush_interval=config['MARKET_FEED_FLUSH_INTERVAL'],
+                      known_tickers=set(stock_ids),
+                      logger=app.logger,
+                      metrics_interval=config['MARKET_FEED_METRICS_INTERVAL'],
+                      observe=observe)
+    return asyncio.run(feed.run())
@@ -1,14 +1,23 @@
 import hashlib
-from datetime import datetime
+import json
+import math
+from datetime import datetime, time
+from itertools import groupby
 from typing import Final
 
+import numpy as np
 from flask import abort, current_app, url_for
 from flask_login import AnonymousUserMixin, UserMixin
 from itsdangerous import TimedJSONWebSignatureSerializer as Serializer, SignatureExpired, BadSignature
 from werkzeug.security import generate_password_hash, check_password_hash
 
 from . import db, login_manager, whooshee
+from .cache import response_cache
+from .database import write_with_retry
 from .exceptions import ValidationError
+from .lots import LotBook, match as match_lots
+from .price_store import price_store
+from .quote_cache import quote_cache
 
 CASCADE: Final = 'all, delete-orphan'
 USERS_ID: Final = 'users.id'
@@ -95,6 +104,9 @@ class Role(db.Model):
 
 class Watch(db.Model):
     __tablename__ = 'watches'
+    __table_args__ = (
+        db.Index('ix_watches_user_id_timestamp', 'user_id', 'timestamp'),
+    )
     user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID),
                         primary_key=True)
     stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'),
@@ -124,6 +136,53 @@ class Watch(db.Model):
             raise ValidationError('stock does not exist')
         return Watch(user_id=user.id, stock_id=stock.id)
 
+    @staticmethod
+    def stock_ids(user):
+        return [row[0] for row in db.session.query(Watch.stock_id).filter(Watch.user_id == user.id)]
+
+    @staticmethod
+    def board(user):
+        """
+        Quote row of every stock user watches, newest watch first. The stocks come from one joined query, the
+        last price from the quote cache and today's change, volume and range from the price store's bars.
+        Days start at midnight UTC, the 52-week range is year_high and year_low widened by today's bars.
+        """
+        rows = db.session.query(Stock.id, Stock.ticker, Stock.name, Stock.photo_filename, Stock.year_high,
+                                Stock.year_low, Watch.timestamp) \
+            .join(Watch, Watch.stock_id == Stock.id) \
+            .filter(Watch.user_id == user.id) \
+            .order_by(Watch.timestamp.desc()).all()
+        quotes = quote_cache.read([row.id for row in rows])
+        midnight = datetime.combine(datetime.utcnow().date(), time())
+        board = []
+        for row, price, quoted_at in zip(rows, quotes.price.tolist(), quotes.timestamp.tolist()):
+            today = price_store.read(row.ticker, start=midnight, columns=('high', 'low', 'close', 'volume'))
+            if math.isnan(price):
+                price = float(today['close'][-1]) if len(today) else price_store.last(row.ticker)
+                quoted_at = None
+            previous_close = price_store.last(row.ticker, before=midnight)
+            change = price - previous_close if price is not None and previous_close is not None else None
+            highs = [value for value in (row.year_high, float(today['high'].max()) if len(today) else None)
+                     if value is not None]
+            lows = [value for value in (row.year_low, float(today['low'].min()) if len(today) else None)
+                    if value is not None]
+            board.append({
+                'stock_id': row.id,
+                'ticker': row.ticker,
+                'name': row.name,
+                'photo_filename': row.photo_filename,
+                'price': price,
+                'quoted_at': datetime.utcfromtimestamp(quoted_at) if quoted_at is not None else None,
+                'previous_close': previous_close,
+                'change': change,
+                'change_percent': change / previous_close * 100 if change is not None and previous_close else None,
+                'volume': float(today['volume'].sum()),
+                'year_high': max(highs) if highs else None,
+                'year_low': min(lows) if lows else None,
+                'watched_since': row.timestamp
+            })
+        return board
+
 
 @whooshee.register_model('name', 'ticker', 'sector')
 class Stock(db.Model):
@@ -143,6 +202,25 @@ class Stock(db.Model):
                                      lazy='dynamic',
                                      cascade=CASCADE)
 
+    def last_price(self):
+        """Price of the most recent trade, the mark used for unrealized P&L"""
+        trade = self.trades.order_by(Trade.timestamp.desc(), Trade.id.desc()).first()
+        return trade.price if trade is not None else None
+
+    def quote(self):
+        """Last market feed quote from the shared quote cache, None before the feed has seen the stock"""
+        return quote_cache.get(self.id) if self.id is not None else None
+
+    @staticmethod
+    def marks(stock_ids):
+        """Spot prices for pricing, the quote cache price or else the last trade, NaN for a stock with neither"""
+        prices = quote_cache.read(stock_ids).price
+        for index in np.flatnonzero(np.isnan(prices)):
+            stock = Stock.query.get(int(stock_ids[index]))
+            price = stock.last_price() if stock is not None else None
+            prices[index] = price if price is not None else np.nan
+        return prices
+
     def is_watched_by(self, user):
         if user.id is None:
             return False
@@ -185,8 +263,45 @@ class Stock(db.Model):
                      year_low=year_low)
 
 
+class StockStatistic(db.Model):
+    """
+    Realized statistics of one stock over the trailing window of daily closes ending at as_of.
+    Vol is annualized, drawdowns are positive fractions of the peak and the return percentiles are of daily log returns.
+    """
+    __tablename__ = 'stock_statistics'
+    __table_args__ = (
+        db.Index('ix_stock_statistics_window_realized_vol', 'window', 'realized_vol'),
+    )
+    FIELDS = ('realized_vol', 'atr', 'atr_percent', 'drawdown', 'max_drawdown', 'return_p05', 'return_p50',
+              'return_p95')
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), primary_key=True)
+    window = db.Column(db.Integer, primary_key=True)
+    as_of = db.Column(db.Date(), nullable=False)
+    realized_vol = db.Column(db.Float, nullable=False)
+    atr = db.Column(db.Float, nullable=False)
+    atr_percent = db.Column(db.Float, nullable=False)
+    drawdown = db.Column(db.Float, nullable=False)
+    max_drawdown = db.Column(db.Float, nullable=False)
+    return_p05 = db.Column(db.Float, nullable=False)
+    return_p50 = db.Column(db.Float, nullable=False)
+    return_p95 = db.Column(db.Float, nullable=False)
+    stock = db.relationship('Stock')
+
+    @staticmethod
+    def for_stock(stock_id):
+        return StockStatistic.query.filter_by(stock_id=stock_id).order_by(StockStatistic.window).all()
+
+    def to_json(self):
+        return dict({field: getattr(self, field) for field in StockStatistic.FIELDS}, window=self.window,
+                    as_of=self.as_of.isoformat())
+
+
 class Trade(db.Model):
     __tablename__ = 'trades'
+    __table_args__ = (
+        db.Index('ix_trades_user_id_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_trades_stock_id_timestamp', 'stock_id', 'timestamp', 'id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'))
     user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID))
@@ -231,8 +346,247 @@ class Trade(db.Model):
                      price=price)
 
 
+class OptionKind:
+    CALL = 'call'
+    PUT = 'put'
+    ALL = (CALL, PUT)
+
+
+class OptionContract(db.Model):
+    """
+    A listed option on a stock. The chain index leads with (underlying, expiry, strike) so one expiry of a chain,
+    or every expiry of it, is a single index range scan that already comes back in strike order.
+    """
+    __tablename__ = 'option_contracts'
+    __table_args__ = (
+        db.Index('ix_option_contracts_chain', 'underlying_id', 'expiry', 'strike', 'kind', unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    underlying_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False)
+    expiry = db.Column(db.Date(), nullable=False)
+    strike = db.Column(db.Float, nullable=False)
+    kind = db.Column(db.String(4), nullable=False)
+    multiplier = db.Column(db.Integer, nullable=False, default=100)
+    underlying = db.relationship('Stock', lazy='joined')
+    trades = db.relationship('OptionTrade', backref=db.backref('contract', lazy='joined'), lazy='dynamic')
+
+    @property
+    def symbol(self):
+        """OCC option symbol, e.g. 'AAPL  261023C00150000'"""
+        return '{:<6}{:%y%m%d}{}{:08d}'.format(self.underlying.ticker, self.expiry, self.kind[0].upper(),
+                                              int(round(self.strike * 1000)))
+
+    @staticmethod
+    def chain(underlying_id, expiry=None, kind=None):
+        """Contracts of one underlying in (expiry, strike) order, optionally of one expiry and one kind"""
+        query = OptionContract.query.filter(OptionContract.underlying_id == underlying_id)
+        if expiry is not None:
+            query = query.filter(OptionContract.expiry == expiry)
+        if kind is not None:
+            query = query.filter(OptionContract.kind == kind)
+        return query.order_by(OptionContract.expiry, OptionContract.strike, OptionContract.kind)
+
+    @staticmethod
+    def expiries(underlying_id):
+        rows = db.session.query(OptionContract.expiry).filter(OptionContract.underlying_id == underlying_id) \
+            .distinct().order_by(OptionContract.expiry)
+        return [row.expiry for row in rows]
+
+    @staticmethod
+    def load(rows):
+        """
+        Insert or update whole chains with one executemany per statement and commit once.
+        Contracts are keyed by (underlying, expiry, strike, kind), a reloaded contract only updates its multiplier.
+        :param rows: dicts of underlying_id, expiry, strike, kind and multiplier
+        :return: (inserted, updated) counts
+        """
+        table = OptionContract.__table__
+        wanted = {}
+        for row in rows:
+            wanted[(row['underlying_id'], row['expiry'], float(row['strike']), row['kind'])] = row['multiplier']
+        existing = {}
+        chains = sorted({key[:2] for key in wanted})
+        for underlying_id, group in groupby(chains, key=lambda chain: chain[0]):
+            found = db.session.execute(
+                db.select([table.c.id, table.c.expiry, table.c.strike, table.c.kind, table.c.multiplier])
+                .where((table.c.underlying_id == underlying_id) &
+                       table.c.expiry.in_([expiry for _, expiry in group])))
+            for contract_id, expiry, strike, kind, multiplier in found:
+                existing[(underlying_id, expiry, strike, kind)] = contract_id, multiplier
+        inserts, updates = [], []
+        for key, multiplier in wanted.items():
+            if key not in existing:
+                inserts.append(dict(zip(('underlying_id', 'expiry', 'strike', 'kind'), key), multiplier=multiplier))
+            elif existing[key][1] != multiplier:
+                updates.append({'contract_id': existing[key][0], 'multiplier': multiplier})
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            db.session.execute(table.update().where(table.c.id == db.bindparam('contract_id'))
+                               .values(multiplier=db.bindparam('multiplier')), updates)
+        if inserts or updates:
+            TableVersion.bump(db.session, {OptionContract.__tablename__})
+        db.session.commit()
+        return len(inserts), len(updates)
+
+    def to_json(self):
+        return {
+            'url': url_for('api.get_option_contract', contract_id=self.id),
+            'symbol': self.symbol,
+            'underlying': self.underlying.ticker,
+            'expiry': self.expiry.isoformat(),
+            'strike': self.strike,
+            'kind': self.kind,
+            'multiplier': self.multiplier
+        }
+
+
+class OptionTrade(db.Model):
+    """A trade of option contracts, quantity is in contracts and price is the premium per share"""
+    __tablename__ = 'option_trades'
+    __table_args__ = (
+        db.Index('ix_option_trades_user_id_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_option_trades_contract_id_timestamp', 'contract_id', 'timestamp', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    contract_id = db.Column(db.Integer, db.ForeignKey('option_contracts.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), nullable=False)
+    timestamp = db.Column(db.DateTime(), default=datetime.utcnow, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+
+    @property
+    def notional(self):
+        return self.quantity * self.price * self.contract.multiplier
+
+    def to_json(self):
+        return {
+            'url': url_for('api.get_option_trade', trade_id=self.id),
+            'contract': url_for('api.get_option_contract', contract_id=self.contract_id),
+            'symbol': self.contract.symbol,
+            'user': self.user.username,
+            'timestamp': self.timestamp,
+            'quantity': self.quantity,
+            'price': self.price,
+            'notional': self.notional
+        }
+
+    @staticmethod
+    def from_json(json_trade, user):
+        contract_id = json_trade.get('contract')
+        if contract_id is None or contract_id == '':
+            raise ValidationError('option trade does not have a contract.')
+        contract = OptionContract.query.get(contract_id)
+        if contract is None:
+            raise ValidationError('option contract does not exist')
+        quantity = json_trade.get('quantity')
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity == 0:
+            raise ValidationError('option trade quantity must be a non-zero number of contracts.')
+        price = json_trade.get('price')
+        if isinstance(price, bool) or not isinstance(price, (int, float)) or price < 0:
+            raise ValidationError('option trade price must be a premium of zero or more.')
+        return OptionTrade(contract=contract, user_id=user.id, quantity=quantity, price=float(price))
+
+
+class OptionPosition(db.Model):
+    """
+    Net contracts of one user in one option contract, kept in the same transaction as the option trades like
+    Position is for shares
+    """
+    __tablename__ = 'option_positions'
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), primary_key=True)
+    contract_id = db.Column(db.Integer, db.ForeignKey('option_contracts.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    trade_count = db.Column(db.Integer, nullable=False, default=0)
+    contract = db.relationship('OptionContract', lazy='joined')
+
+    def to_json(self):
+        return {
+            'contract': url_for('api.get_option_contract', contract_id=self.contract_id),
+            'symbol': self.contract.symbol,
+            'quantity': self.quantity,
+            'trade_count': self.trade_count
+        }
+
+    @staticmethod
+    def on_before_flush(session, flush_context, instances):
+        """Read the stored rows of the option trades this flush edits or deletes, see Position.on_before_flush"""
+        session.info.pop('stored_option_trades', None)
+        trade_ids = [trade.id for trade in session.dirty | session.deleted
+                     if isinstance(trade, OptionTrade) and trade.id is not None]
+        if not trade_ids:
+            return
+        trades = OptionTrade.__table__
+        rows = session.connection().execute(
+            db.select([trades.c.id, trades.c.user_id, trades.c.contract_id, trades.c.quantity])
+            .where(trades.c.id.in_(trade_ids))).fetchall()
+        session.info['stored_option_trades'] = {row[0]: tuple(row[1:]) for row in rows}
+
+    @staticmethod
+    def on_after_flush(session, flush_context):
+        deltas = {}
+        stored = session.info.get('stored_option_trades', {})
+
+        def apply(user_id, contract_id, quantity, sign):
+            total = deltas.setdefault((user_id, contract_id), [0, 0])
+            total[0] += sign * (quantity or 0)
+            total[1] += sign
+
+        for trade in session.new:
+            if isinstance(trade, OptionTrade):
+                apply(trade.user_id, trade.contract_id, trade.quantity, 1)
+        for trade in session.dirty:
+            if isinstance(trade, OptionTrade) and trade.id in stored:
+                apply(*stored[trade.id], -1)
+                apply(trade.user_id, trade.contract_id, trade.quantity, 1)
+        for trade in session.deleted:
+            if isinstance(trade, OptionTrade) and trade.id in stored:
+                apply(*stored[trade.id], -1)
+        if deltas:
+            OptionPosition.apply_deltas(session, deltas)
+
+    @staticmethod
+    def on_after_rollback(session):
+        session.info.pop('stored_option_trades', None)
+
+    @staticmethod
+    def apply_deltas(session, deltas):
+        """Add the trade deltas to the stored positions through Core, which bypasses the version bump of the flush"""
+        connection = session.connection()
+        table = OptionPosition.__table__
+        for (user_id, contract_id), (quantity, count) in deltas.items():
+            if not quantity and not count:
+                continue
+            key = (table.c.user_id == user_id) & (table.c.contract_id == contract_id)
+            result = connection.execute(table.update().where(key).values(
+                quantity=table.c.quantity + quantity, trade_count=table.c.trade_count + count))
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(user_id=user_id, contract_id=contract_id, quantity=quantity,
+                                                         trade_count=count))
+            elif count < 0:
+                connection.execute(table.delete().where(key & (table.c.trade_count <= 0)))
+        TableVersion.bump(session, {OptionPosition.__tablename__})
+
+    @staticmethod
+    def rebuild():
+        """Recompute every option position from the option trades in one grouped INSERT ... SELECT"""
+        trades = OptionTrade.__table__
+        grouped = db.select([trades.c.user_id, trades.c.contract_id, db.func.sum(trades.c.quantity),
+                             db.func.count()]).group_by(trades.c.user_id, trades.c.contract_id)
+        table = OptionPosition.__table__
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select(['user_id', 'contract_id', 'quantity', 'trade_count'],
+                                                      grouped))
+        TableVersion.bump(db.session, {OptionPosition.__tablename__})
+        db.session.commit()
+        return OptionPosition.query.count()
+
+
 class Follow(db.Model):
     __tablename__ = 'follows'
+    __table_args__ = (
+        db.Index('ix_follows_follower_id_followed_id', 'follower_id', 'followed_id'),
+    )
     followed_id = db.Column(db.Integer, db.ForeignKey(USERS_ID),
                             primary_key=True)
     follower_id = db.Column(db.Integer, db.ForeignKey(USERS_ID),
@@ -240,6 +594,581 @@ class Follow(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class Position(db.Model):
+    """
+    Holdings of one user in one stock, kept in the same transaction as the trades they are built from.
+    Every column is a sum over the user's trades in the stock, so inserts, edits and deletes are applied as deltas
+    and rebuild() recomputes the whole table in one grouped pass over the tape.
+    Quantities are signed, buys are positive and sells negative. The average cost is the cost per share of the open
+    lots, so it starts over when a position is closed and reopened and is the average opening sale price of a short.
+    """
+    __tablename__ = 'positions'
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), primary_key=True)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    bought_quantity = db.Column(db.Integer, nullable=False, default=0)
+    bought_cost = db.Column(db.Float, nullable=False, default=0.0)
+    notional = db.Column(db.Float, nullable=False, default=0.0)
+    trade_count = db.Column(db.Integer, nullable=False, default=0)
+    stock = db.relationship('Stock', lazy='joined', viewonly=True)
+
+    @property
+    def average_cost(self):
+        if not hasattr(self, '_average_cost'):
+            Position.load_costs([self])
+        return self._average_cost
+
+    @staticmethod
+    def load_costs(positions):
+        """Fill in the average cost of positions from their open lots with one grouped query"""
+        user_ids = {position.user_id for position in positions}
+        if not user_ids:
+            return positions
+        open_lots = {(user_id, stock_id): (quantity, cost) for user_id, stock_id, quantity, cost in
+                     db.session.query(Lot.user_id, Lot.stock_id, db.func.sum(Lot.quantity),
+                                      db.func.sum(Lot.quantity * Lot.price))
+                     .filter(Lot.user_id.in_(user_ids)).group_by(Lot.user_id, Lot.stock_id)}
+        for position in positions:
+            quantity, cost = open_lots.get((position.user_id, position.stock_id), (0, 0.0))
+            position._average_cost = cost / quantity if quantity else None
+        return positions
+
+    @staticmethod
+    def on_expire(position, attributes):
+        """A commit or refresh expires the columns, the cost loaded with them goes too"""
+        position.__dict__.pop('_average_cost', None)
+
+    def to_json(self):
+        return {
+            'stock': self.stock.ticker,
+            'stock_url': url_for('api.get_stock', ticker=self.stock.ticker),
+            'quantity': self.quantity,
+            'average_cost': self.average_cost,
+            'notional': self.notional,
+            'trade_count': self.trade_count
+        }
+
+    @staticmethod
+    def contribution(user_id, stock_id, quantity, price):
+        """Column deltas one trade adds to its position"""
+        quantity = quantity or 0
+        price = float(price or 0)
+        bought = max(quantity, 0)
+        return (user_id, stock_id), (quantity, bought, bought * price, quantity * price, 1)
+
+    @staticmethod
+    def on_before_flush(session, flush_context, instances):
+        """
+        Read the stored rows of the trades this flush edits or deletes. Unloaded attributes record no history when
+        set, so the database is the only reliable source of what the position currently includes.
+        """
+        session.info.pop('stored_trades', None)
+        trade_ids = [trade.id for trade in session.dirty | session.deleted
+                     if isinstance(trade, Trade) and trade.id is not None]
+        if not trade_ids:
+            return
+        trades = Trade.__table__
+        rows = session.connection().execute(
+            db.select([trades.c.id, trades.c.user_id, trades.c.stock_id, trades.c.quantity, trades.c.price])
+            .where(trades.c.id.in_(trade_ids))).fetchall()
+        session.info['stored_trades'] = {row[0]: tuple(row[1:]) for row in rows}
+
+    @staticmethod
+    def on_after_flush(session, flush_context):
+        deltas = {}
+        stored = session.info.get('stored_trades', {})
+
+        def apply(user_id, stock_id, quantity, price, sign):
+            key, amounts = Position.contribution(user_id, stock_id, quantity, price)
+            if None in key:
+                return
+            total = deltas.setdefault(key, [0, 0, 0.0, 0.0, 0])
+            for index, amount in enumerate(amounts):
+                total[index] += sign * amount
+
+        for trade in session.new:
+            if isinstance(trade, Trade):
+                apply(trade.user_id, trade.stock_id, trade.quantity, trade.price, 1)
+        for trade in session.dirty:
+            if isinstance(trade, Trade) and trade.id in stored:
+                apply(*stored[trade.id], -1)
+                apply(trade.user_id, trade.stock_id, trade.quantity, trade.price, 1)
+        for trade in session.deleted:
+            if isinstance(trade, Trade) and trade.id in stored:
+                apply(*stored[trade.id], -1)
+        if deltas:
+            Position.apply_deltas(session, deltas)
+
+    @staticmethod
+    def on_after_rollback(session):
+        session.info.pop('stored_trades', None)
+
+    @staticmethod
+    def apply_deltas(session, deltas):
+        """Add the trade deltas to the stored positions through Core, which bypasses the version bump of the flush"""
+        connection = session.connection()
+        table = Position.__table__
+        for (user_id, stock_id), (quantity, bought, cost, notional, count) in deltas.items():
+            if not any((quantity, bought, cost, notional, count)):
+                continue
+            key = (table.c.user_id == user_id) & (table.c.stock_id == stock_id)
+            result = connection.execute(table.update().where(key).values(
+                quantity=table.c.quantity + quantity,
+                bought_quantity=table.c.bought_quantity + bought,
+                bought_cost=table.c.bought_cost + cost,
+                notional=table.c.notional + notional,
+                trade_count=table.c.trade_count + count))
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(
+                    user_id=user_id, stock_id=stock_id, quantity=quantity, bought_quantity=bought,
+                    bought_cost=cost, notional=notional, trade_count=count))
+            elif count < 0:
+                connection.execute(table.delete().where(key & (table.c.trade_count <= 0)))
+        TableVersion.bump(session, {Position.__tablename__})
+
+    @staticmethod
+    def rebuild():
+        """Recompute every position from the trades table in one grouped INSERT ... SELECT"""
+        trades = Trade.__table__
+        quantity = db.func.coalesce(trades.c.quantity, 0)
+        price = db.func.coalesce(trades.c.price, 0.0)
+        bought = db.case([(quantity > 0, quantity)], else_=0)
+        grouped = db.select([
+            trades.c.user_id,
+            trades.c.stock_id,
+            db.func.sum(quantity),
+            db.func.sum(bought),
+            db.func.sum(bought * price),
+            db.func.sum(quantity * price),
+            db.func.count()
+        ]).where(trades.c.user_id.isnot(None) & trades.c.stock_id.isnot(None)) \
+            .group_by(trades.c.user_id, trades.c.stock_id)
+        table = Position.__table__
+        db.session.execute(table.delete())
+        db.session.execute(table.insert().from_select(
+            ['user_id', 'stock_id', 'quantity', 'bought_quantity', 'bought_cost', 'notional', 'trade_count'],
+            grouped))
+        TableVersion.bump(db.session, {Position.__tablename__})
+        db.session.commit()
+        return Position.query.count()
+
+
+class Lot(db.Model):
+    """
+    Open tax lot, what is left of the trade that opened it. Lots and realized P&L are rebuilt from the tape in the
+    same flush as the trades; appending a trade only touches its own (user, stock) book.
+    """
+    __tablename__ = 'lots'
+    __table_args__ = (
+        db.Index('ix_lots_user_id_stock_id', 'user_id', 'stock_id', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), nullable=False)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False)
+    trade_id = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime())
+
+    @staticmethod
+    def on_after_flush(session, flush_context):
+        method = session.app.config['LOT_MATCHING_METHOD']
+        stored = session.info.get('stored_trades', {})
+        replay = set()
+        appended = {}
+        for trade in session.dirty:
+            if isinstance(trade, Trade) and trade.id in stored and \
+                    session.is_modified(trade, include_collections=False):
+                replay.update((stored[trade.id][:2], (trade.user_id, trade.stock_id)))
+        for trade in session.deleted:
+            if isinstance(trade, Trade) and trade.id in stored:
+                replay.add(stored[trade.id][:2])
+        for trade in session.new:
+            if isinstance(trade, Trade):
+                appended.setdefault((trade.user_id, trade.stock_id), []).append(trade)
+        connection = session.connection()
+        for key, trades in appended.items():
+            if key in replay or None in key:
+                continue
+            trades.sort(key=lambda trade: (trade.timestamp, trade.id))
+            if Lot.has_later_trades(connection, key, trades):
+                replay.add(key)
+            else:
+                Lot.append(connection, key, trades, method)
+        for key in replay:
+            if None not in key:
+                Lot.replay(connection, key, method)
+
+    @staticmethod
+    def key_clause(table, key):
+        return (table.c.user_id == key[0]) & (table.c.stock_id == key[1])
+
+    @staticmethod
+    def has_later_trades(connection, key, trades):
+        """True when the new trades are backdated behind the existing ones and the book has to be replayed"""
+        table = Trade.__table__
+        later = db.select([table.c.id]).where(Lot.key_clause(table, key) &
+                                               table.c.id.notin_([trade.id for trade in trades]) &
+                                               (table.c.timestamp > trades[0].timestamp)).limit(1)
+        return connection.execute(later).first() is not None
+
+    @staticmethod
+    def append(connection, key, trades, method):
+        """
+        Book new trades against the stored open lots of key. Only the lots the trades closed or shrank are deleted
+        or updated and only the lots they opened are inserted, the rest of the book is not written.
+        """
+        table = Lot.__table__
+        stored = connection.execute(db.select([table.c.id, table.c.trade_id, table.c.quantity, table.c.price])
+                                    .where(Lot.key_clause(table, key)).order_by(table.c.id)).fetchall()
+        book = LotBook(method, [(row.trade_id, row.quantity, row.price) for row in stored])
+        realized = []
+        for trade in trades:
+            for open_id, close_id, quantity, open_price, close_price, pnl in \
+                    book.apply(trade.id, trade.quantity or 0, float(trade.price or 0)):
+                realized.append({'user_id': key[0], 'stock_id': key[1], 'open_trade_id': open_id,
+                                 'close_trade_id': close_id, 'quantity': quantity, 'open_price': open_price,
+                                 'close_price': close_price, 'pnl': pnl, 'timestamp': trade.timestamp})
+        remaining = {trade_id: quantity for trade_id, quantity, price in book.lots}
+        closed = [row.id for row in stored if row.trade_id not in remaining]
+        if closed:
+            connection.execute(table.delete().where(table.c.id.in_(closed)))
+        for row in stored:
+            if row.trade_id in remaining and remaining[row.trade_id] != row.quantity:
+                connection.execute(table.update().where(table.c.id == row.id)
+                                   .values(quantity=remaining[row.trade_id]))
+        new_trades = {trade.id: trade for trade in trades}
+        opened = [{'user_id': key[0], 'stock_id': key[1], 'trade_id': trade_id, 'quantity': quantity,
+                   'price': price, 'timestamp': new_trades[trade_id].timestamp}
+                  for trade_id, quantity, price in book.lots if trade_id in new_trades]
+        if opened:
+            connection.execute(table.insert(), opened)
+        if realized:
+            connection.execute(RealizedPnl.__table__.insert(), realized)
+
+    @staticmethod
+    def replay(connection, key, method):
+        """Recompute the lots and realized P&L of key from its trades"""
+        trades = Trade.__table__
+        for table in (Lot.__table__, RealizedPnl.__table__):
+            connection.execute(table.delete().where(Lot.key_clause(table, key)))
+        rows = connection.execute(db.select([trades.c.id, trades.c.quantity, trades.c.price, trades.c.timestamp])
+                                  .where(Lot.key_clause(trades, key))
+                                  .order_by(trades.c.timestamp, trades.c.id)).fetchall()
+        if rows:
+            ids, quantities, prices, timestamps = zip(*rows)
+            Lot.write_matches(connection, key, ids, quantities, prices, timestamps, method)
+
+    @staticmethod
+    def write_matches(connection, key, ids, quantities, prices, timestamps, method):
+        """Replay one book in trade order and insert its lots and realized P&L"""
+        matches, open_lots = match_lots([quantity or 0 for quantity in quantities],
+                                        [price or 0.0 for price in prices], method)
+        user_id, stock_id = key
+        realized = [{'user_id': user_id, 'stock_id': stock_id, 'open_trade_id': ids[open_index],
+                     'close_trade_id': ids[close_index], 'quantity': quantity, 'open_price': open_price,
+                     'close_price': close_price, 'pnl': pnl, 'timestamp': timestamps[close_index]}
+                    for open_index, close_index, quantity, open_price, close_price, pnl
+                    in zip(*(column.tolist() for column in matches))]
+        lots = [{'user_id': user_id, 'stock_id': stock_id, 'trade_id': ids[index], 'quantity': quantity,
+                 'price': price, 'timestamp': timestamps[index]}
+                for index, quantity, price in zip(*(column.tolist() for column in open_lots))]
+        if realized:
+            connection.execute(RealizedPnl.__table__.insert(), realized)
+        if lots:
+            connection.execute(Lot.__table__.insert(), lots)
+        return len(realized), len(lots)
+
+    @staticmethod
+    def rebuild(method=None):
+        """Replay every book from the trades table in one ordered pass, for backfills and method changes"""
+        method = method or current_app.config['LOT_MATCHING_METHOD']
+        trades = Trade.__table__
+        connection = db.session.connection()
+        for table in (Lot.__table__, RealizedPnl.__table__):
+            connection.execute(table.delete())
+        rows = connection.execute(db.select([trades.c.user_id, trades.c.stock_id, trades.c.id, trades.c.quantity,
+                                             trades.c.price, trades.c.timestamp])
+                                  .where(trades.c.user_id.isnot(None) & trades.c.stock_id.isnot(None))
+                                  .order_by(trades.c.user_id, trades.c.stock_id, trades.c.timestamp,
+                                            trades.c.id)).fetchall()
+        realized = lots = 0
+        for key, book in groupby(rows, key=lambda row: (row[0], row[1])):
+            ids, quantities, prices, timestamps = zip(*(row[2:] for row in book))
+            written = Lot.write_matches(connection, key, ids, quantities, prices, timestamps, method)
+            realized += written[0]
+            lots += written[1]
+        db.session.commit()
+        return realized, lots
+
+
+class RealizedPnl(db.Model):
+    """Quantity of one lot closed by one trade and the profit it realized, quantity is negative for short lots"""
+    __tablename__ = 'realized_pnl'
+    __table_args__ = (
+        db.Index('ix_realized_pnl_user_id_stock_id', 'user_id', 'stock_id', 'timestamp'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), nullable=False)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False)
+    open_trade_id = db.Column(db.Integer, nullable=False)
+    close_trade_id = db.Column(db.Integer, nullable=False, index=True)
+    quantity = db.Column(db.Integer, nullable=False)
+    open_price = db.Column(db.Float, nullable=False)
+    close_price = db.Column(db.Float, nullable=False)
+    pnl = db.Column(db.Float, nullable=False)
+    timestamp = db.Column(db.DateTime())
+    stock = db.relationship('Stock', lazy='joined', viewonly=True)
+
+    def to_json(self):
+        return {
+            'stock': self.stock.ticker,
+            'open_trade_url': url_for('api.get_trade', trade_id=self.open_trade_id),
+            'close_trade_url': url_for('api.get_trade', trade_id=self.close_trade_id),
+            'quantity': self.quantity,
+            'open_price': self.open_price,
+            'close_price': self.close_price,
+            'pnl': self.pnl,
+            'timestamp': self.timestamp
+        }
+
+    @staticmethod
+    def summary(user):
+        """
+        Realized and unrealized P&L of user per stock, marked at each stock's last traded price
+        :return: list of dicts ordered by stock id
+        """
+        realized = dict(db.session.query(RealizedPnl.stock_id, db.func.sum(RealizedPnl.pnl))
+                        .filter(RealizedPnl.user_id == user.id).group_by(RealizedPnl.stock_id).all())
+        open_lots = {stock_id: (quantity, cost) for stock_id, quantity, cost in
+                     db.session.query(Lot.stock_id, db.func.sum(Lot.quantity), db.func.sum(Lot.quantity * Lot.price))
+                     .filter(Lot.user_id == user.id).group_by(Lot.stock_id).all()}
+        stock_ids = sorted(set(realized) | set(open_lots))
+        stocks = {stock.id: stock for stock in Stock.query.filter(Stock.id.in_(stock_ids))} if stock_ids else {}
+        summary = []
+        for stock_id in stock_ids:
+            quantity, cost = open_lots.get(stock_id, (0, 0.0))
+            mark = stocks[stock_id].last_price() if quantity else None
+            summary.append({
+                'stock': stocks[stock_id],
+                'realized': realized.get(stock_id, 0.0),
+                'open_quantity': quantity,
+                'mark': mark,
+                'unrealized': quantity * mark - cost if mark is not None else None
+            })
+        return summary
+
+
+class PortfolioValuation(db.Model):
+    """Mark-to-market snapshot of one user's positions written by a valuation run, all rows of a run share as_of"""
+    __tablename__ = 'portfolio_valuations'
+    __table_args__ = (
+        db.Index('ix_portfolio_valuations_user_id_as_of', 'user_id', 'as_of'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), nullable=False)
+    as_of = db.Column(db.DateTime(), nullable=False, index=True)
+    equity = db.Column(db.Float, nullable=False)
+    day_change = db.Column(db.Float, nullable=False)
+    long_exposure = db.Column(db.Float, nullable=False)
+    short_exposure = db.Column(db.Float, nullable=False)
+    gross_exposure = db.Column(db.Float, nullable=False)
+    positions = db.Column(db.Integer, nullable=False)
+
+    def to_json(self):
+        return {
+            'as_of': self.as_of,
+            'equity': self.equity,
+            'day_change': self.day_change,
+            'long_exposure': self.long_exposure,
+            'short_exposure': self.short_exposure,
+            'gross_exposure': self.gross_exposure,
+            'positions': self.positions
+        }
+
+    @staticmethod
+    def latest(user):
+        return PortfolioValuation.query.filter_by(user_id=user.id) \
+            .order_by(PortfolioValuation.as_of.desc()).first()
+
+
+class EquityCurve(db.Model):
+    """One user's end-of-day equity, net cash flow into positions and return for one day"""
+    __tablename__ = 'equity_curve'
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), primary_key=True)
+    day = db.Column(db.Date(), primary_key=True, index=True)
+    equity = db.Column(db.Float, nullable=False)
+    cash_flow = db.Column(db.Float, nullable=False)
+    daily_return = db.Column(db.Float, nullable=False)
+
+    @staticmethod
+    def series(user, start=None, end=None):
+        """(days, equity, cash_flow, returns) of user between start and end inclusive"""
+        query = db.session.query(EquityCurve.day, EquityCurve.equity, EquityCurve.cash_flow,
+                                 EquityCurve.daily_return).filter(EquityCurve.user_id == user.id)
+        if start is not None:
+            query = query.filter(EquityCurve.day >= start)
+        if end is not None:
+            query = query.filter(EquityCurve.day <= end)
+        rows = query.order_by(EquityCurve.day).all()
+        if not rows:
+            return [], [], [], []
+        return [list(column) for column in zip(*rows)]
+
+
+class ValueAtRisk(db.Model):
+    """
+    One user's latest simulated 1-day and 10-day Value-at-Risk and Expected Shortfall, as positive losses.
+    The fingerprint covers the risk model and the user's exposures, a re-run skips users whose fingerprint holds.
+    """
+    __tablename__ = 'value_at_risk'
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), primary_key=True)
+    as_of = db.Column(db.Date(), nullable=False)
+    confidence = db.Column(db.Float, nullable=False)
+    var_1d = db.Column(db.Float, nullable=False)
+    es_1d = db.Column(db.Float, nullable=False)
+    var_10d = db.Column(db.Float, nullable=False)
+    es_10d = db.Column(db.Float, nullable=False)
+    fingerprint = db.Column(db.String(40), nullable=False)
+    computed_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)
+
+    def to_json(self):
+        return {
+            'as_of': self.as_of.isoformat(),
+            'confidence': self.confidence,
+            'var_1d': self.var_1d,
+            'es_1d': self.es_1d,
+            'var_10d': self.var_10d,
+            'es_10d': self.es_10d,
+            'computed_at': self.computed_at
+        }
+
+
+class AlertKind:
+    """'above' and 'below' thresholds are prices, a 'percent' threshold is a fraction of the reference price"""
+    ABOVE = 'above'
+    BELOW = 'below'
+    PERCENT = 'percent'
+    ALL = (ABOVE, BELOW, PERCENT)
+
+
+class Alert(db.Model):
+    """A user's price alert on one stock, active until it is triggered or cancelled"""
+    __tablename__ = 'alerts'
+    __table_args__ = (
+        db.Index('ix_alerts_user_id_created_at', 'user_id', 'created_at'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(USERS_ID), nullable=False)
+    stock_id = db.Column(db.Integer, db.ForeignKey('stocks.id'), nullable=False)
+    kind = db.Column(db.String(8), nullable=False)
+    threshold = db.Column(db.Float, nullable=False)
+    reference_price = db.Column(db.Float)
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow, nullable=False)
+    cancelled_at = db.Column(db.DateTime(), index=True)
+    triggered_at = db.Column(db.DateTime())
+    triggered_price = db.Column(db.Float)
+    delivered_at = db.Column(db.DateTime())
+    user = db.relationship('User')
+    stock = db.relationship('Stock')
+
+    @property
+    def active(self):
+        return self.triggered_at is None and self.cancelled_at is None
+
+    def payload(self):
+        """Broker message and email content of a triggered alert, free of URLs so it renders outside a request"""
+        return {
+            'id': self.id,
+            'user': self.user.username,
+            'stock': self.stock.ticker,
+            'kind': self.kind,
+            'threshold': self.threshold,
+            'reference_price': self.reference_price,
+            'triggered_price': self.triggered_price,
+            'triggered_at': self.triggered_at.isoformat() + 'Z' if self.triggered_at else None
+        }
+
+    def to_json(self):
+        json_alert = self.payload()
+        json_alert['url'] = url_for('api.cancel_alert', alert_id=self.id)
+        json_alert['created_at'] = self.created_at
+        json_alert['cancelled_at'] = self.cancelled_at
+        json_alert['active'] = self.active
+        return json_alert
+
+    @staticmethod
+    def from_json(json_alert, user):
+        ticker = json_alert.get('stock')
+        if not ticker:
+            raise ValidationError('alert does not have a stock ticker')
+        stock = Stock.query.filter_by(ticker=ticker).first()
+        if stock is None:
+            raise ValidationError('stock does not exist')
+        kind = json_alert.get('kind')
+        if kind not in AlertKind.ALL:
+            raise ValidationError('alert kind must be one of ' + ', '.join(AlertKind.ALL))
+        threshold = json_alert.get('threshold')
+        if isinstance(threshold, bool) or not isinstance(threshold, (int, float)) or threshold <= 0:
+            raise ValidationError('alert threshold must be a positive number')
+        reference_price = None
+        if kind == AlertKind.PERCENT:
+            if threshold >= 1:
+                raise ValidationError('percent alert threshold is a fraction below 1')
+            quote = stock.quote()
+            reference_price = quote.price if quote is not None else stock.last_price()
+            if reference_price is None:
+                raise ValidationError('stock has no price to measure a percent move from')
+        return Alert(user_id=user.id, stock_id=stock.id, kind=kind, threshold=float(threshold),
+                     reference_price=reference_price)
+
+    @staticmethod
+    def changes(after_id, cancelled_since=None):
+        """
+        Rules an alert engine has to load or drop
+        :return: ([(id, stock_id, kind, threshold, reference_price)] of active alerts with id > after_id,
+                  ids of alerts cancelled since cancelled_since)
+        """
+        table = Alert.__table__
+        added = db.session.execute(
+            db.select([table.c.id, table.c.stock_id, table.c.kind, table.c.threshold, table.c.reference_price])
+            .where((table.c.id > after_id) & table.c.triggered_at.is_(None) & table.c.cancelled_at.is_(None))
+            .order_by(table.c.id)).fetchall()
+        cancelled = []
+        if cancelled_since is not None:
+            cancelled = [row[0] for row in db.session.execute(
+                db.select([table.c.id]).where(table.c.cancelled_at >= cancelled_since))]
+        return [tuple(row) for row in added], cancelled
+
+    @staticmethod
+    def trigger(alert_ids, prices, chunk_size=500):
+        """
+        Mark alerts triggered unless they were cancelled meanwhile, and commit
+        :return: the Alerts this call triggered
+        """
+        table = Alert.__table__
+        now = datetime.utcnow()
+        db.session.execute(
+            table.update()
+            .where((table.c.id == db.bindparam('alert_id')) & table.c.triggered_at.is_(None) &
+                   table.c.cancelled_at.is_(None))
+            .values(triggered_at=now, triggered_price=db.bindparam('price')),
+            [{'alert_id': alert_id, 'price': price} for alert_id, price in zip(alert_ids, prices)])
+        TableVersion.bump(db.session, {Alert.__tablename__})
+        db.session.commit()
+        triggered = []
+        for offset in range(0, len(alert_ids), chunk_size):
+            triggered.extend(Alert.query.filter(Alert.id.in_(alert_ids[offset:offset + chunk_size]),
+                                                Alert.triggered_at == now))
+        return triggered
+
+    @staticmethod
+    def mark_delivered(alert_ids):
+        table = Alert.__table__
+        db.session.execute(table.update().where(table.c.id.in_(alert_ids)).values(delivered_at=datetime.utcnow()))
+        db.session.commit()
+
+
 @whooshee.register_model('username', 'email', 'name', 'about_me', 'location')
 class User(UserMixin, db.Model):
     __tablename__ = 'users'
@@ -255,7 +1184,13 @@ class User(UserMixin, db.Model):
     member_since = db.Column(db.DateTime(), default=datetime.utcnow)
     last_seen = db.Column(db.DateTime(), default=datetime.utcnow)
     avatar_hash = db.Column(db.String(32))
+    # ping() touches last_seen on every request, keep it from invalidating everything that embeds a username
+    __versioned_separately__ = ('last_seen',)
     trades = db.relationship('Trade', backref='user', lazy='dynamic')
+    positions = db.relationship('Position', lazy='dynamic', viewonly=True)
+    alerts = db.relationship('Alert', lazy='dynamic', viewonly=True)
+    option_trades = db.relationship('OptionTrade', backref='user', lazy='dynamic')
+    option_positions = db.relationship('OptionPosition', lazy='dynamic', viewonly=True)
     watches = db.relationship('Watch',
                               foreign_keys=[Watch.user_id],
                               backref=db.backref('user', lazy='joined'),
@@ -370,9 +1305,10 @@ class User(UserMixin, db.Model):
 
     def ping(self):
         """Called by @auth.before_app_request to update last_login field"""
-        self.last_seen = datetime.utcnow()
-        db.session.add(self)
-        db.session.commit()
+        def touch():
+            self.last_seen = datetime.utcnow()
+            db.session.add(self)
+        write_with_retry(touch, sticky=False)
 
     def gravatar_hash(self):
         return hashlib.md5(self.email.lower().encode('utf-8')).hexdigest()
@@ -423,19 +1359,22 @@ class User(UserMixin, db.Model):
 
     def watch(self, stock):
         if not self.is_watching(stock):
-            watch = Watch(user=self, stock=stock)
-            db.session.add(watch)
-            db.session.commit()
+            write_with_retry(lambda: db.session.add(Watch(user=self, stock=stock)))
 
     def unwatch(self, stock):
         watch = self.watches.filter_by(stock_id=stock.id).first()
         if watch:
-            db.session.delete(watch)
-            db.session.commit()
+            write_with_retry(lambda: db.session.delete(watch))
 
     @property
     def followed_trades(self):
-        return Trade.query.join(Follow, Follow.followed_id == Trade.user_id).filter(Follow.follower_id == self.id)
+        """
+        Correlated EXISTS instead of a join so SQLite walks ix_trades_timestamp in order and probes the follows
+        primary key for each trade. Joining on follower_id forces a temp B-tree sort of the merged rows.
+        """
+        is_followed = Follow.query.filter(Follow.followed_id == Trade.user_id,
+                                          Follow.follower_id == self.id).exists()
+        return Trade.query.filter(is_followed)
 
     @staticmethod
     def add_self_follows():
@@ -480,10 +1419,218 @@ class User(UserMixin, db.Model):
             'last_seen': self.last_seen,
             'trades_url': url_for('api.get_user_trades', username=self.username),
             'followed_trades_url': url_for('api.get_user_followed_trades', username=self.username),
+            'positions_url': url_for('api.get_user_positions', username=self.username),
             'trade_count': self.trades.count()
         }
 
 
+class TableVersion(db.Model):
+    """
+    Change counter per table, bumped in the same transaction as the change so every worker sees the same value.
+    Read endpoints use the counters of the tables they read from as cheap HTTP validators.
+    """
+    __tablename__ = 'table_versions'
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    @staticmethod
+    def changed_keys(session):
+        """
+        Version keys touched by the pending flush. Updates limited to a model's __versioned_separately__ columns
+        bump '<table>.<column>' instead of the table key.
+        """
+        keys = set()
+        for instance in session.new | session.deleted:
+            keys.add(instance.__table__.name)
+        for instance in session.dirty:
+            if not session.is_modified(instance, include_collections=False):
+                continue
+            table_name = instance.__table__.name
+            changed = {attr.key for attr in db.inspect(instance).attrs if attr.history.has_changes()}
+            separately = set(getattr(instance, '__versioned_separately__', ()))
+            if changed and changed <= separately:
+                keys.update(table_name + '.' + column for column in changed)
+            else:
+                keys.add(table_name)
+        keys.discard(TableVersion.__tablename__)
+        return keys
+
+    @staticmethod
+    def on_after_flush(session, flush_context):
+        TableVersion.bump(session, TableVersion.changed_keys(session))
+
+    @staticmethod
+    def bump(session, keys):
+        """Bump the version keys in the session's transaction, for writes that bypass the unit of work too"""
+        if not keys:
+            return
+        table = TableVersion.__table__
+        connection = session.connection()
+        now = datetime.utcnow()
+        for key in sorted(keys):
+            result = connection.execute(table.update()
+                                        .where(table.c.table_name == key)
+                                        .values(version=table.c.version + 1, updated_at=now))
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(table_name=key, version=1, updated_at=now))
+        session.info.setdefault('changed_tables', set()).update(keys)
+
+    @staticmethod
+    def on_after_commit(session):
+        response_cache.invalidate(session.info.pop('changed_tables', ()))
+
+    @staticmethod
+    def on_after_rollback(session):
+        session.info.pop('changed_tables', None)
+
+    @staticmethod
+    def lookup(keys):
+        """
+        :param keys: version keys, table names or '<table>.<column>'
+        :return: tuple of versions in the order of keys and the latest change time among them, None if never changed
+        """
+        rows = db.session.query(TableVersion.table_name, TableVersion.version, TableVersion.updated_at) \
+            .filter(TableVersion.table_name.in_(keys)).all()
+        found = {row.table_name: row for row in rows}
+        versions = tuple(found[key].version if key in found else 0 for key in keys)
+        changed_at = [row.updated_at for row in rows if row.updated_at is not None]
+        return versions, max(changed_at) if changed_at else None
+
+
+class TradeChange(db.Model):
+    """
+    Append-only log of trade inserts, edits and deletes written in the same flush as the change.
+    seq is AUTOINCREMENT so it is never reused, and SQLite commits one writer at a time, so a client that has seen
+    seq N has seen every change up to N.
+    """
+    __tablename__ = 'trade_changes'
+    __table_args__ = {'sqlite_autoincrement': True}
+    INSERT: Final = 'insert'
+    UPDATE: Final = 'update'
+    DELETE: Final = 'delete'
+    seq = db.Column(db.Integer, primary_key=True)
+    trade_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, index=True)
+    stock_id = db.Column(db.Integer)
+    operation = db.Column(db.String(8), nullable=False)
+    timestamp = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    @staticmethod
+    def on_after_flush(session, flush_context):
+        """
+        Log the flushed trades. A trade moved to another user is also logged as deleted under its previous owner,
+        whose followers' timelines only see changes logged under that user; the stored owner comes from
+        Position.on_before_flush.
+        """
+        rows = []
+        stored = session.info.get('stored_trades', {})
+        for operation, instances in ((TradeChange.INSERT, session.new),
+                                     (TradeChange.UPDATE, session.dirty),
+                                     (TradeChange.DELETE, session.deleted)):
+            for trade in instances:
+                if not isinstance(trade, Trade):
+                    continue
+                if operation == TradeChange.UPDATE and not session.is_modified(trade, include_collections=False):
+                    continue
+                previous = stored.get(trade.id)
+                if operation == TradeChange.UPDATE and previous is not None and previous[0] != trade.user_id:
+                    rows.append({'trade_id': trade.id, 'user_id': previous[0], 'stock_id': previous[1],
+                                 'operation': TradeChange.DELETE, 'timestamp': datetime.utcnow()})
+                rows.append({'trade_id': trade.id, 'user_id': trade.user_id, 'stock_id': trade.stock_id,
+                             'operation': operation, 'timestamp': datetime.utcnow()})
+        if rows:
+            session.connection().execute(TradeChange.__table__.insert(), rows)
+
+    @staticmethod
+    def current_cursor():
+        return db.session.query(db.func.max(TradeChange.seq)).scalar() or 0
+
+    @staticmethod
+    def since(cursor, limit, user_filter=None):
+        """
+        Changes after cursor in seq order
+        :param user_filter: optional clause on TradeChange.user_id, e.g. to restrict to followed users
+        """
+        query = TradeChange.query.filter(TradeChange.seq > cursor)
+        if user_filter is not None:
+            query = query.filter(user_filter)
+        return query.order_by(TradeChange.seq).limit(limit).all()
+
+
+class BrokerMessage(db.Model):
+    """
+    Cross-worker message log for the live streams. Each commit writes its messages once in the same flush, every
+    worker's Relay tails the table and fans them out to its own subscribers.
+    """
+    __tablename__ = 'broker_messages'
+    __table_args__ = {'sqlite_autoincrement': True}
+    seq = db.Column(db.Integer, primary_key=True)
+    topic = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    timestamp = db.Column(db.DateTime(), index=True, default=datetime.utcnow)
+
+    @staticmethod
+    def on_after_flush(session, flush_context):
+        trades = [(TradeChange.INSERT, trade) for trade in session.new if isinstance(trade, Trade)]
+        trades += [(TradeChange.UPDATE, trade) for trade in session.dirty
+                   if isinstance(trade, Trade) and session.is_modified(trade, include_collections=False)]
+        if not trades:
+            return
+        connection = session.connection()
+        tickers = dict(connection.execute(db.select([Stock.id, Stock.ticker]).where(
+            Stock.id.in_({trade.stock_id for operation, trade in trades}))).fetchall())
+        usernames = dict(connection.execute(db.select([User.id, User.username]).where(
+            User.id.in_({trade.user_id for operation, trade in trades}))).fetchall())
+        now = datetime.utcnow()
+        rows = [{'topic': 'trades', 'timestamp': now, 'payload': json.dumps({
+            'id': trade.id,
+            'operation': operation,
+            'stock': tickers.get(trade.stock_id),
+            'user': usernames.get(trade.user_id),
+            'quantity': trade.quantity,
+            'price': trade.price,
+            'timestamp': (trade.timestamp or now).isoformat() + 'Z'})} for operation, trade in trades]
+        connection.execute(BrokerMessage.__table__.insert(), rows)
+
+    @staticmethod
+    def publish(topic, payloads):
+        """Queue messages written outside a model flush, e.g. by the market feed, and commit them"""
+        now = datetime.utcnow()
+        db.session.execute(BrokerMessage.__table__.insert(),
+                           [{'topic': topic, 'payload': json.dumps(payload), 'timestamp': now}
+                            for payload in payloads])
+        db.session.commit()
+
+    @staticmethod
+    def current_seq():
+        return db.session.query(db.func.max(BrokerMessage.seq)).scalar() or 0
+
+    @staticmethod
+    def since(seq, limit):
+        return BrokerMessage.query.filter(BrokerMessage.seq > seq).order_by(BrokerMessage.seq).limit(limit).all()
+
+    @staticmethod
+    def prune(cutoff):
+        BrokerMessage.query.filter(BrokerMessage.timestamp < cutoff).delete(synchronize_session=False)
+        db.session.commit()
+
+
+db.event.listen(db.session, 'after_flush', TableVersion.on_after_flush)
+db.event.listen(db.session, 'after_flush', TradeChange.on_after_flush)
+db.event.listen(db.session, 'after_flush', BrokerMessage.on_after_flush)
+db.event.listen(db.session, 'before_flush', Position.on_before_flush)
+db.event.listen(Position, 'expire', Position.on_expire)
+db.event.listen(db.session, 'after_flush', Position.on_after_flush)
+db.event.listen(db.session, 'before_flush', OptionPosition.on_before_flush)
+db.event.listen(db.session, 'after_flush', OptionPosition.on_after_flush)
+db.event.listen(db.session, 'after_flush', Lot.on_after_flush)
+db.event.listen(db.session, 'after_rollback', Position.on_after_rollback)
+db.event.listen(db.session, 'after_rollback', OptionPosition.on_after_rollback)
+db.event.listen(db.session, 'after_commit', TableVersion.on_after_commit)
+db.event.listen(db.session, 'after_rollback', TableVersion.on_after_rollback)
+
+
 @login_manager.user_loader
 def load_user(user_id):
     return User.query.get(int(user_id))
@@ -0,0 +1,89 @@
+"""
+Option chain loading. Chains arrive as CSV files with one contract per row, a header of expiry, strike and kind and
+optionally ticker and multiplier. They are written through OptionContract.load in chunks so a file of whole chains
+costs a handful of statements instead of one round trip per contract. Every row is parsed before the first chunk is
+loaded, so a bad row leaves the table as it was.
+"""
+import csv
+import io
+from collections import namedtuple
+from datetime import date
+
+from .models import OptionContract, OptionKind
+
+ChainImportResult = namedtuple('ChainImportResult', ['inserted', 'updated', 'tickers', 'skipped'])
+
+KINDS = {'c': OptionKind.CALL, 'call': OptionKind.CALL, 'p': OptionKind.PUT, 'put': OptionKind.PUT}
+
+
+def parse_kind(value):
+    kind = KINDS.get(value.strip().lower())
+    if kind is None:
+        raise ValueError('option kind must be call or put, got {!r}'.format(value))
+    return kind
+
+
+def parse_contract(row, stock_id, default_multiplier):
+    multiplier = (row.get('multiplier') or '').strip()
+    return {
+        'underlying_id': stock_id,
+        'expiry': date.fromisoformat(row['expiry'].strip()),
+        'strike': float(row['strike']),
+        'kind': parse_kind(row['kind']),
+        'multiplier': int(multiplier) if multiplier else default_multiplier
+    }
+
+
+def read_contracts(csv_file, stock_ids, ticker=None, default_multiplier=100):
+    """
+    Parse a chain CSV
+    :return: iterator of (ticker, contract dict), None for each row of an unknown ticker
+    :raises ValueError: for a missing column or a bad row, naming its line
+    """
+    reader = csv.DictReader(csv_file)
+    fields = set(reader.fieldnames or ())
+    if not {'expiry', 'strike', 'kind'} <= fields or (ticker is None and 'ticker' not in fields):
+        raise ValueError('CSV needs expiry, strike and kind columns, and a ticker column unless a ticker is given')
+    for row in reader:
+        symbol = ticker or (row['ticker'] or '').strip().upper()
+        if symbol not in stock_ids:
+            yield None
+            continue
+        try:
+            yield symbol, parse_contract(row, stock_ids[symbol], default_multiplier)
+        except (TypeError, ValueError) as e:
+            raise ValueError('line {}: {}'.format(reader.line_num, e))
+
+
+def import_chains(csv_file, stock_ids, chunk_rows=10000, ticker=None, default_multiplier=100):
+    """
+    Stream a chain CSV into option_contracts, chunk_rows contracts per bulk load, after a first pass that parses
+    every row; a file that cannot be read twice is buffered in memory
+    :param stock_ids: dict of ticker to stock id, rows of other tickers are counted as skipped
+    :param ticker: ticker of every row when the file has no ticker column
+    :return: ChainImportResult
+    """
+    if not csv_file.seekable():
+        csv_file = io.StringIO(csv_file.read())
+    start = csv_file.tell()
+    for _ in read_contracts(csv_file, stock_ids, ticker, default_multiplier):
+        pass
+    csv_file.seek(start)
+    inserted = updated = skipped = 0
+    tickers = set()
+    chunk = []
+    for parsed in read_contracts(csv_file, stock_ids, ticker, default_multiplier):
+        if parsed is None:
+            skipped += 1
+            continue
+        symbol, contract = parsed
+        chunk.append(contract)
+        tickers.add(symbol)
+        if len(chunk) >= chunk_rows:
+            new, changed = OptionContract.load(chunk)
+            inserted, updated = inserted + new, updated + changed
+            chunk = []
+    if chunk:
+        new, changed = OptionContract.load(chunk)
+        inserted, updated = inserted + new, updated + changed
+    return ChainImportResult(inserted, updated, sorted(tickers), skipped)
@@ -0,0 +1,201 @@
+"""
+Daily equity curve per user: end-of-day equity, the day's net cash flow into positions and the day's return.
+The curve is computed from the trade tape. Users are split into chunks and the pure NumPy functions below can run
+in a process pool, the parent does all database reads and writes.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from flask import current_app
+
+from . import db
+from .models import EquityCurve, Stock, TableVersion, Trade
+from .valuation import last_prices
+
+Curves = namedtuple('Curves', ['users', 'first_day', 'equity', 'cash_flow', 'returns'])
+
+
+def close_prices(stock_ids, day_indexes, prices, seed, days):
+    """
+    Forward-filled close price matrix
+    :param stock_ids, day_indexes, prices: trades inside the range in time order
+    :param seed: price vector of the last trades before the range
+    :return: (days + 1, stocks) array, row 0 is the seed and row d + 1 the close of day d, NaN until a first trade
+    """
+    size = len(seed)
+    closes = np.full((days + 1, size), np.nan)
+    closes[0] = seed
+    if len(stock_ids):
+        cells = (np.asarray(day_indexes) + 1) * size + np.asarray(stock_ids)
+        # The last trade of each (day, stock) is the first occurrence in the reversed tape
+        unique_cells, reversed_index = np.unique(cells[::-1], return_index=True)
+        closes.flat[unique_cells] = np.asarray(prices)[len(cells) - 1 - reversed_index]
+    filled = np.where(np.isnan(closes), 0, np.arange(days + 1)[:, None])
+    np.maximum.accumulate(filled, axis=0, out=filled)
+    return closes[filled, np.arange(size)]
+
+
+def equity_curves(user_ids, stock_ids, day_indexes, quantities, prices, initial, closes):
+    """
+    Equity curves of one chunk of users
+    :param user_ids, stock_ids, day_indexes, quantities, prices: the chunk's trades inside the range
+    :param initial: (user_ids, stock_ids, quantities) of the chunk's holdings before the range
+    :param closes: close_prices matrix
+    :return: Curves with (users, days) arrays and each user's first day with holdings or trades
+    """
+    days = closes.shape[0] - 1
+    size = closes.shape[1]
+    initial_users, initial_stocks, initial_quantities = (np.asarray(column, dtype=np.int64) for column in initial)
+    user_ids = np.asarray(user_ids, dtype=np.int64)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    trade_pairs = user_ids * size + np.asarray(stock_ids, dtype=np.int64)
+    pairs, pair_index = np.unique(np.concatenate((initial_users * size + initial_stocks, trade_pairs)),
+                                  return_inverse=True)
+    if not len(pairs):
+        empty = np.zeros((0, days))
+        return Curves(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), empty, empty, empty)
+    # Column 0 holds the opening quantity, column d + 1 the quantity traded on day d
+    columns = np.concatenate((np.zeros(len(initial_users), dtype=np.int64), np.asarray(day_indexes) + 1))
+    flows = np.bincount(pair_index * (days + 1) + columns,
+                        weights=np.concatenate((initial_quantities.astype(np.float64), quantities)),
+                        minlength=len(pairs) * (days + 1)).reshape(len(pairs), days + 1)
+    holdings = np.cumsum(flows, axis=1)
+    values = holdings * np.nan_to_num(closes[:, pairs % size].T)
+
+    pair_users = pairs // size
+    starts = np.flatnonzero(np.concatenate(([True], pair_users[1:] != pair_users[:-1])))
+    users = pair_users[starts]
+    equity = np.add.reduceat(values, starts, axis=0)
+    owner = np.searchsorted(users, user_ids)
+    cash_flow = np.bincount(owner * days + np.asarray(day_indexes), weights=quantities * np.asarray(prices),
+                            minlength=len(users) * days).reshape(len(users), days)
+    active = np.add.reduceat(flows != 0, starts, axis=0)
+    first_day = np.maximum(np.argmax(active, axis=1) - 1, 0)
+
+    previous, equity = equity[:, :-1], equity[:, 1:]
+    invested = previous + cash_flow
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.where(np.abs(invested) > 1e-9, (equity - invested) / invested, 0.0)
+    return Curves(users, first_day, equity, cash_flow, returns)
+
+
+def downsample(equity, cash_flow, returns, points):
+    """
+    Reduce a curve to at most points buckets: last equity, summed cash flow and compounded return per bucket
+    :return: (index of each bucket's last day, equity, cash_flow, returns)
+    """
+    count = len(equity)
+    if count <= points:
+        return np.arange(count), equity, cash_flow, returns
+    starts = np.linspace(0, count, points, endpoint=False).astype(np.int64)
+    ends = np.concatenate((starts[1:], [count])) - 1
+    growth = np.multiply.reduceat(1.0 + returns, starts) - 1.0
+    return ends, equity[ends], np.add.reduceat(cash_flow, starts), growth
+
+
+def day_start(day):
+    return datetime.combine(day, time())
+
+
+def load_range(start, end):
+    """Trades, opening holdings and seed prices of the days start through end, as arrays"""
+    trades = Trade.__table__
+    begin, finish = day_start(start), day_start(end + timedelta(days=1))
+    size = (db.session.query(db.func.max(Stock.id)).scalar() or 0) + 1
+    rows = db.session.execute(
+        db.select([trades.c.user_id, trades.c.stock_id, trades.c.timestamp, trades.c.quantity, trades.c.price])
+        .where((trades.c.timestamp >= begin) & (trades.c.timestamp < finish) &
+               trades.c.user_id.isnot(None) & trades.c.stock_id.isnot(None))
+        .order_by(trades.c.timestamp, trades.c.id)).fetchall()
+    if rows:
+        user_ids, stock_ids, timestamps, quantities, prices = zip(*rows)
+        day_indexes = (np.array(timestamps, dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(np.int64)
+        tape = (np.array(user_ids, dtype=np.int64), np.array(stock_ids, dtype=np.int64), day_indexes,
+                np.array([quantity or 0 for quantity in quantities], dtype=np.float64),
+                np.array([price or 0.0 for price in prices], dtype=np.float64))
+    else:
+        tape = tuple(np.zeros(0, dtype=dtype) for dtype in (np.int64, np.int64, np.int64, np.float64, np.float64))
+    opening = db.session.execute(
+        db.select([trades.c.user_id, trades.c.stock_id, db.func.sum(trades.c.quantity)])
+        .where((trades.c.timestamp < begin) & trades.c.user_id.isnot(None) & trades.c.stock_id.isnot(None))
+        .group_by(trades.c.user_id, trades.c.stock_id)
+        .having(db.func.sum(trades.c.quantity) != 0)).fetchall()
+    initial = np.array(opening, dtype=np.int64).reshape(-1, 3).T
+    return tape, initial, last_prices(size, before=begin)
+
+
+def chunks(tape, initial, chunk_users):
+    """Split the tape and the opening holdings by user into chunks of at most chunk_users users"""
+    users = np.union1d(tape[0], initial[0])
+    for offset in range(0, len(users), chunk_users):
+        members = users[offset:offset + chunk_users]
+        in_tape = np.isin(tape[0], members)
+        in_initial = np.isin(initial[0], members)
+        yield tuple(column[in_tape] for column in tape), tuple(column[in_initial] for column in initial)
+
+
+_worker_closes = None
+
+
+def _share_closes(closes):
+    """Pool initializer, ships the close matrix to each worker once instead of with every chunk"""
+    global _worker_closes
+    _worker_closes = closes
+
+
+def compute_chunk(tape, initial, closes=None):
+    user_ids, stock_ids, day_indexes, quantities, prices = tape
+    closes = _worker_closes if closes is None else closes
+    return equity_curves(user_ids, stock_ids, day_indexes, quantities, prices, initial, closes)
+
+
+def backfill(start=None, end=None, workers=None, chunk_users=None):
+    """
+    Recompute the equity curve rows of the days start through end from the trade tape. The nightly snapshot is
+    the one-day case.
+    :param start: first day, defaults to the day of the first trade
+    :param end: last day, defaults to yesterday (UTC)
+    :param workers: processes to spread the chunks over, defaults to EQUITY_CURVE_WORKERS, 1 runs inline
+    :return: number of rows written
+    """
+    config = current_app.config
+    end = end or datetime.utcnow().date() - timedelta(days=1)
+    if start is None:
+        first = db.session.query(db.func.min(Trade.timestamp)).scalar()
+        if first is None:
+            return 0
+        start = first.date()
+    if start > end:
+        return 0
+    workers = workers or config['EQUITY_CURVE_WORKERS']
+    chunk_users = chunk_users or config['EQUITY_CURVE_CHUNK_USERS']
+    days = (end - start).days + 1
+    tape, initial, seed = load_range(start, end)
+    closes = close_prices(tape[1], tape[2], tape[4], seed, days)
+    parts = list(chunks(tape, initial, chunk_users))
+    if workers > 1 and len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_share_closes, initargs=(closes,)) as pool:
+            results = list(pool.map(compute_chunk, *zip(*parts)))
+    else:
+        results = [compute_chunk(part_tape, part_initial, closes) for part_tape, part_initial in parts]
+
+    table = EquityCurve.__table__
+    db.session.execute(table.delete().where((table.c.day >= start) & (table.c.day <= end)))
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    written = 0
+    for curves in results:
+        rows = []
+        for user, first_day, equity, cash_flow, returns in zip(curves.users.tolist(), curves.first_day.tolist(),
+                                                               curves.equity.tolist(), curves.cash_flow.tolist(),
+                                                               curves.returns.tolist()):
+            rows.extend({'user_id': user, 'day': dates[offset], 'equity': equity[offset],
+                         'cash_flow': cash_flow[offset], 'daily_return': returns[offset]}
+                        for offset in range(first_day, days))
+        if rows:
+            db.session.execute(table.insert(), rows)
+            written += len(rows)
+    TableVersion.bump(db.session, {EquityCurve.__tablename__})
+    db.session.commit()
+    return written
@@ -0,0 +1,299 @@
+"""
+Net delta, gamma, vega and theta per user and underlying, and firm-wide per underlying.
+Every stock and option position keeps its cached Greek contribution along with the spot and vol it was priced at.
+A refresh reprices only the positions whose trades changed, whose underlying moved more than the spot tolerance,
+whose vol moved more than the vol tolerance or whose day rolled, and applies the differences to running sums.
+Units: delta in shares, gamma in shares per 1.00 of spot, vega per vol point and theta per calendar day.
+"""
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from . import db
+from .greeks import black_scholes, years_to_expiry
+from .implied_vol import IVStatus, implied_vol
+from .models import OptionContract, OptionKind, OptionPosition, OptionTrade, Position, Stock, TableVersion
+from .quote_cache import quote_cache
+from .vol_surface import vol_surfaces
+
+GREEKS = ('delta', 'gamma', 'vega', 'theta')
+TABLES = ('positions', 'option_positions', 'option_contracts', 'option_trades')
+
+Book = namedtuple('Book', ['user', 'underlying', 'contract', 'shares', 'strike', 'expiry', 'call', 'spot', 'vol'])
+
+
+def load_positions():
+    """
+    Every open stock and option position
+    :return: list of (user_id, underlying_id, contract_id, shares, strike, expiry, call), contract_id is 0 for
+             shares and shares is contracts times multiplier for options
+    """
+    stocks = Position.__table__
+    rows = [(user_id, stock_id, 0, float(quantity), np.nan, None, False) for user_id, stock_id, quantity in
+            db.session.execute(db.select([stocks.c.user_id, stocks.c.stock_id, stocks.c.quantity])
+                               .where(stocks.c.quantity != 0))]
+    options, contracts = OptionPosition.__table__, OptionContract.__table__
+    rows.extend((user_id, underlying_id, contract_id, float(quantity * multiplier), strike, expiry,
+                 kind == OptionKind.CALL)
+                for user_id, contract_id, quantity, underlying_id, strike, expiry, kind, multiplier in
+                db.session.execute(
+                    db.select([options.c.user_id, options.c.contract_id, options.c.quantity, contracts.c.underlying_id,
+                               contracts.c.strike, contracts.c.expiry, contracts.c.kind, contracts.c.multiplier])
+                    .select_from(options.join(contracts, options.c.contract_id == contracts.c.id))
+                    .where(options.c.quantity != 0)))
+    return rows
+
+
+def last_option_trades():
+    """Id and premium of the most recent trade of every traded contract, as {contract_id: (trade_id, price)}"""
+    trades = OptionTrade.__table__
+    latest = db.select([db.func.max(trades.c.id)]).group_by(trades.c.contract_id)
+    return {contract_id: (trade_id, price) for contract_id, trade_id, price in
+            db.session.execute(db.select([trades.c.contract_id, trades.c.id, trades.c.price])
+                               .where(trades.c.id.in_(latest)))}
+
+
+def last_option_prices():
+    """Premium of the most recent trade of every traded contract"""
+    return {contract_id: price for contract_id, (_, price) in last_option_trades().items()}
+
+
+class GreekBook:
+    """Cached per-position Greek contributions with running sums, refreshed on read"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.spot_tolerance = self.vol_tolerance = self.default_vol = self.rate = None
+        self.clear()
+
+    def init_app(self, app):
+        self.spot_tolerance = app.config['GREEKS_SPOT_TOLERANCE']
+        self.vol_tolerance = app.config['GREEKS_VOL_TOLERANCE']
+        self.default_vol = app.config['OPTION_DEFAULT_VOL']
+        self.rate = app.config['RISK_FREE_RATE']
+        self.clear()
+
+    def clear(self):
+        self.versions = None
+        self.index = {}
+        self.user = np.zeros(0, dtype=np.int64)
+        self.underlying = np.zeros(0, dtype=np.int64)
+        self.contract = np.zeros(0, dtype=np.int64)
+        self.shares = np.zeros(0)
+        self.strike = np.zeros(0)
+        self.expiry = np.zeros(0, dtype='datetime64[D]')
+        self.call = np.zeros(0, dtype=bool)
+        self.spot = np.zeros(0)
+        self.vol = np.zeros(0)
+        self.day = np.zeros(0, dtype='datetime64[D]')
+        self.contributions = np.zeros((0, len(GREEKS)))
+        self.last_trades = {}
+        # Spot per underlying with the quote sequence it was marked at, implied vol per contract with its key
+        self.underlying_marks, self.trades_version = {}, None
+        self.implied = {}
+        # Marks of the last reprice, one per position
+        self.marked_spot, self.marked_vol = np.zeros(0), np.zeros(0)
+        # Running sums, per (user, underlying) pair and per underlying across the firm
+        self.pairs, self.pair_keys, self.pair_sums = {}, [], np.zeros((0, len(GREEKS)))
+        self.firm, self.firm_keys, self.firm_sums = {}, [], np.zeros((0, len(GREEKS)))
+        self.pair = np.zeros(0, dtype=np.int64)
+        self.firm_row = np.zeros(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.user)
+
+    @staticmethod
+    def group(lookup, keys, key):
+        if key not in lookup:
+            lookup[key] = len(keys)
+            keys.append(key)
+        return lookup[key]
+
+    def accumulate(self, rows, amounts):
+        np.add.at(self.pair_sums, self.pair[rows], amounts)
+        np.add.at(self.firm_sums, self.firm_row[rows], amounts)
+
+    def reload(self):
+        """Pick up changed positions, positions whose size did not change keep their cached contribution"""
+        rows = load_positions()
+        self.last_trades = last_option_trades()
+        self.implied = {contract: cached for contract, cached in self.implied.items() if contract in self.last_trades}
+        keep = np.full(len(rows), -1, dtype=np.int64)
+        for position, row in enumerate(rows):
+            previous = self.index.get(row[:3])
+            if previous is not None and self.shares[previous] == row[3]:
+                keep[position] = previous
+        dropped = np.setdiff1d(np.arange(len(self)), keep[keep >= 0])
+        self.accumulate(dropped, -self.contributions[dropped])
+
+        kept = keep >= 0
+        count = len(rows)
+        columns = list(zip(*rows)) if rows else [()] * 7
+        self.index = {row[:3]: position for position, row in enumerate(rows)}
+        pair = np.array([self.group(self.pairs, self.pair_keys, row[:2]) for row in rows], dtype=np.int64)
+        firm_row = np.array([self.group(self.firm, self.firm_keys, row[1]) for row in rows], dtype=np.int64)
+        self.pair_sums = np.vstack([self.pair_sums, np.zeros((len(self.pair_keys) - len(self.pair_sums),
+                                                              len(GREEKS)))])
+        self.firm_sums = np.vstack([self.firm_sums, np.zeros((len(self.firm_keys) - len(self.firm_sums),
+                                                              len(GREEKS)))])
+        spot, vol, day = np.full(count, np.nan), np.full(count, np.nan), np.zeros(count, dtype='datetime64[D]')
+        contributions = np.zeros((count, len(GREEKS)))
+        spot[kept], vol[kept], day[kept] = self.spot[keep[kept]], self.vol[keep[kept]], self.day[keep[kept]]
+        contributions[kept] = self.contributions[keep[kept]]
+        self.user, self.underlying, self.contract = (np.array(values, dtype=np.int64) for values in columns[:3])
+        self.shares, self.strike = np.array(columns[3], dtype=np.float64), np.array(columns[4], dtype=np.float64)
+        self.expiry = np.array([expiry or '1970-01-01' for expiry in columns[5]], dtype='datetime64[D]')
+        self.call = np.array(columns[6], dtype=bool)
+        self.spot, self.vol, self.day, self.contributions = spot, vol, day, contributions
+        self.pair, self.firm_row = pair, firm_row
+
+    def spots(self, underlyings):
+        """
+        Spot of each underlying, re-marked only when its quote sequence changed; underlyings without a quote are
+        marked off their last trade, so those are re-marked when the trades table changes
+        """
+        sequences = quote_cache.versions(underlyings).tolist()
+        trades_version, _ = TableVersion.lookup(('trades',))
+        if trades_version != self.trades_version:
+            self.underlying_marks = {stock_id: mark for stock_id, mark in self.underlying_marks.items() if mark[0]}
+            self.trades_version = trades_version
+        stale = [position for position, (stock_id, sequence) in enumerate(zip(underlyings.tolist(), sequences))
+                 if self.underlying_marks.get(stock_id, (None,))[0] != sequence]
+        if stale:
+            for position, price in zip(stale, Stock.marks(underlyings[stale]).tolist()):
+                self.underlying_marks[int(underlyings[position])] = (sequences[position], price)
+        return np.array([self.underlying_marks[stock_id][1] for stock_id in underlyings.tolist()], dtype=np.float64)
+
+    def implied_vols(self, options, spot, years, today):
+        """
+        Vol implied by the last trade of each option row, NaN where it has none or the solver did not converge.
+        A contract is solved again only when it trades, its spot leaves its bucket of spot tolerance width, or the
+        day rolls.
+        """
+        vol = np.full(len(options), np.nan)
+        contracts = self.contract[options].tolist()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            buckets = np.floor(np.log(spot) / self.spot_tolerance) if self.spot_tolerance > 0 else spot
+        keys = [(self.last_trades[contract][0], bucket, today) if contract in self.last_trades else None
+                for contract, bucket in zip(contracts, buckets.tolist())]
+        solve = {}
+        for position, (contract, key) in enumerate(zip(contracts, keys)):
+            if key is None or np.isnan(spot[position]):
+                continue
+            cached = self.implied.get(contract)
+            if cached is not None and cached[0] == key:
+                vol[position] = cached[1]
+            else:
+                solve.setdefault(contract, position)
+        if solve:
+            positions = np.array(list(solve.values()), dtype=np.int64)
+            rows = options[positions]
+            prices = np.array([self.last_trades[contract][1] for contract in solve])
+            implied = implied_vol(prices, spot[positions], self.strike[rows], years[positions], self.rate, 0.0,
+                                  self.call[rows])
+            solved = np.where(implied.status == IVStatus.CONVERGED, implied.vol, np.nan)
+            for contract, position, value in zip(solve, positions.tolist(), solved.tolist()):
+                self.implied[contract] = (keys[position], value)
+            for position, (contract, key) in enumerate(zip(contracts, keys)):
+                if contract in solve and key is not None and not np.isnan(spot[position]):
+                    vol[position] = self.implied[contract][1]
+        return vol
+
+    def marks(self, now):
+        """
+        Spot of every position's underlying and vol of every option: implied from its last trade if it has one,
+        else read off its underlying's vol surface, else the default vol
+        """
+        underlyings, positions = np.unique(self.underlying, return_inverse=True)
+        spot = self.spots(underlyings)[positions] if len(underlyings) else np.zeros(0)
+        vol = np.full(len(self), np.nan)
+        options = np.flatnonzero(self.contract > 0)
+        if len(options):
+            years = years_to_expiry(self.expiry[options], now)
+            surface = vol_surfaces.vol(self.underlying[options], self.strike[options], years, now)
+            vol[options] = np.where(np.isnan(surface), self.default_vol, surface)
+            implied = self.implied_vols(options, spot[options], years, np.datetime64(now, 'D'))
+            vol[options] = np.where(np.isnan(implied), vol[options], implied)
+        return spot, vol
+
+    def reprice(self, now):
+        spot, vol = self.marks(now)
+        self.marked_spot, self.marked_vol = spot, vol
+        today = np.datetime64(now, 'D')
+        options = self.contract > 0
+        with np.errstate(invalid='ignore'):
+            moved = ~(np.abs(spot - self.spot) <= self.spot_tolerance * np.abs(self.spot))
+            vol_moved = ~(np.abs(vol - self.vol) <= self.vol_tolerance)
+        stale = np.flatnonzero(moved | (options & (vol_moved | (self.day != today))))
+        if not len(stale):
+            return 0
+        amounts = np.zeros((len(stale), len(GREEKS)))
+        amounts[:, 0] = np.where(options[stale], 0.0, self.shares[stale])
+        rows = stale[options[stale]]
+        if len(rows):
+            greeks = black_scholes(spot[rows], self.strike[rows], years_to_expiry(self.expiry[rows], now), self.rate,
+                                   0.0, vol[rows], self.call[rows])
+            shares = self.shares[rows]
+            amounts[options[stale]] = np.nan_to_num(np.column_stack([
+                shares * greeks.delta, shares * greeks.gamma, shares * greeks.vega / 100, shares * greeks.theta / 365
+            ]))
+        self.accumulate(stale, amounts - self.contributions[stale])
+        self.contributions[stale] = amounts
+        self.spot[stale], self.vol[stale], self.day[stale] = spot[stale], vol[stale], today
+        return len(stale)
+
+    def refresh(self, now=None):
+        """
+        Bring the book up to date
+        :return: number of positions repriced
+        """
+        now = now or datetime.utcnow()
+        with self.lock:
+            versions, _ = TableVersion.lookup(TABLES)
+            if versions != self.versions:
+                self.reload()
+                self.versions = versions
+            return self.reprice(now)
+
+    def snapshot(self, now=None):
+        """Copy of every open position with the current spot of its underlying and the vol of its option"""
+        now = now or datetime.utcnow()
+        self.refresh(now)
+        with self.lock:
+            return Book(self.user.copy(), self.underlying.copy(), self.contract.copy(), self.shares.copy(),
+                        self.strike.copy(), self.expiry.copy(), self.call.copy(), self.marked_spot.copy(),
+                        self.marked_vol.copy())
+
+    @staticmethod
+    def summary(keys, sums):
+        underlyings = [dict(zip(GREEKS, values), stock_id=key) for key, values in zip(keys, sums.tolist())]
+        total = dict(zip(GREEKS, sums.sum(axis=0).tolist() if len(sums) else [0.0] * len(GREEKS)))
+        return {'underlyings': underlyings, 'total': total}
+
+    def user_greeks(self, user_id):
+        """Net Greeks of one user per underlying and in total, after a refresh"""
+        self.refresh()
+        with self.lock:
+            held = np.unique(self.pair[self.user == user_id])
+            return self.summary([self.pair_keys[group][1] for group in held.tolist()], self.pair_sums[held])
+
+    def firm_greeks(self):
+        """Net Greeks of every user together per underlying and in total, after a refresh"""
+        self.refresh()
+        with self.lock:
+            held = np.unique(self.firm_row)
+            return self.summary([self.firm_keys[group] for group in held.tolist()], self.firm_sums[held])
+
+
+def with_tickers(summary):
+    """Swap the stock ids of a user_greeks or firm_greeks summary for tickers, in ticker order"""
+    stock_ids = [entry['stock_id'] for entry in summary['underlyings']]
+    tickers = dict(db.session.query(Stock.id, Stock.ticker).filter(Stock.id.in_(stock_ids))) if stock_ids else {}
+    underlyings = [dict({name: value for name, value in entry.items() if name != 'stock_id'},
+                        stock=tickers.get(entry['stock_id'])) for entry in summary['underlyings']]
+    return dict(summary, underlyings=sorted(underlyings, key=lambda entry: entry['stock'] or ''))
+
+
+greek_book = GreekBook()
@@ -0,0 +1,245 @@
+"""
+Append-only columnar price history, one directory per ticker with one raw little-endian file per column.
+Readers memory-map the columns and slice them by time with a binary search, so a range read costs two searches and
+no row objects. The row count is the shortest column, a reader racing an append never sees a half-written row.
+"""
+import csv
+import fcntl
+import os
+import re
+import shutil
+from collections import namedtuple
+from contextlib import contextmanager
+
+import numpy as np
+
+COLUMNS = (('timestamp', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'), ('close', '<f8'),
+           ('volume', '<f8'))
+DTYPES = dict(COLUMNS)
+PRICE_COLUMNS = ('open', 'high', 'low', 'close')
+
+ImportResult = namedtuple('ImportResult', ['rows', 'tickers', 'skipped'])
+
+
+def ticker_directory(ticker):
+    """
+    File name of a ticker's directory: letters and digits as they are, every other character as _ and its UTF-8
+    bytes in hex, so BRK.B is stored under BRK_2EB
+    """
+    if not ticker or not ticker.strip():
+        raise ValueError('invalid ticker {!r}'.format(ticker))
+    return ''.join(character if character.isascii() and character.isalnum() else
+                   ''.join('_{:02X}'.format(byte) for byte in character.encode('utf-8'))
+                   for character in ticker.upper())
+
+
+def directory_ticker(name):
+    """Ticker stored under a directory name, None for names ticker_directory never produces"""
+    try:
+        ticker = re.sub('(?:_[0-9A-F]{2})+', lambda escaped: bytes.fromhex(escaped.group().replace('_', '')).decode(
+            'utf-8'), name)
+    except UnicodeDecodeError:
+        return None
+    return ticker if ticker and ticker_directory(ticker) == name else None
+
+
+def to_epoch_seconds(values):
+    """ISO dates or date-times, or datetime64 values, as int64 seconds since the epoch"""
+    values = np.asarray(values)
+    if values.dtype.kind in 'UO':
+        values = np.char.replace(values.astype(str), ' ', 'T')
+    return values.astype('datetime64[s]').astype(np.int64)
+
+
+class PriceSlice(dict):
+    """Column name to array, timestamps as datetime64[s]; the arrays are read-only views of the mapped files"""
+
+    def __len__(self):
+        return len(self['timestamp']) if 'timestamp' in self else len(next(iter(self.values()), ()))
+
+
+class PriceStore:
+    def __init__(self, root=None):
+        self.root = root
+
+    def init_app(self, app):
+        self.root = app.config['PRICE_STORE_DIR']
+
+    def path(self, ticker, column=None):
+        directory = os.path.join(self.root, ticker_directory(ticker))
+        return directory if column is None else os.path.join(directory, column + '.bin')
+
+    def tickers(self):
+        if not os.path.isdir(self.root):
+            return []
+        tickers = (directory_ticker(name) for name in os.listdir(self.root)
+                   if os.path.isdir(os.path.join(self.root, name)))
+        return sorted(ticker for ticker in tickers if ticker is not None)
+
+    def length(self, ticker):
+        """Number of complete rows stored for ticker"""
+        sizes = []
+        for column, dtype in COLUMNS:
+            try:
+                sizes.append(os.path.getsize(self.path(ticker, column)) // np.dtype(dtype).itemsize)
+            except FileNotFoundError:
+                return 0
+        return min(sizes)
+
+    def version(self, ticker):
+        """Row count and close column mtime of ticker, changed by appends and by rewrites of stored rows"""
+        try:
+            return self.length(ticker), os.stat(self.path(ticker, 'close')).st_mtime_ns
+        except FileNotFoundError:
+            return 0, 0
+
+    def column(self, ticker, column, length=None):
+        """Read-only memory map of one column, cut to the complete rows"""
+        length = self.length(ticker) if length is None else length
+        if not length:
+            return np.zeros(0, dtype=DTYPES[column])
+        return np.memmap(self.path(ticker, column), dtype=DTYPES[column], mode='r', shape=(length,))
+
+    def read(self, ticker, start=None, end=None, columns=None):
+        """
+        Rows of ticker with start <= timestamp < end
+        :param start, end: datetime, date, ISO string or datetime64, None for an open end
+        :param columns: names to return besides timestamp, defaults to all of them
+        :return: PriceSlice of memory-mapped views
+        """
+        length = self.length(ticker)
+        timestamps = self.column(ticker, 'timestamp', length)
+        first = 0 if start is None else int(np.searchsorted(timestamps, to_epoch_seconds([start])[0], side='left'))
+        last = length if end is None else int(np.searchsorted(timestamps, to_epoch_seconds([end])[0], side='left'))
+        result = PriceSlice(timestamp=timestamps[first:last].view('datetime64[s]'))
+        for name in columns or [name for name, dtype in COLUMNS[1:]]:
+            result[name] = self.column(ticker, name, length)[first:last]
+        return result
+
+    def last(self, ticker, before=None, column='close'):
+        """Last value of column strictly before a time, None when there is none"""
+        length = self.length(ticker)
+        index = length if before is None else int(np.searchsorted(self.column(ticker, 'timestamp', length),
+                                                                  to_epoch_seconds([before])[0], side='left'))
+        if not index:
+            return None
+        return float(self.column(ticker, column, length)[index - 1])
+
+    @contextmanager
+    def lock(self, ticker):
+        """Exclusive writer lock of one ticker, readers never take it"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.' + ticker_directory(ticker) + '.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def append(self, ticker, columns):
+        """
+        Add rows to ticker. Rows newer than everything stored are appended in place; older or duplicate
+        timestamps make the ticker be rewritten sorted, with the newest row winning per timestamp.
+        :param columns: dict of equal-length arrays, timestamp is required, missing prices default to close
+        :return: number of rows written
+        """
+        timestamps = to_epoch_seconds(columns['timestamp'])
+        if not len(timestamps):
+            return 0
+        close = np.asarray(columns['close'], dtype='<f8')
+        data = {'timestamp': timestamps}
+        for name, dtype in COLUMNS[1:]:
+            default = close if name in PRICE_COLUMNS else np.zeros(len(timestamps))
+            values = np.asarray(columns.get(name, default), dtype=dtype)
+            data[name] = np.where(np.isnan(values), default, values)
+        order = np.argsort(timestamps, kind='stable')
+        data = {name: values[order] for name, values in data.items()}
+        with self.lock(ticker):
+            length = self.length(ticker)
+            stored = self.column(ticker, 'timestamp', length)
+            in_order = not np.any(data['timestamp'][1:] == data['timestamp'][:-1]) and \
+                (not length or data['timestamp'][0] > stored[-1])
+            if in_order:
+                self._append_in_place(ticker, data, length)
+            else:
+                self._rewrite(ticker, data, length)
+        return len(timestamps)
+
+    def _append_in_place(self, ticker, data, length):
+        os.makedirs(self.path(ticker), exist_ok=True)
+        for name, dtype in COLUMNS:
+            with open(self.path(ticker, name), 'r+b' if length else 'wb') as column_file:
+                # Drop the tail a crashed writer may have left behind
+                column_file.truncate(length * np.dtype(dtype).itemsize)
+                column_file.seek(0, os.SEEK_END)
+                column_file.write(np.ascontiguousarray(data[name], dtype=dtype).tobytes())
+
+    def _rewrite(self, ticker, data, length):
+        merged = {name: np.concatenate((np.array(self.column(ticker, name, length)), data[name]))
+                  for name, dtype in COLUMNS}
+        order = np.argsort(merged['timestamp'], kind='stable')
+        merged = {name: values[order] for name, values in merged.items()}
+        # Stable sort keeps the new rows after the stored ones, so the last row of each timestamp is the newest
+        keep = np.append(merged['timestamp'][1:] != merged['timestamp'][:-1], True)
+        directory = self.path(ticker)
+        staging = directory + '.new'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for name, dtype in COLUMNS:
+            merged[name][keep].astype(dtype).tofile(os.path.join(staging, name + '.bin'))
+        retired = directory + '.old'
+        shutil.rmtree(retired, ignore_errors=True)
+        if os.path.isdir(directory):
+            os.rename(directory, retired)
+        os.rename(staging, directory)
+        shutil.rmtree(retired, ignore_errors=True)
+
+    def import_csv(self, csv_file, known_tickers, chunk_rows=100000, ticker=None):
+        """
+        Stream a CSV with a header of timestamp, close and optionally ticker, open, high, low and volume into the
+        store, chunk_rows rows at a time
+        :param known_tickers: set of tickers to accept, rows of other tickers are counted as skipped
+        :param ticker: ticker of every row when the file has no ticker column
+        :return: ImportResult
+        """
+        reader = csv.DictReader(csv_file)
+        fields = set(reader.fieldnames or ())
+        if 'timestamp' not in fields or 'close' not in fields or (ticker is None and 'ticker' not in fields):
+            raise ValueError('CSV needs timestamp and close columns, and a ticker column unless a ticker is given')
+        optional = [name for name, dtype in COLUMNS[1:] if name in fields and name != 'close']
+        rows = skipped = 0
+        tickers = set()
+        chunk = []
+        for row in reader:
+            chunk.append(row)
+            if len(chunk) >= chunk_rows:
+                written, seen, ignored = self._import_chunk(chunk, known_tickers, optional, ticker)
+                rows, skipped = rows + written, skipped + ignored
+                tickers |= seen
+                chunk = []
+        if chunk:
+            written, seen, ignored = self._import_chunk(chunk, known_tickers, optional, ticker)
+            rows, skipped = rows + written, skipped + ignored
+            tickers |= seen
+        return ImportResult(rows, sorted(tickers), skipped)
+
+    def _import_chunk(self, chunk, known_tickers, optional, ticker):
+        symbols = np.array([ticker or row['ticker'].strip().upper() for row in chunk])
+        columns = {'timestamp': np.array([row['timestamp'].strip() for row in chunk]),
+                   'close': np.array([row['close'] for row in chunk], dtype=np.float64)}
+        for name in optional:
+            columns[name] = np.array([row[name] or 'nan' for row in chunk], dtype=np.float64)
+        names, groups = np.unique(symbols, return_inverse=True)
+        written = skipped = 0
+        seen = set()
+        for index, symbol in enumerate(names.tolist()):
+            selected = groups == index
+            if symbol not in known_tickers or not symbol.strip():
+                skipped += int(np.count_nonzero(selected))
+                continue
+            written += self.append(symbol, {name: values[selected] for name, values in columns.items()})
+            seen.add(symbol)
+        return written, seen, skipped
+
+
+price_store = PriceStore()
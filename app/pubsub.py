@@ -0,0 +1,150 @@
+import json
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+
+class Subscription:
+    """
+    One connected client. The bounded queue decouples the publisher from the client's socket, a client that lets
+    it fill up is dropped instead of slowing everybody else down.
+    """
+
+    def __init__(self, broker, topics, max_queue):
+        self.broker = broker
+        self.topics = tuple(topics)
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.dropped = False
+
+    def get(self, timeout=None):
+        """Next message, or None when nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """
+    In-process publish/subscribe bus. Each worker has one, the Relay feeds it with the messages every worker wrote to
+    the broker_messages table so a commit is published once and fanned out in each process.
+    """
+
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self.relay = None
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.max_queue = app.config['STREAM_QUEUE_SIZE']
+
+    def subscriber_count(self, topic):
+        return len(self._subscribers.get(topic, ()))
+
+    def subscribe(self, *topics):
+        subscription = Subscription(self, topics, self.max_queue)
+        with self._lock:
+            for topic in topics:
+                self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def publish(self, topic, message):
+        """
+        Fan a message out to the local subscribers of topic without ever blocking
+        :return: number of subscribers that received it
+        """
+        with self._lock:
+            subscribers = list(self._subscribers.get(topic, ()))
+        delivered = 0
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+                delivered += 1
+            except queue.Full:
+                subscription.dropped = True
+                self.unsubscribe(subscription)
+        return delivered
+
+    def start_relay(self, app):
+        """Start this worker's relay thread once, unless STREAM_RELAY is off (tests drive Relay.poll by hand)"""
+        with self._lock:
+            if self.relay is None or not self.relay.is_alive():
+                self.relay = Relay(app, self)
+                if app.config['STREAM_RELAY']:
+                    self.relay.start()
+        return self.relay
+
+
+def local_topics(topic, payload):
+    """
+    Topics a cross-worker message is published under locally, trades and quotes also go to their ticker's topic
+    and alerts only to their user's. A trade without a stock has no ticker topic.
+    """
+    if topic == 'trades':
+        return [topic] + (['stocks.' + payload['stock']] if payload.get('stock') is not None else [])
+    if topic == 'quotes':
+        return [topic] + (['quotes.' + payload['ticker']] if payload.get('ticker') is not None else [])
+    if topic == 'alerts':
+        return ['alerts.' + payload['user']] if payload.get('user') is not None else []
+    return [topic]
+
+
+class Relay(threading.Thread):
+    """
+    Tails broker_messages, the SQLite stand-in for an external broker, and republishes new rows on the local
+    Broker. Starts at the current end of the table, old rows are pruned after STREAM_RETENTION_SECONDS.
+    """
+
+    def __init__(self, app, broker):
+        super(Relay, self).__init__(name='broker-relay', daemon=True)
+        self.app = app
+        self.broker = broker
+        self.last_seq = None
+        self.last_prune = time.monotonic()
+
+    def run(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    self.poll()
+                except Exception:
+                    self.app.logger.exception('Broker relay poll failed')
+            time.sleep(self.app.config['STREAM_POLL_INTERVAL'])
+
+    def poll(self):
+        """Publish the rows written since the last poll, needs an app context"""
+        from .models import BrokerMessage
+        config = self.app.config
+        if self.last_seq is None:
+            self.last_seq = BrokerMessage.current_seq()
+        for message in BrokerMessage.since(self.last_seq, config['STREAM_BATCH_SIZE']):
+            # Move past the row first, one that cannot be published must not stall every stream behind it
+            self.last_seq = message.seq
+            try:
+                payload = json.loads(message.payload)
+                event = {'id': message.seq, 'topic': message.topic, 'data': payload}
+                for topic in local_topics(message.topic, payload):
+                    self.broker.publish(topic, event)
+            except (ValueError, TypeError, KeyError, AttributeError):
+                self.app.logger.exception('Broker message %s could not be published', message.seq)
+        if time.monotonic() - self.last_prune > config['STREAM_RETENTION_SECONDS']:
+            self.last_prune = time.monotonic()
+            BrokerMessage.prune(datetime.utcnow() - timedelta(seconds=config['STREAM_RETENTION_SECONDS']))
+
+
+broker = Broker()
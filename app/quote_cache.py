@@ -0,0 +1,167 @@
+"""
+Last quote of every stock in a named POSIX shared-memory segment, so every worker on the host reads the prices the
+market feed writes without a query, a lock or a system call.
+
+The segment is a small header followed by one fixed 32-byte record per stock id: a sequence number, price, size and
+epoch-seconds timestamp. Each record is a seqlock. The writer makes the sequence odd, writes the fields and makes
+it even again; a reader copies the record between two reads of the sequence and retries the records whose sequence
+was odd or changed. Stores and loads go through NumPy in program order, which x86's memory model keeps in order for
+the other cores. Sequence 0 means the stock never had a quote.
+"""
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+MAGIC = 0x47475143  # 'GGQC'
+VERSION = 1
+HEADER = np.dtype([('magic', '<u4'), ('version', '<u4'), ('slots', '<u8'), ('reserved', 'V48')])
+RECORD = np.dtype([('seq', '<u8'), ('price', '<f8'), ('size', '<f8'), ('timestamp', '<f8')])
+
+Quote = namedtuple('Quote', ['price', 'size', 'timestamp'])
+Quotes = namedtuple('Quotes', ['price', 'size', 'timestamp'])
+
+
+class QuoteCache:
+    """
+    The segment is created by the first writer. Readers attach lazily and see no quotes until it exists, retrying
+    the attach at most once per retry_interval seconds. Only one process may write at a time.
+    """
+
+    def __init__(self, name=None, slots=65536, read_retries=64, retry_interval=1.0):
+        self.name = name
+        self.slots = slots
+        self.read_retries = read_retries
+        self.retry_interval = retry_interval
+        self._segment = None
+        self._records = None
+        self._next_attach = 0.0
+        self._write_lock = threading.Lock()
+
+    def init_app(self, app):
+        self.close()
+        self.name = app.config['QUOTE_CACHE_NAME']
+        self.slots = app.config['QUOTE_CACHE_SLOTS']
+
+    def _map(self, segment):
+        header = np.ndarray((), dtype=HEADER, buffer=segment.buf)
+        if header['magic'] and (header['magic'] != MAGIC or header['version'] != VERSION):
+            segment.close()
+            raise RuntimeError('shared memory segment {!r} is not a version {} quote cache'.format(self.name,
+                                                                                                   VERSION))
+        # The tracker would unlink the segment when the first process that touched it exits
+        resource_tracker.unregister(segment._name, 'shared_memory')
+        self._segment = segment
+        self._records = np.ndarray(((segment.size - HEADER.itemsize) // RECORD.itemsize,), dtype=RECORD,
+                                   buffer=segment.buf, offset=HEADER.itemsize)
+        return self._records
+
+    def records(self, create=False):
+        """The mapped record array, None when the segment does not exist and create is False"""
+        if self._records is not None:
+            return self._records
+        if create:
+            try:
+                segment = shared_memory.SharedMemory(self.name, create=True,
+                                                     size=HEADER.itemsize + self.slots * RECORD.itemsize)
+            except FileExistsError:
+                return self._map(shared_memory.SharedMemory(self.name))
+            records = self._map(segment)
+            header = np.ndarray((), dtype=HEADER, buffer=segment.buf)
+            header['slots'] = len(records)
+            header['version'] = VERSION
+            header['magic'] = MAGIC
+            return records
+        if time.monotonic() < self._next_attach:
+            return None
+        try:
+            return self._map(shared_memory.SharedMemory(self.name))
+        except FileNotFoundError:
+            self._next_attach = time.monotonic() + self.retry_interval
+            return None
+
+    def write(self, stock_ids, prices, sizes=None, timestamps=None):
+        """
+        Publish quotes, the last one wins when a stock id repeats
+        :param timestamps: epoch seconds, default now
+        :return: number of stocks updated, ids outside the segment are skipped
+        """
+        records = self.records(create=True)
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        count = len(stock_ids)
+        prices = np.broadcast_to(np.asarray(prices, dtype=np.float64), (count,))
+        sizes = np.broadcast_to(np.asarray(0.0 if sizes is None else sizes, dtype=np.float64), (count,))
+        timestamps = np.broadcast_to(np.asarray(time.time() if timestamps is None else timestamps,
+                                                dtype=np.float64), (count,))
+        # Keep the last occurrence of every id inside the segment
+        unique_ids, reversed_index = np.unique(stock_ids[::-1], return_index=True)
+        keep = count - 1 - reversed_index
+        inside = (unique_ids >= 0) & (unique_ids < len(records))
+        ids, keep = unique_ids[inside], keep[inside]
+        with self._write_lock:
+            seq = records['seq']
+            seq[ids] += 1
+            records['price'][ids] = prices[keep]
+            records['size'][ids] = sizes[keep]
+            records['timestamp'][ids] = timestamps[keep]
+            seq[ids] += 1
+        return len(ids)
+
+    def read(self, stock_ids):
+        """
+        Vectorized consistent read
+        :return: Quotes of arrays aligned with stock_ids, NaN where there is no quote
+        """
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        result = np.zeros(len(stock_ids), dtype=RECORD)
+        records = self.records()
+        if records is not None and len(stock_ids):
+            pending = np.flatnonzero((stock_ids >= 0) & (stock_ids < len(records)))
+            seq = records['seq']
+            for attempt in range(self.read_retries):
+                ids = stock_ids[pending]
+                before = seq[ids]
+                result[pending] = records[ids]
+                after = seq[ids]
+                # A record a writer held for every retry is reported as missing rather than spun on
+                torn = (before != after) | (before & 1 == 1)
+                result['seq'][pending[torn]] = 0
+                pending = pending[torn]
+                if not len(pending):
+                    break
+        missing = result['seq'] == 0
+        return Quotes(*(np.where(missing, np.nan, result[name]) for name in Quotes._fields))
+
+    def versions(self, stock_ids):
+        """Sequence numbers of the records, every write changes them so they make a cheap validator of a read"""
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        records = self.records()
+        if records is None:
+            return np.zeros(len(stock_ids), dtype=np.uint64)
+        inside = (stock_ids >= 0) & (stock_ids < len(records))
+        return np.where(inside, records['seq'][np.where(inside, stock_ids, 0)], 0)
+
+    def get(self, stock_id):
+        """Quote of one stock with a datetime (UTC) timestamp, None when there is none"""
+        quotes = self.read([stock_id])
+        if np.isnan(quotes.price[0]):
+            return None
+        return Quote(float(quotes.price[0]), float(quotes.size[0]),
+                     datetime.utcfromtimestamp(float(quotes.timestamp[0])))
+
+    def close(self, unlink=False):
+        """Detach from the segment, unlink also removes it for every process"""
+        if self._segment is not None:
+            segment = self._segment
+            self._records = self._segment = None
+            if unlink:
+                resource_tracker.register(segment._name, 'shared_memory')
+                segment.unlink()
+            segment.close()
+        self._next_attach = 0.0
+
+
+quote_cache = QuoteCache()
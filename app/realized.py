@@ -0,0 +1,111 @@
+"""
+Realized volatility, average true range, drawdowns and daily return percentiles of every stock over trailing windows
+of daily bars from the price store. Stored bars are rolled up to one bar per day first. Sums over windows are
+differences of cumulative sums and the order statistics run over strided window views, so a stock's whole series
+for every window end costs a few array passes. The nightly update only reads the tail of each stock that gained a
+closed day since its stored statistics and keeps the last value.
+"""
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+from numpy.lib.stride_tricks import sliding_window_view
+
+from . import db
+from .models import Stock, StockStatistic, TableVersion
+from .price_store import price_store
+
+TRADING_DAYS = 252
+PERCENTILES = (5, 50, 95)
+
+DailyBars = namedtuple('DailyBars', ['day', 'open', 'high', 'low', 'close'])
+
+
+def daily_bars(prices):
+    """Roll a PriceSlice of any bar size up to one bar per UTC day"""
+    days = prices['timestamp'].astype('datetime64[D]')
+    if not len(days):
+        return DailyBars(days, *(np.zeros(0) for _ in range(4)))
+    starts = np.flatnonzero(np.r_[True, days[1:] != days[:-1]])
+    ends = np.r_[starts[1:], len(days)] - 1
+    return DailyBars(days[starts], np.asarray(prices['open'])[starts], np.maximum.reduceat(prices['high'], starts),
+                     np.minimum.reduceat(prices['low'], starts), np.asarray(prices['close'])[ends])
+
+
+def window_sums(values, window):
+    """Sum of every run of window consecutive values"""
+    cumulative = np.r_[0.0, np.cumsum(values)]
+    return cumulative[window:] - cumulative[:-window]
+
+
+def rolling_statistics(high, low, close, window):
+    """
+    Statistics of every window of window daily returns, the i-th entry ends at day window + i
+    :return: dict of StockStatistic.FIELDS to arrays of len(close) - window values, empty when too short
+    """
+    high, low, close = (np.asarray(values, dtype=np.float64) for values in (high, low, close))
+    if len(close) <= window:
+        return {field: np.zeros(0) for field in StockStatistic.FIELDS}
+    returns = np.diff(np.log(close))
+    mean = window_sums(returns, window) / window
+    variance = (window_sums(returns * returns, window) - window * mean * mean) / max(window - 1, 1)
+    true_range = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    atr = window_sums(true_range, window) / window
+    closes = sliding_window_view(close, window + 1)
+    peaks = np.maximum.accumulate(closes, axis=1)
+    percentiles = np.percentile(sliding_window_view(returns, window), PERCENTILES, axis=1)
+    return {
+        'realized_vol': np.sqrt(np.maximum(variance, 0.0) * TRADING_DAYS),
+        'atr': atr,
+        'atr_percent': atr / close[window:],
+        'drawdown': 1.0 - close[window:] / peaks[:, -1],
+        'max_drawdown': np.max(1.0 - closes / peaks, axis=1),
+        'return_p05': percentiles[0],
+        'return_p50': percentiles[1],
+        'return_p95': percentiles[2]
+    }
+
+
+def latest_statistics(bars, windows):
+    """Rows of the statistics of the windows ending at the last bar, windows longer than the history are left out"""
+    rows = []
+    for window in windows:
+        tail = slice(-(window + 1), None)
+        values = rolling_statistics(bars.high[tail], bars.low[tail], bars.close[tail], window)
+        if len(values['atr']):
+            rows.append(dict({field: float(series[-1]) for field, series in values.items()}, window=window,
+                             as_of=bars.day[-1].astype(object)))
+    return rows
+
+
+def update(end=None, full=False, windows=None):
+    """
+    Bring the stored statistics up to the last closed day
+    :param end: first day not yet closed, defaults to today (UTC)
+    :param full: recompute every stock, not only those with a new closed day
+    :param windows: window lengths in days, defaults to STATISTICS_WINDOWS
+    :return: number of stocks updated
+    """
+    end = end or datetime.utcnow().date()
+    windows = sorted(windows or current_app.config['STATISTICS_WINDOWS'])
+    stored = dict(db.session.query(StockStatistic.stock_id, db.func.max(StockStatistic.as_of))
+                  .group_by(StockStatistic.stock_id))
+    # Enough calendar days to hold the longest window of trading days
+    start = end - timedelta(days=int(max(windows) * 1.6) + 10)
+    updated, rows = [], []
+    for stock_id, ticker in db.session.query(Stock.id, Stock.ticker).order_by(Stock.id):
+        bars = daily_bars(price_store.read(ticker, start, end))
+        if not len(bars.day) or (not full and stored.get(stock_id) == bars.day[-1].astype(object)):
+            continue
+        updated.append(stock_id)
+        rows.extend(dict(row, stock_id=stock_id) for row in latest_statistics(bars, windows))
+    table = StockStatistic.__table__
+    if updated:
+        db.session.execute(table.delete().where(table.c.stock_id.in_(updated)))
+    if rows:
+        db.session.execute(table.insert(), rows)
+    if updated:
+        TableVersion.bump(db.session, {StockStatistic.__tablename__})
+    db.session.commit()
+    return len(updated)
@@ -0,0 +1,121 @@
+"""
+Scenario P&L of every stock and option position over a grid of relative underlying moves and absolute vol shocks.
+Positions are broadcast against the grid and repriced with the batch Black-Scholes pricer, the time to expiry is
+left unchanged so the grid shows the instantaneous P&L. Rows are sorted by the group they are summed into, users or
+underlyings, and split into chunks that can run in a process pool, each chunk returning its groups' sums. Books
+too small to pay for starting the pool are repriced inline.
+"""
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from flask import current_app
+
+from .greeks import black_scholes, years_to_expiry
+from .portfolio_greeks import greek_book
+
+Grid = namedtuple('Grid', ['keys', 'spot_shocks', 'vol_shocks', 'pnl', 'total', 'unpriced'])
+
+GROUPS = ('user', 'underlying')
+
+
+def scenario_pnl(shares, spot, strike, years, vol, call, option, spot_shocks, vol_shocks, rate=0.0):
+    """
+    P&L of each position under each combination of shocks
+    :param shares: share count, contracts times multiplier for options
+    :param option: False for stock positions, whose strike, years, vol and call are ignored
+    :param spot_shocks: relative underlying moves, -0.1 is a 10% fall
+    :param vol_shocks: absolute vol moves, 0.05 is five vol points up, shocked vols are floored at zero
+    :return: float64 array of shape (positions, spot shocks, vol shocks)
+    """
+    spot_shocks, vol_shocks = np.asarray(spot_shocks, dtype=np.float64), np.asarray(vol_shocks, dtype=np.float64)
+    pnl = np.empty((len(shares), len(spot_shocks), len(vol_shocks)))
+    pnl[:] = (shares * spot)[:, None, None] * spot_shocks[None, :, None]
+    rows = np.flatnonzero(option)
+    if len(rows):
+        spot, strike, years, vol, call = (values[rows, None, None] for values in (spot, strike, years, vol, call))
+        base = black_scholes(spot, strike, years, rate, 0.0, vol, call).price
+        shocked = black_scholes(spot * (1.0 + spot_shocks[None, :, None]), strike, years, rate, 0.0,
+                                np.maximum(vol + vol_shocks[None, None, :], 0.0), call).price
+        pnl[rows] = shares[rows, None, None] * (shocked - base)
+    return pnl
+
+
+def group_sums(group, pnl):
+    """Sum the P&L of rows sorted by group, returns the distinct groups and their sums"""
+    if not len(group):
+        return group, pnl[:0]
+    starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+    return group[starts], np.add.reduceat(pnl, starts, axis=0)
+
+
+_worker_grid = None
+
+
+def _share_grid(spot_shocks, vol_shocks, rate):
+    """Pool initializer, ships the shock grid to each worker once instead of with every chunk"""
+    global _worker_grid
+    _worker_grid = spot_shocks, vol_shocks, rate
+
+
+def compute_chunk(group, shares, spot, strike, years, vol, call, option, grid=None):
+    spot_shocks, vol_shocks, rate = _worker_grid if grid is None else grid
+    return group_sums(group, scenario_pnl(shares, spot, strike, years, vol, call, option, spot_shocks, vol_shocks,
+                                          rate))
+
+
+def chunks(columns, chunk_rows):
+    """Split the group-sorted columns into chunks of about chunk_rows rows without splitting a group"""
+    group = columns[0]
+    start = 0
+    while start < len(group):
+        end = min(start + chunk_rows, len(group))
+        if end < len(group):
+            end = int(np.searchsorted(group, group[end - 1], side='right'))
+        yield tuple(column[start:end] for column in columns)
+        start = end
+
+
+def run(by='user', spot_shocks=None, vol_shocks=None, now=None, workers=None, chunk_rows=None, inline_rows=None):
+    """
+    Scenario P&L of the whole firm
+    :param by: 'user' or 'underlying', what the positions are summed by
+    :param spot_shocks: relative underlying moves, defaults to SCENARIO_SPOT_SHOCKS
+    :param vol_shocks: absolute vol moves, defaults to SCENARIO_VOL_SHOCKS
+    :param workers: processes to spread the chunks over, defaults to SCENARIO_WORKERS, 1 runs inline
+    :param inline_rows: books of at most this many priced positions run inline, defaults to SCENARIO_INLINE_ROWS
+    :return: Grid, pnl holds one (spot shocks, vol shocks) matrix per key and total their sum. Positions whose
+             underlying has no price are left out and counted in unpriced.
+    """
+    if by not in GROUPS:
+        raise ValueError('by must be one of ' + ', '.join(GROUPS))
+    config = current_app.config
+    now = now or datetime.utcnow()
+    spot_shocks = np.asarray(config['SCENARIO_SPOT_SHOCKS'] if spot_shocks is None else spot_shocks, dtype=np.float64)
+    vol_shocks = np.asarray(config['SCENARIO_VOL_SHOCKS'] if vol_shocks is None else vol_shocks, dtype=np.float64)
+    workers = workers or config['SCENARIO_WORKERS']
+    chunk_rows = chunk_rows or config['SCENARIO_CHUNK_ROWS']
+    inline_rows = config['SCENARIO_INLINE_ROWS'] if inline_rows is None else inline_rows
+    rate = greek_book.rate
+
+    book = greek_book.snapshot(now)
+    option = book.contract > 0
+    priced = ~np.isnan(book.spot) & (~option | ~np.isnan(book.vol))
+    group = (book.user if by == 'user' else book.underlying)[priced]
+    order = np.argsort(group, kind='stable')
+    columns = tuple(values[priced][order] for values in (
+        group, book.shares, book.spot, np.nan_to_num(book.strike), years_to_expiry(book.expiry, now),
+        np.nan_to_num(book.vol), book.call, option))
+    parts = list(chunks(columns, chunk_rows))
+    grid = (spot_shocks, vol_shocks, rate)
+    if workers > 1 and len(parts) > 1 and len(group) > inline_rows:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_share_grid, initargs=grid) as pool:
+            results = list(pool.map(compute_chunk, *zip(*parts)))
+    else:
+        results = [compute_chunk(*part, grid=grid) for part in parts]
+
+    shape = (len(spot_shocks), len(vol_shocks))
+    keys = np.concatenate([keys for keys, _ in results]) if results else np.zeros(0, dtype=np.int64)
+    pnl = np.concatenate([sums for _, sums in results]) if results else np.zeros((0,) + shape)
+    return Grid(keys, spot_shocks, vol_shocks, pnl, pnl.sum(axis=0), int(np.count_nonzero(~priced)))
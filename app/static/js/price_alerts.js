@@ -0,0 +1,34 @@
+// Shows the signed-in user's triggered price alerts as dismissible messages
+const alertBox = document.getElementById('price-alerts');
+
+function describe(alert) {
+    const price = Number(alert.triggered_price).toFixed(2);
+    if (alert.kind === 'percent') {
+        return alert.stock + ' moved ' + (alert.threshold * 100).toFixed(1) + '% from ' +
+            Number(alert.reference_price).toFixed(2) + ', now ' + price;
+    }
+    return alert.stock + ' is ' + alert.kind + ' ' + Number(alert.threshold).toFixed(2) + ', now ' + price;
+}
+
+function message(alert) {
+    const div = document.createElement('div');
+    div.className = 'alert alert-info alert-dismissible';
+    div.setAttribute('role', 'alert');
+    div.textContent = describe(alert);
+    const close = document.createElement('button');
+    close.type = 'button';
+    close.className = 'close';
+    close.dataset.dismiss = 'alert';
+    close.setAttribute('aria-label', 'Close');
+    close.innerHTML = '<span aria-hidden="true">&times;</span>';
+    div.append(close);
+    return div;
+}
+
+if (alertBox && window.EventSource) {
+    const source = new EventSource(alertBox.dataset.stream);
+    source.addEventListener('alerts', (e) => {
+        alertBox.append(message(JSON.parse(e.data)));
+    });
+    // After a 'dropped' event the server ends the response and EventSource reconnects with Last-Event-ID
+}
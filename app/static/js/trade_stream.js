@@ -0,0 +1,52 @@
+// Prepends trades published on the page's server-sent event stream to its trade list
+const tradeList = document.querySelector('ul.trades[data-stream]');
+
+function link(href, text) {
+    const a = document.createElement('a');
+    a.href = href;
+    a.textContent = text;
+    return a;
+}
+
+function paragraph(text, className) {
+    const p = document.createElement('p');
+    p.className = className || 'card-text';
+    p.textContent = text;
+    return p;
+}
+
+function tradeCard(trade) {
+    const card = document.createElement('div');
+    card.className = 'card mb-3';
+    card.dataset.tradeId = trade.id;
+    const body = document.createElement('div');
+    body.className = 'card-body';
+    const title = document.createElement('h5');
+    title.className = 'card-title';
+    title.append('Trade by ', link('/users/' + encodeURIComponent(trade.user), trade.user),
+                 ' on ', link('/stocks/' + encodeURIComponent(trade.stock), trade.stock));
+    body.append(title,
+                paragraph('$' + trade.price),
+                paragraph(trade.quantity + ' shares'),
+                paragraph(new Date(trade.timestamp).toLocaleString(), 'card-text text-muted'));
+    const footer = document.createElement('div');
+    footer.className = 'card-footer';
+    footer.append(link('/trades/' + trade.id, 'Permalink'));
+    card.append(body, footer);
+    return card;
+}
+
+if (tradeList && window.EventSource) {
+    const source = new EventSource(tradeList.dataset.stream);
+    source.addEventListener('trades', (e) => {
+        const trade = JSON.parse(e.data);
+        const existing = tradeList.querySelector('[data-trade-id="' + trade.id + '"]');
+        if (existing) {
+            existing.replaceWith(tradeCard(trade));
+        } else if (trade.operation === 'insert') {
+            tradeList.prepend(tradeCard(trade));
+        }
+    });
+    // A 'dropped' event ends the response, EventSource then reconnects on its own with Last-Event-ID after the
+    // retry delay and the server replays what this page missed
+}
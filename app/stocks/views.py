@@ -6,8 +6,8 @@ from . import stocks
 from .forms import AddStockForm, EditStockForm
 from .. import db, photos
 from ..main.forms import SearchForm
-from ..decorators import admin_required
-from ..models import Stock, Trade
+from ..decorators import admin_required, read_only
+from ..models import Stock, StockStatistic, Trade
 
 STOCK_INFO: Final = '.stock_info'
 
@@ -67,6 +67,7 @@ def edit_stock(ticker):
 
 @stocks.route('/<ticker>')
 @login_required
+@read_only
 def stock_info(ticker):
     search_form = SearchForm()
     stock = Stock.query.filter_by(ticker=ticker).first()
@@ -78,7 +79,9 @@ def stock_info(ticker):
         per_page=current_app.config['TRADES_PER_PAGE'],
         error_out=False)
     trades = pagination.items
-    return render_template('stocks/stock_info.html', stock=stock, trades=trades, pagination=pagination, search_form=search_form)
+    statistics = StockStatistic.for_stock(stock.id)
+    return render_template('stocks/stock_info.html', stock=stock, trades=trades, pagination=pagination,
+                           statistics=statistics, search_form=search_form)
 
 
 @stocks.route('/watch/<ticker>')
@@ -0,0 +1,6 @@
+from flask import Blueprint
+
+stream = Blueprint('stream', __name__)
+
+# Import modules here to avoid circular dependencies until after stream is defined
+from . import views
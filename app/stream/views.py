@@ -0,0 +1,91 @@
+import json
+
+from flask import Response, abort, current_app, request
+from flask_login import current_user, login_required
+
+from . import stream
+from ..models import BrokerMessage, Stock
+from ..pubsub import broker, local_topics
+
+RETRY_MILLISECONDS = 3000
+
+
+def format_event(event):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(event['id'], event['topic'], json.dumps(event['data']))
+
+
+def format_dropped(last_id):
+    """Ask the client to reconnect, an id moves its Last-Event-ID past messages it was never sent"""
+    return '{}event: dropped\ndata: {{}}\n\n'.format('id: {}\n'.format(last_id) if last_id else '')
+
+
+def replay(topic):
+    """
+    Messages missed since the client's Last-Event-ID, so a reconnect does not lose trades
+    :return: (events of topic, seq of the last message looked at when more are left past the batch, else None)
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    if last_event_id is None:
+        return [], None
+    limit = current_app.config['STREAM_BATCH_SIZE']
+    messages = BrokerMessage.since(last_event_id, limit)
+    missed = []
+    for message in messages:
+        payload = json.loads(message.payload)
+        if topic in local_topics(message.topic, payload):
+            missed.append({'id': message.seq, 'topic': message.topic, 'data': payload})
+    return missed, messages[-1].seq if len(messages) == limit else None
+
+
+def event_stream(topic):
+    """
+    Subscribe to topic and answer with a text/event-stream. The subscription is taken before the replay query so
+    nothing committed in between is lost, events the replay already sent are skipped.
+    """
+    app = current_app._get_current_object()
+    broker.start_relay(app)
+    heartbeat = app.config['STREAM_HEARTBEAT_SECONDS']
+    subscription = broker.subscribe(topic)
+    missed, more_after = replay(topic)
+
+    def generate():
+        last_id = missed[-1]['id'] if missed else 0
+        try:
+            yield 'retry: {}\n\n'.format(RETRY_MILLISECONDS)
+            for event in missed:
+                yield format_event(event)
+            if more_after is not None:
+                # Missed more than one batch, the reconnect replays the next one
+                yield format_dropped(more_after)
+                return
+            while not subscription.dropped:
+                event = subscription.get(timeout=heartbeat)
+                if event is None:
+                    yield ': heartbeat\n\n'
+                elif event['id'] > last_id:
+                    yield format_event(event)
+            # Too slow to keep up, tell the client to reconnect from its Last-Event-ID
+            yield format_dropped(None)
+        finally:
+            subscription.close()
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@stream.route('/trades')
+def trades():
+    return event_stream('trades')
+
+
+@stream.route('/stocks/<ticker>')
+def stock_trades(ticker):
+    if Stock.query.filter_by(ticker=ticker).first() is None:
+        abort(404)
+    return event_stream('stocks.' + ticker)
+
+
+@stream.route('/alerts')
+@login_required
+def alerts():
+    return event_stream('alerts.' + current_user.username)
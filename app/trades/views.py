@@ -4,6 +4,7 @@ from flask_login import current_user, login_required
 from . import trades
 from .forms import BuyStockForm, EditTradeForm
 from .. import db
+from ..database import write_with_retry
 from ..main.forms import SearchForm
 from ..decorators import admin_required
 from ..models import Permission, Stock, Trade, User
@@ -43,8 +44,7 @@ def trades_list():
                              price=form.price.data,
                              quantity=form.quantity.data,
                              user=current_user._get_current_object())
-        db.session.add(trade_object)
-        db.session.commit()
+        write_with_retry(lambda: db.session.add(trade_object))
         return redirect(url_for('.index', search_form=search_form))
     page = request.args.get('page', 1, type=int)
     pagination = Trade.query.order_by(Trade.timestamp.desc()).paginate(
@@ -78,8 +78,7 @@ def new_stock_trade():
                           user_id=current_user.id,
                           quantity=form.quantity.data,
                           price=form.price.data)
-        db.session.add(stock_trade)
-        db.session.commit()
+        write_with_retry(lambda: db.session.add(stock_trade))
         flash('Trade for ' + str(stock_trade.id) + ' created successfully.')
         return redirect(url_for('users.user_profile', username=current_user.username, search_form=search_form))
     return render_template('trades/new_trade.html', form=form, search_form=search_form)
\ No newline at end of file
@@ -6,8 +6,9 @@ from . import users
 from .forms import EditProfileAdministratorForm, EditProfileForm
 from .. import db
 from ..main.forms import SearchForm
-from ..decorators import admin_required, permission_required
-from ..models import Permission, Role, Trade, User
+from ..decorators import admin_required, permission_required, read_only
+from ..models import Permission, Position, RealizedPnl, Role, Trade, User, Watch
+from ..portfolio_greeks import greek_book, with_tickers
 
 INDEX: Final = '.index'
 INVALID_USER: Final = 'Invalid user.'
@@ -138,23 +139,28 @@ def followed_by(username):
 
 @users.route('/watchlist/')
 @login_required
+@read_only
 def watchlist():
     search_form = SearchForm()
-    page = request.args.get('page', 1, type=int)
-    pagination = current_user.watches.paginate(page, per_page=current_app.config['WATCHLIST_PER_PAGE'], error_out=False)
-    watches = [{'stock': item.stock, 'timestamp': item.timestamp} for item in pagination.items]
     return render_template('users/watchlist.html',
                            user=current_user,
                            title='Watchlist',
-                           endpoint='.watchlist',
-                           pagination=pagination,
-                           watches=watches, search_form=search_form)
+                           board=Watch.board(current_user), search_form=search_form)
 
 
 @users.route('/<username>')
 @login_required
+@read_only
 def user_profile(username):
     search_form = SearchForm()
     user = User.find_by_username_or_404(username=username)
-    trades = user.trades.order_by(Trade.timestamp.desc()).all()
-    return render_template('users/user_profile.html', user=user, trades=trades, search_form=search_form)
+    positions = Position.load_costs(user.positions.all())
+    pnl = {entry['stock'].id: entry for entry in RealizedPnl.summary(user)}
+    page = request.args.get('page', 1, type=int)
+    pagination = user.trades.order_by(Trade.timestamp.desc()).paginate(
+        page,
+        per_page=current_app.config['TRADES_PER_PAGE'],
+        error_out=False)
+    greeks = with_tickers(greek_book.user_greeks(user.id))
+    return render_template('users/user_profile.html', user=user, positions=positions, pnl=pnl, greeks=greeks,
+                           trades=pagination.items, pagination=pagination, search_form=search_form)
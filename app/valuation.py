@@ -0,0 +1,111 @@
+"""
+Mark-to-market valuation of every portfolio in one pass. Positions are loaded as flat arrays, priced through a
+vector indexed by stock id and reduced per user with bincount, so the cost is a few array operations per run no
+matter how many users there are.
+"""
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from . import db
+from .models import PortfolioValuation, Position, Stock, TableVersion, Trade
+
+Valuation = namedtuple('Valuation', ['equity', 'day_change', 'long_exposure', 'short_exposure', 'gross_exposure',
+                                     'positions'])
+
+
+def price_vector(stock_ids, prices, size):
+    """Prices indexed by stock id, NaN for stocks without a price"""
+    vector = np.full(size, np.nan)
+    vector[np.asarray(stock_ids, dtype=np.int64)] = prices
+    return vector
+
+
+def value_portfolios(user_ids, stock_ids, quantities, prices, previous_prices):
+    """
+    Value positions given as parallel arrays
+    :param prices: price vector of the valuation time, see price_vector
+    :param previous_prices: price vector of the previous close, day change is 0 where it is unknown
+    :return: (sorted unique user ids, Valuation of per-user arrays aligned with them)
+    """
+    users, owner = np.unique(user_ids, return_inverse=True)
+    quantities = np.asarray(quantities, dtype=np.float64)
+    price = prices[stock_ids]
+    # Unpriced positions count as worth nothing, NaN differences as no change
+    value = quantities * np.nan_to_num(price)
+    change = quantities * np.nan_to_num(price - previous_prices[stock_ids])
+
+    def total(weights):
+        return np.bincount(owner, weights=weights, minlength=len(users))
+
+    return users, Valuation(equity=total(value),
+                            day_change=total(change),
+                            long_exposure=total(np.maximum(value, 0.0)),
+                            short_exposure=total(np.minimum(value, 0.0)),
+                            gross_exposure=total(np.abs(value)),
+                            positions=np.bincount(owner, minlength=len(users)))
+
+
+def last_prices(size, before=None):
+    """Price vector of the last trade of every stock, optionally only counting trades before a time"""
+    trades = Trade.__table__
+    last = db.select([trades.c.stock_id, db.func.max(trades.c.timestamp).label('timestamp')])
+    if before is not None:
+        last = last.where(trades.c.timestamp < before)
+    last = last.group_by(trades.c.stock_id).alias('last')
+    rows = db.session.execute(
+        db.select([trades.c.stock_id, trades.c.price])
+        .select_from(trades.join(last, (trades.c.stock_id == last.c.stock_id) &
+                                 (trades.c.timestamp == last.c.timestamp)))
+        .order_by(trades.c.id)).fetchall()
+    if not rows:
+        return np.full(size, np.nan)
+    # Ordered by id so the latest of same-timestamp trades is written last
+    stock_ids, prices = zip(*rows)
+    return price_vector(stock_ids, np.array(prices, dtype=np.float64), size)
+
+
+def load_positions():
+    """Open positions as (user_ids, stock_ids, quantities) arrays"""
+    table = Position.__table__
+    rows = db.session.execute(db.select([table.c.user_id, table.c.stock_id, table.c.quantity])
+                              .where(table.c.quantity != 0)).fetchall()
+    columns = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    return columns[:, 0], columns[:, 1], columns[:, 2]
+
+
+def exited_users(user_ids):
+    """Users whose latest valuation still had positions but who hold none now, sorted"""
+    table = PortfolioValuation.__table__
+    latest = db.select([table.c.user_id, db.func.max(table.c.as_of).label('as_of')]) \
+        .group_by(table.c.user_id).alias('latest')
+    rows = db.session.execute(
+        db.select([table.c.user_id])
+        .select_from(table.join(latest, (table.c.user_id == latest.c.user_id) & (table.c.as_of == latest.c.as_of)))
+        .where(table.c.positions > 0)).fetchall()
+    return np.setdiff1d(np.array([row[0] for row in rows], dtype=np.int64), user_ids)
+
+
+def run_valuation(as_of=None):
+    """
+    Value every open position at the last traded prices and append one PortfolioValuation per user.
+    Day change is measured against the last prices before midnight UTC of the valuation day. Users who went flat
+    since their last valuation get one empty valuation, so the latest one does not keep their old equity.
+    :return: number of portfolios valued
+    """
+    as_of = as_of or datetime.utcnow()
+    size = (db.session.query(db.func.max(Stock.id)).scalar() or 0) + 1
+    prices = last_prices(size, before=as_of)
+    previous_prices = last_prices(size, before=as_of.replace(hour=0, minute=0, second=0, microsecond=0))
+    user_ids, stock_ids, quantities = load_positions()
+    users, valuation = value_portfolios(user_ids, stock_ids, quantities, prices, previous_prices)
+    rows = [dict(zip(('user_id',) + Valuation._fields, values), as_of=as_of)
+            for values in zip(users.tolist(), *(column.tolist() for column in valuation))]
+    rows.extend(dict(dict.fromkeys(Valuation._fields, 0), user_id=user_id, as_of=as_of)
+                for user_id in exited_users(users).tolist())
+    if rows:
+        db.session.execute(PortfolioValuation.__table__.insert(), rows)
+        TableVersion.bump(db.session, {PortfolioValuation.__tablename__})
+    db.session.commit()
+    return len(rows)
@@ -0,0 +1,277 @@
+"""
+Monte Carlo 1-day and 10-day Value-at-Risk and Expected Shortfall per user.
+Daily log returns of the held underlyings come from the price store, their covariance is shrunk towards its
+diagonal and paths are drawn in batches, each from its own stream spawned from one SeedSequence. Positions are
+reduced to dollar delta, dollar gamma and theta per user and underlying at the last close, so a path's P&L is a
+delta-gamma-theta revaluation and vega is left out. Horizons scale the daily returns by the square root of time.
+Path batches are split over a process pool and every worker keeps each user's worst path P&Ls of its batches, one
+slice of users at a time; the tails are merged, so one run's results are bit-identical whatever the worker count. A
+user is only recomputed when the fingerprint of the closes and spots of their own underlyings, of the simulation
+settings and of their exposures changed since the stored result. The paths come from the covariance root of every
+held underlying, so when other stocks' prices or the held universe change, a kept result matches what a full run
+would give in distribution only, not bit for bit.
+"""
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+import numpy as np
+from flask import current_app
+
+from . import db
+from .greeks import EXPIRY_TIME, black_scholes, years_to_expiry
+from .implied_vol import IVStatus, implied_vol
+from .models import Stock, TableVersion, ValueAtRisk
+from .portfolio_greeks import last_option_prices, load_positions
+from .price_store import price_store
+
+HORIZONS = (1, 10)
+
+Model = namedtuple('Model', ['stock_ids', 'spot', 'root', 'closes', 'key'])
+Exposures = namedtuple('Exposures', ['user', 'factor', 'dollar_delta', 'dollar_gamma', 'theta'])
+RunResult = namedtuple('RunResult', ['computed', 'unchanged', 'removed'])
+
+
+def daily_closes(tickers, end, lookback):
+    """
+    Last close of each day over the lookback + 1 most recent days with a price before end, carried forward over
+    a ticker's missing days
+    :return: (days, closes of shape (days, tickers)), NaN before a ticker's first price
+    """
+    start = end - timedelta(days=2 * lookback + 10)
+    series = []
+    for ticker in tickers:
+        prices = price_store.read(ticker, start, end, columns=('close',))
+        days = prices['timestamp'].astype('datetime64[D]')
+        last = np.r_[days[1:] != days[:-1], True] if len(days) else np.zeros(0, dtype=bool)
+        series.append((days[last], np.asarray(prices['close'][last], dtype=np.float64)))
+    days = np.unique(np.concatenate([days for days, _ in series])) if series else np.zeros(0, dtype='datetime64[D]')
+    days = days[-(lookback + 1):]
+    closes = np.full((len(days), len(tickers)), np.nan)
+    for column, (ticker_days, ticker_closes) in enumerate(series):
+        position = np.searchsorted(ticker_days, days, side='right') - 1
+        found = position >= 0
+        closes[found, column] = ticker_closes[position[found]]
+    return days, closes
+
+
+def covariance_root(returns, shrinkage):
+    """
+    Square root of the zero-mean sample covariance shrunk towards its diagonal, root @ root.T is the covariance.
+    Missing returns count as no move.
+    """
+    returns = np.nan_to_num(returns)
+    covariance = returns.T @ returns / max(len(returns), 1)
+    covariance = (1.0 - shrinkage) * covariance + shrinkage * np.diag(np.diag(covariance))
+    values, vectors = np.linalg.eigh(covariance)
+    return vectors * np.sqrt(np.clip(values, 0.0, None))
+
+
+def tail_size(paths, confidence):
+    """Number of worst paths beyond the VaR quantile, the ones Expected Shortfall averages"""
+    return max(int(np.ceil(paths * (1.0 - confidence) - 1e-9)), 1)
+
+
+def worst_paths(factor, dollar_delta, dollar_gamma, theta, starts, root, seeds, batch_paths, tail, chunk_users=None):
+    """
+    The tail lowest path P&Ls of each user over some path batches
+    :param factor: column of each (user, underlying) pair's underlying in root, pairs sorted by user
+    :param starts: index of each user's first pair
+    :param root: covariance root of the daily returns of every modelled underlying
+    :param seeds: one SeedSequence per path batch
+    :param chunk_users: users whose paths are held in memory at once, all of them by default
+    :return: float64 array of shape (len(HORIZONS), users, min(tail, paths)), unsorted along the paths
+    """
+    bounds = np.r_[starts, len(factor)]
+    chunk_users = chunk_users or max(len(starts), 1)
+    worst = np.empty((len(HORIZONS), len(starts), 0))
+    for seed in seeds:
+        normals = np.random.default_rng(seed).standard_normal((batch_paths, root.shape[0]))
+        returns = normals @ root.T
+        kept = min(worst.shape[2] + batch_paths, tail)
+        merged = np.empty((len(HORIZONS), len(starts), kept))
+        for offset in range(0, len(starts), chunk_users):
+            users = slice(offset, min(offset + chunk_users, len(starts)))
+            first, last = bounds[users.start], bounds[users.stop]
+            pairs = returns[:, factor[first:last]]
+            # Paths on the last axis, so every user's partition runs over a contiguous row
+            pnl = np.empty((len(HORIZONS), users.stop - users.start, batch_paths))
+            for index, days in enumerate(HORIZONS):
+                moves = np.expm1(np.sqrt(days) * pairs)
+                paths = moves * dollar_delta[first:last] + 0.5 * dollar_gamma[first:last] * moves * moves + \
+                    days * theta[first:last]
+                pnl[index] = np.add.reduceat(paths, starts[users] - first, axis=1).T
+            candidates = np.concatenate((worst[:, users], pnl), axis=2)
+            merged[:, users] = np.partition(candidates, kept - 1, axis=2)[:, :, :kept] \
+                if kept < candidates.shape[2] else candidates
+        worst = merged
+    return worst
+
+
+def tail_statistics(worst, tail):
+    """
+    VaR and ES of each user from the worst path P&Ls of every batch
+    :param worst: (len(HORIZONS), users, paths) P&Ls holding at least each user's tail lowest ones
+    :return: float64 array of shape (users, 2 * len(HORIZONS)), VaR and ES per horizon as positive losses
+    """
+    worst = np.sort(worst, axis=2)[:, :, :tail]
+    result = np.empty((worst.shape[1], 2 * len(HORIZONS)))
+    result[:, 0::2] = -worst[:, :, -1].T
+    result[:, 1::2] = -worst.mean(axis=2).T
+    return result
+
+
+def simulate(factor, dollar_delta, dollar_gamma, theta, starts, root, seeds, batch_paths, confidence):
+    """
+    VaR and ES of each user over every path batch, see worst_paths for the arguments
+    :return: float64 array of shape (users, 2 * len(HORIZONS)), VaR and ES per horizon as positive losses
+    """
+    tail = tail_size(len(seeds) * batch_paths, confidence)
+    return tail_statistics(worst_paths(factor, dollar_delta, dollar_gamma, theta, starts, root, seeds, batch_paths,
+                                       tail), tail)
+
+
+_worker_model = None
+
+
+def _share_model(columns, root, batch_paths, tail, chunk_users):
+    """Pool initializer, ships the pair columns and the covariance root to each worker once"""
+    global _worker_model
+    _worker_model = columns, root, batch_paths, tail, chunk_users
+
+
+def compute_batches(seeds, model=None):
+    columns, root, batch_paths, tail, chunk_users = _worker_model if model is None else model
+    return worst_paths(*columns, root, seeds, batch_paths, tail, chunk_users)
+
+
+def build_model(stock_ids, as_of, config):
+    """
+    Covariance root, daily closes and last close of the underlyings, and a key that changes with the simulation
+    settings; what each user's result depends on is in their fingerprint
+    """
+    tickers = dict(db.session.query(Stock.id, Stock.ticker).filter(Stock.id.in_(stock_ids.tolist()))) \
+        if len(stock_ids) else {}
+    days, closes = daily_closes([tickers[stock_id] for stock_id in stock_ids.tolist()], as_of + timedelta(days=1),
+                                config['VAR_LOOKBACK_DAYS'])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(np.log(closes), axis=0)
+    root = covariance_root(returns, config['VAR_SHRINKAGE'])
+    spot = closes[-1] if len(closes) else np.full(len(stock_ids), np.nan)
+    missing = np.isnan(spot)
+    if np.any(missing):
+        spot[missing] = Stock.marks(stock_ids[missing])
+    key = hashlib.sha1(repr((config['VAR_SEED'], config['VAR_PATHS'], config['VAR_BATCH_PATHS'],
+                             config['VAR_CONFIDENCE'], config['VAR_SHRINKAGE'])).encode('utf-8')).digest()
+    return Model(stock_ids, spot, root, closes, key)
+
+
+def exposures(rows, model, as_of, config):
+    """Dollar delta, dollar gamma per unit of relative move squared and theta per day, per (user, underlying)"""
+    user, underlying, contract = (np.array([row[column] for row in rows], dtype=np.int64) for column in range(3))
+    shares = np.array([row[3] for row in rows], dtype=np.float64)
+    factor = np.searchsorted(model.stock_ids, underlying)
+    spot = model.spot[factor]
+    delta, gamma, theta = np.ones(len(rows)), np.zeros(len(rows)), np.zeros(len(rows))
+    options = np.flatnonzero(contract > 0)
+    if len(options):
+        strike = np.array([rows[row][4] for row in options.tolist()])
+        call = np.array([rows[row][6] for row in options.tolist()], dtype=bool)
+        years = years_to_expiry([rows[row][5] for row in options.tolist()], datetime.combine(as_of, EXPIRY_TIME))
+        vol = np.full(len(options), config['OPTION_DEFAULT_VOL'])
+        last_prices = last_option_prices()
+        prices = np.array([last_prices.get(int(contract_id), np.nan) for contract_id in contract[options]])
+        traded = ~np.isnan(prices) & ~np.isnan(spot[options])
+        if np.any(traded):
+            implied = implied_vol(prices[traded], spot[options][traded], strike[traded], years[traded],
+                                  config['RISK_FREE_RATE'], 0.0, call[traded])
+            vol[np.flatnonzero(traded)[implied.status == IVStatus.CONVERGED]] = \
+                implied.vol[implied.status == IVStatus.CONVERGED]
+        greeks = black_scholes(spot[options], strike, years, config['RISK_FREE_RATE'], 0.0, vol, call)
+        delta[options], gamma[options], theta[options] = greeks.delta, greeks.gamma, greeks.theta / 365
+    columns = np.nan_to_num(np.column_stack([shares * delta * spot, shares * gamma * spot * spot, shares * theta]))
+
+    # One row per (user, underlying) pair, sorted by user
+    order = np.lexsort((factor, user))
+    user, factor, columns = user[order], factor[order], columns[order]
+    starts = np.flatnonzero(np.r_[True, (user[1:] != user[:-1]) | (factor[1:] != factor[:-1])])
+    sums = np.add.reduceat(columns, starts, axis=0) if len(starts) else columns
+    return Exposures(user[starts], factor[starts], sums[:, 0].copy(), sums[:, 1].copy(), sums[:, 2].copy())
+
+
+def fingerprints(book, model):
+    """
+    {user_id: digest of the user's exposures and of their own underlyings' ids, daily closes and spots}, so a move
+    in a stock the user does not hold leaves it unchanged
+    """
+    starts = np.flatnonzero(np.r_[True, book.user[1:] != book.user[:-1]]) if len(book.user) else np.zeros(0, int)
+    ends = np.r_[starts[1:], len(book.user)]
+    result = {}
+    for start, end in zip(starts.tolist(), ends.tolist()):
+        factor = book.factor[start:end]
+        digest = hashlib.sha1(model.key)
+        for values in (model.stock_ids[factor], model.closes[:, factor], model.spot[factor],
+                       book.dollar_delta[start:end], book.dollar_gamma[start:end], book.theta[start:end]):
+            digest.update(np.ascontiguousarray(values).tobytes())
+        result[int(book.user[start])] = digest.hexdigest()
+    return result
+
+
+def selected(book, users):
+    """Pair columns of the users to compute, with the index of each user's first pair"""
+    keep = np.isin(book.user, users)
+    user, factor, dollar_delta, dollar_gamma, theta = (column[keep] for column in book)
+    starts = np.flatnonzero(np.r_[True, user[1:] != user[:-1]]) if len(user) else np.zeros(0, dtype=np.int64)
+    return factor, dollar_delta, dollar_gamma, theta, starts
+
+
+def run(as_of=None, full=False, workers=None, chunk_users=None):
+    """
+    Recompute the stored VaR and ES of every user whose model inputs or exposures changed
+    :param as_of: day whose close the positions are marked at, defaults to today (UTC)
+    :param full: recompute every user
+    :param workers: processes to spread the path batches over, defaults to VAR_WORKERS, 1 runs inline
+    :param chunk_users: users whose paths a worker holds at once, defaults to VAR_CHUNK_USERS
+    :return: RunResult of user counts
+    """
+    config = current_app.config
+    as_of = as_of or datetime.utcnow().date()
+    workers = workers or config['VAR_WORKERS']
+    chunk_users = chunk_users or config['VAR_CHUNK_USERS']
+    rows = load_positions()
+    model = build_model(np.unique([row[1] for row in rows]).astype(np.int64), as_of, config)
+    book = exposures(rows, model, as_of, config) if rows else Exposures(*(np.zeros(0) for _ in Exposures._fields))
+    current = fingerprints(book, model)
+    stored = dict(db.session.query(ValueAtRisk.user_id, ValueAtRisk.fingerprint))
+    users = sorted(user for user, fingerprint in current.items() if full or stored.get(user) != fingerprint)
+    removed = sorted(set(stored) - set(current))
+
+    paths, batch_paths = config['VAR_PATHS'], config['VAR_BATCH_PATHS']
+    seeds = np.random.SeedSequence(config['VAR_SEED']).spawn(-(-paths // batch_paths))
+    tail = tail_size(len(seeds) * batch_paths, config['VAR_CONFIDENCE'])
+    shared = (selected(book, users), model.root, batch_paths, tail, chunk_users)
+    size = -(-len(seeds) // max(workers, 1))
+    parts = [seeds[first:first + size] for first in range(0, len(seeds), size)] if users else []
+    if workers > 1 and len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_share_model, initargs=shared) as pool:
+            results = list(pool.map(compute_batches, parts))
+    else:
+        results = [compute_batches(part, model=shared) for part in parts]
+
+    table = ValueAtRisk.__table__
+    if users or removed:
+        db.session.execute(table.delete().where(table.c.user_id.in_(users + removed)))
+    # Unchanged results still hold on the new day
+    moved = db.session.execute(table.update().where(table.c.as_of != as_of).values(as_of=as_of)).rowcount
+    now = datetime.utcnow()
+    values = tail_statistics(np.concatenate(results, axis=2), tail) if results else np.zeros((0, 2 * len(HORIZONS)))
+    if users:
+        db.session.execute(table.insert(), [
+            {'user_id': user, 'as_of': as_of, 'confidence': config['VAR_CONFIDENCE'], 'var_1d': row[0],
+             'es_1d': row[1], 'var_10d': row[2], 'es_10d': row[3], 'fingerprint': current[user], 'computed_at': now}
+            for user, row in zip(users, values.tolist())])
+    if users or removed or moved:
+        TableVersion.bump(db.session, {ValueAtRisk.__tablename__})
+    db.session.commit()
+    return RunResult(len(users), len(current) - len(users), len(removed))
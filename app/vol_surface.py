@@ -0,0 +1,243 @@
+"""
+Implied volatility surface per underlying, built from the implied vols of each contract's last trade.
+Each expiry's smile is an SVI slice in total variance over log-moneyness, fitted quasi-explicitly: for fixed (m,
+sigma) the other three parameters are a linear least-squares fit, so a grid of (m, sigma) candidates is solved at
+once and refined around the best one. Expiries with too few quotes get a flat smile. Across time total variance is
+interpolated linearly at fixed moneyness and extrapolated at constant vol. The fitted surface is evaluated once on
+a dense (years, log-moneyness) grid and lookups round to the nearest node, so they are plain array indexing.
+An underlying is only refit when its quotes changed, its spot moved beyond the tolerance or the day rolled.
+"""
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import numpy as np
+
+from . import db
+from .greeks import years_to_expiry
+from .implied_vol import IVStatus, implied_vol
+from .models import OptionContract, OptionKind, OptionTrade, Stock, TableVersion
+
+SVI_PARAMETERS = ('a', 'b', 'rho', 'm', 'sigma')
+TABLES = ('option_trades', 'option_contracts')
+
+# Cached in place of a surface for an underlying without usable quotes, until its quotes, spot or day change
+NoSurface = namedtuple('NoSurface', ['spot', 'day', 'versions'])
+
+
+def svi_total_variance(params, moneyness):
+    """Raw SVI total variance a + b (rho (k - m) + sqrt((k - m)^2 + sigma^2)), params broadcast on their last axis"""
+    a, b, rho, m, sigma = np.moveaxis(np.asarray(params, dtype=np.float64), -1, 0)
+    shifted = moneyness - m
+    return a + b * (rho * shifted + np.sqrt(shifted * shifted + sigma * sigma))
+
+
+def fit_svi(moneyness, variance, rounds=8, points=16):
+    """
+    Least-squares SVI slice through total variances
+    :param moneyness: log(strike / forward) of each quote
+    :param variance: total implied variance, vol squared times years, of each quote
+    :return: (params in SVI_PARAMETERS order, root mean square error in total variance)
+    """
+    moneyness, variance = np.asarray(moneyness, dtype=np.float64), np.asarray(variance, dtype=np.float64)
+    low, high = moneyness.min(), moneyness.max()
+    spread = max(high - low, 1e-3)
+    centers = np.linspace(low - 0.5 * spread, high + 0.5 * spread, points)
+    widths = np.geomspace(1e-3, 2.0 * spread, points)
+    for _ in range(rounds):
+        m, sigma = (values.ravel() for values in np.meshgrid(centers, widths))
+        scaled = (moneyness - m[:, None]) / sigma[:, None]
+        design = np.stack([np.ones_like(scaled), scaled, np.sqrt(scaled * scaled + 1.0)], axis=-1)
+        normal = np.einsum('cni,cnj->cij', design, design) + 1e-12 * np.eye(3)
+        a, slope, curvature = np.linalg.solve(normal, np.einsum('cni,n->ci', design, variance)[..., None])[..., 0].T
+        # Keep the slice a valid smile: wings that do not fall, and a non-negative minimum total variance
+        curvature = np.maximum(curvature, 0.0)
+        slope = np.clip(slope, -curvature, curvature)
+        a = np.maximum(a, -np.sqrt(curvature * curvature - slope * slope))
+        fitted = a[:, None] + slope[:, None] * scaled + curvature[:, None] * design[..., 2]
+        best = int(np.argmin(np.sum((fitted - variance) ** 2, axis=1)))
+        # Zoom in on two grid steps either side, the valley of (m, sigma) is a diagonal one
+        step = 2.0 * (centers[1] - centers[0])
+        ratio = widths[1] / widths[0]
+        centers = np.linspace(m[best] - step, m[best] + step, points)
+        widths = np.geomspace(sigma[best] / ratio ** 2, sigma[best] * ratio ** 2, points)
+    b = curvature[best] / sigma[best]
+    rho = slope[best] / curvature[best] if curvature[best] > 0 else 0.0
+    params = np.array([a[best], b, rho, m[best], sigma[best]])
+    return params, float(np.sqrt(np.mean((svi_total_variance(params, moneyness) - variance) ** 2)))
+
+
+def flat_slice(variance):
+    """SVI parameters of a flat smile at the mean total variance"""
+    return np.array([float(np.mean(variance)), 0.0, 0.0, 0.0, 1.0])
+
+
+def last_quotes(stock_id, today):
+    """(contract_id, expiry, strike, kind, price, trade_id) of the last trade of every unexpired contract of a stock"""
+    trades, contracts = OptionTrade.__table__, OptionContract.__table__
+    latest = db.select([db.func.max(trades.c.id)]) \
+        .select_from(trades.join(contracts, trades.c.contract_id == contracts.c.id)) \
+        .where((contracts.c.underlying_id == stock_id) & (contracts.c.expiry >= today)) \
+        .group_by(trades.c.contract_id)
+    return db.session.execute(
+        db.select([contracts.c.id, contracts.c.expiry, contracts.c.strike, contracts.c.kind, trades.c.price,
+                   trades.c.id]).select_from(trades.join(contracts, trades.c.contract_id == contracts.c.id))
+        .where(trades.c.id.in_(latest)).order_by(contracts.c.expiry, contracts.c.strike)).fetchall()
+
+
+class VolSurface:
+    """Fitted slices of one underlying and their dense grid of vols, rows by years and columns by log-moneyness"""
+
+    def __init__(self, stock_id, spot, rate, day, quote_key, expiries, years, params, quotes, errors, moneyness,
+                 times):
+        self.stock_id, self.spot, self.rate, self.day, self.quote_key = stock_id, spot, rate, day, quote_key
+        self.expiries, self.years, self.params, self.quotes, self.errors = expiries, years, params, quotes, errors
+        self.moneyness, self.times = moneyness, times
+        self.versions = None
+        self.vols = self.evaluate(times[:, None], moneyness[None, :])
+
+    def evaluate(self, years, moneyness):
+        """Vol of the fitted surface, interpolating total variance linearly in time"""
+        years, moneyness = np.broadcast_arrays(np.asarray(years, dtype=np.float64),
+                                               np.asarray(moneyness, dtype=np.float64))
+        slices = svi_total_variance(self.params[:, None, :], moneyness.ravel()[None, :])
+        # Total variance may not fall with time at any moneyness
+        slices = np.maximum.accumulate(np.maximum(slices, 0.0), axis=0)
+        flat_years = np.maximum(years.ravel(), 0.0)
+        after = np.clip(np.searchsorted(self.years, flat_years, side='right'), 1, len(self.years) - 1) \
+            if len(self.years) > 1 else np.zeros(len(flat_years), dtype=np.int64)
+        before = np.maximum(after - 1, 0)
+        columns = np.arange(len(flat_years))
+        if len(self.years) > 1:
+            weight = (flat_years - self.years[before]) / (self.years[after] - self.years[before])
+            variance = slices[before, columns] + np.clip(weight, 0.0, None) * (slices[after, columns] -
+                                                                              slices[before, columns])
+            vol = np.sqrt(np.maximum(variance, 0.0) / np.maximum(flat_years, 1e-12))
+        else:
+            vol = np.zeros(len(flat_years))
+        # Constant vol before the first expiry and after the last
+        first = np.sqrt(slices[0, columns] / self.years[0])
+        last = np.sqrt(slices[-1, columns] / self.years[-1])
+        vol = np.where(flat_years <= self.years[0], first, np.where(flat_years >= self.years[-1], last, vol))
+        return vol.reshape(years.shape)
+
+    def lookup(self, strike, years):
+        """Vol at the grid node nearest to each (strike, years)"""
+        years = np.asarray(years, dtype=np.float64)
+        moneyness = np.log(np.asarray(strike, dtype=np.float64) / (self.spot * np.exp(self.rate * years)))
+        column = np.rint((moneyness - self.moneyness[0]) / (self.moneyness[1] - self.moneyness[0]))
+        row = np.rint(years / (self.times[1] - self.times[0]))
+        return self.vols[np.clip(row, 0, len(self.times) - 1).astype(np.int64),
+                         np.clip(column, 0, len(self.moneyness) - 1).astype(np.int64)]
+
+    def to_json(self):
+        return {
+            'spot': self.spot,
+            'day': self.day.isoformat(),
+            'expiries': [dict(zip(SVI_PARAMETERS, params), expiry=expiry.isoformat(), years=years, quotes=quotes,
+                              rmse=error)
+                         for expiry, years, params, quotes, error in zip(self.expiries, self.years.tolist(),
+                                                                         self.params.tolist(), self.quotes.tolist(),
+                                                                         self.errors.tolist())],
+            'moneyness': self.moneyness.tolist(),
+            'years': self.times.tolist(),
+            'vols': self.vols.tolist()
+        }
+
+
+class SurfaceBook:
+    """Per-process cache of fitted surfaces, refit on read when an underlying's quotes or spot changed"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.surfaces = {}
+        self.rate = self.spot_tolerance = self.min_quotes = None
+        self.moneyness_range = self.moneyness_points = self.time_points = None
+
+    def init_app(self, app):
+        self.rate = app.config['RISK_FREE_RATE']
+        self.spot_tolerance = app.config['VOL_SURFACE_SPOT_TOLERANCE']
+        self.min_quotes = app.config['VOL_SURFACE_MIN_QUOTES']
+        self.moneyness_range = app.config['VOL_SURFACE_MONEYNESS_RANGE']
+        self.moneyness_points = app.config['VOL_SURFACE_MONEYNESS_POINTS']
+        self.time_points = app.config['VOL_SURFACE_TIME_POINTS']
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.surfaces = {}
+
+    def fit(self, stock_id, spot, now, quotes):
+        """Surface through the last trades of a stock's contracts, None when none of them implies a vol"""
+        expiries = [row.expiry for row in quotes]
+        years = years_to_expiry(expiries, now)
+        strike = np.array([row.strike for row in quotes], dtype=np.float64)
+        call = np.array([row.kind == OptionKind.CALL for row in quotes])
+        implied = implied_vol(np.array([row.price for row in quotes], dtype=np.float64), spot, strike, years,
+                              self.rate, 0.0, call)
+        usable = implied.status == IVStatus.CONVERGED
+        if not np.any(usable):
+            return None
+        moneyness = np.log(strike / (spot * np.exp(self.rate * years)))
+        variance = implied.vol ** 2 * years
+        slices, slice_years, params, counts, errors = [], [], [], [], []
+        for expiry in sorted(set(expiry for expiry, ok in zip(expiries, usable.tolist()) if ok)):
+            rows = usable & np.array([value == expiry for value in expiries])
+            if np.count_nonzero(rows) >= self.min_quotes:
+                fitted, error = fit_svi(moneyness[rows], variance[rows])
+            else:
+                fitted = flat_slice(variance[rows])
+                error = float(np.sqrt(np.mean((variance[rows] - fitted[0]) ** 2)))
+            slices.append(expiry)
+            slice_years.append(years[rows][0])
+            params.append(fitted)
+            counts.append(int(np.count_nonzero(rows)))
+            errors.append(error)
+        moneyness_axis = np.linspace(-self.moneyness_range, self.moneyness_range, self.moneyness_points)
+        times = np.linspace(0.0, max(slice_years), self.time_points)
+        return VolSurface(stock_id, float(spot), self.rate, now.date(), self.quote_key(quotes), slices,
+                          np.array(slice_years), np.array(params), np.array(counts), np.array(errors),
+                          moneyness_axis, times)
+
+    @staticmethod
+    def quote_key(quotes):
+        return len(quotes), max((row[5] for row in quotes), default=0)
+
+    def surface(self, stock_id, now=None):
+        """Fitted surface of one stock, None when it has no usable quotes"""
+        now = now or datetime.utcnow()
+        versions, _ = TableVersion.lookup(TABLES)
+        spot = float(Stock.marks(np.array([stock_id]))[0])
+        with self.lock:
+            cached = self.surfaces.get(stock_id)
+        fresh = cached is not None and cached.day == now.date() and \
+            abs(spot - cached.spot) <= self.spot_tolerance * cached.spot
+        if fresh and cached.versions == versions:
+            return None if isinstance(cached, NoSurface) else cached
+        if np.isnan(spot):
+            return None
+        quotes = last_quotes(stock_id, now.date())
+        if fresh and not isinstance(cached, NoSurface) and cached.quote_key == self.quote_key(quotes):
+            cached.versions = versions
+            return cached
+        surface = self.fit(stock_id, spot, now, quotes) if quotes else None
+        if surface is not None:
+            surface.versions = versions
+        with self.lock:
+            self.surfaces[stock_id] = surface if surface is not None else NoSurface(spot, now.date(), versions)
+        return surface
+
+    def vol(self, stock_ids, strikes, years, now=None):
+        """Surface vol of each (underlying, strike, years), NaN for underlyings without a surface"""
+        stock_ids = np.asarray(stock_ids, dtype=np.int64)
+        strikes, years = np.asarray(strikes, dtype=np.float64), np.asarray(years, dtype=np.float64)
+        result = np.full(len(stock_ids), np.nan)
+        for stock_id in np.unique(stock_ids).tolist():
+            surface = self.surface(stock_id, now)
+            if surface is not None:
+                rows = stock_ids == stock_id
+                result[rows] = surface.lookup(strikes[rows], years[rows])
+        return result
+
+
+vol_surfaces = SurfaceBook()
@@ -0,0 +1,63 @@
+"""
+Price alert evaluation at scale, the in-memory part of the market feed's alert engine.
+Run from the repository root:
+$ python -m benchmarks.alerts --alerts 1000000 --stocks 5000 --ticks-per-second 10000 --seconds 30
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.alerts import AlertIndex
+from app.models import AlertKind
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--alerts', type=int, default=1000000)
+    parser.add_argument('--stocks', type=int, default=5000)
+    parser.add_argument('--ticks-per-second', type=int, default=10000)
+    parser.add_argument('--seconds', type=int, default=30)
+    parser.add_argument('--batches-per-second', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    prices = rng.uniform(10, 500, size=args.stocks + 1)
+    stock_ids = rng.integers(1, args.stocks + 1, size=args.alerts)
+    kinds = rng.choice(np.array(AlertKind.ALL), size=args.alerts)
+    # Levels within a few percent of the price so a realistic share fires during the run
+    move = rng.uniform(0.01, 0.10, size=args.alerts)
+    thresholds = np.where(kinds == AlertKind.ABOVE, prices[stock_ids] * (1 + move),
+                          np.where(kinds == AlertKind.BELOW, prices[stock_ids] * (1 - move), move))
+    references = prices[stock_ids]
+
+    start = time.perf_counter()
+    index = AlertIndex()
+    index.add(np.arange(1, args.alerts + 1), stock_ids, kinds, thresholds, references)
+    build = time.perf_counter() - start
+
+    batch = args.ticks_per_second // args.batches_per_second
+    batches = args.seconds * args.batches_per_second
+    fired = 0
+    busy = worst = 0.0
+    for _ in range(batches):
+        tick_stocks = rng.integers(1, args.stocks + 1, size=batch)
+        prices[tick_stocks] *= np.exp(rng.normal(0, 0.002, size=batch))
+        start = time.perf_counter()
+        ids, crossed = index.evaluate_ticks(tick_stocks, prices[tick_stocks])
+        elapsed = time.perf_counter() - start
+        busy += elapsed
+        worst = max(worst, elapsed)
+        fired += len(ids)
+
+    ticks = batch * batches
+    print('{:,} alerts on {:,} stocks, index built in {:.2f}s'.format(args.alerts, args.stocks, build))
+    print('{:,} ticks in batches of {:,}: {:.3f}s busy, {:,.0f} ticks/s, worst batch {:.1f}ms'.format(
+        ticks, batch, busy, ticks / busy, worst * 1000))
+    print('{:,} alerts fired, {:,} still active, one core {:.1%} busy at {:,} ticks/s'.format(
+        fired, len(index), busy / args.seconds, args.ticks_per_second))
+
+
+if __name__ == '__main__':
+    main()
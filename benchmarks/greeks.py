@@ -0,0 +1,71 @@
+"""
+Vectorized Black-Scholes Greeks against a per-contract Python loop.
+Run from the repository root:
+$ python -m benchmarks.greeks --contracts 1000000 --loop-contracts 20000
+"""
+import argparse
+import math
+import time
+
+import numpy as np
+
+from app.greeks import black_scholes
+
+
+def scalar_greeks(spot, strike, years, rate, dividend, vol, call):
+    """The one-at-a-time version the vectorized engine replaces, math.erf per contract"""
+    sign = 1.0 if call else -1.0
+    spread = vol * math.sqrt(years)
+    carry, discount = math.exp(-dividend * years), math.exp(-rate * years)
+    d1 = (math.log(spot / strike) + (rate - dividend) * years) / spread + 0.5 * spread
+    d2 = d1 - spread
+    n1 = 0.5 * math.erfc(-sign * d1 / math.sqrt(2))
+    n2 = 0.5 * math.erfc(-sign * d2 / math.sqrt(2))
+    density = math.exp(-0.5 * d1 * d1) / math.sqrt(2 * math.pi)
+    price = sign * (spot * carry * n1 - strike * discount * n2)
+    delta = sign * carry * n1
+    gamma = carry * density / (spot * spread)
+    vega = spot * carry * density * math.sqrt(years)
+    theta = sign * (dividend * spot * carry * n1 - rate * strike * discount * n2) - \
+        spot * carry * density * vol / (2 * math.sqrt(years))
+    rho = sign * years * strike * discount * n2
+    return price, delta, gamma, theta, vega, rho
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--contracts', type=int, default=1000000)
+    parser.add_argument('--loop-contracts', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    spot = rng.uniform(10, 500, size=args.contracts)
+    strike = spot * rng.uniform(0.5, 1.5, size=args.contracts)
+    years = rng.uniform(1 / 365, 2, size=args.contracts)
+    vol = rng.uniform(0.05, 1.0, size=args.contracts)
+    call = rng.random(args.contracts) < 0.5
+    rate, dividend = 0.04, 0.01
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        greeks = black_scholes(spot, strike, years, rate, dividend, vol, call)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+
+    count = min(args.loop_contracts, args.contracts)
+    start = time.perf_counter()
+    looped = [scalar_greeks(spot[i], strike[i], years[i], rate, dividend, vol[i], call[i]) for i in range(count)]
+    loop = (time.perf_counter() - start) / count * args.contracts
+    error = np.max(np.abs(np.array(looped).T - np.array(greeks)[:, :count]))
+
+    print('{:,} contracts: {:.3f}s best of {}, {:,.0f} contracts/s'.format(args.contracts, best, args.repeat,
+                                                                          args.contracts / best))
+    print('Python loop extrapolated from {:,} contracts: {:.1f}s, {:.0f}x slower, max abs difference {:.1e}'.format(
+        count, loop, loop / best, error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Batch implied volatility against a one-contract-at-a-time scalar root finder.
+Run from the repository root:
+$ python -m benchmarks.implied_vol --quotes 100000 --loop-quotes 1000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.greeks import black_scholes
+from app.implied_vol import IVStatus, implied_vol
+
+
+def scalar_implied_vol(price, spot, strike, years, rate, dividend, call, tolerance=1e-12):
+    """Bisection on the Black-Scholes price, the textbook scalar solver the batch one replaces"""
+    low, high = 1e-6, 10.0
+    for _ in range(200):
+        middle = 0.5 * (low + high)
+        if black_scholes(spot, strike, years, rate, dividend, middle, call).price > price:
+            high = middle
+        else:
+            low = middle
+        if high - low < tolerance:
+            break
+    return 0.5 * (low + high)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--quotes', type=int, default=100000)
+    parser.add_argument('--loop-quotes', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    spot = rng.uniform(10, 500, size=args.quotes)
+    strike = spot * rng.uniform(0.6, 1.4, size=args.quotes)
+    years = rng.uniform(7 / 365, 2, size=args.quotes)
+    vol = rng.uniform(0.05, 1.5, size=args.quotes)
+    call = rng.random(args.quotes) < 0.5
+    rate, dividend = 0.04, 0.01
+    price = black_scholes(spot, strike, years, rate, dividend, vol, call).price
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        result = implied_vol(price, spot, strike, years, rate, dividend, call)
+        timings.append(time.perf_counter() - start)
+    best = min(timings)
+    # Deep in-the-money quotes whose time value is lost in the price's rounding have no recoverable vol
+    intrinsic = np.maximum(np.where(call, 1, -1) * (spot * np.exp(-dividend * years) - strike * np.exp(-rate * years)),
+                           0.0)
+    meaningful = price - intrinsic > 1e-6 * price
+    error = np.abs(result.vol - vol)[meaningful]
+
+    count = min(args.loop_quotes, args.quotes)
+    start = time.perf_counter()
+    for i in range(count):
+        scalar_implied_vol(price[i], spot[i], strike[i], years[i], rate, dividend, call[i])
+    loop = (time.perf_counter() - start) / count * args.quotes
+
+    print('{:,} quotes: {:.3f}s best of {}, {:,.0f} quotes/s'.format(args.quotes, best, args.repeat,
+                                                                    args.quotes / best))
+    print('{:,} converged, iterations median {:.0f} and max {}, max vol error {:.1e} where time value is above '
+          '1e-6 of the price'.format(int(np.count_nonzero(result.status == IVStatus.CONVERGED)),
+                                     np.median(result.iterations), result.iterations.max(), error.max()))
+    print('Scalar bisection extrapolated from {:,} quotes: {:.1f}s, {:.0f}x slower'.format(count, loop, loop / best))
+
+
+if __name__ == '__main__':
+    main()
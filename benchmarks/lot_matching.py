@@ -0,0 +1,57 @@
+"""
+Replay speed of the lot matcher on one user's long trade history.
+Compares the vectorized FIFO replay with the sequential LotBook and checks that both produce the same ledger.
+Run from the repository root:
+$ python -m benchmarks.lot_matching --trades 1000000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.lots import FIFO, LIFO, match_fifo, match_sequential
+
+
+def make_history(trades, seed):
+    """Random walk of buys and sells, mostly small, that keeps crossing between long and short"""
+    rng = np.random.default_rng(seed)
+    quantities = rng.integers(-100, 101, size=trades)
+    quantities[quantities == 0] = 1
+    prices = np.round(100 * np.exp(np.cumsum(rng.normal(0, 0.001, size=trades))), 2)
+    return quantities, prices
+
+
+def timed(function, *args, repeat=3):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--trades', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    quantities, prices = make_history(args.trades, args.seed)
+    vectorized_time, vectorized = timed(match_fifo, quantities, prices, repeat=args.repeat)
+    sequential_time, sequential = timed(match_sequential, quantities, prices, FIFO, repeat=args.repeat)
+    lifo_time, lifo = timed(match_sequential, quantities, prices, LIFO, repeat=args.repeat)
+    for expected, actual in zip(sequential[0] + sequential[1], vectorized[0] + vectorized[1]):
+        np.testing.assert_allclose(expected, actual)
+
+    print('{:,} trades, {:,} realized matches, {:,} open lots'.format(
+        args.trades, len(vectorized[0].pnl), len(vectorized[1].index)))
+    print('FIFO vectorized  {:8.3f}s  {:12,.0f} trades/s'.format(vectorized_time, args.trades / vectorized_time))
+    print('FIFO sequential  {:8.3f}s  {:12,.0f} trades/s'.format(sequential_time, args.trades / sequential_time))
+    print('LIFO sequential  {:8.3f}s  {:12,.0f} trades/s'.format(lifo_time, args.trades / lifo_time))
+    print('realized P&L FIFO {:,.2f}  LIFO {:,.2f}'.format(vectorized[0].pnl.sum(), lifo[0].pnl.sum()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+Firm-wide scenario grid over a synthetic book, inline and spread over a process pool.
+Run from the repository root:
+$ python -m benchmarks.scenarios --positions 200000 --users 5000 --workers 4
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from app.scenarios import _share_grid, chunks, compute_chunk
+
+
+def run(parts, grid, workers):
+    start = time.perf_counter()
+    if workers > 1 and len(parts) > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_share_grid, initargs=grid) as pool:
+            results = list(pool.map(compute_chunk, *zip(*parts)))
+    else:
+        results = [compute_chunk(*part, grid=grid) for part in parts]
+    return time.perf_counter() - start, np.concatenate([sums for _, sums in results])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--positions', type=int, default=200000)
+    parser.add_argument('--users', type=int, default=5000)
+    parser.add_argument('--option-share', type=float, default=0.7)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--chunk-rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    count = args.positions
+    user = np.sort(rng.integers(1, args.users + 1, count))
+    spot = rng.uniform(10, 500, count)
+    option = rng.random(count) < args.option_share
+    columns = (user, rng.integers(-50, 50, count) * np.where(option, 100.0, 1.0), spot,
+               np.where(option, spot * rng.uniform(0.7, 1.3, count), 0.0), rng.uniform(0, 2, count),
+               np.where(option, rng.uniform(0.1, 0.8, count), 0.0), rng.random(count) < 0.5, option)
+    grid = (np.linspace(-0.2, 0.2, 9), np.linspace(-0.1, 0.1, 5), 0.04)
+    parts = list(chunks(columns, args.chunk_rows))
+
+    inline, expected = run(parts, grid, 1)
+    pooled, pnl = run(parts, grid, args.workers)
+    cells = count * len(grid[0]) * len(grid[1])
+    print('{:,} positions x {} scenarios: inline {:.2f}s, {:,.0f} repricings/s'.format(
+        count, len(grid[0]) * len(grid[1]), inline, cells / inline))
+    print('{} workers: {:.2f}s including pool start-up, {:.1f}x, results identical: {}'.format(
+        args.workers, pooled, inline / pooled, bool(np.array_equal(expected, pnl))))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+"""
+Sustained write throughput of the production SQLite profile under concurrent worker processes.
+Each worker mimics a gunicorn worker: its own app, its own pool, a mix of ping() updates, trade inserts and watches.
+Run from the repository root:
+$ python -m benchmarks.sqlite_writes --workers 8 --seconds 10
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+
+def make_app(db_path, tuned, search_index=False):
+    from app import create_app
+    app = create_app('production')
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + db_path
+    # Whoosh serializes its own index writes behind a file lock, keep it out unless asked for
+    app.extensions['whooshee']['enable_indexing'] = search_index
+    if not tuned:
+        app.config['SQLITE_PRAGMAS'] = None
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 0.01}}
+        app.config['WRITE_RETRY_ATTEMPTS'] = 1
+    return app
+
+
+def setup_database(db_path, users, stocks):
+    from app import db
+    from app.models import Role, Stock, User
+    app = make_app(db_path, tuned=True)
+    with app.app_context():
+        db.create_all()
+        Role.insert_roles()
+        for i in range(users):
+            db.session.add(User(username='user%d' % i, email='user%d@example.com' % i, password='password'))
+        for i in range(stocks):
+            db.session.add(Stock(name='Stock %d' % i, ticker='S%d' % i, sector='Tech'))
+        db.session.commit()
+        db.get_engine().dispose()
+
+
+def worker(db_path, tuned, search_index, seconds, users, stocks, results):
+    from app import db
+    from app.database import write_with_retry
+    from app.models import Stock, Trade, User
+    app = make_app(db_path, tuned, search_index)
+    writes = errors = 0
+    with app.app_context():
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            user = User.query.get(random.randint(1, users))
+            stock = Stock.query.get(random.randint(1, stocks))
+            try:
+                choice = random.random()
+                if choice < 0.5:
+                    user.ping()
+                elif choice < 0.9:
+                    trade = Trade(stock_id=stock.id, user_id=user.id, quantity=random.randint(1, 100),
+                                  price=random.uniform(1, 500))
+                    write_with_retry(lambda: db.session.add(trade))
+                elif user.is_watching(stock):
+                    user.unwatch(stock)
+                else:
+                    user.watch(stock)
+                writes += 1
+            except Exception:
+                db.session.rollback()
+                errors += 1
+        db.session.remove()
+    results.put((writes, errors))
+
+
+def run(tuned, search_index, workers, seconds, users, stocks):
+    handle, db_path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(handle)
+    try:
+        setup_database(db_path, users, stocks)
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=worker, args=(db_path, tuned, search_index, seconds, users, stocks, results))
+                     for _ in range(workers)]
+        for process in processes:
+            process.start()
+        totals = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+    writes = sum(total[0] for total in totals)
+    errors = sum(total[1] for total in totals)
+    print('{:>8}: {:>8.0f} writes/s, {} failed writes'.format('tuned' if tuned else 'baseline',
+                                                              writes / seconds, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--stocks', type=int, default=50)
+    parser.add_argument('--search-index', action='store_true', help='keep Whooshee indexing enabled')
+    args = parser.parse_args()
+    print('{} workers for {}s'.format(args.workers, args.seconds))
+    for tuned in (False, True):
+        run(tuned, args.search_index, args.workers, args.seconds, args.users, args.stocks)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+"""
+Vectorized portfolio valuation at scale, the in-memory part of 'flask value-portfolios'.
+Run from the repository root:
+$ python -m benchmarks.valuation --users 100000 --stocks 5000 --positions-per-user 20
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.valuation import price_vector, value_portfolios
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--stocks', type=int, default=5000)
+    parser.add_argument('--positions-per-user', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    count = args.users * args.positions_per_user
+    user_ids = np.repeat(np.arange(1, args.users + 1), args.positions_per_user)
+    stock_ids = rng.integers(1, args.stocks + 1, size=count)
+    quantities = rng.integers(-500, 1000, size=count)
+    stock_range = np.arange(1, args.stocks + 1)
+    prices = price_vector(stock_range, rng.uniform(1, 1000, size=args.stocks), args.stocks + 1)
+    previous = price_vector(stock_range, prices[1:] * rng.normal(1, 0.02, size=args.stocks), args.stocks + 1)
+
+    best = float('inf')
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        users, valuation = value_portfolios(user_ids, stock_ids, quantities, prices, previous)
+        best = min(best, time.perf_counter() - start)
+
+    print('{:,} users, {:,} stocks, {:,} positions'.format(args.users, args.stocks, count))
+    print('valuation pass {:.3f}s ({:,.0f} positions/s)'.format(best, count / best))
+    print('total equity {:,.0f}, gross exposure {:,.0f}'.format(valuation.equity.sum(),
+                                                                valuation.gross_exposure.sum()))
+
+
+if __name__ == '__main__':
+    main()
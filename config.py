@@ -1,4 +1,7 @@
 import os
+
+from sqlalchemy.pool import QueuePool
+
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 
@@ -12,17 +15,109 @@ class Config:
     MAIL_PASSWORD = os.environ.get('MAIL_PASSWORD')
     GREEK_MAIL_SUBJECT_PREFIX = '[Greek Gang Terminal]'
     GREEK_MAIL_SENDER = 'Greek Gang Terminal Admin <GreekGangTerminal@example.com>'
-    GREEK_ = os.environ.get('GREEK_ADMIN')
+    GREEK_ADMIN = os.environ.get('GREEK_ADMIN')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     FOLLOWERS_PER_PAGE = os.environ.get('FOLLOWERS_PER_PAGE') or 50
     TRADES_PER_PAGE = os.environ.get('TRADES_PER_PAGE') or 10
     WATCHLIST_PER_PAGE = os.environ.get('WATCHLIST_PER_PAGE') or 10
+    STOCKS_PER_PAGE = os.environ.get('STOCKS_PER_PAGE') or 20
     UPLOADED_PHOTOS_DEST = os.environ.get('UPLOADED_PHOTOS_DEST') or 'app/files/images'
     UPLOADED_PHOTOS_URL = os.environ.get('UPLOADED_PHOTOS_URL') or 'http://localhost:5000/files/images/'
     RESIZE_URL = os.environ.get('RESIZE_URL') or 'http://localhost:5000/files/images/'
     RESIZE_ROOT = os.environ.get('RESIZE_ROOT') or 'app/files/images/'
     RESIZE_TARGET_DIRECTORY = os.environ.get('RESIZE_TARGET_DIRECTORY') or 'resized-images'
     RESIZE_STORAGE_BACKEND = os.environ.get('RESIZE_STORAGE_BACKEND') or 'file'
+    WRITE_RETRY_ATTEMPTS = int(os.environ.get('WRITE_RETRY_ATTEMPTS', '8'))
+    WRITE_RETRY_BASE_DELAY = float(os.environ.get('WRITE_RETRY_BASE_DELAY', '0.02'))
+    # Comma separated replica URIs become 'replica_<n>' binds, reads marked read-only are spread across them
+    SQLALCHEMY_BINDS = {'replica_%d' % index: uri for index, uri in
+                        enumerate(filter(None, os.environ.get('READ_REPLICA_URLS', '').split(',')))}
+    READ_YOUR_WRITES_SECONDS = float(os.environ.get('READ_YOUR_WRITES_SECONDS', '5'))
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '1024'))
+    DELTA_SYNC_LIMIT = int(os.environ.get('DELTA_SYNC_LIMIT', '500'))
+    DELTA_SYNC_MAX_WAIT = float(os.environ.get('DELTA_SYNC_MAX_WAIT', '25'))
+    DELTA_SYNC_POLL_INTERVAL = float(os.environ.get('DELTA_SYNC_POLL_INTERVAL', '0.25'))
+    # 'fifo' or 'lifo', changing it needs 'flask rebuild-lots' to restate the stored realized P&L
+    LOT_MATCHING_METHOD = os.environ.get('LOT_MATCHING_METHOD', 'fifo').lower()
+    EQUITY_CURVE_WORKERS = int(os.environ.get('EQUITY_CURVE_WORKERS', str(os.cpu_count() or 1)))
+    EQUITY_CURVE_CHUNK_USERS = int(os.environ.get('EQUITY_CURVE_CHUNK_USERS', '2000'))
+    PERFORMANCE_MAX_POINTS = int(os.environ.get('PERFORMANCE_MAX_POINTS', '250'))
+    PRICE_STORE_DIR = os.environ.get('PRICE_STORE_DIR') or os.path.join(basedir, 'prices')
+    PRICE_IMPORT_CHUNK_ROWS = int(os.environ.get('PRICE_IMPORT_CHUNK_ROWS', '100000'))
+    OPTION_IMPORT_CHUNK_ROWS = int(os.environ.get('OPTION_IMPORT_CHUNK_ROWS', '10000'))
+    PRICES_PER_REQUEST = int(os.environ.get('PRICES_PER_REQUEST', '5000'))
+    MARKET_FEED_SOURCE = os.environ.get('MARKET_FEED_SOURCE')
+    MARKET_FEED_INTERVAL = float(os.environ.get('MARKET_FEED_INTERVAL', '1'))
+    MARKET_FEED_LATENESS = float(os.environ.get('MARKET_FEED_LATENESS', '2'))
+    MARKET_FEED_QUEUE_SIZE = int(os.environ.get('MARKET_FEED_QUEUE_SIZE', '10000'))
+    MARKET_FEED_BATCH_SIZE = int(os.environ.get('MARKET_FEED_BATCH_SIZE', '1000'))
+    MARKET_FEED_FLUSH_INTERVAL = float(os.environ.get('MARKET_FEED_FLUSH_INTERVAL', '0.5'))
+    MARKET_FEED_METRICS_INTERVAL = float(os.environ.get('MARKET_FEED_METRICS_INTERVAL', '10'))
+    # Shared-memory segment with the last quote of every stock id below QUOTE_CACHE_SLOTS, written by the market feed
+    QUOTE_CACHE_NAME = os.environ.get('QUOTE_CACHE_NAME', 'greekgang-quotes')
+    QUOTE_CACHE_SLOTS = int(os.environ.get('QUOTE_CACHE_SLOTS', '65536'))
+    # Continuously compounded rate used by the option pricers when a request does not give one
+    RISK_FREE_RATE = float(os.environ.get('RISK_FREE_RATE', '0.04'))
+    GREEKS_MAX_BATCH = int(os.environ.get('GREEKS_MAX_BATCH', '100000'))
+    # American prices: binomial steps, options per request, and the time and vol buckets whose lattices are cached
+    # between requests
+    LATTICE_STEPS = int(os.environ.get('LATTICE_STEPS', '100'))
+    LATTICE_MAX_BATCH = int(os.environ.get('LATTICE_MAX_BATCH', '2000'))
+    LATTICE_CACHE_SIZE = int(os.environ.get('LATTICE_CACHE_SIZE', '256'))
+    LATTICE_TIME_BUCKET_HOURS = float(os.environ.get('LATTICE_TIME_BUCKET_HOURS', '1'))
+    LATTICE_VOL_BUCKET = float(os.environ.get('LATTICE_VOL_BUCKET', '0.005'))
+    # Vol of option positions without a trade to imply one from
+    OPTION_DEFAULT_VOL = float(os.environ.get('OPTION_DEFAULT_VOL', '0.3'))
+    # Vol surfaces: expiries with fewer quotes get a flat smile, the grid spans +-range in log-moneyness and runs
+    # from now to the last expiry. A surface is refit when its quotes change or its spot moves beyond the tolerance.
+    VOL_SURFACE_MIN_QUOTES = int(os.environ.get('VOL_SURFACE_MIN_QUOTES', '5'))
+    VOL_SURFACE_MONEYNESS_RANGE = float(os.environ.get('VOL_SURFACE_MONEYNESS_RANGE', '1.0'))
+    VOL_SURFACE_MONEYNESS_POINTS = int(os.environ.get('VOL_SURFACE_MONEYNESS_POINTS', '101'))
+    VOL_SURFACE_TIME_POINTS = int(os.environ.get('VOL_SURFACE_TIME_POINTS', '200'))
+    VOL_SURFACE_SPOT_TOLERANCE = float(os.environ.get('VOL_SURFACE_SPOT_TOLERANCE', '0.01'))
+    # Cached position Greeks are only repriced after a relative spot move or an absolute vol move beyond these
+    GREEKS_SPOT_TOLERANCE = float(os.environ.get('GREEKS_SPOT_TOLERANCE', '0.005'))
+    GREEKS_VOL_TOLERANCE = float(os.environ.get('GREEKS_VOL_TOLERANCE', '0.005'))
+    # Scenario grid: relative underlying moves and absolute vol moves, positions are repriced at every pair
+    # Books of up to SCENARIO_INLINE_ROWS positions are repriced inline, below that the process pool
+    # costs more to start than it saves
+    SCENARIO_SPOT_SHOCKS = [float(value) for value in os.environ.get(
+        'SCENARIO_SPOT_SHOCKS', '-0.2,-0.15,-0.1,-0.05,0,0.05,0.1,0.15,0.2').split(',')]
+    SCENARIO_VOL_SHOCKS = [float(value) for value in os.environ.get(
+        'SCENARIO_VOL_SHOCKS', '-0.1,-0.05,0,0.05,0.1').split(',')]
+    SCENARIO_MAX_POINTS = int(os.environ.get('SCENARIO_MAX_POINTS', '41'))
+    SCENARIO_WORKERS = int(os.environ.get('SCENARIO_WORKERS', str(os.cpu_count() or 1)))
+    SCENARIO_CHUNK_ROWS = int(os.environ.get('SCENARIO_CHUNK_ROWS', '20000'))
+    SCENARIO_INLINE_ROWS = int(os.environ.get('SCENARIO_INLINE_ROWS', '200000'))
+    # Monte Carlo VaR: VAR_PATHS is rounded up to whole batches, each batch draws from its own stream of VAR_SEED
+    VAR_CONFIDENCE = float(os.environ.get('VAR_CONFIDENCE', '0.99'))
+    VAR_PATHS = int(os.environ.get('VAR_PATHS', '10000'))
+    VAR_BATCH_PATHS = int(os.environ.get('VAR_BATCH_PATHS', '1000'))
+    VAR_SEED = int(os.environ.get('VAR_SEED', '20261019'))
+    VAR_LOOKBACK_DAYS = int(os.environ.get('VAR_LOOKBACK_DAYS', '252'))
+    VAR_SHRINKAGE = float(os.environ.get('VAR_SHRINKAGE', '0.1'))
+    VAR_WORKERS = int(os.environ.get('VAR_WORKERS', str(os.cpu_count() or 1)))
+    VAR_CHUNK_USERS = int(os.environ.get('VAR_CHUNK_USERS', '500'))
+    # Trailing windows, in trading days, of the realized statistics shown on the stock pages and screened on
+    STATISTICS_WINDOWS = [int(value) for value in os.environ.get('STATISTICS_WINDOWS', '10,20,60,252').split(',')]
+    # Return correlations of the whole universe: stocks with fewer daily returns than CORRELATION_MIN_DAYS are left
+    # out, the off-diagonal is shrunk by CORRELATION_SHRINKAGE and the matrix is filled in square blocks of stocks
+    CORRELATION_DIR = os.environ.get('CORRELATION_DIR') or os.path.join(basedir, 'correlation')
+    CORRELATION_LOOKBACK_DAYS = int(os.environ.get('CORRELATION_LOOKBACK_DAYS', '252'))
+    CORRELATION_MIN_DAYS = int(os.environ.get('CORRELATION_MIN_DAYS', '60'))
+    CORRELATION_SHRINKAGE = float(os.environ.get('CORRELATION_SHRINKAGE', '0.1'))
+    CORRELATION_BLOCK_STOCKS = int(os.environ.get('CORRELATION_BLOCK_STOCKS', '1024'))
+    ALERTS_PER_PAGE = int(os.environ.get('ALERTS_PER_PAGE', '20'))
+    # How often the market feed's alert engine picks up alerts created or cancelled by the workers
+    ALERTS_REFRESH_INTERVAL = float(os.environ.get('ALERTS_REFRESH_INTERVAL', '5'))
+    ALERTS_EMAIL = os.environ.get('ALERTS_EMAIL', 'true').lower() in ['true', 'on', '1']
+    # Server-sent trade stream, each worker relays the broker_messages table to its own subscribers
+    STREAM_RELAY = os.environ.get('STREAM_RELAY', 'true').lower() in ['true', 'on', '1']
+    STREAM_QUEUE_SIZE = int(os.environ.get('STREAM_QUEUE_SIZE', '256'))
+    STREAM_POLL_INTERVAL = float(os.environ.get('STREAM_POLL_INTERVAL', '0.2'))
+    STREAM_BATCH_SIZE = int(os.environ.get('STREAM_BATCH_SIZE', '500'))
+    STREAM_RETENTION_SECONDS = int(os.environ.get('STREAM_RETENTION_SECONDS', '300'))
+    STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', '15'))
 
 
     @staticmethod
@@ -42,11 +137,39 @@ class TestingConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('TEST_DATABASE_URL') or \
         'sqlite://'
     WTF_CSRF_ENABLED = False
+    STREAM_RELAY = False
+    QUOTE_CACHE_NAME = 'greekgang-quotes-test-{}'.format(os.getpid())
 
 
 class ProductionConfig(Config):
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
         'sqlite:///' + os.path.join(basedir, 'data.sqlite')
+    # WAL lets readers run alongside the single writer, NORMAL only fsyncs at checkpoints in WAL mode
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', str(256 * 1024 * 1024))),
+        'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', '-65536')),
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT', '5000')),
+        'temp_store': 'MEMORY'
+    }
+    SQLITE_ENGINE_OPTIONS = {
+        'poolclass': QueuePool,
+        'pool_size': int(os.environ.get('SQLITE_POOL_SIZE', '8')),
+        'max_overflow': int(os.environ.get('SQLITE_MAX_OVERFLOW', '4')),
+        'pool_timeout': 30,
+        'pool_pre_ping': True,
+        'connect_args': {'timeout': 30, 'check_same_thread': False}
+    }
+
+    @classmethod
+    def init_app(cls, app):
+        """The pool and driver options only make sense for SQLite, leave other databases on their defaults"""
+        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            engine_options = app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {}
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(cls.SQLITE_ENGINE_OPTIONS, **engine_options)
+        else:
+            app.config['SQLITE_PRAGMAS'] = None
 
 
 config = {
@@ -1,6 +1,7 @@
 import os
 import sys
 import click
+from datetime import datetime, timedelta
 
 COV = None
 if os.environ.get('FLASK_COVERAGE'):
@@ -9,7 +10,8 @@ if os.environ.get('FLASK_COVERAGE'):
     COV.start()
 
 from app import create_app, db
-from app.models import Follow, Permission, Role, Stock, Trade, User
+from app.models import Follow, Lot, OptionContract, OptionPosition, OptionTrade, Permission, Position, Role, Stock, \
+    Trade, User
 from flask_migrate import Migrate
 from app import whooshee
 
@@ -19,7 +21,8 @@ migrate = Migrate(app, db)
 
 @app.shell_context_processor
 def make_shell_context():
-    return dict(db=db, Follow=Follow, Permission=Permission, Role=Role, Stock=Stock, Trade=Trade, User=User)
+    return dict(db=db, Follow=Follow, OptionContract=OptionContract, OptionTrade=OptionTrade, Permission=Permission,
+                Position=Position, Role=Role, Stock=Stock, Trade=Trade, User=User)
 
 
 @app.cli.command()
@@ -27,6 +30,148 @@ def reindex():
     whooshee.reindex()
 
 
+@app.cli.command()
+def rebuild_positions():
+    """Recompute the positions and option positions tables from the trades"""
+    count = Position.rebuild()
+    options = OptionPosition.rebuild()
+    click.echo('Rebuilt {} positions and {} option positions.'.format(count, options))
+
+
+@app.cli.command()
+@click.option('--method', type=click.Choice(['fifo', 'lifo']), default=None,
+              help='Lot matching method, defaults to LOT_MATCHING_METHOD.')
+def rebuild_lots(method):
+    """Replay every trade into tax lots and realized P&L"""
+    realized, lots = Lot.rebuild(method)
+    click.echo('Rebuilt {} realized P&L records and {} open lots.'.format(realized, lots))
+
+
+@app.cli.command()
+def value_portfolios():
+    """Mark every portfolio to market and store a valuation snapshot"""
+    from app.valuation import run_valuation
+    count = run_valuation()
+    click.echo('Valued {} portfolios.'.format(count))
+
+
+@app.cli.command()
+@click.option('--day', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Day to snapshot, defaults to yesterday (UTC).')
+def snapshot_equity(day):
+    """Nightly job, append one equity curve row per user for a finished day"""
+    from app.performance import backfill
+    day = day.date() if day else datetime.utcnow().date() - timedelta(days=1)
+    count = backfill(start=day, end=day, workers=1)
+    click.echo('Wrote {} equity curve rows for {}.'.format(count, day))
+
+
+@app.cli.command()
+@click.option('--day', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Day whose close positions are marked at, defaults to today (UTC).')
+@click.option('--full', is_flag=True, help='Recompute every user, not only those whose exposures changed.')
+@click.option('--workers', type=int, default=None, help='Worker processes, defaults to VAR_WORKERS.')
+def value_at_risk(day, full, workers):
+    """Nightly job, simulate the 1-day and 10-day VaR and Expected Shortfall of every user"""
+    from app.value_at_risk import run
+    result = run(as_of=day.date() if day else None, full=full, workers=workers)
+    click.echo('Computed {} users, {} unchanged, {} removed.'.format(result.computed, result.unchanged,
+                                                                     result.removed))
+
+
+@app.cli.command()
+@click.option('--full', is_flag=True, help='Recompute every stock, not only those with a newly closed day.')
+def update_statistics(full):
+    """Nightly job, roll the realized statistics of every stock forward to the last closed day"""
+    from app.realized import update
+    count = update(full=full)
+    click.echo('Updated the statistics of {} stocks.'.format(count))
+
+
+@app.cli.command()
+@click.option('--day', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Day of the last close included, defaults to yesterday (UTC).')
+@click.option('--lookback', type=int, default=None, help='Days of returns, defaults to CORRELATION_LOOKBACK_DAYS.')
+def correlation_matrix(day, lookback):
+    """Nightly job, recompute the return correlation matrix of every stock"""
+    from app.correlation import run
+    count = run(as_of=day.date() if day else None, lookback=lookback)
+    click.echo('Correlated {} stocks.'.format(count))
+
+
+@app.cli.command()
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='First day, defaults to the day of the first trade.')
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Last day, defaults to yesterday (UTC).')
+@click.option('--workers', type=int, default=None, help='Worker processes, defaults to EQUITY_CURVE_WORKERS.')
+def backfill_equity(start, end, workers):
+    """Recompute the equity curves of a range of days from the trade tape"""
+    from app.performance import backfill
+    count = backfill(start=start.date() if start else None, end=end.date() if end else None, workers=workers)
+    click.echo('Wrote {} equity curve rows.'.format(count))
+
+
+@app.cli.command()
+@click.argument('csv_files', nargs=-1, type=click.File('r'), required=True)
+@click.option('--ticker', default=None, help='Ticker of every row, for files without a ticker column.')
+@click.option('--chunk-rows', type=int, default=None, help='Rows per bulk append, defaults to PRICE_IMPORT_CHUNK_ROWS.')
+def import_prices(csv_files, ticker, chunk_rows):
+    """Stream price history CSV files into the columnar price store"""
+    from app.price_store import price_store
+    known_tickers = {stock.ticker.upper() for stock in Stock.query.all()}
+    chunk_rows = chunk_rows or app.config['PRICE_IMPORT_CHUNK_ROWS']
+    for csv_file in csv_files:
+        result = price_store.import_csv(csv_file, known_tickers, chunk_rows=chunk_rows,
+                                        ticker=ticker.upper() if ticker else None)
+        click.echo('{}: imported {} rows for {} tickers, skipped {} rows of unknown tickers.'.format(
+            csv_file.name, result.rows, len(result.tickers), result.skipped))
+
+
+@app.cli.command()
+@click.argument('csv_files', nargs=-1, type=click.File('r'), required=True)
+@click.option('--ticker', default=None, help='Underlying of every row, for files without a ticker column.')
+@click.option('--chunk-rows', type=int, default=None,
+              help='Contracts per bulk load, defaults to OPTION_IMPORT_CHUNK_ROWS.')
+@click.option('--multiplier', type=int, default=100, help='Multiplier of rows without a multiplier column.')
+def import_chains(csv_files, ticker, chunk_rows, multiplier):
+    """Bulk load option chain CSV files into the option contracts table"""
+    from app.options import import_chains as load_chains
+    stock_ids = {stock.ticker.upper(): stock.id for stock in Stock.query.all()}
+    chunk_rows = chunk_rows or app.config['OPTION_IMPORT_CHUNK_ROWS']
+    for csv_file in csv_files:
+        try:
+            result = load_chains(csv_file, stock_ids, chunk_rows=chunk_rows, ticker=ticker.upper() if ticker else None,
+                                 default_multiplier=multiplier)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint=csv_file.name)
+        click.echo('{}: inserted {} and updated {} contracts on {} underlyings, skipped {} rows of unknown '
+                   'tickers.'.format(csv_file.name, result.inserted, result.updated, len(result.tickers),
+                                     result.skipped))
+
+
+@app.cli.command()
+@click.option('--source', default=None, help='csv:///path?speed=N, tail:///path or tcp://host:port, defaults to '
+                                             'MARKET_FEED_SOURCE.')
+@click.option('--speed', type=float, default=None, help='Replay speed multiplier of csv sources, 0 for no pacing.')
+@click.option('--interval', type=float, default=None, help='Bar interval in seconds.')
+def market_feed(source, speed, interval):
+    """Ingest price ticks into the price store and publish last trades"""
+    from urllib.parse import urlparse
+    from app.market_feed import SOURCES, run_feed
+    source = source or app.config['MARKET_FEED_SOURCE']
+    if not source:
+        raise click.UsageError('No --source given and MARKET_FEED_SOURCE is not set.')
+    if urlparse(source).scheme not in SOURCES:
+        raise click.BadParameter('expected one of the {} schemes'.format(', '.join(sorted(SOURCES))),
+                                 param_hint='--source')
+    if interval:
+        app.config['MARKET_FEED_INTERVAL'] = interval
+    metrics = run_feed(app, source, speed)
+    click.echo('Received {received} ticks, wrote {bars} bars in {batches} batches; dropped {malformed} malformed, '
+               '{unknown} unknown, {duplicates} duplicate and {late} late ticks.'.format(**metrics))
+
+
 @app.cli.command()
 @click.option('--code-coverage/--no-code-coverage', default=False, help='Run tests with code coverage.')
 @click.argument('test_names', nargs=-1)
@@ -0,0 +1,110 @@
+import json
+import unittest
+from base64 import b64encode
+
+import numpy as np
+
+from app import create_app, db
+from app.alerts import AlertEngine, AlertIndex
+from app.models import Alert, AlertKind, BrokerMessage, Role, Stock, Trade, User
+
+
+class AlertIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = AlertIndex()
+        self.index.add([1, 2, 3, 4], [7, 7, 7, 8], [AlertKind.ABOVE, AlertKind.BELOW, AlertKind.PERCENT,
+                                                     AlertKind.ABOVE], [10.0, 5.0, 0.1, 3.0], [None, None, 8.0, None])
+
+    def test_levels_fire_once(self):
+        ids, prices = self.index.evaluate([7], [9.0], [7.5])
+        self.assertEqual(([3], [9.0]), (ids.tolist(), prices.tolist()))
+        ids, prices = self.index.evaluate([7, 8], [10.0, 2.0], [4.0, 2.0])
+        self.assertEqual(([1, 2], [10.0, 4.0]), (ids.tolist(), prices.tolist()))
+        self.assertEqual(0, len(self.index.evaluate([7], [100.0], [0.5])[0]))
+        self.assertEqual(1, len(self.index))
+
+    def test_percent_rule_crossing_both_levels_fires_once(self):
+        ids, prices = self.index.evaluate_ticks([7, 7, 7], [7.0, 9.0, 8.0])
+        self.assertEqual([3], ids.tolist())
+        ids, prices = self.index.evaluate_ticks([7], [6.0])
+        self.assertEqual([], ids.tolist())
+
+    def test_removed_and_added_rules(self):
+        self.index.remove([1])
+        self.index.add([9], [7], [AlertKind.ABOVE], [9.5], [None])
+        self.index.compact()
+        ids, prices = self.index.evaluate([7], [12.0], [6.0])
+        self.assertEqual([3, 9], ids.tolist())
+        np.testing.assert_array_equal([12.0, 12.0], prices)
+
+    def test_many_alerts_only_touch_crossed_levels(self):
+        index = AlertIndex()
+        levels = np.arange(1, 100001, dtype=np.float64)
+        index.add(np.arange(1, 100001), np.ones(100000, dtype=np.int64), [AlertKind.ABOVE] * 100000, levels,
+                  [None] * 100000)
+        ids, prices = index.evaluate([1], [50.5], [50.5])
+        self.assertEqual(list(range(1, 51)), ids.tolist())
+        self.assertEqual(50, index.books[1].above_start)
+
+
+class AlertEngineTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.other = User(username='other', email='other@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True)
+        db.session.add_all([self.student, self.other, self.stock])
+        db.session.commit()
+        db.session.add(Trade(stock=self.stock, user=self.student, quantity=1, price=100.0))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def headers(email):
+        return {'Authorization': 'Basic ' + b64encode((email + ':password').encode('utf-8')).decode('utf-8'),
+                'Accept': 'application/json', 'Content-Type': 'application/json'}
+
+    def post_alert(self, kind, threshold, email='student@utdallas.edu'):
+        return self.client.post('/api/v1/users/student/alerts/', headers=self.headers(email),
+                                data=json.dumps({'stock': 'AAPL', 'kind': kind, 'threshold': threshold}))
+
+    def test_alerts_api(self):
+        response = self.post_alert(AlertKind.PERCENT, 0.05)
+        self.assertEqual(201, response.status_code)
+        self.assertEqual(100.0, json.loads(response.get_data(as_text=True))['reference_price'])
+        self.assertEqual(400, self.post_alert('sideways', 1).status_code)
+        self.assertEqual(400, self.post_alert(AlertKind.ABOVE, -1).status_code)
+        self.assertEqual(403, self.post_alert(AlertKind.ABOVE, 1, email='other@utdallas.edu').status_code)
+        response = self.client.get('/api/v1/users/student/alerts/', headers=self.headers('student@utdallas.edu'))
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual(1, body['count'])
+        url = body['alerts'][0]['url']
+        self.assertEqual(403, self.client.delete(url, headers=self.headers('other@utdallas.edu')).status_code)
+        self.assertEqual(204, self.client.delete(url, headers=self.headers('student@utdallas.edu')).status_code)
+        self.assertEqual(400, self.client.delete(url, headers=self.headers('student@utdallas.edu')).status_code)
+
+    def test_engine_triggers_and_delivers(self):
+        self.post_alert(AlertKind.ABOVE, 110.0)
+        self.post_alert(AlertKind.BELOW, 90.0)
+        cancelled = json.loads(self.post_alert(AlertKind.ABOVE, 105.0).get_data(as_text=True))['url']
+        engine = AlertEngine()
+        self.assertEqual(0, engine.observe([self.stock.id], [104.0], [95.0]))
+        self.client.delete(cancelled, headers=self.headers('student@utdallas.edu'))
+        engine.next_refresh = 0
+        self.assertEqual(1, engine.observe([self.stock.id], [112.0], [101.0]))
+        alert = Alert.query.filter_by(kind=AlertKind.ABOVE, cancelled_at=None).one()
+        self.assertEqual(112.0, alert.triggered_price)
+        self.assertIsNotNone(alert.delivered_at)
+        self.assertFalse(alert.active)
+        message, = [message for message in BrokerMessage.since(0, 10) if message.topic == 'alerts']
+        self.assertEqual({'student', 'AAPL'}, {json.loads(message.payload)[key] for key in ('user', 'stock')})
+        self.assertEqual(0, engine.observe([self.stock.id], [120.0], [100.0]))
@@ -0,0 +1,122 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime
+from typing import Final
+from unittest import mock
+
+from app import create_app, db
+from app.cache import response_cache
+from app.models import Role, Stock, TableVersion, Trade, User
+
+CONTENT_TYPE: Final = 'application/json'
+STUDENT_EMAIL: Final = 'student@utdallas.edu'
+
+
+class ConditionalGetTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        role = Role.query.filter_by(name='Administrator').first()
+        self.user = User(username='student', email=STUDENT_EMAIL, password='password', confirmed=True, role=role)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.user, self.stock])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def get_api_headers(**extra):
+        headers = {
+            'Authorization': 'Basic ' + b64encode((STUDENT_EMAIL + ':password').encode('utf-8')).decode('utf-8'),
+            'Accept': CONTENT_TYPE,
+            'Content-Type': CONTENT_TYPE
+        }
+        headers.update(extra)
+        return headers
+
+    def test_versions_bumped_on_commit(self):
+        versions, changed_at = TableVersion.lookup(('stocks', 'trades'))
+        self.assertEqual(0, versions[1])
+        self.stock.year_high = 2000.0
+        db.session.commit()
+        new_versions, new_changed_at = TableVersion.lookup(('stocks', 'trades'))
+        self.assertEqual(versions[0] + 1, new_versions[0])
+        self.assertEqual(0, new_versions[1])
+        self.assertIsNotNone(new_changed_at)
+
+    def test_last_seen_versioned_separately(self):
+        users_version = TableVersion.lookup(('users',))[0]
+        self.user.ping()
+        self.assertEqual(users_version, TableVersion.lookup(('users',))[0])
+        self.assertEqual((1,), TableVersion.lookup(('users.last_seen',))[0])
+
+    def test_not_modified(self):
+        response = self.client.get('/api/v1/stocks/AAPL', headers=self.get_api_headers())
+        self.assertEqual(200, response.status_code)
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        self.assertIsNotNone(etag)
+        self.assertIsNotNone(last_modified)
+
+        response = self.client.get('/api/v1/stocks/AAPL', headers=self.get_api_headers(**{'If-None-Match': etag}))
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.data)
+
+        response = self.client.get('/api/v1/stocks/AAPL',
+                                   headers=self.get_api_headers(**{'If-Modified-Since': last_modified}))
+        self.assertEqual(304, response.status_code)
+
+        # A version time with a fraction of a second is sent rounded up, a copy from within that second is stale
+        TableVersion.query.filter_by(table_name='stocks').update({'updated_at': datetime(2026, 1, 5, 12, 0, 0, 500000)})
+        db.session.commit()
+        response = self.client.get('/api/v1/stocks/AAPL', headers=self.get_api_headers(
+            **{'If-Modified-Since': 'Mon, 05 Jan 2026 12:00:00 GMT'}))
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('Mon, 05 Jan 2026 12:00:01 GMT', response.headers.get('Last-Modified'))
+        response = self.client.get('/api/v1/stocks/AAPL', headers=self.get_api_headers(
+            **{'If-Modified-Since': response.headers.get('Last-Modified')}))
+        self.assertEqual(304, response.status_code)
+
+        # Any change to the stocks table yields a new validator
+        response = self.client.put('/api/v1/stocks/AAPL', headers=self.get_api_headers(),
+                                   data=json.dumps({'year_high': 1500}))
+        self.assertEqual(200, response.status_code)
+        response = self.client.get('/api/v1/stocks/AAPL', headers=self.get_api_headers(**{'If-None-Match': etag}))
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers.get('ETag'))
+        self.assertEqual(1500, json.loads(response.get_data(as_text=True))['year_high'])
+
+    def test_cached_body_skips_view(self):
+        trade = Trade(stock=self.stock, user=self.user, quantity=1, price=1.0)
+        db.session.add(trade)
+        db.session.commit()
+        url = '/api/v1/trades/{}'.format(trade.id)
+        first = self.client.get(url, headers=self.get_api_headers())
+        self.assertEqual(200, first.status_code)
+        with mock.patch.object(Trade, 'to_json') as to_json:
+            second = self.client.get(url, headers=self.get_api_headers())
+            to_json.assert_not_called()
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(first.headers.get('ETag'), second.headers.get('ETag'))
+
+    def test_commit_invalidates_cache(self):
+        self.client.get('/api/v1/stocks/', headers=self.get_api_headers())
+        self.assertEqual(1, len(response_cache))
+        self.stock.sector = 'Hardware'
+        db.session.commit()
+        self.assertEqual(0, len(response_cache))
+        response = self.client.get('/api/v1/stocks/', headers=self.get_api_headers())
+        self.assertEqual('Hardware', json.loads(response.get_data(as_text=True))['stocks'][0]['sector'])
+
+    def test_missing_resource_not_cached(self):
+        response = self.client.get('/api/v1/stocks/NOPE', headers=self.get_api_headers())
+        self.assertEqual(404, response.status_code)
+        self.assertEqual(0, len(response_cache))
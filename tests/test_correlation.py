@@ -0,0 +1,142 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+from datetime import date, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.correlation import MANIFEST, CorrelationStore, correlation_store, run
+from app.models import Role, Stock, Trade, User
+from app.price_store import price_store
+
+START = date(2025, 10, 1)
+DAYS = 300
+AS_OF = START + timedelta(days=DAYS - 1)
+
+
+def closes(days, stocks, seed=1):
+    rng = np.random.default_rng(seed)
+    common = rng.normal(0, 0.01, (days, 1))
+    return 100 * np.exp(np.cumsum(common + rng.normal(0, 0.01, (days, stocks)), axis=0))
+
+
+class CorrelationStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = CorrelationStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_matches_numpy_and_blocks_agree(self):
+        prices = closes(200, 7)
+        self.assertEqual(7, self.store.write(np.arange(1, 8) * 2, prices, AS_OF, shrinkage=0.0, min_days=20,
+                                             block_stocks=1000))
+        whole = self.store.submatrix(np.arange(1, 8) * 2)
+        returns = np.diff(np.log(prices), axis=0)
+        np.testing.assert_allclose(np.corrcoef(returns.T), whole.correlation, atol=1e-6)
+        np.testing.assert_allclose(returns.std(axis=0, ddof=1) * np.sqrt(252), whole.vol, rtol=1e-6)
+        np.testing.assert_allclose(np.cov(returns.T) * 252, whole.covariance, rtol=1e-5)
+        self.store.write(np.arange(1, 8) * 2, prices, AS_OF, shrinkage=0.0, min_days=20, block_stocks=3)
+        np.testing.assert_array_equal(whole.correlation, self.store.submatrix(np.arange(1, 8) * 2).correlation)
+        # The published generation and the one it replaced are kept
+        self.assertEqual(['manifest.json'], [entry for entry in os.listdir(self.root)
+                                             if not os.path.isdir(os.path.join(self.root, entry))])
+        self.assertEqual(3, len(os.listdir(self.root)))
+
+    def test_publish_keeps_the_previous_generation_and_other_directories(self):
+        os.makedirs(os.path.join(self.root, 'backups'))
+        names = []
+        for day in range(3):
+            self.store.write([1, 2], closes(50, 2, seed=day), AS_OF + timedelta(days=day), min_days=10)
+            names.append(self.store.published()['generation'])
+        self.assertEqual(sorted(['backups', MANIFEST] + names[1:]), sorted(os.listdir(self.root)))
+
+    def test_shrinkage_and_missing_history(self):
+        prices = closes(100, 3)
+        prices[:80, 2] = np.nan
+        self.store.write([3, 1, 5], prices, AS_OF, shrinkage=0.5, min_days=30, block_stocks=2)
+        raw = np.corrcoef(np.diff(np.log(prices[:, :2]), axis=0).T)[0, 1]
+        matrix = self.store.submatrix([1, 3, 5, 4, 99])
+        self.assertAlmostEqual(0.5 * raw, matrix.correlation[0, 1], places=6)
+        self.assertEqual([1.0, 1.0], np.diag(matrix.correlation)[:2].tolist())
+        # Too short a history, a stock id without a stock and one beyond the matrix
+        self.assertTrue(np.all(np.isnan(matrix.correlation[2:])))
+        self.assertTrue(np.all(np.isnan(matrix.vol[2:])))
+        self.assertEqual(AS_OF, matrix.as_of)
+
+    def test_readers_follow_new_runs(self):
+        self.assertIsNone(self.store.submatrix([1]))
+        self.store.write([1, 2], closes(50, 2, seed=1), AS_OF, min_days=10)
+        reader = CorrelationStore(self.root)
+        first = reader.submatrix([1, 2]).correlation[0, 1]
+        self.store.write([1, 2], closes(50, 2, seed=2), AS_OF + timedelta(days=1), min_days=10)
+        updated = reader.submatrix([1, 2])
+        self.assertNotEqual(first, updated.correlation[0, 1])
+        self.assertEqual(AS_OF + timedelta(days=1), updated.as_of)
+
+
+class CorrelationRunTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(PRICE_STORE_DIR=self.root + '/prices', CORRELATION_DIR=self.root + '/correlation',
+                               CORRELATION_MIN_DAYS=20)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        price_store.init_app(self.app)
+        correlation_store.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.other = User(username='other', email='other@utdallas.edu', password='password', confirmed=True)
+        self.stocks = [Stock(name=ticker, ticker=ticker, sector='Tech', is_active=True)
+                       for ticker in ('AAPL', 'INTC', 'MSFT', 'F')]
+        db.session.add_all([self.student, self.other] + self.stocks)
+        db.session.commit()
+        days = np.arange(np.datetime64(START), np.datetime64(START) + DAYS)
+        for ticker, column in zip(('AAPL', 'INTC', 'MSFT'), closes(DAYS, 3).T):
+            price_store.append(ticker, {'timestamp': days, 'close': column})
+        db.session.add_all([Trade(stock=self.stocks[0], user=self.student, quantity=10, price=100.0),
+                            Trade(stock=self.stocks[2], user=self.student, quantity=-5, price=100.0),
+                            Trade(stock=self.stocks[3], user=self.student, quantity=5, price=10.0)])
+        db.session.commit()
+        self.student.watch(self.stocks[1])
+        self.student.watch(self.stocks[0])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.root)
+
+    def get(self, url, email='student@utdallas.edu'):
+        headers = {'Authorization': 'Basic ' + b64encode((email + ':password').encode('utf-8')).decode('utf-8'),
+                   'Accept': 'application/json'}
+        return self.app.test_client().get(url, headers=headers)
+
+    def test_run_and_api(self):
+        self.assertEqual(404, self.get('/api/v1/users/student/correlation/').status_code)
+        self.assertEqual(3, run(AS_OF))
+        response = self.get('/api/v1/users/student/correlation/')
+        self.assertEqual(200, response.status_code)
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual(['AAPL', 'MSFT', 'F'], body['stocks'])
+        self.assertEqual(AS_OF.isoformat(), body['as_of'])
+        self.assertIsNone(body['vol'][2])
+        self.assertEqual(1.0, body['correlation'][0][0])
+        self.assertGreater(body['correlation'][0][1], 0.2)
+        self.assertAlmostEqual(body['correlation'][0][1], body['average_correlation'])
+
+        body = json.loads(self.get('/api/v1/users/student/correlation/?of=watchlist').get_data(as_text=True))
+        self.assertEqual(['AAPL', 'INTC'], body['stocks'])
+        self.assertEqual(403, self.get('/api/v1/users/student/correlation/?of=watchlist',
+                                       email='other@utdallas.edu').status_code)
+        self.assertEqual(400, self.get('/api/v1/users/student/correlation/?of=sector').status_code)
+        body = json.loads(self.get('/api/v1/users/other/correlation/').get_data(as_text=True))
+        self.assertEqual([], body['stocks'])
@@ -0,0 +1,88 @@
+import os
+import sqlite3
+import tempfile
+import unittest
+
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import QueuePool
+
+from app import create_app, db
+from app.database import write_with_retry
+from app.models import Role, User
+from config import ProductionConfig
+
+
+def lock_error():
+    return OperationalError('INSERT INTO trades', {}, sqlite3.OperationalError('database is locked'))
+
+
+class DatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp(suffix='.sqlite')
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.db_path
+        self.app.config['SQLITE_PRAGMAS'] = ProductionConfig.SQLITE_PRAGMAS
+        self.app.config['WRITE_RETRY_BASE_DELAY'] = 0.001
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        db.get_engine().dispose()
+        self.app_context.pop()
+        os.close(self.db_fd)
+        os.remove(self.db_path)
+
+    def test_pragmas_applied_on_connect(self):
+        with db.engine.connect() as connection:
+            self.assertEqual('wal', connection.execute('PRAGMA journal_mode').scalar())
+            self.assertEqual(1, connection.execute('PRAGMA synchronous').scalar())
+            self.assertEqual(ProductionConfig.SQLITE_PRAGMAS['busy_timeout'],
+                             connection.execute('PRAGMA busy_timeout').scalar())
+            self.assertEqual(ProductionConfig.SQLITE_PRAGMAS['cache_size'],
+                             connection.execute('PRAGMA cache_size').scalar())
+
+    def test_production_pool_options(self):
+        app = create_app('production')
+        options = app.config['SQLALCHEMY_ENGINE_OPTIONS']
+        self.assertIs(QueuePool, options['poolclass'])
+        self.assertEqual(ProductionConfig.SQLITE_ENGINE_OPTIONS['pool_size'], options['pool_size'])
+        self.assertFalse(options['connect_args']['check_same_thread'])
+
+    def test_write_retries_on_lock(self):
+        calls = []
+
+        def work():
+            calls.append(1)
+            db.session.add(User(username='student', email='student@utdallas.edu', password='password'))
+            if len(calls) < 3:
+                raise lock_error()
+            return len(calls)
+
+        self.assertEqual(3, write_with_retry(work))
+        self.assertEqual(1, User.query.filter_by(username='student').count())
+
+    def test_write_gives_up_after_attempts(self):
+        calls = []
+
+        def work():
+            calls.append(1)
+            raise lock_error()
+
+        with self.assertRaises(OperationalError):
+            write_with_retry(work, attempts=4)
+        self.assertEqual(4, len(calls))
+
+    def test_write_does_not_retry_other_errors(self):
+        calls = []
+
+        def work():
+            calls.append(1)
+            raise OperationalError('SELECT', {}, sqlite3.OperationalError('no such table: trades'))
+
+        with self.assertRaises(OperationalError):
+            write_with_retry(work)
+        self.assertEqual(1, len(calls))
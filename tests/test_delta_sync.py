@@ -0,0 +1,141 @@
+import json
+import time
+import unittest
+from base64 import b64encode
+from typing import Final
+
+from app import create_app, db
+from app.models import Role, Stock, Trade, TradeChange, User
+
+CONTENT_TYPE: Final = 'application/json'
+API_V1_TRADES: Final = '/api/v1/trades/'
+STUDENT_EMAIL: Final = 'student@utdallas.edu'
+TA_EMAIL: Final = 'ta@utdallas.edu'
+
+
+class DeltaSyncTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['DELTA_SYNC_POLL_INTERVAL'] = 0.05
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email=STUDENT_EMAIL, password='password', confirmed=True)
+        self.ta = User(username='ta', email=TA_EMAIL, password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.student, self.ta, self.stock])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def get_api_headers(email):
+        return {
+            'Authorization': 'Basic ' + b64encode((email + ':password').encode('utf-8')).decode('utf-8'),
+            'Accept': CONTENT_TYPE,
+            'Content-Type': CONTENT_TYPE
+        }
+
+    def get_json(self, url, email=STUDENT_EMAIL):
+        response = self.client.get(url, headers=self.get_api_headers(email))
+        self.assertEqual(200, response.status_code)
+        return json.loads(response.get_data(as_text=True))
+
+    def add_trade(self, user, quantity):
+        trade = Trade(stock=self.stock, user=user, quantity=quantity, price=1.0)
+        db.session.add(trade)
+        db.session.commit()
+        return trade
+
+    def test_change_log_written_on_commit(self):
+        trade = self.add_trade(self.student, 1)
+        trade.quantity = 2
+        db.session.commit()
+        db.session.delete(trade)
+        db.session.commit()
+        operations = [change.operation for change in TradeChange.query.order_by(TradeChange.seq)]
+        self.assertEqual([TradeChange.INSERT, TradeChange.UPDATE, TradeChange.DELETE], operations)
+
+    def test_since_returns_only_changes(self):
+        first = self.add_trade(self.student, 1)
+        cursor = self.get_json(API_V1_TRADES)['cursor']
+        self.assertEqual(cursor, self.get_json(API_V1_TRADES + '?since={}'.format(cursor))['cursor'])
+
+        second = self.add_trade(self.student, 2)
+        response = self.client.put(API_V1_TRADES + str(first.id), headers=self.get_api_headers(STUDENT_EMAIL),
+                                   data=json.dumps({'quantity': 5}))
+        self.assertEqual(200, response.status_code)
+        delta = self.get_json(API_V1_TRADES + '?since={}'.format(cursor))
+        self.assertEqual([5, 2], [trade['quantity'] for trade in delta['trades']])
+        self.assertEqual([], delta['deleted'])
+        self.assertFalse(delta['more'])
+
+        db.session.delete(second)
+        db.session.commit()
+        delta = self.get_json(API_V1_TRADES + '?since={}'.format(delta['cursor']))
+        self.assertEqual([], delta['trades'])
+        self.assertEqual([second.id], delta['deleted'])
+
+    def test_batches_limited(self):
+        self.app.config['DELTA_SYNC_LIMIT'] = 2
+        for quantity in range(1, 4):
+            self.add_trade(self.student, quantity)
+        delta = self.get_json(API_V1_TRADES + '?since=0')
+        self.assertEqual(2, len(delta['trades']))
+        self.assertTrue(delta['more'])
+        delta = self.get_json(API_V1_TRADES + '?since={}'.format(delta['cursor']))
+        self.assertEqual([3], [trade['quantity'] for trade in delta['trades']])
+        self.assertFalse(delta['more'])
+
+    def test_timeline_only_followed(self):
+        self.ta.follow(self.student)
+        db.session.commit()
+        cursor = self.get_json('/api/v1/users/ta/timeline/', TA_EMAIL)['cursor']
+        self.add_trade(self.student, 1)
+        other = User(username='other', email='other@utdallas.edu', password='password', confirmed=True)
+        db.session.add(other)
+        db.session.commit()
+        self.add_trade(other, 7)
+        delta = self.get_json('/api/v1/users/ta/timeline/?since={}'.format(cursor), TA_EMAIL)
+        self.assertEqual(['student'], [trade['user'] for trade in delta['trades']])
+
+    def test_trade_moved_away_from_followed_user(self):
+        self.ta.follow(self.student)
+        trade = self.add_trade(self.student, 1)
+        cursor = self.get_json('/api/v1/users/ta/timeline/', TA_EMAIL)['cursor']
+        other = User(username='other', email='other@utdallas.edu', password='password', confirmed=True)
+        db.session.add(other)
+        db.session.commit()
+        trade.user = other
+        db.session.commit()
+        delta = self.get_json('/api/v1/users/ta/timeline/?since={}'.format(cursor), TA_EMAIL)
+        self.assertEqual([], delta['trades'])
+        self.assertEqual([trade.id], delta['deleted'])
+        # The unfiltered feed still has the trade, under its new owner
+        delta = self.get_json(API_V1_TRADES + '?since={}'.format(cursor))
+        self.assertEqual(['other'], [trade['user'] for trade in delta['trades']])
+        self.assertEqual([], delta['deleted'])
+
+    def test_long_poll_times_out(self):
+        cursor = self.get_json(API_V1_TRADES)['cursor']
+        start = time.monotonic()
+        delta = self.get_json(API_V1_TRADES + '?since={}&wait=0.3'.format(cursor))
+        self.assertGreaterEqual(time.monotonic() - start, 0.3)
+        self.assertEqual([], delta['trades'])
+        self.assertEqual(cursor, delta['cursor'])
+
+    def test_long_poll_returns_immediately_with_changes(self):
+        self.add_trade(self.student, 1)
+        start = time.monotonic()
+        delta = self.get_json(API_V1_TRADES + '?since=0&wait=5')
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertEqual(1, len(delta['trades']))
+
+    def test_bad_cursor(self):
+        response = self.client.get(API_V1_TRADES + '?since=abc', headers=self.get_api_headers(STUDENT_EMAIL))
+        self.assertEqual(400, response.status_code)
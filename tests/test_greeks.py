@@ -0,0 +1,128 @@
+import json
+import math
+import unittest
+from base64 import b64encode
+from datetime import date, datetime
+
+import numpy as np
+
+from app import create_app, db
+from app.greeks import black_scholes, norm_cdf, years_to_expiry
+from app.models import OptionContract, OptionKind, Role, Stock, Trade, User
+
+
+class BlackScholesTest(unittest.TestCase):
+    def test_norm_cdf(self):
+        x = np.linspace(-45, 45, 9001)
+        expected = np.array([0.5 * math.erfc(-value / math.sqrt(2)) for value in x])
+        np.testing.assert_allclose(norm_cdf(x), expected, rtol=0, atol=1e-15)
+        self.assertEqual([0.0, 1.0], norm_cdf([-np.inf, np.inf]).tolist())
+
+    def test_reference_values_and_parity(self):
+        call, put = black_scholes(100.0, 100.0, 1.0, 0.05, 0.0, 0.2, [True, False]).price
+        self.assertAlmostEqual(10.450583572185565, call, places=12)
+        self.assertAlmostEqual(5.573526022256971, put, places=12)
+        spot, strike, years, rate, dividend = 120.0, np.linspace(50, 200, 31), 0.75, 0.03, 0.02
+        calls = black_scholes(spot, strike, years, rate, dividend, 0.35, True)
+        puts = black_scholes(spot, strike, years, rate, dividend, 0.35, False)
+        np.testing.assert_allclose(calls.price - puts.price,
+                                   spot * math.exp(-dividend * years) - strike * math.exp(-rate * years), atol=1e-10)
+        np.testing.assert_allclose(calls.gamma, puts.gamma)
+        np.testing.assert_allclose(calls.vega, puts.vega)
+
+    def test_greeks_match_finite_differences(self):
+        args = dict(spot=np.array([80.0, 100.0, 130.0]), strike=100.0, years=0.5, rate=0.04, dividend=0.01,
+                    vol=0.3, call=np.array([True, False, True]))
+        greeks = black_scholes(**args)
+
+        def bumped(name, step):
+            up = black_scholes(**dict(args, **{name: args[name] + step})).price
+            down = black_scholes(**dict(args, **{name: args[name] - step})).price
+            return (up - down) / (2 * step), up, down
+
+        delta, up, down = bumped('spot', 1e-3)
+        np.testing.assert_allclose(greeks.delta, delta, rtol=1e-6)
+        np.testing.assert_allclose(greeks.gamma, (up - 2 * greeks.price + down) / 1e-6, rtol=1e-4)
+        np.testing.assert_allclose(greeks.vega, bumped('vol', 1e-5)[0], rtol=1e-6)
+        np.testing.assert_allclose(greeks.rho, bumped('rate', 1e-5)[0], rtol=1e-6)
+        np.testing.assert_allclose(greeks.theta, -bumped('years', 1e-6)[0], rtol=1e-5)
+
+    def test_edge_cases(self):
+        spot = np.array([120.0, 80.0, 100.0, 100.0, 1e6, 1e-6])
+        greeks = black_scholes(spot, 100.0, [0.0, 0.0, 0.0, 1.0, 1.0, 1.0], 0.05, 0.0, [0.2, 0.2, 0.2, 0.0, 0.2, 0.2],
+                               True)
+        for values in greeks:
+            self.assertTrue(np.all(np.isfinite(values)))
+        np.testing.assert_allclose(greeks.price[:3], [20.0, 0.0, 0.0])
+        np.testing.assert_allclose(greeks.delta[:5], [1.0, 0.0, 0.5, 1.0, 1.0])
+        self.assertEqual([0.0] * 4, greeks.gamma[:4].tolist())
+        self.assertEqual([0.0] * 4, greeks.vega[:4].tolist())
+        self.assertEqual([0.0] * 3, greeks.theta[:3].tolist())
+        self.assertAlmostEqual(100 - 100 * math.exp(-0.05), greeks.price[3])
+        self.assertEqual(0.0, greeks.price[5])
+
+    def test_years_to_expiry(self):
+        years = years_to_expiry(['2026-10-23', '2026-10-01'], now=datetime(2026, 10, 22, 20, 0))
+        np.testing.assert_allclose(years, [1 / 365.0, 0.0])
+
+
+class GreeksApiTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True)
+        db.session.add_all([self.student, self.stock])
+        db.session.commit()
+        db.session.add(Trade(stock=self.stock, user=self.student, quantity=1, price=100.0))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def post(self, body):
+        headers = {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+                   'Accept': 'application/json', 'Content-Type': 'application/json'}
+        response = self.client.post('/api/v1/greeks', headers=headers, data=json.dumps(body))
+        return response.status_code, json.loads(response.get_data(as_text=True))
+
+    def test_arrays(self):
+        status, body = self.post({'spot': 100, 'strike': [90, 100, 110], 'years': 1, 'vol': 0.2, 'rate': 0.05,
+                                  'kind': ['call', 'put', 'call']})
+        self.assertEqual(200, status)
+        self.assertEqual(3, body['count'])
+        self.assertAlmostEqual(5.573526022256971, body['price'][1])
+        self.assertEqual(400, self.post({'spot': 100, 'strike': [90, 100], 'years': [1, 2, 3], 'vol': 0.2})[0])
+        self.assertEqual(400, self.post({'spot': 100, 'strike': 90, 'years': 1})[0])
+        self.assertEqual(400, self.post({'spot': 100, 'strike': 90, 'years': 1, 'vol': 0.2, 'kind': 'straddle'})[0])
+
+    def test_american_style(self):
+        status, body = self.post({'spot': 100, 'strike': [90, 110], 'years': 1, 'vol': 0.2, 'rate': 0.05,
+                                  'kind': 'put', 'style': 'american'})
+        self.assertEqual(200, status)
+        european = self.post({'spot': 100, 'strike': [90, 110], 'years': 1, 'vol': 0.2, 'rate': 0.05,
+                              'kind': 'put'})[1]
+        self.assertTrue(all(premium > 0 for premium in body['early_exercise']))
+        self.assertEqual(european['delta'], body['delta'])
+        self.assertAlmostEqual(european['price'][1] + body['early_exercise'][1], body['price'][1])
+        self.assertEqual(400, self.post({'spot': 100, 'strike': 90, 'years': 1, 'vol': 0.2, 'style': 'asian'})[0])
+
+        self.app.config['LATTICE_MAX_BATCH'] = 1
+        status, body = self.post({'spot': 100, 'strike': [90, 110], 'years': 1, 'vol': 0.2, 'style': 'american'})
+        self.assertEqual((400, 'at most 1 american options per request'), (status, body['message']))
+        self.assertEqual(200, self.post({'spot': 100, 'strike': [90, 110], 'years': 1, 'vol': 0.2})[0])
+
+    def test_contracts(self):
+        OptionContract.load([{'underlying_id': self.stock.id, 'expiry': date(2099, 1, 16), 'strike': strike,
+                              'kind': OptionKind.CALL, 'multiplier': 100} for strike in (90.0, 110.0)])
+        ids = [contract.id for contract in OptionContract.chain(self.stock.id)]
+        status, body = self.post({'contracts': ids, 'vol': 0.25, 'rate': 0.0})
+        self.assertEqual(200, status)
+        self.assertGreater(body['delta'][0], body['delta'][1])
+        self.assertEqual(400, self.post({'contracts': ids + [999], 'vol': 0.25})[0])
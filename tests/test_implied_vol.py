@@ -0,0 +1,44 @@
+import unittest
+
+import numpy as np
+
+from app.greeks import black_scholes
+from app.implied_vol import IVStatus, implied_vol
+
+
+class ImpliedVolTest(unittest.TestCase):
+    def test_round_trip(self):
+        rng = np.random.default_rng(7)
+        count = 20000
+        spot = rng.uniform(20, 300, count)
+        strike = spot * rng.uniform(0.6, 1.4, count)
+        years = rng.uniform(7 / 365, 2, count)
+        vol = rng.uniform(0.05, 1.5, count)
+        call = rng.random(count) < 0.5
+        price = black_scholes(spot, strike, years, 0.04, 0.01, vol, call).price
+        result = implied_vol(price, spot, strike, years, 0.04, 0.01, call)
+        self.assertTrue(np.all(result.status == IVStatus.CONVERGED))
+        intrinsic = np.maximum(np.where(call, 1, -1) * (spot * np.exp(-0.01 * years) - strike * np.exp(-0.04 * years)),
+                               0.0)
+        meaningful = price - intrinsic > 1e-4 * price
+        np.testing.assert_allclose(result.vol[meaningful], vol[meaningful], rtol=0, atol=1e-10)
+
+    def test_deep_out_of_the_money(self):
+        strike = np.array([170.0, 200.0, 300.0])
+        price = black_scholes(100.0, strike, 0.25, 0.0, 0.0, 0.3, True).price
+        self.assertTrue(np.all(price < 1e-3))
+        np.testing.assert_allclose(implied_vol(price, 100.0, strike, 0.25).vol, 0.3, rtol=1e-8)
+
+    def test_flags(self):
+        result = implied_vol([10.0, 5.0, 120.0, 0.0, 50.0, 5.0], 100.0, [100.0, 90.0, 100.0, 120.0, 50.0, 100.0],
+                             [0.0, 1.0, 1.0, 1.0, 1.0, 1e-12], call=True, max_vol=1.0)
+        self.assertEqual([IVStatus.EXPIRED, IVStatus.BELOW_INTRINSIC, IVStatus.ABOVE_UPPER_BOUND,
+                          IVStatus.CONVERGED, IVStatus.CONVERGED, IVStatus.NOT_CONVERGED], result.status.tolist())
+        self.assertEqual([0.0, 0.0], result.vol[3:5].tolist())
+        self.assertTrue(np.all(np.isnan(result.vol[[0, 1, 2, 5]])))
+
+    def test_puts_and_shape(self):
+        price = black_scholes(100.0, [[80.0, 100.0], [120.0, 140.0]], 0.5, 0.05, 0.02, 0.4, False).price
+        result = implied_vol(price, 100.0, [[80.0, 100.0], [120.0, 140.0]], 0.5, 0.05, 0.02, False)
+        self.assertEqual((2, 2), result.vol.shape)
+        np.testing.assert_allclose(result.vol, 0.4, rtol=1e-12)
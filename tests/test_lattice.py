@@ -0,0 +1,54 @@
+import unittest
+
+import numpy as np
+
+from app.greeks import black_scholes
+from app.lattice import LatticeCache, american_price, backward_induction, build_lattice
+
+
+def plain_tree(spot, strike, years, rate, dividend, vol, call, steps):
+    lattice = build_lattice(steps, years, vol, rate, dividend)
+    return backward_induction(np.array([spot]), np.array([strike]), np.array([1.0 if call else -1.0]),
+                              lattice.powers[None, :], np.array([lattice.up_probability]),
+                              np.array([lattice.discount]), steps)[0][0]
+
+
+class LatticeTest(unittest.TestCase):
+    def test_converges_to_a_fine_tree(self):
+        rng = np.random.default_rng(11)
+        errors, plain, prices = [], [], []
+        for _ in range(20):
+            strike, years, vol = rng.uniform(70, 130), rng.uniform(0.05, 2), rng.uniform(0.1, 0.8)
+            dividend, call = rng.uniform(0, 0.04), bool(rng.random() < 0.5)
+            fine = plain_tree(100.0, strike, years, 0.05, dividend, vol, call, 4000)
+            prices.append(fine)
+            errors.append(american_price(100.0, strike, years, 0.05, dividend, vol, call, 100,
+                                         LatticeCache()).price - fine)
+            plain.append(plain_tree(100.0, strike, years, 0.05, dividend, vol, call, 100) - fine)
+        # Vol bucket rounding is the largest error left, for low-vol puts deep in the money
+        self.assertLess(np.max(np.abs(errors) / prices), 0.005)
+        self.assertLess(np.abs(errors).mean(), np.abs(plain).mean())
+
+    def test_premium_and_bounds(self):
+        strike = np.array([80.0, 100.0, 120.0, 160.0])
+        calls = american_price(100.0, strike, 1.0, 0.05, 0.0, 0.3, True, cache=LatticeCache())
+        # Without dividends an American call is never exercised early
+        np.testing.assert_allclose(calls.price, black_scholes(100.0, strike, 1.0, 0.05, 0.0, 0.3, True).price)
+        np.testing.assert_array_equal(0.0, calls.premium)
+        puts = american_price(100.0, strike, 1.0, 0.05, 0.0, 0.3, False, cache=LatticeCache())
+        self.assertTrue(np.all(puts.premium > 0))
+        self.assertTrue(np.all(puts.price >= np.maximum(strike - 100.0, 0.0)))
+        np.testing.assert_allclose(american_price(100.0, [90.0, 110.0], 0.0, 0.05, 0.0, 0.3, False).price,
+                                   [0.0, 10.0])
+
+    def test_lattices_are_cached_per_bucket(self):
+        cache = LatticeCache(time_bucket_hours=1.0, vol_bucket=0.01)
+        strike = np.linspace(80, 120, 40)
+        vol = np.where(strike < 100, 0.3, 0.302)
+        first = american_price(100.0, strike, 0.5, 0.05, 0.01, vol, False, cache=cache)
+        self.assertEqual((0, 1), (cache.hits, cache.misses))
+        second = american_price(100.0, strike, 0.5 - 1e-6, 0.05, 0.01, vol, False, cache=cache)
+        self.assertEqual((1, 1), (cache.hits, cache.misses))
+        np.testing.assert_allclose(first.price, second.price, rtol=1e-5)
+        self.assertEqual((2, 2), american_price(100.0, [[90.0], [110.0]], 0.5, 0.05, 0.01, [0.3, 0.5], False,
+                                                cache=cache).price.shape)
@@ -0,0 +1,141 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.lots import FIFO, LIFO, LotBook, match_fifo, match_sequential
+from app.models import Lot, RealizedPnl, Role, Stock, Trade, User
+
+
+class LotMatchingTest(unittest.TestCase):
+    def test_fifo_closes_oldest_lot_first(self):
+        book = LotBook(FIFO)
+        book.apply(1, 10, 100.0)
+        book.apply(2, 10, 110.0)
+        realized = book.apply(3, -15, 120.0)
+        self.assertEqual([(1, 3, 10, 100.0, 120.0, 200.0), (2, 3, 5, 110.0, 120.0, 50.0)], realized)
+        self.assertEqual([[2, 5, 110.0]], list(book.lots))
+
+    def test_lifo_closes_newest_lot_first(self):
+        book = LotBook(LIFO)
+        book.apply(1, 10, 100.0)
+        book.apply(2, 10, 110.0)
+        realized = book.apply(3, -15, 120.0)
+        self.assertEqual([(2, 3, 10, 110.0, 120.0, 100.0), (1, 3, 5, 100.0, 120.0, 100.0)], realized)
+        self.assertEqual([[1, 5, 100.0]], list(book.lots))
+
+    def test_flip_to_short(self):
+        book = LotBook(FIFO)
+        book.apply(1, 10, 100.0)
+        realized = book.apply(2, -15, 90.0)
+        self.assertEqual([(1, 2, 10, 100.0, 90.0, -100.0)], realized)
+        self.assertEqual(-5, book.quantity)
+        self.assertEqual([(2, 3, -5, 90.0, 80.0, 50.0)], book.apply(3, 5, 80.0))
+
+    def test_vectorized_fifo_matches_sequential(self):
+        rng = np.random.default_rng(7)
+        for trial in range(50):
+            quantities = rng.integers(-50, 51, size=rng.integers(1, 200))
+            prices = rng.uniform(1, 500, size=len(quantities))
+            vectorized = match_fifo(quantities, prices)
+            sequential = match_sequential(quantities, prices)
+            for expected, actual in zip(sequential[0] + sequential[1], vectorized[0] + vectorized[1]):
+                np.testing.assert_allclose(expected, actual)
+
+
+class LotLedgerTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.student, self.stock])
+        db.session.commit()
+        self.start = datetime.utcnow()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_trade(self, quantity, price, minutes=None):
+        trade = Trade(stock=self.stock, user=self.student, quantity=quantity, price=price)
+        if minutes is not None:
+            trade.timestamp = self.start + timedelta(minutes=minutes)
+        db.session.add(trade)
+        db.session.commit()
+        return trade
+
+    def ledger(self):
+        realized = [(r.open_trade_id, r.close_trade_id, r.quantity, round(r.pnl, 6))
+                    for r in RealizedPnl.query.order_by(RealizedPnl.id)]
+        lots = [(lot.trade_id, lot.quantity) for lot in Lot.query.order_by(Lot.id)]
+        return realized, lots
+
+    def test_sell_realizes_pnl(self):
+        first = self.add_trade(10, 100.0, 0)
+        second = self.add_trade(10, 110.0, 1)
+        sell = self.add_trade(-15, 120.0, 2)
+        realized, lots = self.ledger()
+        self.assertEqual([(first.id, sell.id, 10, 200.0), (second.id, sell.id, 5, 50.0)], realized)
+        self.assertEqual([(second.id, 5)], lots)
+
+    def test_append_only_writes_touched_lots(self):
+        for minute in range(4):
+            self.add_trade(10, 100.0 + minute, minute)
+        row_ids = {lot.trade_id: lot.id for lot in Lot.query}
+        sell = self.add_trade(-15, 120.0, 5)
+        lots = Lot.query.order_by(Lot.id).all()
+        self.assertEqual([5, 10, 10], [lot.quantity for lot in lots])
+        # The shrunk lot and the untouched ones keep their rows
+        self.assertEqual([row_ids[lot.trade_id] for lot in lots], [lot.id for lot in lots])
+        self.add_trade(-30, 125.0, 6)
+        self.add_trade(-5, 130.0, 7)
+        incremental = self.ledger()
+        self.assertEqual(-10, sum(quantity for _, quantity in incremental[1]))
+        self.assertNotIn(sell.id, [trade_id for trade_id, _ in incremental[1]])
+        Lot.rebuild()
+        self.assertEqual(incremental, self.ledger())
+
+    def test_backdated_trade_replays_book(self):
+        self.add_trade(10, 100.0, 0)
+        sell = self.add_trade(-10, 120.0, 2)
+        backdated = self.add_trade(5, 90.0, 1)
+        incremental = self.ledger()
+        self.assertEqual([(backdated.id, 5)], incremental[1])
+        self.assertEqual(sell.id, incremental[0][0][1])
+        Lot.rebuild()
+        self.assertEqual(incremental, self.ledger())
+
+    def test_edit_and_delete_replay_book(self):
+        buy = self.add_trade(10, 100.0, 0)
+        sell = self.add_trade(-4, 120.0, 1)
+        sell.price = 130.0
+        db.session.commit()
+        self.assertEqual([(buy.id, sell.id, 4, 120.0)], self.ledger()[0])
+        db.session.delete(sell)
+        db.session.commit()
+        self.assertEqual(([], [(buy.id, 10)]), self.ledger())
+
+    def test_pnl_api(self):
+        self.add_trade(10, 100.0, 0)
+        self.add_trade(-4, 120.0, 1)
+        headers = {
+            'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+            'Accept': 'application/json'
+        }
+        client = self.app.test_client()
+        response = client.get('/api/v1/users/student/pnl/', headers=headers)
+        self.assertEqual(200, response.status_code)
+        body = json.loads(response.get_data(as_text=True))
+        self.assertAlmostEqual(80.0, body['realized'])
+        # Marked at the last traded price of 120
+        self.assertAlmostEqual(6 * 20.0, body['unrealized'])
+        response = client.get(body['realized_url'], headers=headers)
+        self.assertEqual(1, json.loads(response.get_data(as_text=True))['count'])
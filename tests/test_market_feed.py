@@ -0,0 +1,111 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from app import create_app, db
+from app.market_feed import Coalescer, MarketFeed, Tick, open_source, parse_tick, run_feed
+from app.models import BrokerMessage, Stock
+from app.price_store import PriceStore, price_store
+from app.quote_cache import quote_cache
+
+
+async def lines(*items):
+    for item in items:
+        yield item
+
+
+class MarketFeedTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_parse_tick_normalizes(self):
+        self.assertEqual(Tick('AAPL', 60.0, 10.5, 100.0), parse_tick(' aapl ,60,10.5,100\n'))
+        self.assertEqual(Tick('AAPL', 1772409600.0, 10.5, 0.0), parse_tick('AAPL,2026-03-02T00:00:00Z,10.5'))
+        self.assertEqual(1772409600.0, parse_tick('AAPL,2026-03-02T00:00:00,10.5').timestamp)
+        self.assertEqual('BRK.B', parse_tick('brk.b,60,10.5').ticker)
+        for line in ('ticker,timestamp,price', 'AAPL,60', 'AAPL,60,-1', 'AAPL,60,nan', ' ,60,1', 'AAPL,60,1,-5'):
+            self.assertIsNone(parse_tick(line), line)
+
+    def test_coalescer_builds_bars_and_drops_duplicates_and_late_ticks(self):
+        coalescer = Coalescer(interval=60, lateness=5, known_tickers={'AAPL', 'TSLA'})
+        for tick in (Tick('AAPL', 0, 10.0, 1), Tick('AAPL', 10, 12.0, 2), Tick('AAPL', 10, 12.0, 2),
+                     Tick('AAPL', 20, 9.0, 3), Tick('TSLA', 30, 20.0, 1), Tick('NOPE', 30, 1.0, 1)):
+            coalescer.add(tick)
+        self.assertEqual(({}, {}), coalescer.close())
+        coalescer.add(Tick('AAPL', 66, 11.0, 1))
+        closed, last_trades = coalescer.close()
+        bar, = closed['AAPL']
+        self.assertEqual((0, 10.0, 12.0, 9.0, 9.0, 6.0), (bar.start, bar.open, bar.high, bar.low, bar.close,
+                                                         bar.volume))
+        self.assertEqual(['AAPL', 'TSLA'], sorted(closed))
+        self.assertEqual((66, 11.0, 1), last_trades['AAPL'])
+        self.assertFalse(coalescer.add(Tick('AAPL', 50, 8.0, 1)))
+        metrics = coalescer.metrics
+        self.assertEqual((1, 1, 1), (metrics.duplicates, metrics.unknown, metrics.late))
+        closed, last_trades = coalescer.close(everything=True)
+        self.assertEqual([60], [bar.start for bar in closed['AAPL']])
+
+    def test_backpressure_bounds_the_queue(self):
+        store = PriceStore(self.root)
+        published = []
+        feed = MarketFeed(lines(*['AAPL,{},{}\n'.format(second, 10 + second) for second in range(500)]),
+                          store.append, published.extend, interval=60, lateness=0, queue_size=8, batch_size=50)
+        depths = []
+        original = feed.coalescer.add
+
+        def add(tick):
+            depths.append(feed.ticks.qsize())
+            return original(tick)
+        feed.coalescer.add = add
+        metrics = asyncio.run(feed.run())
+        self.assertLessEqual(max(depths), 8)
+        self.assertEqual((500, 9), (metrics['received'], metrics['bars']))
+        prices = store.read('AAPL')
+        np.testing.assert_array_equal(np.arange(0, 500, 60), prices['timestamp'].astype(np.int64))
+        np.testing.assert_array_equal([69.0, 129.0, 189.0], prices['close'][:3])
+        self.assertEqual({'ticker': 'AAPL', 'price': 509.0, 'size': 0.0, 'timestamp': '1970-01-01T00:08:19Z'},
+                         published[-1])
+
+    def test_unknown_source(self):
+        with self.assertRaises(ValueError):
+            open_source('ftp://example.com/ticks')
+
+    def test_replay_csv_into_app(self):
+        path = os.path.join(self.root, 'ticks.csv')
+        with open(path, 'w') as tick_file:
+            tick_file.write('ticker,timestamp,price,size\n'
+                            'AAPL,2026-03-02T14:30:00,10,5\n'
+                            'AAPL,2026-03-02T14:30:00.5,11,5\n'
+                            'NOPE,2026-03-02T14:30:01,1,1\n'
+                            'BRK.B,2026-03-02T14:30:01,400,2\n'
+                            'AAPL,2026-03-02T14:30:01,12,5\n')
+        app = create_app('testing')
+        app.config['PRICE_STORE_DIR'] = os.path.join(self.root, 'prices')
+        with app.app_context():
+            price_store.init_app(app)
+            db.create_all()
+            db.session.add_all([Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True),
+                                Stock(name='Berkshire', ticker='BRK.B', sector='Finance', is_active=True)])
+            db.session.commit()
+            db.session.remove()
+            metrics = run_feed(app, 'csv://' + path + '?speed=0')
+            self.assertEqual((6, 1, 1, 3), (metrics['received'], metrics['malformed'], metrics['unknown'],
+                                            metrics['bars']))
+            np.testing.assert_array_equal([11.0, 12.0], price_store.read('AAPL')['close'])
+            np.testing.assert_array_equal([400.0], price_store.read('BRK.B')['close'])
+            messages = BrokerMessage.since(0, 10)
+            self.assertEqual(['quotes'] * len(messages), [message.topic for message in messages])
+            self.assertEqual({12.0, 400.0}, {json.loads(message.payload)['price'] for message in messages})
+            stock = Stock.query.filter_by(ticker='AAPL').first()
+            self.assertEqual((12.0, 5.0), stock.quote()[:2])
+            quote_cache.close(unlink=True)
+            db.session.remove()
+            db.drop_all()
@@ -271,6 +271,6 @@ class ModelUserTest(unittest.TestCase):
         with self.app.test_request_context('/'):
             json_user = user.to_json()
         expected_keys = ['url', 'username', 'member_since', 'last_seen',
-                         'trades_url', 'followed_trades_url', 'trade_count']
+                         'trades_url', 'followed_trades_url', 'positions_url', 'trade_count']
         self.assertEqual(sorted(expected_keys), sorted(json_user.keys()))
         self.assertEqual('/api/v1/users/' + user.username, json_user['url'])
@@ -0,0 +1,88 @@
+import io
+import json
+import unittest
+from base64 import b64encode
+from datetime import date
+
+from app import create_app, db
+from app.models import OptionContract, OptionKind, Role, Stock, User
+from app.options import import_chains
+
+CHAIN = '''ticker,expiry,strike,kind
+AAPL,2026-10-23,155,C
+AAPL,2026-10-23,150,P
+AAPL,2026-10-23,150,call
+AAPL,2026-10-30,150,C
+MSFT,2026-10-23,300,C
+'''
+
+
+class OptionChainTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True)
+        db.session.add_all([self.student, self.stock])
+        db.session.commit()
+        self.stock_ids = {'AAPL': self.stock.id}
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def headers(self):
+        return {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+                'Accept': 'application/json', 'Content-Type': 'application/json'}
+
+    def test_import_and_reload(self):
+        result = import_chains(io.StringIO(CHAIN), self.stock_ids, chunk_rows=2)
+        self.assertEqual((4, 0, ['AAPL'], 1), result)
+        chain = OptionContract.chain(self.stock.id, date(2026, 10, 23)).all()
+        self.assertEqual([(150.0, OptionKind.CALL), (150.0, OptionKind.PUT), (155.0, OptionKind.CALL)],
+                         [(contract.strike, contract.kind) for contract in chain])
+        self.assertEqual('AAPL  261023C00150000', chain[0].symbol)
+        self.assertEqual([date(2026, 10, 23), date(2026, 10, 30)], OptionContract.expiries(self.stock.id))
+
+        reloaded = 'expiry,strike,kind,multiplier\n2026-10-23,150,C,10\n2026-10-23,160,P,\n'
+        result = import_chains(io.StringIO(reloaded), self.stock_ids, ticker='AAPL')
+        self.assertEqual((1, 1), result[:2])
+        self.assertEqual(5, OptionContract.query.count())
+        self.assertEqual(10, OptionContract.chain(self.stock.id, date(2026, 10, 23), OptionKind.CALL).first()
+                         .multiplier)
+
+    def test_bad_chain_file(self):
+        with self.assertRaises(ValueError):
+            import_chains(io.StringIO('expiry,strike\n2026-10-23,150\n'), self.stock_ids, ticker='AAPL')
+        with self.assertRaises(ValueError):
+            import_chains(io.StringIO('expiry,strike,kind\n2026-10-23,150,X\n'), self.stock_ids, ticker='AAPL')
+        # A bad row after whole chunks loads nothing
+        with self.assertRaisesRegex(ValueError, 'line 7'):
+            import_chains(io.StringIO(CHAIN + 'AAPL,2026-13-01,150,C\n'), self.stock_ids, chunk_rows=1)
+        self.assertEqual(0, OptionContract.query.count())
+
+    def test_chain_api_and_option_trades(self):
+        import_chains(io.StringIO(CHAIN), self.stock_ids)
+        response = self.client.get('/api/v1/stocks/AAPL/options?expiry=2026-10-23&kind=call', headers=self.headers())
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual(2, body['count'])
+        self.assertEqual(['2026-10-23', '2026-10-30'], body['expiries'])
+        self.assertEqual(400, self.client.get('/api/v1/stocks/AAPL/options?expiry=friday',
+                                              headers=self.headers()).status_code)
+
+        contract = OptionContract.chain(self.stock.id, date(2026, 10, 30)).first()
+        response = self.client.post('/api/v1/option-trades/', headers=self.headers(),
+                                    data=json.dumps({'contract': contract.id, 'quantity': -2, 'price': 3.5}))
+        self.assertEqual(201, response.status_code)
+        trade = json.loads(response.get_data(as_text=True))
+        self.assertEqual(('student', -700.0), (trade['user'], trade['notional']))
+        self.assertEqual(200, self.client.get(response.headers['Location'], headers=self.headers()).status_code)
+        self.assertEqual(1, self.student.option_trades.count())
+        self.assertEqual(400, self.client.post('/api/v1/option-trades/', headers=self.headers(),
+                                               data=json.dumps({'contract': contract.id, 'quantity': 0,
+                                                                'price': 3.5})).status_code)
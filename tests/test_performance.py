@@ -0,0 +1,106 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.models import EquityCurve, Role, Stock, Trade, User
+from app.performance import backfill, close_prices, downsample
+
+START = date(2026, 3, 2)
+
+
+class PerformanceTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['EQUITY_CURVE_WORKERS'] = 1
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.ta = User(username='ta', email='ta@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.student, self.ta, self.stock])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_trade(self, user, quantity, price, day, hour=12):
+        timestamp = datetime.combine(START + timedelta(days=day), datetime.min.time()) + timedelta(hours=hour)
+        db.session.add(Trade(stock=self.stock, user=user, quantity=quantity, price=price, timestamp=timestamp))
+        db.session.commit()
+
+    def curve(self, user):
+        return [(row.day, round(row.equity, 6), round(row.cash_flow, 6), round(row.daily_return, 6))
+                for row in EquityCurve.query.filter_by(user_id=user.id).order_by(EquityCurve.day)]
+
+    def test_close_prices_forward_fill(self):
+        seed = np.array([np.nan, 5.0, np.nan])
+        closes = close_prices(np.array([2, 2, 1]), np.array([0, 0, 2]), np.array([7.0, 8.0, 6.0]), seed, 3)
+        np.testing.assert_array_equal([5.0, 5.0, 5.0, 6.0], closes[:, 1])
+        np.testing.assert_array_equal([8.0, 8.0, 8.0], closes[1:, 2])
+        self.assertTrue(np.isnan(closes[0, 2]))
+
+    def test_backfill(self):
+        self.add_trade(self.student, 10, 100.0, 0)
+        self.add_trade(self.ta, 1, 110.0, 1)
+        self.add_trade(self.student, -5, 120.0, 2)
+        self.assertEqual(3 + 2, backfill(end=START + timedelta(days=2)))
+        self.assertEqual([
+            (START, 1000.0, 1000.0, 0.0),
+            (START + timedelta(days=1), 1100.0, 0.0, 0.1),
+            (START + timedelta(days=2), 600.0, -600.0, round(100.0 / 500.0, 6)),
+        ], self.curve(self.student))
+        self.assertEqual(START + timedelta(days=1), self.curve(self.ta)[0][0])
+
+    def test_nightly_snapshot_matches_backfill(self):
+        self.add_trade(self.student, 10, 100.0, 0)
+        self.add_trade(self.ta, 4, 90.0, 1)
+        self.add_trade(self.student, 3, 105.0, 2)
+        backfill(end=START + timedelta(days=2))
+        expected = self.curve(self.student), self.curve(self.ta)
+        EquityCurve.query.filter(EquityCurve.day == START + timedelta(days=2)).delete()
+        db.session.commit()
+        backfill(start=START + timedelta(days=2), end=START + timedelta(days=2))
+        self.assertEqual(expected, (self.curve(self.student), self.curve(self.ta)))
+
+    def test_parallel_backfill_matches_inline(self):
+        for day in range(5):
+            self.add_trade(self.student, 2 + day, 100.0 + day, day)
+            self.add_trade(self.ta, -1 - day, 101.0 - day, day, hour=15)
+        backfill(end=START + timedelta(days=4))
+        expected = self.curve(self.student), self.curve(self.ta)
+        backfill(end=START + timedelta(days=4), workers=2, chunk_users=1)
+        self.assertEqual(expected, (self.curve(self.student), self.curve(self.ta)))
+
+    def test_downsample(self):
+        returns = np.full(10, 0.1)
+        ends, equity, cash_flow, growth = downsample(np.arange(10.0), np.ones(10), returns, 3)
+        np.testing.assert_array_equal([2, 5, 9], ends)
+        np.testing.assert_array_equal([2.0, 5.0, 9.0], equity)
+        np.testing.assert_array_equal([3.0, 3.0, 4.0], cash_flow)
+        np.testing.assert_allclose([1.1 ** 3 - 1, 1.1 ** 3 - 1, 1.1 ** 4 - 1], growth)
+
+    def test_performance_api(self):
+        for day in range(6):
+            self.add_trade(self.student, 1, 100.0 + day, day)
+        backfill(end=START + timedelta(days=5))
+        headers = {
+            'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+            'Accept': 'application/json'
+        }
+        client = self.app.test_client()
+        response = client.get('/api/v1/users/student/performance/?from=2026-03-03&to=2026-03-06&points=2',
+                              headers=headers)
+        self.assertEqual(200, response.status_code)
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual(4, body['count'])
+        self.assertEqual(['2026-03-04', '2026-03-06'], [point['day'] for point in body['series']])
+        self.assertEqual(400, client.get('/api/v1/users/student/performance/?from=march',
+                                         headers=headers).status_code)
@@ -0,0 +1,151 @@
+import json
+import time
+import unittest
+from base64 import b64encode
+from datetime import date, datetime
+from unittest import mock
+
+import numpy as np
+
+from app import create_app, db
+from app.greeks import black_scholes, years_to_expiry
+from app.models import OptionContract, OptionKind, OptionPosition, OptionTrade, Role, Stock, Trade, User
+from app import portfolio_greeks
+from app.portfolio_greeks import greek_book
+from app.quote_cache import quote_cache
+
+NOW = datetime.utcnow()
+EXPIRY = date(2027, 1, 15)
+
+
+class PortfolioGreeksTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['OPTION_DEFAULT_VOL'] = 0.25
+        self.app.config['RISK_FREE_RATE'] = 0.0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        greek_book.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.other = User(username='other', email='other@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True)
+        db.session.add_all([self.student, self.other, self.stock])
+        db.session.commit()
+        OptionContract.load([{'underlying_id': self.stock.id, 'expiry': EXPIRY, 'strike': 100.0,
+                              'kind': OptionKind.CALL, 'multiplier': 100}])
+        self.contract = OptionContract.query.one()
+        db.session.add_all([Trade(stock=self.stock, user=self.student, quantity=50, price=100.0),
+                            Trade(stock=self.stock, user=self.other, quantity=-20, price=100.0)])
+        db.session.commit()
+        self.write_quote(100.0)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        quote_cache.close(unlink=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def write_quote(self, price):
+        quote_cache.write([self.stock.id], [price], [1.0], [time.time()])
+
+    def call_greeks(self, spot, vol):
+        return black_scholes(spot, 100.0, years_to_expiry([EXPIRY], NOW)[0], 0.0, 0.0, vol, True)
+
+    def test_option_positions_follow_trades(self):
+        trade = OptionTrade(contract=self.contract, user_id=self.student.id, quantity=3, price=5.0)
+        db.session.add_all([trade, OptionTrade(contract=self.contract, user_id=self.student.id, quantity=-1,
+                                               price=6.0)])
+        db.session.commit()
+        self.assertEqual((2, 2), (self.student.option_positions.one().quantity,
+                                  self.student.option_positions.one().trade_count))
+        trade.quantity = 5
+        db.session.commit()
+        self.assertEqual(4, self.student.option_positions.one().quantity)
+        OptionPosition.rebuild()
+        self.assertEqual(4, self.student.option_positions.one().quantity)
+
+    def test_incremental_sums(self):
+        greek_book.refresh(NOW)
+        self.assertEqual(50.0, greek_book.user_greeks(self.student.id)['total']['delta'])
+        self.assertEqual(30.0, greek_book.firm_greeks()['total']['delta'])
+
+        # No trade, price or vol change: nothing is repriced
+        self.assertEqual(0, greek_book.refresh(NOW))
+
+        db.session.add(OptionTrade(contract=self.contract, user_id=self.student.id, quantity=2, price=8.0))
+        db.session.commit()
+        self.assertEqual(1, greek_book.refresh(NOW))
+        vol = greek_book.vol[greek_book.contract > 0][0]
+        greeks = self.call_greeks(100.0, vol)
+        totals = greek_book.user_greeks(self.student.id)['total']
+        self.assertAlmostEqual(50 + 200 * greeks.delta, totals['delta'])
+        self.assertAlmostEqual(200 * greeks.vega / 100, totals['vega'])
+        self.assertAlmostEqual(200 * greeks.theta / 365, totals['theta'])
+
+        # A move inside the tolerances keeps the cached contributions, a larger one reprices the stock's positions
+        self.write_quote(100.1)
+        self.assertEqual(0, greek_book.refresh(NOW))
+        self.write_quote(103.0)
+        self.assertEqual(3, greek_book.refresh(NOW))
+        vol = greek_book.vol[greek_book.contract > 0][0]
+        self.assertAlmostEqual(50 + 200 * self.call_greeks(103.0, vol).delta,
+                               greek_book.user_greeks(self.student.id)['total']['delta'])
+
+        book = greek_book.firm_greeks()
+        self.assertEqual(1, len(book['underlyings']))
+        np.testing.assert_allclose(book['total']['gamma'], greek_book.pair_sums[:, 1].sum())
+
+    def test_marks_are_cached(self):
+        db.session.add(OptionTrade(contract=self.contract, user_id=self.student.id, quantity=2, price=8.0))
+        db.session.commit()
+        greek_book.refresh(NOW)
+        # The vol surface marks its underlying itself, keep it out of the count
+        no_surface = mock.patch.object(portfolio_greeks.vol_surfaces, 'vol',
+                                       side_effect=lambda stock_ids, *args: np.full(len(stock_ids), np.nan))
+        with mock.patch.object(portfolio_greeks, 'implied_vol', wraps=portfolio_greeks.implied_vol) as solver, \
+                mock.patch.object(Stock, 'marks', wraps=Stock.marks) as marks, no_surface:
+            greek_book.snapshot(NOW)
+            self.assertEqual((0, 0), (solver.call_count, marks.call_count))
+            # A quote inside the spot bucket re-marks the underlying but keeps the implied vol
+            self.write_quote(100.0)
+            greek_book.refresh(NOW)
+            self.assertEqual((0, 1), (solver.call_count, marks.call_count))
+            db.session.add(OptionTrade(contract=self.contract, user_id=self.other.id, quantity=1, price=9.0))
+            db.session.commit()
+            greek_book.refresh(NOW)
+            self.assertEqual((1, 1), (solver.call_count, marks.call_count))
+        # Cached marks agree with marks computed from scratch
+        cached = greek_book.snapshot(NOW)
+        greek_book.clear()
+        np.testing.assert_allclose(cached.vol, greek_book.snapshot(NOW).vol)
+
+    def test_snapshot_keeps_the_refresh_marks(self):
+        with mock.patch.object(greek_book, 'marks', wraps=greek_book.marks) as marks:
+            book = greek_book.snapshot(NOW)
+        self.assertEqual(1, marks.call_count)
+        np.testing.assert_array_equal([100.0, 100.0], book.spot)
+
+    def test_share_trades_after_a_refresh(self):
+        greek_book.refresh(NOW)
+        db.session.add(Trade(stock=self.stock, user=self.student, quantity=25, price=100.0))
+        db.session.commit()
+        self.assertEqual(75.0, greek_book.user_greeks(self.student.id)['total']['delta'])
+        self.assertEqual(55.0, greek_book.firm_greeks()['total']['delta'])
+
+    def test_closed_positions_leave_the_book(self):
+        db.session.add(Trade(stock=self.stock, user=self.other, quantity=20, price=100.0))
+        db.session.commit()
+        self.assertEqual([], greek_book.user_greeks(self.other.id)['underlyings'])
+        self.assertEqual(50.0, greek_book.firm_greeks()['total']['delta'])
+
+    def test_api(self):
+        headers = {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+                   'Accept': 'application/json'}
+        response = self.client.get('/api/v1/users/student/greeks', headers=headers)
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual(['AAPL'], [entry['stock'] for entry in body['underlyings']])
+        self.assertEqual(50.0, body['total']['delta'])
+        self.assertEqual(403, self.client.get('/api/v1/greeks/firm', headers=headers).status_code)
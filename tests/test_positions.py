@@ -0,0 +1,104 @@
+import json
+import unittest
+from base64 import b64encode
+
+from app import create_app, db
+from app.models import Position, Role, Stock, Trade, User
+
+
+class PositionTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.apple = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        self.tesla = Stock(name='Tesla', ticker='TSLA', sector="Auto", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.student, self.apple, self.tesla])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_trade(self, stock, quantity, price):
+        trade = Trade(stock=stock, user=self.student, quantity=quantity, price=price)
+        db.session.add(trade)
+        db.session.commit()
+        return trade
+
+    def position(self, stock):
+        return Position.query.get((self.student.id, stock.id))
+
+    def snapshot(self):
+        return sorted((p.user_id, p.stock_id, p.quantity, p.bought_quantity, round(p.bought_cost, 6),
+                       round(p.notional, 6), p.trade_count) for p in Position.query.all())
+
+    def test_insert_updates_position(self):
+        self.add_trade(self.apple, 10, 100.0)
+        self.add_trade(self.apple, 30, 120.0)
+        self.add_trade(self.apple, -20, 130.0)
+        position = self.position(self.apple)
+        self.assertEqual(20, position.quantity)
+        # The sale closes the first lot and half of the second
+        self.assertAlmostEqual(120.0, position.average_cost)
+        self.assertAlmostEqual(10 * 100.0 + 30 * 120.0 - 20 * 130.0, position.notional)
+        self.assertEqual(3, position.trade_count)
+
+    def test_close_and_reopen_starts_a_new_cost(self):
+        self.add_trade(self.apple, 10, 100.0)
+        self.add_trade(self.apple, -10, 150.0)
+        self.add_trade(self.apple, 10, 200.0)
+        self.assertAlmostEqual(200.0, self.position(self.apple).average_cost)
+        # Through zero into a short, the cost is the price the short was opened at
+        self.add_trade(self.apple, -15, 180.0)
+        position = self.position(self.apple)
+        self.assertEqual(-5, position.quantity)
+        self.assertAlmostEqual(180.0, position.average_cost)
+        self.add_trade(self.apple, 5, 170.0)
+        self.assertIsNone(self.position(self.apple).average_cost)
+
+    def test_edit_moves_trade_between_positions(self):
+        trade = self.add_trade(self.apple, 10, 100.0)
+        self.add_trade(self.apple, 5, 100.0)
+        trade.stock = self.tesla
+        trade.quantity = 4
+        db.session.commit()
+        self.assertEqual(5, self.position(self.apple).quantity)
+        self.assertEqual(4, self.position(self.tesla).quantity)
+        incremental = self.snapshot()
+        Position.rebuild()
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_delete_removes_empty_position(self):
+        trade = self.add_trade(self.apple, 10, 100.0)
+        db.session.delete(trade)
+        db.session.commit()
+        self.assertIsNone(self.position(self.apple))
+
+    def test_rebuild_matches_incremental(self):
+        for quantity, price in ((10, 10.0), (-3, 12.0), (7, 11.5)):
+            self.add_trade(self.apple, quantity, price)
+            self.add_trade(self.tesla, quantity * 2, price * 3)
+        incremental = self.snapshot()
+        db.session.execute(Position.__table__.delete())
+        db.session.commit()
+        self.assertEqual(2, Position.rebuild())
+        self.assertEqual(incremental, self.snapshot())
+
+    def test_positions_api(self):
+        self.add_trade(self.apple, 10, 100.0)
+        headers = {
+            'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+            'Accept': 'application/json'
+        }
+        response = self.app.test_client().get('/api/v1/users/student/positions/', headers=headers)
+        self.assertEqual(200, response.status_code)
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual(1, body['count'])
+        self.assertEqual('AAPL', body['positions'][0]['stock'])
+        self.assertEqual(10, body['positions'][0]['quantity'])
+        self.assertAlmostEqual(100.0, body['positions'][0]['average_cost'])
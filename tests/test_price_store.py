@@ -0,0 +1,107 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+
+import numpy as np
+
+from app import create_app, db
+from app.models import Role, Stock, User
+from app.price_store import PriceStore, directory_ticker, ticker_directory
+
+
+class PriceStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.store = PriceStore(self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_append_and_read_range(self):
+        self.store.append('AAPL', {'timestamp': ['2026-03-02', '2026-03-03', '2026-03-04'],
+                                   'close': [10.0, 11.0, 12.0]})
+        self.store.append('AAPL', {'timestamp': ['2026-03-05T00:00:00'], 'close': [13.0], 'volume': [500.0]})
+        prices = self.store.read('AAPL', '2026-03-03', '2026-03-05')
+        self.assertEqual(2, len(prices))
+        np.testing.assert_array_equal([11.0, 12.0], prices['close'])
+        np.testing.assert_array_equal([11.0, 12.0], prices['open'])
+        self.assertEqual(np.datetime64('2026-03-03T00:00:00'), prices['timestamp'][0])
+        self.assertIsInstance(prices['close'].base, np.memmap)
+        self.assertEqual(500.0, self.store.read('AAPL', '2026-03-05')['volume'][0])
+        self.assertEqual(12.0, self.store.last('AAPL', before='2026-03-05'))
+
+    def test_out_of_order_append_rewrites_sorted(self):
+        self.store.append('AAPL', {'timestamp': ['2026-03-02', '2026-03-04'], 'close': [10.0, 12.0]})
+        self.store.append('AAPL', {'timestamp': ['2026-03-03', '2026-03-04'], 'close': [11.0, 12.5]})
+        prices = self.store.read('AAPL')
+        np.testing.assert_array_equal([10.0, 11.0, 12.5], prices['close'])
+        self.assertEqual(['AAPL'], self.store.tickers())
+
+    def test_partial_row_is_invisible(self):
+        self.store.append('AAPL', {'timestamp': ['2026-03-02'], 'close': [10.0]})
+        with open(self.store.path('AAPL', 'timestamp'), 'ab') as column_file:
+            column_file.write(np.array([1], dtype='<i8').tobytes())
+        self.assertEqual(1, self.store.length('AAPL'))
+        self.store.append('AAPL', {'timestamp': ['2026-03-03'], 'close': [11.0]})
+        np.testing.assert_array_equal([10.0, 11.0], self.store.read('AAPL')['close'])
+
+    def test_import_csv_in_chunks(self):
+        csv_file = io.StringIO('ticker,timestamp,open,close\n'
+                               'AAPL,2026-03-02,9.5,10\n'
+                               'TSLA,2026-03-02,,20\n'
+                               'NOPE,2026-03-02,1,1\n'
+                               'AAPL,2026-03-03,10.5,11\n')
+        result = self.store.import_csv(csv_file, {'AAPL', 'TSLA'}, chunk_rows=2)
+        self.assertEqual((3, ['AAPL', 'TSLA'], 1), tuple(result))
+        np.testing.assert_array_equal([9.5, 10.5], self.store.read('AAPL')['open'])
+        np.testing.assert_array_equal([20.0], self.store.read('TSLA')['open'])
+
+    def test_tickers_with_punctuation(self):
+        self.store.append('BRK.B', {'timestamp': ['2026-03-02'], 'close': [400.0]})
+        self.store.append('brk.b', {'timestamp': ['2026-03-03'], 'close': [410.0]})
+        self.store.append('AAPL', {'timestamp': ['2026-03-02'], 'close': [10.0]})
+        np.testing.assert_array_equal([400.0, 410.0], self.store.read('BRK.B')['close'])
+        self.assertEqual(['AAPL', 'BRK.B'], self.store.tickers())
+        self.assertEqual(os.path.join(self.root, 'BRK_2EB'), self.store.path('BRK.B'))
+        self.assertEqual('BRK_2EB', ticker_directory('BRK.B'))
+        self.assertIsNone(directory_ticker('BRK.B'))
+        self.assertIsNone(directory_ticker('AAPL.new'))
+        with self.assertRaises(ValueError):
+            self.store.path(' ')
+
+    def test_prices_api(self):
+        app = create_app('testing')
+        app.config['PRICE_STORE_DIR'] = self.root
+        app.config['PRICES_PER_REQUEST'] = 2
+        with app.app_context():
+            from app.price_store import price_store
+            price_store.init_app(app)
+            db.create_all()
+            Role.insert_roles()
+            db.session.add(Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True))
+            db.session.add(Stock(name='Berkshire', ticker='BRK.B', sector='Finance', is_active=True))
+            db.session.add(User(username='student', email='student@utdallas.edu', password='password',
+                                confirmed=True))
+            db.session.commit()
+            self.store.append('AAPL', {'timestamp': ['2026-03-02', '2026-03-03', '2026-03-04'],
+                                       'close': [10.0, 11.0, 12.0]})
+            client = app.test_client()
+            headers = {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8')}
+            response = client.get('/api/v1/stocks/AAPL/prices?from=2026-03-02', headers=headers)
+            self.assertEqual(200, response.status_code)
+            body = json.loads(response.get_data(as_text=True))
+            self.assertEqual(['2026-03-03T00:00:00', '2026-03-04T00:00:00'], body['timestamp'])
+            self.assertEqual([11.0, 12.0], body['close'])
+            self.assertTrue(body['more'])
+            response = client.get('/api/v1/stocks/AAPL/prices?to=yesterday', headers=headers)
+            self.assertEqual(400, response.status_code)
+            self.assertIn('to must be', json.loads(response.get_data(as_text=True))['message'])
+            self.store.append('BRK.B', {'timestamp': ['2026-03-02'], 'close': [400.0]})
+            response = client.get('/api/v1/stocks/BRK.B/prices', headers=headers)
+            self.assertEqual([400.0], json.loads(response.get_data(as_text=True))['close'])
+            db.session.remove()
+            db.drop_all()
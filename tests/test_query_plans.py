@@ -0,0 +1,62 @@
+import unittest
+from datetime import date
+
+from app import create_app, db
+from app.models import OptionContract, Role, Stock, Trade, User, Watch
+
+
+class QueryPlanTest(unittest.TestCase):
+    """Regression tests for the composite indexes backing the paginated trade and watchlist queries"""
+
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username='student', email='student@utdallas.edu', password='password')
+        self.stock = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.user, self.stock])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    @staticmethod
+    def query_plan(query):
+        statement = query.limit(10).offset(0).statement.compile(dialect=db.engine.dialect,
+                                                                compile_kwargs={'literal_binds': True})
+        rows = db.session.execute('EXPLAIN QUERY PLAN ' + str(statement)).fetchall()
+        return [row[-1] for row in rows]
+
+    def assertIndexedWithoutSort(self, query, index_name):
+        plan = self.query_plan(query)
+        self.assertTrue(any(index_name in step for step in plan), plan)
+        self.assertFalse(any('TEMP B-TREE' in step for step in plan), plan)
+
+    def test_user_trades_plan(self):
+        query = self.user.trades.order_by(Trade.timestamp.desc())
+        self.assertIndexedWithoutSort(query, 'ix_trades_user_id_timestamp')
+
+    def test_stock_trades_plan(self):
+        query = self.stock.trades.order_by(Trade.timestamp.desc())
+        self.assertIndexedWithoutSort(query, 'ix_trades_stock_id_timestamp')
+
+    def test_followed_trades_plan(self):
+        query = self.user.followed_trades.order_by(Trade.timestamp.desc())
+        self.assertIndexedWithoutSort(query, 'ix_trades_timestamp')
+
+    def test_watchlist_plan(self):
+        query = self.user.watches.order_by(Watch.timestamp.desc())
+        self.assertIndexedWithoutSort(query, 'ix_watches_user_id_timestamp')
+
+    def test_followed_users_plan(self):
+        query = self.user.followed
+        self.assertIndexedWithoutSort(query, 'ix_follows_follower_id_followed_id')
+
+    def test_option_chain_plan(self):
+        query = OptionContract.chain(self.stock.id, date(2026, 10, 23))
+        self.assertIndexedWithoutSort(query, 'ix_option_contracts_chain')
+        self.assertIndexedWithoutSort(OptionContract.chain(self.stock.id), 'ix_option_contracts_chain')
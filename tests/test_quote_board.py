@@ -0,0 +1,99 @@
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+
+from app import create_app, db
+from app.models import Role, Stock, User, Watch
+from app.price_store import price_store
+from app.quote_cache import quote_cache
+
+QUOTES_URL = '/api/v1/users/student/watchlist/quotes'
+
+
+class QuoteBoardTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['PRICE_STORE_DIR'] = self.root
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        price_store.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.apple = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True, year_high=120.0, year_low=80.0)
+        self.tesla = Stock(name='Tesla', ticker='TSLA', sector='Auto', is_active=True)
+        db.session.add_all([self.student, self.apple, self.tesla])
+        db.session.commit()
+        self.student.watch(self.apple)
+        self.student.watch(self.tesla)
+        db.session.commit()
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        price_store.append('AAPL', {'timestamp': [today - timedelta(days=1), today, today + timedelta(seconds=1)],
+                                    'high': [101.0, 125.0, 111.0], 'low': [99.0, 104.0, 105.0],
+                                    'close': [100.0, 110.0, 106.0], 'volume': [50.0, 10.0, 20.0]})
+        self.client = self.app.test_client()
+        self.headers = {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+                        'Accept': 'application/json'}
+
+    def tearDown(self):
+        quote_cache.close(unlink=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.root)
+
+    def get_board(self, **headers):
+        return self.client.get(QUOTES_URL, headers=dict(self.headers, **headers))
+
+    def test_board_from_bars(self):
+        board = {row['ticker']: row for row in Watch.board(self.student)}
+        apple = board['AAPL']
+        self.assertEqual((106.0, 100.0, 6.0, 30.0), (apple['price'], apple['previous_close'], apple['change'],
+                                                     apple['volume']))
+        self.assertEqual((80.0, 125.0), (apple['year_low'], apple['year_high']))
+        self.assertIsNone(apple['quoted_at'])
+        self.assertIsNone(board['TSLA']['price'])
+        self.assertIsNone(board['TSLA']['change'])
+
+    def test_quote_cache_wins_and_changes_the_etag(self):
+        response = self.get_board()
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(2, json.loads(response.get_data(as_text=True))['count'])
+        etag = response.headers['ETag']
+        self.assertEqual(304, self.get_board(**{'If-None-Match': etag}).status_code)
+
+        quote_cache.write([self.apple.id], [108.0], [5.0], [time.time()])
+        response = self.get_board(**{'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        apple = next(row for row in json.loads(response.get_data(as_text=True))['stocks'] if row['ticker'] == 'AAPL')
+        self.assertEqual((108.0, 8.0), (apple['price'], apple['change']))
+        etag = response.headers['ETag']
+        self.assertEqual(304, self.get_board(**{'If-None-Match': etag}).status_code)
+
+        self.student.unwatch(self.tesla)
+        db.session.commit()
+        response = self.get_board(**{'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, json.loads(response.get_data(as_text=True))['count'])
+
+    def test_new_bars_change_the_etag(self):
+        response = self.get_board()
+        etag = response.headers['ETag']
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        price_store.append('TSLA', {'timestamp': [today], 'close': [200.0], 'volume': [7.0]})
+        response = self.get_board(**{'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        tesla = next(row for row in json.loads(response.get_data(as_text=True))['stocks'] if row['ticker'] == 'TSLA')
+        self.assertEqual((200.0, 7.0), (tesla['price'], tesla['volume']))
+        self.assertEqual(304, self.get_board(**{'If-None-Match': response.headers['ETag']}).status_code)
+
+    def test_board_is_private(self):
+        db.session.add(User(username='other', email='other@utdallas.edu', password='password', confirmed=True))
+        db.session.commit()
+        headers = {'Authorization': 'Basic ' + b64encode(b'other@utdallas.edu:password').decode('utf-8')}
+        self.assertEqual(403, self.client.get(QUOTES_URL, headers=headers).status_code)
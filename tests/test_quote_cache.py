@@ -0,0 +1,58 @@
+import multiprocessing
+import os
+import unittest
+
+import numpy as np
+
+from app.quote_cache import QuoteCache
+
+
+def read_in_child(name, stock_ids, results):
+    cache = QuoteCache(name)
+    results.put(cache.read(stock_ids).price.tolist())
+    cache.close()
+
+
+class QuoteCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.name = 'greekgang-quotes-unittest-{}'.format(os.getpid())
+        self.writer = QuoteCache(self.name, slots=16)
+        self.reader = QuoteCache(self.name, retry_interval=0)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close(unlink=True)
+
+    def test_reader_before_the_segment_exists(self):
+        quotes = self.reader.read([1, 2])
+        self.assertTrue(np.isnan(quotes.price).all())
+        self.assertIsNone(self.reader.get(1))
+
+    def test_bulk_write_and_read(self):
+        self.assertEqual(2, self.writer.write([3, 5, 3, 99], [10.0, 20.0, 11.0, 1.0], [1, 2, 3, 4],
+                                              [100.0, 200.0, 300.0, 400.0]))
+        quotes = self.reader.read([5, 3, 4, 99, -1])
+        np.testing.assert_array_equal([20.0, 11.0], quotes.price[:2])
+        np.testing.assert_array_equal([2.0, 3.0], quotes.size[:2])
+        np.testing.assert_array_equal([200.0, 300.0], quotes.timestamp[:2])
+        self.assertTrue(np.isnan(quotes.price[2:]).all())
+        self.assertEqual(11.0, self.reader.get(3).price)
+        self.assertEqual(1970, self.reader.get(3).timestamp.year)
+
+    def test_record_held_by_a_writer_reads_as_missing(self):
+        self.writer.write([1, 2], [10.0, 20.0])
+        records = self.writer.records()
+        records['seq'][2] += 1
+        quotes = self.reader.read([1, 2])
+        self.assertEqual(10.0, quotes.price[0])
+        self.assertTrue(np.isnan(quotes.price[1]))
+        records['seq'][2] += 1
+        self.assertEqual(20.0, self.reader.get(2).price)
+
+    def test_other_processes_read_the_segment(self):
+        self.writer.write(np.arange(16), np.arange(16) * 2.0)
+        results = multiprocessing.Queue()
+        child = multiprocessing.Process(target=read_in_child, args=(self.name, [1, 15], results))
+        child.start()
+        child.join(10)
+        self.assertEqual([2.0, 30.0], results.get(timeout=1))
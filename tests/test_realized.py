@@ -0,0 +1,129 @@
+import json
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+from datetime import date, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.models import Role, Stock, StockStatistic, User
+from app.price_store import price_store
+from app.realized import daily_bars, rolling_statistics, update
+
+START = date(2025, 10, 1)
+DAYS = 400
+END = START + timedelta(days=DAYS)
+
+
+class RollingStatisticsTest(unittest.TestCase):
+    def test_matches_direct_computation(self):
+        rng = np.random.default_rng(1)
+        close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 80)))
+        high, low = close * 1.01, close * 0.98
+        window = 20
+        values = rolling_statistics(high, low, close, window)
+        self.assertEqual(len(close) - window, len(values['realized_vol']))
+        for end in (window, 47, len(close) - 1):
+            closes = close[end - window:end + 1]
+            returns = np.diff(np.log(closes))
+            true_range = np.maximum(high[end - window + 1:end + 1], closes[:-1]) - \
+                np.minimum(low[end - window + 1:end + 1], closes[:-1])
+            peaks = np.maximum.accumulate(closes)
+            index = end - window
+            self.assertAlmostEqual(np.std(returns, ddof=1) * np.sqrt(252), values['realized_vol'][index])
+            self.assertAlmostEqual(true_range.mean(), values['atr'][index])
+            self.assertAlmostEqual(1 - closes[-1] / peaks[-1], values['drawdown'][index])
+            self.assertAlmostEqual(np.max(1 - closes / peaks), values['max_drawdown'][index])
+            self.assertAlmostEqual(np.percentile(returns, 5), values['return_p05'][index])
+            self.assertAlmostEqual(np.median(returns), values['return_p50'][index])
+
+    def test_short_history(self):
+        self.assertEqual(0, len(rolling_statistics([1.0] * 5, [1.0] * 5, [1.0] * 5, 5)['atr']))
+
+    def test_daily_bars(self):
+        timestamps = np.array(['2026-01-05T10:00', '2026-01-05T15:00', '2026-01-06T10:00'], dtype='datetime64[s]')
+        bars = daily_bars({'timestamp': timestamps, 'open': np.array([10.0, 11.0, 12.0]),
+                           'high': np.array([10.5, 13.0, 12.5]), 'low': np.array([9.0, 10.0, 11.5]),
+                           'close': np.array([10.2, 12.0, 12.1])})
+        self.assertEqual(['2026-01-05', '2026-01-06'], np.datetime_as_string(bars.day).tolist())
+        np.testing.assert_array_equal([10.0, 12.0], bars.open)
+        np.testing.assert_array_equal([13.0, 12.5], bars.high)
+        np.testing.assert_array_equal([9.0, 11.5], bars.low)
+        np.testing.assert_array_equal([12.0, 12.1], bars.close)
+
+
+class StockStatisticsTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(PRICE_STORE_DIR=self.root, STATISTICS_WINDOWS=[10, 20, 60, 252])
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        price_store.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        db.session.add_all([User(username='student', email='student@utdallas.edu', password='password',
+                                 confirmed=True),
+                            Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True),
+                            Stock(name='Intel', ticker='INTC', sector='Tech', is_active=True),
+                            Stock(name='Ford', ticker='F', sector='Auto', is_active=True)])
+        db.session.commit()
+        rng = np.random.default_rng(2)
+        self.days = np.arange(np.datetime64(START), np.datetime64(END))
+        for ticker, vol in (('AAPL', 0.01), ('INTC', 0.03)):
+            close = 50 * np.exp(np.cumsum(rng.normal(0, vol, DAYS)))
+            price_store.append(ticker, {'timestamp': self.days, 'close': close, 'high': close * 1.01,
+                                        'low': close * 0.99})
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.root)
+
+    def test_incremental_update(self):
+        self.assertEqual(2, update(END))
+        apple = Stock.query.filter_by(ticker='AAPL').first()
+        statistics = StockStatistic.for_stock(apple.id)
+        self.assertEqual([10, 20, 60, 252], [statistic.window for statistic in statistics])
+        self.assertEqual({END - timedelta(days=1)}, {statistic.as_of for statistic in statistics})
+        prices = price_store.read('AAPL')
+        expected = rolling_statistics(prices['high'], prices['low'], prices['close'], 60)
+        self.assertAlmostEqual(expected['realized_vol'][-1], statistics[2].realized_vol)
+        self.assertAlmostEqual(0.01 * np.sqrt(252), statistics[3].realized_vol, delta=0.02)
+
+        # Nothing closed since, then one new day for one stock; today's bars are not closed yet
+        self.assertEqual(0, update(END))
+        price_store.append('AAPL', {'timestamp': [np.datetime64(END)], 'close': [60.0]})
+        self.assertEqual(0, update(END))
+        self.assertEqual(1, update(END + timedelta(days=1)))
+        self.assertEqual({END}, {statistic.as_of for statistic in StockStatistic.for_stock(apple.id)})
+        self.assertEqual(2, update(END + timedelta(days=1), full=True))
+
+    def test_windows_longer_than_the_history(self):
+        price_store.append('F', {'timestamp': self.days[-30:], 'close': np.linspace(10, 12, 30)})
+        update(END)
+        ford = Stock.query.filter_by(ticker='F').first()
+        self.assertEqual([10, 20], [statistic.window for statistic in StockStatistic.for_stock(ford.id)])
+
+    def test_api(self):
+        headers = {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+                   'Accept': 'application/json'}
+        client = self.app.test_client()
+        update(END)
+        body = json.loads(client.get('/api/v1/stocks/INTC/statistics', headers=headers).get_data(as_text=True))
+        self.assertEqual([10, 20, 60, 252], [row['window'] for row in body['statistics']])
+        self.assertEqual(404, client.get('/api/v1/stocks/NOPE/statistics', headers=headers).status_code)
+
+        body = json.loads(client.get('/api/v1/stocks/screen?window=252', headers=headers).get_data(as_text=True))
+        self.assertEqual(['INTC', 'AAPL'], [row['ticker'] for row in body['stocks']])
+        body = json.loads(client.get('/api/v1/stocks/screen?window=252&max_realized_vol=0.3&order=asc',
+                                     headers=headers).get_data(as_text=True))
+        self.assertEqual(['AAPL'], [row['ticker'] for row in body['stocks']])
+        body = json.loads(client.get('/api/v1/stocks/screen?window=252&limit=-1', headers=headers)
+                          .get_data(as_text=True))
+        self.assertEqual(['INTC'], [row['ticker'] for row in body['stocks']])
+        self.assertEqual(400, client.get('/api/v1/stocks/screen?sort=name', headers=headers).status_code)
+        self.assertEqual(400, client.get('/api/v1/stocks/screen?min_atr=x', headers=headers).status_code)
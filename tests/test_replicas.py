@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+from unittest import mock
+
+from app import create_app, db
+from app.models import Role, Stock, Trade, User
+
+
+class ReplicaRoutingTest(unittest.TestCase):
+    """The replica is a file copy of the primary taken in setUp, so it stays frozen while the primary moves on"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.primary_path = os.path.join(self.directory, 'primary.sqlite')
+        self.replica_path = os.path.join(self.directory, 'replica.sqlite')
+        self.app = create_app('testing')
+        self.app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + self.primary_path
+        self.app.config['SQLALCHEMY_BINDS'] = {'replica_0': 'sqlite:///' + self.replica_path}
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.user = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.user, self.stock])
+        db.session.add(Trade(stock=self.stock, user=self.user, quantity=1, price=1.0))
+        db.session.commit()
+        shutil.copyfile(self.primary_path, self.replica_path)
+        db.session.add(Trade(stock=self.stock, user=self.user, quantity=2, price=2.0))
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        for bind in (None, 'replica_0'):
+            db.get_engine(bind=bind).dispose()
+        self.app_context.pop()
+        shutil.rmtree(self.directory)
+
+    def test_read_only_queries_use_replica(self):
+        self.assertEqual(2, Trade.query.count())
+        with db.read_only():
+            self.assertEqual(1, Trade.query.count())
+        self.assertEqual(2, Trade.query.count())
+
+    def test_one_replica_per_request(self):
+        self.app.config['SQLALCHEMY_BINDS']['replica_1'] = 'sqlite:///' + os.path.join(self.directory, 'empty.sqlite')
+        with mock.patch('app.database.random.choice', side_effect=['replica_0', 'replica_1']) as choice:
+            with self.app.test_request_context('/'), db.read_only():
+                self.assertEqual(1, Trade.query.count())
+                self.assertEqual(1, Trade.query.count())
+            self.assertEqual(1, choice.call_count)
+        db.get_engine(bind='replica_1').dispose()
+
+    def test_writes_go_to_primary(self):
+        with db.read_only():
+            db.session.add(Trade(stock_id=self.stock.id, user_id=self.user.id, quantity=3, price=3.0))
+            db.session.flush()
+            # The transaction wrote, so its later reads must see its own rows
+            self.assertEqual(3, Trade.query.count())
+            db.session.commit()
+        self.assertEqual(3, Trade.query.count())
+
+    def test_read_your_writes_window(self):
+        with self.app.test_request_context('/'):
+            db.session.add(Trade(stock_id=self.stock.id, user_id=self.user.id, quantity=3, price=3.0))
+            db.session.commit()
+            with db.read_only():
+                self.assertEqual(3, Trade.query.count())
+
+    def test_window_expires(self):
+        self.app.config['READ_YOUR_WRITES_SECONDS'] = 0
+        with self.app.test_request_context('/'):
+            db.session.add(Trade(stock_id=self.stock.id, user_id=self.user.id, quantity=3, price=3.0))
+            db.session.commit()
+            with db.read_only():
+                self.assertEqual(1, Trade.query.count())
+
+    def test_non_sticky_write_keeps_replica_reads(self):
+        with self.app.test_request_context('/'):
+            self.user.ping()
+            with db.read_only():
+                self.assertEqual(1, Trade.query.count())
+
+    def test_api_get_reads_from_replica(self):
+        headers = {
+            'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+            'Accept': 'application/json',
+            'Content-Type': 'application/json'
+        }
+        response = self.client.get('/api/v1/users/student/trades/', headers=headers)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, json.loads(response.get_data(as_text=True))['count'])
+
+        # Posting a trade opens the read-your-writes window for this client
+        response = self.client.post('/api/v1/trades/', headers=headers, data=json.dumps(
+            {'stock': 'AAPL', 'user': 'student', 'quantity': 4, 'price': 4.0}))
+        self.assertEqual(201, response.status_code)
+        response = self.client.get('/api/v1/users/student/trades/', headers=headers)
+        self.assertEqual(3, json.loads(response.get_data(as_text=True))['count'])
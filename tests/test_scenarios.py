@@ -0,0 +1,128 @@
+import json
+import time
+import unittest
+from base64 import b64encode
+from datetime import date, datetime
+from unittest import mock
+
+import numpy as np
+
+from app import create_app, db
+from app.greeks import black_scholes, years_to_expiry
+from app.models import OptionContract, OptionKind, OptionTrade, Role, Stock, Trade, User
+from app.portfolio_greeks import greek_book
+from app.quote_cache import quote_cache
+from app.scenarios import chunks, compute_chunk, run, scenario_pnl
+
+NOW = datetime.utcnow()
+EXPIRY = date(2027, 1, 15)
+
+
+class ScenarioPnlTest(unittest.TestCase):
+    def test_matches_full_revaluation(self):
+        spot_shocks, vol_shocks = np.array([-0.2, 0.0, 0.1]), np.array([-0.05, 0.0, 0.3])
+        shares = np.array([100.0, -200.0, 50.0])
+        spot, strike, years = np.array([100.0, 100.0, 40.0]), np.array([0.0, 110.0, 35.0]), np.array([0, 0.5, 1.0])
+        vol, call, option = np.array([0.0, 0.25, 0.04]), np.array([False, True, False]), np.array([False, True, True])
+        pnl = scenario_pnl(shares, spot, strike, years, vol, call, option, spot_shocks, vol_shocks, 0.03)
+        self.assertEqual((3, 3, 3), pnl.shape)
+        np.testing.assert_allclose(pnl[0], 100 * 100.0 * spot_shocks[:, None].repeat(3, axis=1))
+        self.assertTrue(np.all(pnl[:, 1, 1] == 0))
+        for row in (1, 2):
+            base = black_scholes(spot[row], strike[row], years[row], 0.03, 0.0, vol[row], call[row]).price
+            for i, spot_shock in enumerate(spot_shocks):
+                for j, vol_shock in enumerate(vol_shocks):
+                    shocked = black_scholes(spot[row] * (1 + spot_shock), strike[row], years[row], 0.03, 0.0,
+                                            max(vol[row] + vol_shock, 0.0), call[row]).price
+                    self.assertAlmostEqual(shares[row] * (shocked - base), pnl[row, i, j], places=9)
+
+    def test_chunks_keep_groups_whole(self):
+        group = np.array([1, 1, 1, 2, 3, 3, 4])
+        parts = list(chunks((group, np.arange(7)), 2))
+        self.assertEqual([[1, 1, 1], [2, 3, 3], [4]], [part[0].tolist() for part in parts])
+        keys, sums = compute_chunk(group, np.ones(7), np.full(7, 10.0), np.zeros(7), np.zeros(7), np.zeros(7),
+                                   np.zeros(7, dtype=bool), np.zeros(7, dtype=bool), grid=([0.1], [0.0], 0.0))
+        self.assertEqual([1, 2, 3, 4], keys.tolist())
+        np.testing.assert_allclose(sums[:, 0, 0], [3.0, 1.0, 2.0, 1.0])
+
+
+class FirmScenarioTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['OPTION_DEFAULT_VOL'] = 0.25
+        self.app.config['RISK_FREE_RATE'] = 0.0
+        self.app.config['SCENARIO_WORKERS'] = 1
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        greek_book.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        admin = Role.query.filter_by(name='Administrator').first()
+        self.admin = User(username='admin', email='admin@utdallas.edu', password='password', confirmed=True,
+                          role=admin)
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.apple = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True)
+        self.intel = Stock(name='Intel', ticker='INTC', sector='Tech', is_active=True)
+        db.session.add_all([self.admin, self.student, self.apple, self.intel])
+        db.session.commit()
+        OptionContract.load([{'underlying_id': self.apple.id, 'expiry': EXPIRY, 'strike': 100.0,
+                              'kind': OptionKind.PUT, 'multiplier': 100}])
+        self.contract = OptionContract.query.one()
+        db.session.add_all([Trade(stock=self.apple, user=self.student, quantity=50, price=100.0),
+                            Trade(stock=self.intel, user=self.student, quantity=10, price=30.0),
+                            Trade(stock=self.apple, user=self.admin, quantity=-20, price=100.0),
+                            OptionTrade(contract=self.contract, user_id=self.admin.id, quantity=2, price=9.0)])
+        db.session.commit()
+        quote_cache.write([self.apple.id, self.intel.id], [100.0, 30.0], [1.0, 1.0], [time.time()] * 2)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        quote_cache.close(unlink=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def headers(self, email):
+        return {'Authorization': 'Basic ' + b64encode((email + ':password').encode('utf-8')).decode('utf-8'),
+                'Accept': 'application/json'}
+
+    def test_groups(self):
+        by_user = run('user', [-0.1, 0.0, 0.1], [0.0, 0.1], NOW)
+        by_underlying = run('underlying', [-0.1, 0.0, 0.1], [0.0, 0.1], NOW)
+        np.testing.assert_allclose(by_user.total, by_underlying.total)
+        self.assertEqual([self.admin.id, self.student.id], by_user.keys.tolist())
+        np.testing.assert_allclose(by_user.pnl[1][:, 0], [-530.0, 0.0, 530.0])
+        np.testing.assert_allclose(by_underlying.pnl[1][:, 1], [-30.0, 0.0, 30.0])
+        vol = greek_book.snapshot(NOW).vol[greek_book.contract > 0][0]
+        years = years_to_expiry([EXPIRY], NOW)[0]
+        put = black_scholes(90.0, 100.0, years, 0.0, 0.0, vol + 0.1, False).price - \
+            black_scholes(100.0, 100.0, years, 0.0, 0.0, vol, False).price
+        self.assertAlmostEqual(-20 * -10.0 + 200 * put, by_user.pnl[0][0, 1])
+        self.assertEqual(0, by_user.unpriced)
+
+    def test_pool_matches_inline(self):
+        inline = run('underlying', now=NOW, workers=1, chunk_rows=1)
+        pooled = run('underlying', now=NOW, workers=2, chunk_rows=1, inline_rows=0)
+        self.assertEqual(inline.keys.tolist(), pooled.keys.tolist())
+        np.testing.assert_array_equal(inline.pnl, pooled.pnl)
+
+    def test_small_books_run_inline(self):
+        with mock.patch('app.scenarios.ProcessPoolExecutor') as pool:
+            run('underlying', now=NOW, workers=2, chunk_rows=1, inline_rows=100)
+        pool.assert_not_called()
+
+    def test_api(self):
+        response = self.client.get('/api/v1/risk/scenarios?by=underlying&spot_shocks=0.1,-0.1&vol_shocks=0',
+                                   headers=self.headers('admin@utdallas.edu'))
+        self.assertEqual(200, response.status_code)
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual([-0.1, 0.1], body['spot_shocks'])
+        self.assertEqual(['AAPL', 'INTC'], [entry['stock'] for entry in body['underlyings']])
+        self.assertEqual([[-30.0], [30.0]], body['underlyings'][1]['pnl'])
+        self.assertEqual(400, self.client.get('/api/v1/risk/scenarios?spot_shocks=a',
+                                              headers=self.headers('admin@utdallas.edu')).status_code)
+        for shocks in ('-1,0.1', '-1.5', 'nan'):
+            self.assertEqual(400, self.client.get('/api/v1/risk/scenarios?spot_shocks=' + shocks,
+                                                  headers=self.headers('admin@utdallas.edu')).status_code)
+        self.assertEqual(403, self.client.get('/api/v1/risk/scenarios',
+                                              headers=self.headers('student@utdallas.edu')).status_code)
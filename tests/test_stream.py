@@ -0,0 +1,132 @@
+import json
+import unittest
+
+from app import create_app, db
+from app.models import BrokerMessage, Role, Stock, Trade, User
+from app.pubsub import Broker, Relay, broker
+
+
+class StreamTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['STREAM_HEARTBEAT_SECONDS'] = 0.05
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.student, self.stock])
+        db.session.commit()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_trade(self, quantity):
+        trade = Trade(stock=self.stock, user=self.student, quantity=quantity, price=1.0)
+        db.session.add(trade)
+        db.session.commit()
+        return trade
+
+    def test_trade_commit_writes_one_message(self):
+        trade = self.add_trade(3)
+        messages = BrokerMessage.since(0, 10)
+        self.assertEqual(1, len(messages))
+        payload = json.loads(messages[0].payload)
+        self.assertEqual('trades', messages[0].topic)
+        self.assertEqual(trade.id, payload['id'])
+        self.assertEqual('AAPL', payload['stock'])
+        self.assertEqual('student', payload['user'])
+        self.assertEqual('insert', payload['operation'])
+
+    def test_publish_fans_out_to_every_subscriber(self):
+        local = Broker(max_queue=4)
+        first = local.subscribe('trades')
+        second = local.subscribe('trades', 'stocks.AAPL')
+        self.assertEqual(2, local.publish('trades', {'id': 1}))
+        self.assertEqual(1, local.publish('stocks.AAPL', {'id': 1}))
+        self.assertEqual({'id': 1}, first.get(timeout=0))
+        self.assertEqual({'id': 1}, second.get(timeout=0))
+        self.assertIsNone(first.get(timeout=0))
+
+    def test_slow_subscriber_is_dropped(self):
+        local = Broker(max_queue=2)
+        slow = local.subscribe('trades')
+        fast = local.subscribe('trades')
+        for seq in range(3):
+            local.publish('trades', {'id': seq})
+            fast.get(timeout=0)
+        self.assertTrue(slow.dropped)
+        self.assertFalse(fast.dropped)
+        self.assertEqual(1, local.subscriber_count('trades'))
+
+    def test_relay_publishes_new_rows(self):
+        local = Broker()
+        relay = Relay(self.app, local)
+        relay.poll()
+        everything = local.subscribe('trades')
+        apple = local.subscribe('stocks.AAPL')
+        trade = self.add_trade(5)
+        relay.poll()
+        event = everything.get(timeout=0)
+        self.assertEqual(trade.id, event['data']['id'])
+        self.assertEqual(event, apple.get(timeout=0))
+        relay.poll()
+        self.assertIsNone(everything.get(timeout=0))
+
+    def test_relay_skips_the_ticker_of_trades_without_a_stock(self):
+        local = Broker()
+        relay = Relay(self.app, local)
+        relay.poll()
+        everything = local.subscribe('trades')
+        db.session.add(Trade(user=self.student, quantity=1, price=1.0))
+        db.session.commit()
+        db.session.add(BrokerMessage(topic='trades', payload='not json'))
+        db.session.commit()
+        trade = self.add_trade(2)
+        with self.assertLogs(self.app.logger, 'ERROR'):
+            relay.poll()
+        self.assertIsNone(everything.get(timeout=0)['data']['stock'])
+        self.assertEqual(trade.id, everything.get(timeout=0)['data']['id'])
+        self.assertEqual(BrokerMessage.current_seq(), relay.last_seq)
+
+    def test_event_stream(self):
+        response = self.client.get('/stream/stocks/AAPL')
+        self.assertEqual(200, response.status_code)
+        self.assertTrue(response.content_type.startswith('text/event-stream'))
+        chunks = iter(response.response)
+        self.assertTrue(next(chunks).startswith(b'retry:'))
+        self.assertEqual(1, broker.subscriber_count('stocks.AAPL'))
+        self.assertEqual(b': heartbeat\n\n', next(chunks))
+        broker.publish('stocks.AAPL', {'id': 7, 'topic': 'trades', 'data': {'id': 1}})
+        self.assertEqual(b'id: 7\nevent: trades\ndata: {"id": 1}\n\n', next(chunks))
+        response.close()
+        self.assertEqual(0, broker.subscriber_count('stocks.AAPL'))
+
+    def test_event_stream_replays_missed_messages(self):
+        self.add_trade(1)
+        last_event_id = BrokerMessage.current_seq()
+        trade = self.add_trade(2)
+        response = self.client.get('/stream/trades', headers={'Last-Event-ID': str(last_event_id)})
+        chunks = iter(response.response)
+        next(chunks)
+        replayed = next(chunks).decode('utf-8')
+        self.assertIn('id: {}\n'.format(last_event_id + 1), replayed)
+        self.assertEqual(trade.id, json.loads(replayed.split('data: ')[1])['id'])
+        response.close()
+
+    def test_replay_beyond_one_batch_asks_to_reconnect(self):
+        self.app.config['STREAM_BATCH_SIZE'] = 2
+        last_event_id = BrokerMessage.current_seq()
+        for quantity in (1, 2, 3):
+            self.add_trade(quantity)
+        response = self.client.get('/stream/stocks/AAPL', headers={'Last-Event-ID': str(last_event_id)})
+        chunks = [chunk.decode('utf-8') for chunk in response.response]
+        self.assertEqual('id: {}\nevent: dropped\ndata: {{}}\n\n'.format(last_event_id + 2), chunks[-1])
+        response.close()
+
+    def test_unknown_stock_stream(self):
+        self.assertEqual(404, self.client.get('/stream/stocks/NOPE').status_code)
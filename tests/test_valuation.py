@@ -0,0 +1,80 @@
+import json
+import unittest
+from base64 import b64encode
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.models import PortfolioValuation, Role, Stock, Trade, User
+from app.valuation import price_vector, run_valuation, value_portfolios
+
+
+class ValuationTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.ta = User(username='ta', email='ta@utdallas.edu', password='password', confirmed=True)
+        self.apple = Stock(name='Apple', ticker='AAPL', sector="Tech", is_active=True, year_high=1000.0, year_low=100.0)
+        self.tesla = Stock(name='Tesla', ticker='TSLA', sector="Auto", is_active=True, year_high=1000.0, year_low=100.0)
+        db.session.add_all([self.student, self.ta, self.apple, self.tesla])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_trade(self, user, stock, quantity, price, timestamp):
+        db.session.add(Trade(stock=stock, user=user, quantity=quantity, price=price, timestamp=timestamp))
+        db.session.commit()
+
+    def test_value_portfolios(self):
+        prices = price_vector([1, 2], [10.0, 20.0], 4)
+        previous = price_vector([1], [8.0], 4)
+        users, valuation = value_portfolios(np.array([5, 3, 5, 5]), np.array([1, 1, 2, 3]),
+                                            np.array([2, 1, -3, 7]), prices, previous)
+        np.testing.assert_array_equal([3, 5], users)
+        np.testing.assert_allclose([10.0, 20.0 - 60.0], valuation.equity)
+        np.testing.assert_allclose([2.0, 4.0], valuation.day_change)
+        np.testing.assert_allclose([10.0, 20.0], valuation.long_exposure)
+        np.testing.assert_allclose([0.0, -60.0], valuation.short_exposure)
+        np.testing.assert_allclose([10.0, 80.0], valuation.gross_exposure)
+        np.testing.assert_array_equal([1, 3], valuation.positions)
+
+    def test_run_valuation(self):
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.add_trade(self.student, self.apple, 10, 100.0, today - timedelta(hours=2))
+        self.add_trade(self.ta, self.apple, 5, 110.0, today + timedelta(minutes=1))
+        self.add_trade(self.student, self.tesla, -2, 50.0, today + timedelta(minutes=2))
+        self.assertEqual(2, run_valuation(as_of=today + timedelta(minutes=5)))
+        student = PortfolioValuation.latest(self.student)
+        self.assertAlmostEqual(10 * 110.0 - 2 * 50.0, student.equity)
+        self.assertAlmostEqual(10 * 10.0, student.day_change)
+        self.assertAlmostEqual(1200.0, student.gross_exposure)
+        self.assertEqual(2, student.positions)
+
+        headers = {
+            'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+            'Accept': 'application/json'
+        }
+        response = self.app.test_client().get('/api/v1/users/ta/valuation/', headers=headers)
+        self.assertEqual(200, response.status_code)
+        self.assertAlmostEqual(550.0, json.loads(response.get_data(as_text=True))['equity'])
+
+    def test_exited_user_gets_an_empty_valuation(self):
+        start = datetime.utcnow() - timedelta(hours=1)
+        self.add_trade(self.student, self.apple, 10, 100.0, start)
+        self.add_trade(self.ta, self.apple, 5, 100.0, start)
+        run_valuation(as_of=start + timedelta(minutes=1))
+        self.add_trade(self.student, self.apple, -10, 120.0, start + timedelta(minutes=2))
+        self.assertEqual(2, run_valuation(as_of=start + timedelta(minutes=3)))
+        student = PortfolioValuation.latest(self.student)
+        self.assertEqual((0.0, 0), (student.equity, student.positions))
+        # Once the empty valuation is written there is nothing left to value
+        self.assertEqual(1, run_valuation(as_of=start + timedelta(minutes=4)))
+        self.assertEqual(3, PortfolioValuation.query.filter_by(user_id=self.ta.id).count())
@@ -0,0 +1,130 @@
+import json
+import shutil
+import tempfile
+import unittest
+from base64 import b64encode
+from datetime import date, timedelta
+
+import numpy as np
+
+from app import create_app, db
+from app.models import Role, Stock, Trade, User, ValueAtRisk
+from app.price_store import price_store
+from app.value_at_risk import covariance_root, run, simulate
+
+START = date(2025, 10, 1)
+DAYS = 300
+AS_OF = START + timedelta(days=DAYS - 1)
+
+
+class SimulateTest(unittest.TestCase):
+    def test_single_stock_matches_normal_quantile(self):
+        vol = 0.02
+        seeds = np.random.SeedSequence(1).spawn(20)
+        result = simulate(np.array([0]), np.array([10000.0]), np.array([0.0]), np.array([0.0]), np.array([0]),
+                          np.array([[vol]]), seeds, 5000, 0.99)
+        self.assertAlmostEqual(10000 * -np.expm1(vol * -2.326), result[0, 0], delta=10)
+        self.assertAlmostEqual(10000 * -np.expm1(vol * np.sqrt(10) * -2.326), result[0, 2], delta=40)
+        # Expected Shortfall is the mean loss beyond VaR, about 2.665 standard deviations at 99%
+        self.assertAlmostEqual(10000 * -np.expm1(vol * -2.665), result[0, 1], delta=15)
+
+    def test_users_sum_their_pairs(self):
+        root = covariance_root(np.random.default_rng(3).normal(0, 0.01, (250, 2)), 0.0)
+        seeds = np.random.SeedSequence(2).spawn(2)
+        result = simulate(np.array([1, 0, 1]), np.array([0.0, 5000.0, 0.0]), np.zeros(3), np.array([-7.0, 0, -1.0]),
+                          np.array([0, 1]), root, seeds, 500, 0.95)
+        # Theta alone is a certain loss, the same on every path
+        np.testing.assert_allclose(result[0], [7.0, 7.0, 70.0, 70.0])
+        alone = simulate(np.array([0]), np.array([5000.0]), np.zeros(1), np.zeros(1), np.array([0]), root, seeds,
+                         500, 0.95)
+        np.testing.assert_allclose(result[1], alone[0] + [1.0, 1.0, 10.0, 10.0])
+
+    def test_shrinkage_keeps_variances(self):
+        returns = np.random.default_rng(4).normal(0, 0.01, (100, 3))
+        raw, shrunk = covariance_root(returns, 0.0), covariance_root(returns, 0.5)
+        np.testing.assert_allclose(np.diag(raw @ raw.T), np.diag(shrunk @ shrunk.T))
+        covariance = shrunk @ shrunk.T
+        np.testing.assert_allclose(covariance[0, 1], 0.5 * (raw @ raw.T)[0, 1])
+
+
+class ValueAtRiskRunTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config.update(PRICE_STORE_DIR=self.root, VAR_WORKERS=1, VAR_PATHS=2000, VAR_BATCH_PATHS=500)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        price_store.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.other = User(username='other', email='other@utdallas.edu', password='password', confirmed=True)
+        self.apple = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True)
+        self.intel = Stock(name='Intel', ticker='INTC', sector='Tech', is_active=True)
+        db.session.add_all([self.student, self.other, self.apple, self.intel])
+        db.session.commit()
+        rng = np.random.default_rng(5)
+        days = np.arange(np.datetime64(START), np.datetime64(START) + DAYS)
+        common = rng.normal(0, 0.01, DAYS)
+        for ticker, price in (('AAPL', 100.0), ('INTC', 30.0)):
+            closes = price * np.exp(np.cumsum(common + rng.normal(0, 0.01, DAYS)))
+            price_store.append(ticker, {'timestamp': days, 'close': closes})
+        db.session.add_all([Trade(stock=self.apple, user=self.student, quantity=50, price=100.0),
+                            Trade(stock=self.intel, user=self.student, quantity=100, price=30.0),
+                            Trade(stock=self.apple, user=self.other, quantity=-20, price=100.0)])
+        db.session.commit()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.root)
+
+    def stored(self):
+        return {row.user_id: (row.var_1d, row.es_1d, row.var_10d, row.es_10d) for row in ValueAtRisk.query}
+
+    def test_incremental_runs(self):
+        self.assertEqual((2, 0, 0), run(AS_OF))
+        first = self.stored()
+        self.assertTrue(0 < first[self.other.id][0] < first[self.other.id][1] < first[self.other.id][2])
+        self.assertEqual((0, 2, 0), run(AS_OF))
+
+        db.session.add(Trade(stock=self.apple, user=self.student, quantity=10, price=100.0))
+        db.session.commit()
+        self.assertEqual((1, 1, 0), run(AS_OF))
+        self.assertEqual(first[self.other.id], self.stored()[self.other.id])
+        self.assertGreater(self.stored()[self.student.id][0], first[self.student.id][0])
+
+        db.session.add(Trade(stock=self.apple, user=self.other, quantity=20, price=100.0))
+        db.session.commit()
+        self.assertEqual((0, 1, 1), run(AS_OF))
+        self.assertEqual([self.student.id], list(self.stored()))
+        self.assertEqual((1, 0, 0), run(AS_OF, full=True))
+
+    def test_unrelated_moves_keep_results(self):
+        run(AS_OF)
+        first = self.stored()
+        # Only the student holds Intel
+        price_store.append('INTC', {'timestamp': [np.datetime64(AS_OF)], 'close': [40.0]})
+        self.assertEqual((1, 1, 0), run(AS_OF))
+        self.assertEqual(first[self.other.id], self.stored()[self.other.id])
+        # A day without new closes changes nothing but the day the results hold for
+        self.assertEqual((0, 2, 0), run(AS_OF + timedelta(days=1)))
+        self.assertEqual({AS_OF + timedelta(days=1)}, {row.as_of for row in ValueAtRisk.query})
+
+    def test_reproducible_across_workers_and_chunks(self):
+        run(AS_OF, full=True, workers=1, chunk_users=500)
+        inline = self.stored()
+        run(AS_OF, full=True, workers=2, chunk_users=1)
+        self.assertEqual(inline, self.stored())
+
+    def test_api(self):
+        headers = {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+                   'Accept': 'application/json'}
+        client = self.app.test_client()
+        self.assertEqual(404, client.get('/api/v1/users/student/var/', headers=headers).status_code)
+        run(AS_OF)
+        body = json.loads(client.get('/api/v1/users/student/var/', headers=headers).get_data(as_text=True))
+        self.assertEqual(AS_OF.isoformat(), body['as_of'])
+        self.assertEqual(0.99, body['confidence'])
+        self.assertGreater(body['es_10d'], body['var_10d'])
@@ -0,0 +1,143 @@
+import json
+import time
+import unittest
+from base64 import b64encode
+from datetime import date, datetime, timedelta
+from unittest import mock
+
+import numpy as np
+
+from app import create_app, db
+from app.greeks import black_scholes, years_to_expiry
+from app.models import OptionContract, OptionKind, OptionTrade, Role, Stock, Trade, User
+from app.portfolio_greeks import greek_book
+from app.quote_cache import quote_cache
+from app import vol_surface
+from app.vol_surface import fit_svi, svi_total_variance, vol_surfaces
+
+STRIKES = [70.0, 80.0, 90.0, 95.0, 100.0, 105.0, 110.0, 120.0, 130.0]
+
+
+def smile(strike, years):
+    return 0.25 + 0.3 * np.log(strike / 100.0) ** 2 - 0.05 * np.log(strike / 100.0) + 0.02 * years
+
+
+class SviTest(unittest.TestCase):
+    def test_recovers_a_slice(self):
+        params = np.array([0.02, 0.1, -0.5, 0.05, 0.2])
+        moneyness = np.linspace(-0.6, 0.4, 30)
+        fitted, error = fit_svi(moneyness, svi_total_variance(params, moneyness))
+        self.assertLess(error, 1e-5)
+        np.testing.assert_allclose(svi_total_variance(fitted, moneyness), svi_total_variance(params, moneyness),
+                                   atol=2e-5)
+
+
+class VolSurfaceTest(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['RISK_FREE_RATE'] = 0.0
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        greek_book.init_app(self.app)
+        vol_surfaces.init_app(self.app)
+        db.create_all()
+        Role.insert_roles()
+        self.student = User(username='student', email='student@utdallas.edu', password='password', confirmed=True)
+        self.stock = Stock(name='Apple', ticker='AAPL', sector='Tech', is_active=True)
+        self.other = Stock(name='Intel', ticker='INTC', sector='Tech', is_active=True)
+        db.session.add_all([self.student, self.stock, self.other])
+        db.session.commit()
+        self.expiries = [date.today() + timedelta(days=91), date.today() + timedelta(days=182)]
+        OptionContract.load([{'underlying_id': self.stock.id, 'expiry': expiry, 'strike': strike,
+                              'kind': OptionKind.CALL if strike >= 100 else OptionKind.PUT, 'multiplier': 100}
+                             for expiry in self.expiries for strike in STRIKES + [101.0]])
+        self.now = datetime.utcnow()
+        for contract in OptionContract.query.filter(OptionContract.strike != 101.0):
+            db.session.add(OptionTrade(contract=contract, user_id=self.student.id, quantity=1,
+                                       price=self.premium(contract)))
+        db.session.commit()
+        quote_cache.write([self.stock.id, self.other.id], [100.0, 30.0], [1.0, 1.0], [time.time()] * 2)
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        quote_cache.close(unlink=True)
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def premium(self, contract, spot=100.0):
+        years = years_to_expiry([contract.expiry], self.now)[0]
+        return float(black_scholes(spot, contract.strike, years, 0.0, 0.0, smile(contract.strike, years),
+                                   contract.kind == OptionKind.CALL).price)
+
+    def test_fit_and_lookup(self):
+        surface = vol_surfaces.surface(self.stock.id, self.now)
+        self.assertEqual(self.expiries, surface.expiries)
+        self.assertEqual([len(STRIKES)] * 2, surface.quotes.tolist())
+        self.assertTrue(np.all(surface.errors < 1e-3))
+        years = years_to_expiry(self.expiries, self.now)
+        strikes = np.array(STRIKES[1:-1])
+        for expiry_years in years:
+            np.testing.assert_allclose(surface.lookup(strikes, expiry_years), smile(strikes, expiry_years),
+                                       atol=0.01)
+        # Between expiries and before the first one
+        middle = years.mean()
+        np.testing.assert_allclose(surface.lookup(100.0, [middle, years[0] / 2]), smile(100.0, years[0]),
+                                   atol=0.01)
+        self.assertEqual((3, 2), surface.lookup(np.full((3, 2), 100.0), 0.3).shape)
+
+    def test_refit_only_on_new_quotes(self):
+        surface = vol_surfaces.surface(self.stock.id, self.now)
+        self.assertIs(surface, vol_surfaces.surface(self.stock.id, self.now))
+        # A trade in another underlying bumps the tables but not this stock's quotes
+        db.session.add(Trade(stock=self.other, user=self.student, quantity=1, price=30.0))
+        db.session.commit()
+        self.assertIs(surface, vol_surfaces.surface(self.stock.id, self.now))
+        contract = OptionContract.query.filter_by(strike=101.0).first()
+        db.session.add(OptionTrade(contract=contract, user_id=self.student.id, quantity=1,
+                                   price=self.premium(contract)))
+        db.session.commit()
+        refit = vol_surfaces.surface(self.stock.id, self.now)
+        self.assertIsNot(surface, refit)
+        self.assertEqual(len(STRIKES) + 1, refit.quotes[0])
+        quote_cache.write([self.stock.id], [100.5], [1.0], [time.time()])
+        self.assertIs(refit, vol_surfaces.surface(self.stock.id, self.now))
+        quote_cache.write([self.stock.id], [103.0], [1.0], [time.time()])
+        self.assertIsNot(refit, vol_surfaces.surface(self.stock.id, self.now))
+        self.assertIsNone(vol_surfaces.surface(self.other.id, self.now))
+
+    def test_missing_surfaces_are_cached(self):
+        with mock.patch.object(vol_surface, 'last_quotes', wraps=vol_surface.last_quotes) as quotes:
+            self.assertIsNone(vol_surfaces.surface(self.other.id, self.now))
+            self.assertIsNone(vol_surfaces.surface(self.other.id, self.now))
+            self.assertEqual(1, quotes.call_count)
+            db.session.add(Trade(stock=self.other, user=self.student, quantity=1, price=30.0))
+            db.session.commit()
+            self.assertIsNone(vol_surfaces.surface(self.other.id, self.now))
+            self.assertEqual(1, quotes.call_count)
+            OptionContract.load([{'underlying_id': self.other.id, 'expiry': self.expiries[0], 'strike': 30.0,
+                                  'kind': OptionKind.CALL, 'multiplier': 100}])
+            self.assertIsNone(vol_surfaces.surface(self.other.id, self.now))
+            self.assertEqual(2, quotes.call_count)
+
+    def test_untraded_positions_use_the_surface(self):
+        self.app.config['OPTION_DEFAULT_VOL'] = 0.9
+        greek_book.init_app(self.app)
+        contract = OptionContract.query.filter_by(strike=101.0, expiry=self.expiries[1]).first()
+        # A premium above the spot implies no vol
+        db.session.add(OptionTrade(contract=contract, user_id=self.student.id, quantity=1, price=1000.0))
+        db.session.commit()
+        greek_book.refresh(self.now)
+        vol = greek_book.vol[greek_book.contract == contract.id][0]
+        self.assertAlmostEqual(smile(101.0, years_to_expiry([contract.expiry], self.now)[0]), vol, delta=0.01)
+
+    def test_api(self):
+        headers = {'Authorization': 'Basic ' + b64encode(b'student@utdallas.edu:password').decode('utf-8'),
+                   'Accept': 'application/json'}
+        response = self.client.get('/api/v1/stocks/AAPL/volsurface', headers=headers)
+        self.assertEqual(200, response.status_code)
+        body = json.loads(response.get_data(as_text=True))
+        self.assertEqual([expiry.isoformat() for expiry in self.expiries], [row['expiry'] for row in body['expiries']])
+        self.assertEqual((len(body['years']), len(body['moneyness'])), np.shape(body['vols']))
+        self.assertEqual(404, self.client.get('/api/v1/stocks/INTC/volsurface', headers=headers).status_code)
+        self.assertEqual(404, self.client.get('/api/v1/stocks/NOPE/volsurface', headers=headers).status_code)